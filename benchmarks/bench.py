@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Banco de pruebas de rendimiento del ciclo completo con proyectos sintéticos.
+    python -m benchmarks.bench [--buildings 2] [--dwellings 20] [--rooms 4] [--fancoil-every 4] [--cycles 5]
+                               [--save-baseline] [--tolerance 0.25] [--keep]
+Genera el proyecto sintético (benchmarks.synthetic) en una carpeta temporal, ejecuta benchmarks.runner en un proceso
+aparte contra el bus simulado (mb_utils.simulator sin esperas) y muestra la duración de cada etapa del ciclo, la
+memoria y los micro-benchmarks.
+Los resultados se comparan con los del mismo escenario guardados en BENCHMARK_BASELINE_FILE. Si algún tiempo o
+consumo de memoria supera la referencia en más de la tolerancia, se muestra la regresión y el proceso termina con
+código 1. Con --save-baseline los resultados pasan a ser la nueva referencia del escenario.
+Las referencias dependen de la máquina: deben guardarse y compararse en el mismo equipo.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from benchmarks.synthetic import write_exchange_files, write_project
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+
+def scenario_id(args: argparse.Namespace) -> str:
+    return f"b{args.buildings}_d{args.dwellings}_r{args.rooms}_f{args.fancoil_every}"
+
+
+def run_scenario(args: argparse.Namespace, work_folder: str) -> Dict:
+    """
+    Genera el proyecto sintético en 'work_folder' y lo ejecuta en un proceso aparte
+    Returns: resultados de benchmarks.runner más el resumen del proyecto
+    """
+    project_file = os.path.join(work_folder, "project.json")
+    results_file = os.path.join(work_folder, "results.json")
+    project = write_project(project_file, buildings=args.buildings, dwellings=args.dwellings, rooms=args.rooms,
+                            fancoil_every=args.fancoil_every)
+    exchange_folder = os.path.join(work_folder, "reg")
+    write_exchange_files(exchange_folder)
+    env = dict(os.environ,
+               PHOENIX_CONFIG_FILE=project_file,
+               PHOENIX_TEMP_FOLDER=os.path.join(work_folder, "phoenix", ""),
+               PHOENIX_EXCHANGE_FOLDER=exchange_folder,
+               PHOENIX_MODBUS_SIMULATOR="1",
+               PHOENIX_SIMULATOR_TIME_SCALE="0")
+    env.setdefault("PHOENIX_BOARD_SN", "BENCHMARK")
+    env.setdefault("PHOENIX_LOG_LEVEL", "ERROR")
+    env.pop("PHOENIX_MODBUS_REPLAY", None)
+    env.pop("PHOENIX_MODBUS_TRACE", None)
+    subprocess.run([sys.executable, "-m", "benchmarks.runner", results_file, str(args.cycles)], cwd=MODULE_PATH,
+                   env=env, check=True)
+    with open(results_file, "r") as f:
+        results = json.load(f)
+    results["project"] = project
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compara los tiempos y la memoria de 'results' con los de 'baseline'
+    Returns: lista con la descripción de las regresiones encontradas
+    """
+    regressions = []
+    for section in ("cycle", "micro", "memory"):
+        for name, value in results.get(section, {}).items():
+            ref = baseline.get(section, {}).get(name)
+            if ref and value > ref * (1 + tolerance):
+                regressions.append(f"{section}.{name}: {value:.6g} frente a {ref:.6g} "
+                                   f"(+{(value / ref - 1) * 100:.0f}%)")
+    return regressions
+
+
+def report(scenario: str, results: Dict, baseline: [Dict, None]):
+    def line(section: str, name: str, value: float, unit: str):
+        ref = (baseline or {}).get(section, {}).get(name)
+        delta = f"\t({(value / ref - 1) * 100:+.1f}%)" if ref else ""
+        print(f"  {name:<32}{value:>14.3f} {unit}{delta}")
+
+    project = results["project"]
+    print(f"Escenario {scenario}: {project['rooms']} habitaciones, {project['groups']} grupos, "
+          f"dispositivos {project['devices']}")
+    print("Ciclo (mediana):")
+    for name, value in results["cycle"].items():
+        line("cycle", name, value * 1000, "ms")
+    print("Micro-benchmarks:")
+    for name, value in results["micro"].items():
+        line("micro", name, value * 1e6, "µs")
+    print("Memoria:")
+    for name, value in results["memory"].items():
+        line("memory", name, value, "kB")
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench", description=__doc__.split("\n")[1])
+    parser.add_argument("--buildings", type=int, default=2)
+    parser.add_argument("--dwellings", type=int, default=20)
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--fancoil-every", type=int, default=4)
+    parser.add_argument("--cycles", type=int, default=BENCHMARK_CYCLES)
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="No borrar la carpeta de trabajo")
+    args = parser.parse_args(argv)
+
+    scenario = scenario_id(args)
+    baselines = {}
+    if os.path.isfile(BENCHMARK_BASELINE_FILE):
+        with open(BENCHMARK_BASELINE_FILE, "r") as f:
+            baselines = json.load(f)
+    work_folder = tempfile.mkdtemp(prefix="phoenix_bench_")
+    try:
+        results = run_scenario(args, work_folder)
+    finally:
+        if args.keep:
+            print(f"Carpeta de trabajo: {work_folder}")
+        else:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+    baseline = baselines.get(scenario)
+    report(scenario, results, baseline)
+    regressions = compare(results, baseline, args.tolerance) if baseline else []
+    if baseline is None:
+        print(f"No hay referencia guardada para el escenario {scenario}")
+    elif regressions:
+        print(f"REGRESIONES (tolerancia {args.tolerance * 100:.0f}%):")
+        for regression in regressions:
+            print(f"  {regression}")
+    if args.save_baseline:
+        baselines[scenario] = {section: results[section] for section in ("cycle", "micro", "memory")}
+        with open(BENCHMARK_BASELINE_FILE, "w") as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+        print(f"Referencia del escenario {scenario} guardada en {BENCHMARK_BASELINE_FILE}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
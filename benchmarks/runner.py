@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Ejecución de un escenario del banco de pruebas de rendimiento.
+Se lanza en un proceso propio desde benchmarks.bench, con las variables de entorno PHOENIX_* apuntando al proyecto
+sintético y al simulador, porque phoenix_init carga el proyecto al importarse.
+    python -m benchmarks.runner <archivo_resultados> [nº_ciclos]
+Mide:
+- Ciclos completos de main.ciclo contra el bus simulado: duración total y de cada etapa (publish.metrics)
+- Memoria: RSS tras la carga del proyecto, RSS máximo y pico de memoria reservada durante un ciclo (tracemalloc)
+- Micro-benchmarks de group_adrs, recursive_conv_f, get_value, RoomGroup.get_consignas y los archivos de intercambio
+"""
+import asyncio
+import json
+import resource
+import sys
+import tracemalloc
+from statistics import median
+from time import perf_counter
+from timeit import Timer
+from typing import Callable, Dict
+
+import phoenix_init as phi
+import main
+from mb_utils.mb_utils import get_value, update_xch_files_from_devices, check_changes_from_web
+from publish import metrics
+from regops.regops import group_adrs, recursive_conv_f
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+ROOM_SOURCES = ("iv_source", "sp_source", "rt_source", "rh_source", "st_source")
+
+
+def rss_kb() -> int:
+    """
+    Memoria residente máxima del proceso en kB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def stage_totals() -> Dict[str, float]:
+    """
+    Tiempo acumulado de cada etapa del ciclo registrado en publish.metrics
+    """
+    return {dict(key).get("stage"): counts[-2] for key, counts in metrics.stage_duration.values.items()}
+
+
+def measure(func: Callable) -> float:
+    """
+    Segundos por llamada de 'func': mejor de 3 tandas de al menos BENCHMARK_MICRO_TIME / 3 segundos
+    """
+    timer = Timer(func)
+    number = 1
+    while timer.timeit(number) < phi.BENCHMARK_MICRO_TIME / 3:
+        number *= 2
+    return min(timer.repeat(3, number)) / number
+
+
+async def measure_async(coro_func: Callable) -> float:
+    """
+    Segundos por llamada de la corrutina 'coro_func', ejecutada durante al menos BENCHMARK_MICRO_TIME segundos
+    """
+    calls = 0
+    start = perf_counter()
+    while not calls or perf_counter() - start < phi.BENCHMARK_MICRO_TIME:
+        await coro_func()
+        calls += 1
+    return (perf_counter() - start) / calls
+
+
+async def run_cycles(cycles: int) -> Dict:
+    """
+    Ejecuta un ciclo de calentamiento, que crea los archivos de intercambio y las lecturas iniciales, y 'cycles'
+    ciclos medidos
+    Returns: mediana de la duración total y de cada etapa
+    """
+    await main.ciclo(0)
+    totals = []
+    stages = {}
+    for id_lectura in range(1, cycles + 1):
+        before = stage_totals()
+        start = perf_counter()
+        await main.ciclo(id_lectura)
+        totals.append(perf_counter() - start)
+        for stage, total in stage_totals().items():
+            stages.setdefault(stage, []).append(total - before.get(stage, 0))
+    result = {"total": median(totals), "total_max": max(totals)}
+    result.update({stage: median(durations) for stage, durations in stages.items()})
+    return result
+
+
+async def cycle_alloc_peak() -> int:
+    """
+    Pico de memoria reservada por Python (kB) durante un ciclo completo
+    """
+    tracemalloc.start()
+    await main.ciclo(-1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak // 1024
+
+
+async def run_micro() -> Dict:
+    """
+    Micro-benchmarks de las funciones más utilizadas en cada ciclo. Los tiempos de get_value y recursive_conv_f son
+    por llamada; los de get_consignas y update_xch_files_from_devices, por pasada sobre todo el proyecto
+    """
+    adrs = []  # Direcciones de cada tipo de registro de cada mapa de registros del proyecto
+    convs = []  # Operaciones de conversión de lectura de todos los registros que las tienen
+    for regmap in phi.mbregmaps:
+        for datatype in phi.MODBUS_DATATYPES_KEYS.values():
+            regs = regmap.rmap.get(datatype)
+            if not regs:
+                continue
+            adrs.append(sorted(int(adr) for adr in regs))
+            convs += [(reg.get("conv_f_read"), 215) for reg in regs.values() if reg.get("conv_f_read")]
+    sources = [getattr(room, src) for rg in phi.all_room_groups.values() for room in rg.roomgroup
+               for src in ROOM_SOURCES if getattr(room, src, None)]
+    devices = [device for bus in phi.buses.values() for device in bus.values()]
+    roomgroups = tuple(phi.all_room_groups.values())
+
+    async def all_consignas():
+        for rg in roomgroups:
+            await rg.get_consignas()
+
+    async def all_xch_files():
+        for device in devices:
+            await update_xch_files_from_devices(device)
+
+    micro = {}
+    if adrs:
+        micro["group_adrs"] = measure(lambda: [group_adrs(adr_list) for adr_list in adrs]) / len(adrs)
+    if convs:
+        micro["recursive_conv_f"] = measure(lambda: [recursive_conv_f(ops, val) for ops, val in convs]) / len(convs)
+    if sources:
+        micro["get_value"] = measure(lambda: [get_value(src) for src in sources]) / len(sources)
+    micro["get_consignas"] = await measure_async(all_consignas)
+    micro["update_xch_files_from_devices"] = await measure_async(all_xch_files)
+    micro["check_changes_from_web"] = await measure_async(check_changes_from_web)
+    return micro
+
+
+async def run(cycles: int) -> Dict:
+    rss_init = rss_kb()
+    cycle = await run_cycles(cycles)
+    micro = await run_micro()
+    memory = {"rss_init_kb": rss_init, "rss_peak_kb": rss_kb(), "cycle_alloc_peak_kb": await cycle_alloc_peak()}
+    return {"cycle": cycle, "micro": micro, "memory": memory}
+
+
+if __name__ == "__main__":
+    results = asyncio.run(run(int(sys.argv[2]) if len(sys.argv) > 2 else phi.BENCHMARK_CYCLES))
+    with open(sys.argv[1], "w") as f:
+        json.dump(results, f, indent=1)
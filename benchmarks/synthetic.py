@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Generador de proyectos sintéticos para el banco de pruebas de rendimiento.
+El proyecto tiene el mismo formato que project.json:
+- 'buildings' edificios con 'dwellings' viviendas de 'rooms' habitaciones cada una
+- Cada vivienda tiene una centralita de suelo radiante Uponor (un canal por habitación), X148 en las viviendas
+  impares y X147 en las pares, y un recuperador Sistena SIG310. Cada 'fancoil_every' viviendas se añade un fancoil
+  Sistena SIG311
+- Cada edificio tiene un controlador de temperatura de impulsión Sistena SIG610 y su propio bus
+- Una sonda exterior Sistena SIG430 da la temperatura y humedad exterior de todos los edificios
+Las habitaciones pertenecen a grupos solapados: proyecto, edificio, vivienda, tipo de habitación dentro del edificio
+y dos zonas formadas por viviendas consecutivas, de modo que cada vivienda comparte zona con la anterior y con la
+siguiente.
+Como todos los puertos serie del proyecto comparten /dev/ttySC0, las direcciones de los esclavos son únicas en todo el
+proyecto y no pueden superar BENCHMARK_MAX_SLAVE.
+"""
+import json
+import os
+from typing import Dict
+
+from phoenix_constants import *
+
+PROJECT_GROUP = "Synth"
+ROOM_TYPES = ("Dorm", "Bano", "Salon", "Cocina")
+UFHC_CHANNELS = 12  # Canales de las centralitas Uponor X147 y X148
+DEVICE_DEFAULTS = {"baudrate": 9600, "databits": 8, "parity": "E", "stopbits": 1}
+# Archivos de intercambio del modo Frío/Calor y de los valores exteriores, relativos a EXCHANGE_FOLDER
+IV_FILE = "/1/5000/modo_iv"
+TE_FILE = "/1/1000/temp"
+RH_FILE = "/1/2000/humd"
+
+
+def room_sources(bus_id: int, device_id: int, channel: int) -> Dict:
+    """
+    Fuentes de datos de la habitación asociada al canal 'channel' de la centralita 'device_id'
+    """
+    source = {"bus": bus_id, "device": device_id}
+    return {"iv_source": {**source, "datatype": "co", "adr": 0},
+            "sp_source": {**source, "datatype": "hr", "adr": channel - 1},
+            "rt_source": {**source, "datatype": "ir", "adr": channel},
+            "rh_source": {**source, "datatype": "ir", "adr": channel + UFHC_CHANNELS},
+            "st_source": {**source, "datatype": "di", "adr": channel - 1}}
+
+
+def generate_project(buildings: int = 2, dwellings: int = 20, rooms: int = 4, fancoil_every: int = 4) -> Dict:
+    """
+    Genera un proyecto sintético
+    Params:
+        buildings: nº de edificios
+        dwellings: nº de viviendas de cada edificio
+        rooms: nº de habitaciones de cada vivienda (como máximo los canales de una centralita)
+        fancoil_every: nº de viviendas por fancoil. Con 0 no se añaden fancoils
+    Returns: diccionario con el contenido del JSON del proyecto
+    """
+    if not 1 <= rooms <= UFHC_CHANNELS:
+        raise ValueError(f"El nº de habitaciones por vivienda debe estar entre 1 y {UFHC_CHANNELS}")
+    prj_buildings = {}
+    prj_buses = {}
+    slave = 0
+    device_id = 0
+
+    def add_device(bus: Dict, name: str, groups: list, cls: str, brand: str, model: str) -> int:
+        nonlocal slave, device_id
+        slave += 1
+        device_id += 1
+        if slave > BENCHMARK_MAX_SLAVE:
+            raise ValueError(f"El proyecto sintético necesita más de {BENCHMARK_MAX_SLAVE} esclavos ModBus")
+        bus["devices"][str(device_id)] = {"id": device_id, "name": name, "groups": groups, "slave": slave,
+                                          **DEVICE_DEFAULTS, "class": cls, "brand": brand, "model": model}
+        return device_id
+
+    outdoor = None  # (bus, dispositivo) de la sonda exterior
+    for b in range(1, buildings + 1):
+        bld_group = f"Edif_{b}"
+        bus = prj_buses[str(b)] = {"id": b, "name": f"Bus Edificio {b}", "ip": [127, 0, 0, 1],
+                                   "port": 1 + (b - 1) % len(SERIAL_PORTS), "devices": {}}
+        if outdoor is None:
+            outdoor = (b, add_device(bus, "Sonda exterior", [PROJECT_GROUP], "datasource", "sistena", "sig430"))
+        add_device(bus, f"Controlador tª impulsión Edificio {b}", [bld_group], "tempfluidcontroller", "sistena",
+                   "sig610")
+        prj_dwellings = {}
+        for d in range(1, dwellings + 1):
+            dwell_group = f"Viv_{b}_{d}"
+            zones = [f"Zona_{b}_{d // 2}", f"Zona_{b}_{(d + 1) // 2}"]
+            ufhc = add_device(bus, f"Centralita UFHC Vivienda {b}-{d}", [dwell_group], "ufhccontroller", "uponor",
+                              "x147" if d % 2 == 0 else "x148")
+            add_device(bus, f"Recuperador Vivienda {b}-{d}", [dwell_group], "heatrecoveryunit", "sistena", "sig310")
+            if fancoil_every and d % fancoil_every == 0:
+                add_device(bus, f"Fancoil Zona {b}-{d // 2}", [zones[0]], "fancoil", "sistena", "sig311")
+            prj_rooms = {}
+            for r in range(1, rooms + 1):
+                room_type = ROOM_TYPES[(r - 1) % len(ROOM_TYPES)]
+                groups = [PROJECT_GROUP, bld_group, dwell_group, f"{room_type}_{b}"] + sorted(set(zones))
+                prj_rooms[str(r)] = {"id": r, "name": f"{room_type} {r} Vivienda {b}-{d}", "groups": groups,
+                                     **room_sources(b, ufhc, r), "af": 0, "aq_source": {}, "aqsp_source": {},
+                                     "offsetairref": 0.5, "offsetaircal": -1.0}
+            prj_dwellings[str(d)] = {"id": d, "name": f"Vivienda {b}-{d}", "rooms": prj_rooms}
+        te_bus, te_device = outdoor
+        prj_buildings[str(b)] = {
+            "id": b,
+            "name": f"Edificio {b}",
+            "onoff_source": {"bus": te_bus, "device": te_device},
+            "iv_source": {"mbdev": {}, "file": IV_FILE},
+            "o_data": {
+                "te_source": {"mbdev": {"bus": te_bus, "device": te_device, "datatype": "ir", "adr": 16},
+                              "file": TE_FILE},
+                "rh_source": {"mbdev": {"bus": te_bus, "device": te_device, "datatype": "ir", "adr": 17},
+                              "file": RH_FILE},
+                "aq_source": {}
+            },
+            "dwellings": prj_dwellings
+        }
+    return {"project": {"id": 1, "name": f"Proyecto sintético {buildings}x{dwellings}x{rooms}", "country": "",
+                        "region": "", "city": "", "address": "", "zp": "", "buildings": prj_buildings,
+                        "buses": prj_buses}}
+
+
+def write_project(project_file: str, **kwargs) -> Dict:
+    """
+    Genera un proyecto sintético con los parámetros de generate_project y lo guarda en 'project_file'
+    Returns: diccionario con el resumen del proyecto generado (nº de habitaciones, grupos y dispositivos por clase)
+    """
+    project = generate_project(**kwargs)
+    with open(project_file, "w") as f:
+        json.dump(project, f, indent=1)
+    return summary(project)
+
+
+def write_exchange_files(exchange_folder: str, modo_iv: int = HEATING):
+    """
+    Crea en 'exchange_folder' el archivo del modo Frío/Calor con el modo 'modo_iv'. El proyecto sintético lee el modo
+    de ese archivo y phoenix_init sólo lo crea vacío
+    """
+    iv_file = exchange_folder + IV_FILE
+    os.makedirs(os.path.dirname(iv_file), exist_ok=True)
+    with open(iv_file, "w") as f:
+        f.write(str(modo_iv))
+
+
+def summary(project: Dict) -> Dict:
+    prj = project["project"]
+    rooms = [room for bld in prj["buildings"].values() for dwell in bld["dwellings"].values()
+             for room in dwell["rooms"].values()]
+    devices = {}
+    for bus in prj["buses"].values():
+        for dev in bus["devices"].values():
+            devices[dev["class"]] = devices.get(dev["class"], 0) + 1
+    return {"rooms": len(rooms), "groups": len({g for room in rooms for g in room["groups"]}), "devices": devices}
@@ -3,10 +3,14 @@ import json
 from bisect import bisect
 
 import phoenix_init as phi
-from mb_utils.mb_utils import get_value, save_value, set_value, get_h, get_dp, get_roomgroup_values, \
-    update_xch_files_from_devices, get_regmap
+from mb_utils.mb_utils import get_value, save_value, set_value, get_roomgroup_values, update_xch_files_from_devices, \
+    get_regmap
+from mb_utils import exchange, psychrometrics
 from regops.regops import set_hb, set_lb
-from project_elements.building import get_temp_exterior, get_hrel_exterior, get_h_exterior, get_modo_iv
+from publish import metrics
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
 
 
 class Generator(phi.MBDevice):
@@ -27,6 +31,15 @@ class Generator(phi.MBDevice):
     alarm_info: Diccionario con el tipo de registro, la dirección del registro ModBus y los valores
     de alarma del Generador
     """
+    __slots__ = ("bus_id", "device_id", "groups", "onoff_source", "onoff_st", "on_value", "off_value",
+                 "manual_onoff_mode", "manual_onoff", "demanda_source", "sp_source", "sp", "manual_sp_mode",
+                 "manual_sp", "dwh_temp_source", "dhw_sp", "dhw_t", "iv_source", "iv_target", "heating_value",
+                 "cooling_value", "iv", "manual_iv_mode", "manual_iv", "alarm_source", "alarm", "t_ext_source", "t_ext",
+                 "supply_water_temp_source", "supply_water_temp", "return_water_temp_source", "return_water_temp",
+                 "t_inercia_source", "t_inercia", "water_flow_source", "water_flow", "eelectrica_consumida_source",
+                 "eelectrica_consumida", "ecooling_consumida_source", "ecooling_consumida", "eheating_consumida_source",
+                 "eheating_consumida", "edhw_consumida_source", "edhw_consumida", "cop_source", "cop", "eer_source",
+                 "eer")
 
     def __init__(self,
                  bus_id: str = "",
@@ -113,16 +126,16 @@ class Generator(phi.MBDevice):
         elif current_st == self.off_value:
             self.onoff_st = phi.OFF
         else:
-            print(f"ERROR {__file__} - Posible error de definición de los valores de On y Off "
-                  f"para {self.name}. Ver JSON {self.brand}-{self.model}.JSON")
+            log.error("Posible error de definición de los valores de On y Off para %s. Ver JSON %s-%s.JSON",
+                      self.name, self.brand, self.model)
             return
         if new_st_value is not None:
             if new_st_value not in [phi.OFF, phi.ON]:
-                print(f"{self.name}: Error accionando la bomba de calor {self.name} con el valor {new_st_value}")
+                log.error("%s: Error accionando la bomba de calor %s con el valor %s",
+                          self.name, self.name, new_st_value)
             else:
                 gen_onoff_value = self.on_value if new_st_value == phi.ON else self.off_value
                 res = await set_value(target, gen_onoff_value)
-                dbval = save_value(target, gen_onoff_value)
                 self.onoff_st = new_st_value
 
         return self.onoff_st
@@ -135,7 +148,7 @@ class Generator(phi.MBDevice):
         """
         if self.manual_onoff_mode and self.manual_onoff is not None:
             operations = ("Apagando", "Encendiendo")
-            print(f"{operations[self.manual_onoff]} MANUALMENTE el generador {self.name}")
+            log.debug("%s MANUALMENTE el generador %s", operations[self.manual_onoff], self.name)
             await self.onoff(self.manual_onoff)
             return 1
         return 0
@@ -164,9 +177,9 @@ class Generator(phi.MBDevice):
                   "adr": adr}
         current_iv_mode = get_value(source)  # Valor del modo IV en el generador. No confundir con el modo IV del
         # sistema ya que podrían tener distintos valores.
-        print(f"Valor actual IV en la ecodan: {current_iv_mode} - {type(current_iv_mode)}")
-        print(f"Valor actual modo refr en la ecodan: {self.cooling_value} - {type(self.cooling_value)}")
-        print(f"Valor actual modo calefen la ecodan: {self.heating_value} - {type(self.heating_value)}")
+        log.debug("Valor actual IV en la ecodan: %s - %s", current_iv_mode, type(current_iv_mode))
+        log.debug("Valor actual modo refr en la ecodan: %s - %s", self.cooling_value, type(self.cooling_value))
+        log.debug("Valor actual modo calefen la ecodan: %s - %s", self.heating_value, type(self.heating_value))
         if current_iv_mode is None:  # No se ha leído el modo de funcionamiento
             return
         if current_iv_mode == self.cooling_value:
@@ -174,8 +187,8 @@ class Generator(phi.MBDevice):
         elif current_iv_mode == self.heating_value:
             self.iv = phi.HEATING
         else:
-            print(f"ERROR {__file__} - Posible error de definición de los valores de calefacción o refrigeración "
-                  f"en {self.name}. Ver JSON {self.brand}-{self.model}.JSON")
+            log.error("Posible error de definición de los valores de calefacción o refrigeración en %s. Ver JSON "
+                      "%s-%s.JSON", self.name, self.brand, self.model)
         iv_set_datatype = self.iv_target[0]
         iv_set_adr = self.iv_target[1]
         target = {"bus": int(self.bus_id),
@@ -185,16 +198,16 @@ class Generator(phi.MBDevice):
         if new_iv_mode is None:
             return self.iv
         elif new_iv_mode == phi.HEATING:
-            res = await set_value(target, self.heating_value)
+            res = await set_value(target, self.heating_value, group=True)
             self.iv = phi.HEATING
         elif new_iv_mode == phi.COOLING:
-            res = await set_value(target, self.cooling_value)
+            res = await set_value(target, self.cooling_value, group=True)
             self.iv = phi.COOLING
         else:
-            print(f"ERROR {__file__}\n\tValor no válido, {new_iv_mode}, para modo Calefacción/Refrigeración "
-                  f"en {self.name}. Ver JSON {self.brand}-{self.model}.JSON")
+            log.error("Valor no válido, %s, para modo Calefacción/Refrigeración en %s. Ver JSON %s-%s.JSON",
+                      new_iv_mode, self.name, self.brand, self.model)
             # self.iv = current_iv_mode
-            self.iv = phi.system_iv
+            self.iv = phi.cycle.system_iv
         dbval = save_value(target, self.iv)
         return self.iv
 
@@ -206,7 +219,7 @@ class Generator(phi.MBDevice):
         """
         if self.manual_iv_mode and self.manual_iv is not None:
             operations = ("Calefaccion", "Refrigeracion")
-            print(f"Activando {operations[self.manual_iv]} MANUALMENTE en el generador {self.name}")
+            log.debug("Activando %s MANUALMENTE en el generador %s", operations[self.manual_iv], self.name)
             await self.iv_mode(self.manual_iv)
             return 1
         return 0
@@ -232,8 +245,8 @@ class Generator(phi.MBDevice):
 
         if new_sp is not None:
             if new_sp > phi.TMAX_IMPUL_CALEF or new_sp < phi.TMIN_IMPUL_REFR:
-                print(f"{self.name}: Error escribiendo la consigna {new_sp} para el generador {self.name}.\n"
-                      f"Está fuera de los límites [{phi.TMIN_IMPUL_REFR} - {phi.TMAX_IMPUL_CALEF}]")
+                log.error("%s: Error escribiendo la consigna %s para el generador %s.\nEstá fuera de los límites [%s "
+                          "- %s]", self.name, new_sp, self.name, phi.TMIN_IMPUL_REFR, phi.TMAX_IMPUL_CALEF)
                 # Se limita a la temperatura máxima en calefacción y a la mínima en refrigeración
                 self.sp = phi.TMAX_IMPUL_CALEF if self.iv == phi.HEATING else phi.TMIN_IMPUL_REFR
             else:
@@ -251,7 +264,7 @@ class Generator(phi.MBDevice):
 
         """
         if self.manual_sp_mode and self.manual_sp is not None:
-            print(f"Aplicando la consigna {self.manual_sp} MANUALMENTE en el generador {self.name}")
+            log.debug("Aplicando la consigna %s MANUALMENTE en el generador %s", self.manual_sp, self.name)
             await self.set_sp(self.manual_sp)
             return 1
         return 0
@@ -276,8 +289,8 @@ class Generator(phi.MBDevice):
 
         if new_dhwsp is not None:
             if new_dhwsp > phi.TMAX_ACS:
-                print(f"{self.name}: Error escribiendo la consigna de ACS {new_dhwsp} para el generador {self.name}.\n"
-                      f"Está fuera del límite {phi.TMAX_ACS}.")
+                log.error("%s: Error escribiendo la consigna de ACS %s para el generador %s.\nEstá fuera del límite "
+                          "%s.", self.name, new_dhwsp, self.name, phi.TMAX_ACS)
                 # Se limita a la temperatura máxima en calefacción y a la mínima en refrigeración
                 self.dhw_sp = phi.TMAX_ACS
             else:
@@ -328,7 +341,7 @@ class Generator(phi.MBDevice):
             if current_attr_val is not None:
                 # self.__setattr__(v, current_attr_val)
                 setattr(self, v, current_attr_val)
-                print(f"{self.name}. Valor de {v}:\t{current_attr_val}")
+                log.debug("%s. Valor de %s:\t%s", self.name, v, current_attr_val)
         return 1
 
     async def upload(self):
@@ -350,21 +363,18 @@ class Generator(phi.MBDevice):
 
         Returns: resultado de la escritura modbus de los valores actualizados o los valores manuales.
         """
-        system_iv = await get_modo_iv()  # Modo frío=1 / calor=0 del sistema
-        print(f"DEBUGGING {__file__} - Modo de funcionamiento del sistema asociado al "
-              f"generador {self.name} = {system_iv}")
+        system_iv = phi.cycle.system_iv  # Modo frío=1 / calor=0 del sistema, obtenido al empezar el ciclo
+        log.debug("Modo de funcionamiento del sistema asociado al generador %s = %s", self.name, system_iv)
 
         if not self.groups:
-            print(f"ERROR {__file__} - No se ha definido grupo de habitaciones para {self.name}")
+            log.error("No se ha definido grupo de habitaciones para %s", self.name)
 
-        with open(phi.ROOMGROUPS_VALUES_FILE, "r") as f:
-            roomgroups_values = json.load(f)
+        roomgroups_values = phi.roomgroups_values  # Resultados del ciclo (update_roomgroups_values)
 
         roomgroup_id = self.groups[0]  # No puede asociarse más de 1 grupo de habitaciones al generador
         roomgroup = roomgroups_values.get(roomgroup_id)  # Objeto del grupo RoomGroup
         if roomgroup is None:
-            print(f"ERROR {__file__} - El grupo de habitaciones {roomgroup_id} asociado {self.name} no "
-                  f"tiene información")
+            log.error("El grupo de habitaciones %s asociado %s no tiene información", roomgroup_id, self.name)
             return
         group_supply_water_setpoint = roomgroup.get("water_sp")
         if self.manual_iv_mode:
@@ -428,6 +438,14 @@ class UFHCController(phi.MBDevice):
                  'coff10', 'coff11', 'coff12',
                  'dp1', 'dp2', 'dp3', 'dp4', 'dp5', 'dp6', 'dp7', 'dp8', 'dp9', 'dp10', 'dp11', 'dp12',
                  'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'h7', 'h8', 'h9', 'h10', 'h11', 'h12')
+    channels = 12  # Nº de canales de la centralita
+    channel_read_quantities = ("sp", "rt", "rh", "ft", "st", "coff")  # Magnitudes de cada canal leídas por ModBus
+    channel_quantities = channel_read_quantities + ("dp", "h")  # Más punto de rocío y entalpía calculados
+    SP, RT, RH = 0, 1, 2  # Índices de channel_values
+    # Los atributos de los canales (sp1...h12 y ch1...ch12) son vistas de channel_values y no ocupan espacio en las
+    # instancias
+    __slots__ = ("bus_id", "device_id", "groups", "channel_values", "channel_handles", "active_channels", "iv_source",
+                 "iv", "pump_source", "pump") + tuple(f"ch{ch}_source" for ch in range(1, channels + 1))
 
     def __init__(self,
                  bus_id: str = "",
@@ -445,6 +463,10 @@ class UFHCController(phi.MBDevice):
         self.groups = groups
         self.brand = brand
         self.model = model
+        # Valores de los canales: una lista por magnitud (channel_quantities) con un valor por canal. Los atributos
+        # sp1...h12 y ch1...ch12 son vistas de estas listas (channel_views)
+        self.channel_values = [[None] * self.channels for _ in self.channel_quantities]
+        self.channel_handles = None  # Registros de los canales activos en datadb (resolve_channel_handles)
         for attr in self.attr_list:
             self.__setattr__(attr, None)
         self.active_channels = []  # Lista con los canales activos del controlador
@@ -452,30 +474,43 @@ class UFHCController(phi.MBDevice):
         self.iv = None
         self.pump_source = None
         self.pump = None
-        self.ch1_source = None
-        self.ch1 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch2_source = None
-        self.ch2 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch3_source = None
-        self.ch3 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch4_source = None
-        self.ch4 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch5_source = None
-        self.ch5 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch6_source = None
-        self.ch6 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch7_source = None
-        self.ch7 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch8_source = None
-        self.ch8 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch9_source = None
-        self.ch9 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch10_source = None
-        self.ch10 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch11_source = None
-        self.ch11 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        self.ch12_source = None
-        self.ch12 = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
+        for ch in range(1, self.channels + 1):
+            setattr(self, f"ch{ch}_source", None)  # {magnitud: (tipo de registro, dirección)}. Ver ufhccontrollers.json
+
+    def __setstate__(self, state):
+        """
+        Las instancias guardadas antes de channel_values tienen los atributos de los canales en el diccionario de la
+        instancia
+        """
+        if isinstance(state, dict):
+            if "channel_values" not in state:
+                state["channel_values"] = [[state.pop(f"{quantity}{ch}", None) for ch in range(1, self.channels + 1)]
+                                           for quantity in self.channel_quantities]
+                for ch in range(1, self.channels + 1):
+                    state.pop(f"ch{ch}", None)
+            state.setdefault("channel_handles", None)
+        super().__setstate__(state)
+
+    def channel_info(self, channel: int) -> phi.Dict:
+        """
+        Diccionario con las magnitudes leídas del canal 'channel' (vista chx)
+        """
+        return {quantity: self.channel_values[idx][channel - 1]
+                for idx, quantity in enumerate(self.channel_read_quantities)}
+
+    def resolve_channel_handles(self):
+        """
+        Resuelve una sola vez las claves de datadb de las magnitudes leídas de los canales activos:
+        [(índice de la magnitud, índice del canal, tipo de registro, dirección)]
+        """
+        handles = []
+        for channel in self.active_channels:
+            ch_sources = getattr(self, f"ch{channel}_source", None) or {}
+            for idx, quantity in enumerate(self.channel_read_quantities):
+                source = ch_sources.get(quantity)
+                if source is not None:
+                    handles.append((idx, channel - 1, source[0], str(source[1])))
+        self.channel_handles = handles
 
     async def get_active_channels(self):
         """
@@ -484,24 +519,24 @@ class UFHCController(phi.MBDevice):
 
         """
         if not self.groups:
-            print(f"ERROR {__file__} - No se ha definido grupo de habitaciones para {self.name}")
+            log.error("No se ha definido grupo de habitaciones para %s", self.name)
 
         # with open(phi.ROOMGROUPS_VALUES_FILE, "r") as f:
         #     roomgroups_values = json.load(f)
 
         roomgroup_id = self.groups[0]  # No puede asociarse más de 1 grupo de habitaciones al controlador
         roomgroup = phi.all_room_groups.get(roomgroup_id)  # Objeto del grupo RoomGroup
-        print(f"(devices.py/get_active_channels). Importando roomgroup de {self.name} / tipo {type(roomgroup)}")
+        log.debug("(devices.py/get_active_channels). Importando roomgroup de %s / tipo %s", self.name, type(roomgroup))
         if roomgroup is None:
-            print(f"ERROR {__file__} - El grupo de habitaciones {roomgroup_id} asociado {self.name} no "
-                  f"tiene información")
+            log.error("El grupo de habitaciones %s asociado %s no tiene información", roomgroup_id, self.name)
             return
         rooms = roomgroup.roomgroup  # Lista con las habitaciones del grupo (objetos Room)
         for room in rooms:
             channel = room.rt_source.get("adr")  # el adr de rt_source coincide con el canal
             if channel is not None:
                 self.active_channels.append(channel)
-        print(f"(devices.py). Canales activos Controlador {self.name}: {self.active_channels}")
+        self.channel_handles = None  # Se resuelven de nuevo con los canales activos
+        log.debug("(devices.py). Canales activos Controlador %s: %s", self.name, self.active_channels)
 
     async def iv_mode(self, new_iv_mode: [int, None] = None):
         """
@@ -530,7 +565,7 @@ class UFHCController(phi.MBDevice):
         if new_iv_mode is None:
             self.iv = current_iv_mode
         elif new_iv_mode in [phi.COOLING, phi.HEATING]:
-            res = await set_value(target, new_iv_mode)
+            res = await set_value(target, new_iv_mode, group=True)
             self.iv = new_iv_mode
 
         dbval = save_value(target, self.iv)
@@ -556,70 +591,51 @@ class UFHCController(phi.MBDevice):
 
         return self.pump
 
-    async def set_channel_info(self, channel: int) -> [phi.Dict, None]:
+    async def set_channels_info(self):
         """
-        Actualiza los diccionarios de cada canal con la consigna, temperatura ambiente, humedad relativa,
-        temperatura del suelo, estado del actuador y autorización para refrigeración
+        Actualiza en una sola pasada, con los registros resueltos en resolve_channel_handles, la consigna,
+        temperatura ambiente, humedad relativa, temperatura del suelo, estado del actuador y autorización para
+        refrigeración de los canales activos, y calcula su punto de rocío y su entalpía
         Si el modelo es X147, la consigna es la leída por Modbus, convertida a gradC + 2
-        Param:
-            channel: Canal a actualizar
-        Returns:
-            Diccionario con la información del canal
-            None cuando el canal no se utiliza en el proyecto
-        """
-        channel_source_attr = f"ch{channel}_source"
-        channel_attr = f"ch{channel}"
-        channel_info = {"sp": None, "rt": None, "rh": None, "ft": None, "st": None, "coff": None}
-        channel_val_attrs = {magnitud: f"{magnitud}{channel}" for magnitud in tuple(channel_info.keys())}
-        # ch_sources = self.__getattribute__(channel_source_attr)
-        ch_sources = getattr(self, channel_source_attr)
-        print(f"(método set_channel_info) Valor almacenado modo IV X147: {self.iv} ")
-
-        for key, value in ch_sources.items():
-            datatype = value[0]
-            adr = value[1]
-            source = {"bus": int(self.bus_id),
-                      "device": int(self.device_id),
-                      "datatype": datatype,
-                      "adr": adr}
-            # current_value = get_value(source)
-            current_value = get_value(source)
-            if current_value not in (None, ""):
-                if "sp" in key and "x147" in self.model.lower() and self.iv:
-                    print(f"(método set_channel_info) Valor almacenado consigna X147:sl-{self.slave} - canal: {channel}"
-                          f" {current_value} / ({type(current_value)})")
-                    current_value += 2.0  # En refrigeración, la consigna de los ttos es 2 gradC superior a la leída
-                    print(f"(método set_channel_info) Valor corregido consigna X147: {current_value} "
-                          f"({type(current_value)})")
-            else:
+        """
+        if self.channel_handles is None:
+            self.resolve_channel_handles()
+        try:
+            data = phi.datadb["buses"][str(self.bus_id)][str(self.device_id)]["data"]
+        except (KeyError, TypeError):  # Dispositivo sin lecturas
+            data = {}
+        x147_cooling = "x147" in self.model.lower() and self.iv
+        log.debug("(método set_channels_info) Valor almacenado modo IV X147: %s", self.iv)
+        values = self.channel_values
+        for idx, ch_idx, datatype, adr in self.channel_handles:
+            current_value = data.get(datatype, {}).get(adr)
+            if current_value in (None, ""):
                 current_value = phi.READ_ERROR_VALUE  # 08/07/2023 mala lectura
+            elif idx == self.SP and x147_cooling:
+                current_value += 2.0  # En refrigeración, la consigna de los ttos es 2 gradC superior a la leída
+                log.debug("(método set_channels_info) Valor corregido consigna X147:sl-%s - canal: %s %s",
+                          self.slave, ch_idx + 1, current_value)
+            values[idx][ch_idx] = current_value  # Actualiza las vistas spx, rtx, etc. siendo x el canal
 
-            # if current_value is None:  # El canal no se utiliza
-            #     return
-
-            setattr(self, channel_val_attrs.get(key), current_value)  # actualiza los atributos spx, rtx,
-            # etc. siendo x el canal
-            channel_info[key] = current_value
-        # print(f"Método set_channel_info UFHCController.\nCanal {channel}\nOrigen de datos: {ch_sources}")
-        setattr(self, channel_attr, channel_info)
         # Si los valores de rt y rh son válidos, se calcula el punto de rocío y la entalpía del canal
-        rt = getattr(self, channel_val_attrs.get("rt"))
-        rh = getattr(self, channel_val_attrs.get("rh"))
-        if rh and rh != phi.READ_ERROR_VALUE:
-            rh = rh[1]  # Se toma solo el byte bajo
-        channel_h_attr = f"h{channel}"
-        channel_dp_attr = f"dp{channel}"
-        channel_h = 0
-        channel_dp = None
-
-        if rt is not None and rh not in [None, '0', 0]:
-            if 100 > float(rt) > -100:
-                channel_h = await get_h(float(rt), float(rh))
-                channel_dp = await get_dp(float(rt), float(rh))
-        setattr(self, channel_h_attr, channel_h)
-        setattr(self, channel_dp_attr, channel_dp)
-
-        return getattr(self, channel_attr)
+        dp_values, h_values = values[-2], values[-1]
+        valid_channels = []  # Índices de los canales activos con lecturas válidas
+        pairs = []  # (temperatura, humedad) de esos canales
+        for channel in self.active_channels:
+            ch_idx = channel - 1
+            rt = values[self.RT][ch_idx]
+            rh = values[self.RH][ch_idx]
+            if rh and rh != phi.READ_ERROR_VALUE:
+                rh = rh[1]  # Se toma solo el byte bajo
+            h_values[ch_idx] = 0
+            dp_values[ch_idx] = None
+            if rt is not None and rh not in [None, '0', 0, phi.READ_ERROR_VALUE]:  # Sin lectura no hay cálculo
+                if 100 > float(rt) > -100:
+                    valid_channels.append(ch_idx)
+                    pairs.append((float(rt), float(rh)))
+        for ch_idx, (channel_h, channel_dp) in zip(valid_channels, psychrometrics.batch(pairs)):
+            h_values[ch_idx] = channel_h
+            dp_values[ch_idx] = channel_dp
 
     async def upload(self):
         """
@@ -634,25 +650,23 @@ class UFHCController(phi.MBDevice):
         await self.iv_mode(self.iv)
         # spch_sources = (("sp" + str(idx + 1), "ch" + str(idx + 1) + "_source") for idx in range(12))
         # Propago únicamente la información de los canales activos
-        spch_sources = (("sp" + str(idx), "ch" + str(idx) + "_source") for idx in self.active_channels)
-        for sp, src in spch_sources:
-            ch_info = getattr(self, src)
-            sp_value = getattr(self, sp)
-            print(f"\n\tValor actual de la consigna de {ch_info} antes de terminar upload:"
-                  f" {sp_value}/{type(sp_value)}\n")
+        for channel in self.active_channels:
+            ch_info = getattr(self, f"ch{channel}_source")
+            sp_value = self.channel_values[self.SP][channel - 1]
+            log.debug("Valor actual de la consigna de %s antes de terminar upload: %s/%s",
+                      ch_info, sp_value, type(sp_value))
             sp_value_corr = sp_value
             if sp_value is not None and sp_value:
                 if float(sp_value) > 950:
                     continue
                 else:
                     if "x147" in self.model.lower() and self.iv:
-                        print(
-                            f"(método x147 upload) Valor real consigna:sl-{self.slave} - canal: {src}"
-                            f" {sp_value} / ({type(sp_value)})")
+                        log.debug("(método x147 upload) Valor real consigna:sl-%s - canal: %s %s / (%s)",
+                                  self.slave, channel, sp_value, type(sp_value))
                         sp_value_corr = float(sp_value) - 2.0  # En refrig, la consigna a escribir es 2 gradC
                         # inferior a la de los ttos
-                        print(f"(método set_channel_info) Valor consigna a escribir X147: {sp_value_corr} "
-                              f"({type(sp_value_corr)})")
+                        log.debug("(método set_channel_info) Valor consigna a escribir X147: %s (%s)",
+                                  sp_value_corr, type(sp_value_corr))
 
             if None not in (ch_info, sp_value):
                 sp_target = ch_info.get("sp")
@@ -662,11 +676,8 @@ class UFHCController(phi.MBDevice):
                           "device": int(self.device_id),
                           "datatype": datatype,
                           "adr": adr}
-                print(f"UFHCController {self.name}. uploading value {sp_value_corr}")
+                log.debug("UFHCController %s. uploading value %s", self.name, sp_value_corr)
                 uploaded_value = await set_value(target, sp_value_corr)
-                dbval = save_value(target, sp_value_corr)
-                uploaded_value = get_value(target)
-                print(f"UPLOAD - Comprobando valor de atributo escrito: {uploaded_value}")
 
         return 1
 
@@ -686,44 +697,42 @@ class UFHCController(phi.MBDevice):
 
         """
         # Compruebo si el atributo existe
-        attributes = self.__dict__.keys()
-        if attr not in attributes:
-            print(f"{attr} NO es un atributo de {self.name}")
+        if not hasattr(self, attr):
+            log.error("%s NO es un atributo de %s", attr, self.name)
             return 0
         attr_dev_file = f"{phi.EXCHANGE_FOLDER}/{self.bus_id}/{self.slave}/{attr}"
         if not phi.os.path.isfile(attr_dev_file):
-            print(f"ERROR {__file__}\nNo se encuentra el archivo {attr_dev_file}")
+            log.error("No se encuentra el archivo %s", attr_dev_file)
             return 0
         current_attr_val = getattr(self, attr)  # Valor leído en el dispositivo
-        print(f"\n\tValor actual del atributo {attr} antes de terminar update:"
-              f" {current_attr_val}/{type(current_attr_val)}\n"
-              f"\tArchivo del que se recoge el atributo: {attr_dev_file}\n")
+        log.debug("Valor actual del atributo %s antes de terminar update: %s/%s\n\tArchivo del que se recoge el "
+                  "atributo: %s", attr, current_attr_val, type(current_attr_val), attr_dev_file)
         with open(attr_dev_file, "r") as attrf:
             xch_value = attrf.read().strip()  # Valor compartido con la Web
-            print(f"Valor almacenado en {attr_dev_file} de {self.name}: {xch_value}")
+            log.debug("Valor almacenado en %s de %s: %s", attr_dev_file, self.name, xch_value)
         if not xch_value:
-            print("\n\t\tel archivo de intercambio está vacío\n")
+            log.debug("el archivo de intercambio está vacío")
             xch_value = current_attr_val
             with open(attr_dev_file, "w") as f:
                 f.write(str(current_attr_val))
         # Gestiono las consignas, que tienen un tratamiento distinto al resto
         if "sp" in attr:
-            print(f"Valor del atributo leído en el dispositivo: {current_attr_val} / {type(current_attr_val)}")
+            log.debug("Valor del atributo leído en el dispositivo: %s / %s", current_attr_val, type(current_attr_val))
             attr_dev_bus_file = f"{attr_dev_file}_bus"  # Debe comprobarse si hay cambios desde la web
             if not phi.os.path.isfile(attr_dev_bus_file):
-                print(f"ERROR {__file__}\nNo se encuentra el archivo {attr_dev_bus_file}")
-                print(f"Se actualiza con el valor leído en {attr_dev_file}: {current_attr_val}")
+                log.error("No se encuentra el archivo %s", attr_dev_bus_file)
+                log.debug("Se actualiza con el valor leído en %s: %s", attr_dev_file, current_attr_val)
                 try:
                     with open(attr_dev_bus_file, "w") as f:
                         f.write(str(current_attr_val))
                 except FileNotFoundError as e:
-                    print(f"\n\tError guardando valor en spx_bus file\n{e}\n")
+                    log.error("Error guardando valor en spx_bus file\n%s", e)
                 stored_sp_bus_val = current_attr_val
             else:
                 with open(attr_dev_bus_file, "r") as f:
                     stored_sp_bus_val = f.read().strip()  # Valor leído anteriormente en el dispositivo
-            print(f"Valor almacenado en {attr_dev_bus_file} de {self.name}: {stored_sp_bus_val} / "
-                  f"{type(stored_sp_bus_val)}")
+            log.debug("Valor almacenado en %s de %s: %s / %s",
+                      attr_dev_bus_file, self.name, stored_sp_bus_val, type(stored_sp_bus_val))
             if not stored_sp_bus_val:
                 stored_sp_bus_val = current_attr_val
                 with open(attr_dev_bus_file, "w") as f:
@@ -732,40 +741,45 @@ class UFHCController(phi.MBDevice):
             # if float(stored_sp_bus_val) != float(current_attr_val):  # El usuario ha cambiado la consigna.
             if float(stored_sp_bus_val) != current_attr_val:  # El usuario ha cambiado la consigna.
                 # Se actualizan con el nuevo valor los archivos spx, spx_bus y el dispositivo
-                print(f"{self.name} - Consigna {stored_sp_bus_val} cambiada en termostato a {current_attr_val}")
+                log.debug("%s - Consigna %s cambiada en termostato a %s",
+                          self.name, stored_sp_bus_val, current_attr_val)
                 with open(attr_dev_bus_file, "w") as attdbf:
                     attdbf.write(str(current_attr_val))
                 with open(attr_dev_file, "w") as attdf:
                     attdf.write(str(current_attr_val))
+                metrics.exchange_writes.inc(2, cls=self.__class__.__name__)
                 setattr(self, attr, current_attr_val)  # Se actualiza el atributo
                 return 1
             elif float(xch_value) != current_attr_val:  # Se ha cambiado desde la Web.
                 # Se actualiza el archivo spx_bus
-                print(f"{self.name} - Consigna {stored_sp_bus_val} cambiada desde la web a {xch_value}")
+                log.debug("%s - Consigna %s cambiada desde la web a %s", self.name, stored_sp_bus_val, xch_value)
                 setattr(self, attr, float(xch_value))  # Se actualiza el atributo
-                print(f"Atributo {attr} actualizado desde la web a {getattr(self, attr)}/{type(getattr(self, attr))}")
+                log.debug("Atributo %s actualizado desde la web a %s/%s",
+                          attr, getattr(self, attr), type(getattr(self, attr)))
                 with open(attr_dev_bus_file, "w") as attdbf:
                     attdbf.write(str(xch_value))  # Se actualiza el archivo
                 with open(attr_dev_file, "w") as attdbf:
                     attdbf.write(str(xch_value))  # Se actualiza el archivo
-                print("\n\tCOMPROBANDO ACTUALIZACIÓN DE ARCHIVO")
+                metrics.exchange_writes.inc(2, cls=self.__class__.__name__)
+                log.debug("COMPROBANDO ACTUALIZACIÓN DE ARCHIVO")
                 with open(attr_dev_bus_file, "r") as attdbf:
                     file_content = attdbf.read()
-                    print(f"\n\tValor guardado en el archivo leído desde el termostato {file_content}")
+                    log.debug("Valor guardado en el archivo leído desde el termostato %s", file_content)
                 return 1
             else:
-                print(f"No hay que actualizar {attr} en {self.name}")
+                log.debug("No hay que actualizar %s en %s", attr, self.name)
                 return 0
         # Gestiono el resto de atributos
         if str(current_attr_val) == xch_value:
-            print(f"Valor leido en archivo: {xch_value} IGUAL A\nValor actual {current_attr_val}")
+            log.debug("Valor leido en archivo: %s IGUAL A\nValor actual %s", xch_value, current_attr_val)
             # No cambio el archivo
             return 0
         else:
-            print(f"Valor leido en archivo: {xch_value} DISTINTO A\nValor actual {current_attr_val}")
+            log.debug("Valor leido en archivo: %s DISTINTO A\nValor actual %s", xch_value, current_attr_val)
             with open(attr_dev_file, "w") as attrf:
-                print(f"Actualizando archivo {attr_dev_file} desde método de clase de {self.name}")
+                log.debug("Actualizando archivo %s desde método de clase de %s", attr_dev_file, self.name)
                 attrf.write(str(current_attr_val))
+                metrics.exchange_writes.inc(cls=self.__class__.__name__)
                 setattr(self, attr, current_attr_val)  # Se actualiza el atributo
                 return 1
 
@@ -778,18 +792,18 @@ class UFHCController(phi.MBDevice):
             await self.get_active_channels()
 
         # system_iv = get_modo_iv()  # Modo frío=1 / calor=0 del sistema
-        print(f"DEBUGGING {__file__} - Modo de funcionamiento del sistema asociado al "
-              f"Controlador UFHC {self.name} = {phi.system_iv}")
-        await self.iv_mode(phi.system_iv)  # Actualizo el modo IV de la centralita
+        log.debug("Modo de funcionamiento del sistema asociado al Controlador UFHC %s = %s", self.name,
+                  phi.cycle.system_iv)
+        await self.iv_mode(phi.cycle.system_iv)  # Actualizo el modo IV de la centralita
         await self.update_attr_file("iv")  # Actualizo archivo de intercambio iv de la centralita
         await self.pump_st()  # Actualizo el estado de la bomba
         await self.update_attr_file("pump")  # Actualizo archivo de intercambio iv de la centralita
         # Actualizo solo la información de los canales activos
-        files_to_update = []
+        await self.set_channels_info()
         for ch in self.active_channels:
-            await self.set_channel_info(ch)
             channel_files = [f"sp{ch}", f"rt{ch}", f"rh{ch}", f"ft{ch}", f"st{ch}", f"coff{ch}"]
-            print(f"(devices.py - UFHCController) Actualizando información en archivos de {self.name}. Canal {ch}")
+            log.debug("(devices.py - UFHCController) Actualizando información en archivos de %s. Canal %s",
+                      self.name, ch)
             for f in channel_files:
                 await self.update_attr_file(f)
         await self.upload()  # Se cargan los nuevos valores en el dispositivo
@@ -813,20 +827,42 @@ class UFHCController(phi.MBDevice):
         # for ch in range(12):
         # Represento únicamente los canales activos
         for ch in self.active_channels:
-            channel_source_attr = f"ch{ch}_source"
-            # attr_value = self.__getattribute__(channel_source_attr)
-            attr_value = getattr(self, channel_source_attr)
-            if attr_value is not None:
-                channel_attr = f"ch{ch}"
-                # channel_info = self.__getattribute__(channel_attr)
-                channel_info = getattr(self, channel_attr)
-                dev_info += f"\n\tCanal {ch}:\n\t\t{channel_info}"
+            if getattr(self, f"ch{ch}_source") is not None:
+                dev_info += f"\n\tCanal {ch}:\n\t\t{self.channel_info(ch)}"
 
         return dev_info
 
 
+def channel_views(cls):
+    """
+    Crea en la clase 'cls' (UFHCController) los atributos sp1...h12, vistas de cls.channel_values, y ch1...ch12,
+    diccionarios con las magnitudes leídas de cada canal
+    """
+    def value_view(idx: int, ch_idx: int):
+        def getter(self):
+            return self.channel_values[idx][ch_idx]
+
+        def setter(self, value):
+            self.channel_values[idx][ch_idx] = value
+        return property(getter, setter)
+
+    def info_view(channel: int):
+        def setter(self, info: phi.Dict):
+            for idx, quantity in enumerate(cls.channel_read_quantities):
+                self.channel_values[idx][channel - 1] = info.get(quantity)
+        return property(lambda self: self.channel_info(channel), setter)
+
+    for ch in range(1, cls.channels + 1):
+        for idx, quantity in enumerate(cls.channel_quantities):
+            setattr(cls, f"{quantity}{ch}", value_view(idx, ch - 1))
+        setattr(cls, f"ch{ch}", info_view(ch))
+
+
+channel_views(UFHCController)
+
+
 class Split(phi.MBDevice):
-    pass
+    __slots__ = ()
 
 
 class HeatRecoveryUnit(phi.MBDevice):
@@ -859,6 +895,14 @@ class HeatRecoveryUnit(phi.MBDevice):
     Param: groups: grupos de habitaciones vinculados al dispositivo. Cada recuperador sólo puede estar asociado a
     un grupo de habitaciones. Si se introduce más de 1, sólo se utiliza el primero de ellos.
     """
+    __slots__ = ("bus_id", "device_id", "groups", "onoff", "hru_modes", "hru_mode", "man_hru_mode_st", "man_hru_mode",
+                 "manual", "flow_target", "supply_flow_source", "supply_flow", "exhaust_flow_source", "exhaust_flow",
+                 "manual_airflow", "otemp_source", "itemp_source", "supply_pres_source", "supply_pres",
+                 "exhaust_pres_source", "exhaust_pres", "filter_st_source", "error_source", "speed1_source",
+                 "speed2_source", "speed3_source", "speed", "manual_speed", "valv_source", "valv_st", "man_valv_pos",
+                 "bypass_target", "bypass_source", "bypass_st", "dampers_source", "dampers_st", "man_dampers_pos",
+                 "remote_onoff_st_source", "remote_onoff", "aux_ed2_source", "aux_ed2_st", "aux_ed3_source",
+                 "aux_ed3_st", "max_airflow")
 
     def __init__(self,
                  bus_id: str = "",
@@ -982,7 +1026,7 @@ class HeatRecoveryUnit(phi.MBDevice):
 
         Returns: Velocidad actual del recuperador
         """
-        print(f"DEBUGGING {__file__}: Fijando velocidad recuperador - {new_speed}")
+        log.debug("Fijando velocidad recuperador - %s", new_speed)
         sources = {1: self.speed1_source, 2: self.speed2_source, 3: self.speed3_source}
         if all([x is None for x in sources.values()]):
             return  # El recuperador no trabaja con velocidades, sino con caudales
@@ -999,17 +1043,17 @@ class HeatRecoveryUnit(phi.MBDevice):
                       "adr": speed_adr}
             spd_value = get_value(target)
             if new_speed == 0:
-                print(f"DEBUGGING {__file__}: Poniendo recuperador a velocidad 0")
+                log.debug("Poniendo recuperador a velocidad 0")
                 self.speed = 0
                 if spd_value == phi.ON:
                     res = await set_value(target, phi.OFF)
             elif new_speed is None:
                 if spd_value:
-                    print(f"DEBUGGING {__file__}: Velocidad actual recuperador {spd_value}")
+                    log.debug("Velocidad actual recuperador %s", spd_value)
                     current_speed = spd
                     self.speed = spd
             elif new_speed == spd:
-                print(f"DEBUGGING {__file__}: Poniendo recuperador a velocidad {new_speed}")
+                log.debug("Poniendo recuperador a velocidad %s", new_speed)
                 res = await set_value(target, phi.ON)
                 current_speed = spd
                 self.speed = spd
@@ -1021,7 +1065,7 @@ class HeatRecoveryUnit(phi.MBDevice):
         if current_speed == 0:  # No se ha seleccionado ninguna velocidad y el recuperador estaba apagado
             self.speed = 0
 
-        print(f"DEBUGGING {__file__}: (antes de return) Poniendo recuperador a velocidad {self.speed}")
+        log.debug("(antes de return) Poniendo recuperador a velocidad %s", self.speed)
         return self.speed
 
     async def set_manual_speed(self):
@@ -1047,14 +1091,11 @@ class HeatRecoveryUnit(phi.MBDevice):
                 self.speed = 0
                 if spd_value == phi.ON:
                     res = await set_value(target, phi.OFF)
-                    dbval = save_value(target, phi.OFF)
             elif self.manual_speed == spd:
                 res = await set_value(target, phi.ON)
-                dbval = save_value(target, phi.ON)
                 self.speed = spd
             else:
                 res = await set_value(target, phi.OFF)
-                dbval = save_value(target, phi.OFF)
 
         return self.speed
 
@@ -1101,15 +1142,14 @@ class HeatRecoveryUnit(phi.MBDevice):
                   "datatype": datatype,
                   "adr": adr}
         current_pos = get_value(value_source=source)
-        print(f"DEBUGGING {__file__}: Posición actual compuertas {current_pos}\n(0=sin recirculación)")
+        log.debug("Posición actual compuertas %s\n(0=sin recirculación)", current_pos)
         if current_pos == new_pos or new_pos is None:
             self.dampers_st = current_pos
         else:
             res = await set_value(source, new_pos)
-            dbval = save_value(source, new_pos)
             self.dampers_st = new_pos
 
-        print(f"DEBUGGING {__file__}: Posición calculada compuertas {self.dampers_st}\n(0=sin recirculación)")
+        log.debug("Posición calculada compuertas %s\n(0=sin recirculación)", self.dampers_st)
         return self.dampers_st
 
     async def set_valv_pos(self, new_pos: [int, None] = None):
@@ -1138,9 +1178,8 @@ class HeatRecoveryUnit(phi.MBDevice):
         else:
             states = ["Cerrando", "Abriendo"]
             valv_operation = "No se puede actuar sobre " if self.valv_st is None else f"{states[new_pos]}"
-            print(f"DEBUGGING {__file__}: {valv_operation} válvula")
+            log.debug("%s válvula", valv_operation)
             res = await set_value(source, new_pos)
-            dbval = save_value(source, new_pos)
             self.valv_st = new_pos
 
         # print(f"DEBUGGING {__file__}: Estado válvula {self.valv_st}\t(0 = Cerrada)")
@@ -1178,7 +1217,6 @@ class HeatRecoveryUnit(phi.MBDevice):
                           "datatype": tgt_datatype,
                           "adr": tgt_adr}
             res = await set_value(target, new_pos)
-            dbval = save_value(target, new_pos)
             self.bypass_st = new_pos if res else current_pos
 
         return self.bypass_st
@@ -1226,16 +1264,14 @@ class HeatRecoveryUnit(phi.MBDevice):
         group_sp = group.air_sp  # Consigna de ambiente calculada para el grupo
         group_wsp = group.water_sp  # Consigna de impulsión de agua para el grupo
         group_demand = group.demand  # 0-No demanda / 1-Demanda Refrig / 2-Demanda Calef.
-        print(f"DEBUGGING {__file__}: Grupo {self.groups[0]}\n\tConsignas:\t{group_sp} \n\t"
-              f"temperaturas:\t{group_rt}\n\tImpulsion agua:\t{group_wsp}\n\tDemanda:\t{group_demand}  ")
+        log.debug("Grupo %s\n\tConsignas:\t%s \n\ttemperaturas:\t%s\n\tImpulsion agua:\t%s\n\tDemanda:\t%s",
+                  self.groups[0], group_sp, group_rt, group_wsp, group_demand)
         if not group_sp or not group_rt:  # Si no leo temperaturas o consignas,
             # activo Modo Ventilación
-            print(f"DEBUGGING {__file__}: Grupo {self.groups[0]}\n\tFaltan consignas ({group_sp} o "
-                  f"temperaturas{group_rt}")
+            log.debug("Grupo %s\n\tFaltan consignas (%s o temperaturas%s", self.groups[0], group_sp, group_rt)
             return self.hru_mode
         else:
-            print(f"DEBUGGING {__file__}: Grupo {self.groups[0]}\n\tConsignas y temp válidas ({group_sp} "
-                  f"temperaturas{group_rt}")
+            log.debug("Grupo %s\n\tConsignas y temp válidas (%s temperaturas%s", self.groups[0], group_sp, group_rt)
 
         group_dp = group.air_dp  # Punto de rocío del grupo
         group_h = group.air_h  # Entalpía del grupo
@@ -1246,13 +1282,13 @@ class HeatRecoveryUnit(phi.MBDevice):
                     dehumid_mode = True
                     self.hru_mode = phi.DESHUMIDIFICACION
             building = group.roomgroup[0].building_id  # Edificio al que pertenece el grupo de habitaciones
-            t_ext = get_temp_exterior(building)  # Temperatura exterior
-            rh_ext = get_hrel_exterior(building)  # Humedad relativa Exterior
+            t_ext = phi.cycle.temp_exterior(building)  # Temperatura exterior
+            rh_ext = phi.cycle.hrel_exterior(building)  # Humedad relativa Exterior
             if rh_ext == 0 or rh_ext is None:  # El freecooling debe ser térmico
                 if t_ext < min(group_rt):  # Se activa el freecooling térmico
                     freecooling_mode = True
             elif group_h is not None:  # Se comprueba si se puede habilitar el free-cooling entálpico
-                h_ext = get_h_exterior()  # Entalpía exterior
+                h_ext = phi.cycle.h_exterior(building)  # Entalpía exterior
                 if h_ext < group_h:
                     freecooling_mode = True
 
@@ -1284,7 +1320,7 @@ class HeatRecoveryUnit(phi.MBDevice):
             Válvula de 3 vías cerrada
         :return:
         """
-        print(f"Apagando recuperador {self.name}")
+        log.debug("Apagando recuperador %s", self.name)
         await self.set_speed(phi.OFF)
         await self.set_airflow(0)
         await self.set_valv_pos(phi.CLOSED)
@@ -1298,7 +1334,7 @@ class HeatRecoveryUnit(phi.MBDevice):
             Válvula de 3 vías abierta
         :return:
         """
-        print(f"Activando modo deshumidificación en el recuperador {self.name}")
+        log.debug("Activando modo deshumidificación en el recuperador %s", self.name)
         await self.set_speed(phi.MAX_HRU_SPEED)
         await self.set_airflow(self.max_airflow)
         await self.set_valv_pos(phi.OPEN)
@@ -1312,7 +1348,7 @@ class HeatRecoveryUnit(phi.MBDevice):
             Válvula de 3 vías abierta
         :return:
         """
-        print(f"Activando modo fancoil en el recuperador {self.name}")
+        log.debug("Activando modo fancoil en el recuperador %s", self.name)
         await self.set_speed(phi.MAX_HRU_SPEED)
         await self.set_airflow(self.max_airflow)
         await self.set_valv_pos(phi.OPEN)
@@ -1327,7 +1363,7 @@ class HeatRecoveryUnit(phi.MBDevice):
             Bypass recuperador abierto
         :return:
         """
-        print(f"Activando freecooling en el recuperador {self.name}")
+        log.debug("Activando freecooling en el recuperador %s", self.name)
         await self.set_speed(phi.MAX_HRU_SPEED)
         await self.set_airflow(self.max_airflow)
         if self.hru_mode in (5, 6):
@@ -1347,7 +1383,7 @@ class HeatRecoveryUnit(phi.MBDevice):
             Bypass recuperador abierto
         :return:  Velocidad seleccionada o caudal actual
         """
-        print(f"Activando modo ventilación en el recuperador {self.name}")
+        log.debug("Activando modo ventilación en el recuperador %s", self.name)
         await self.set_valv_pos(phi.CLOSED)
         await self.set_dampers_pos(phi.CLOSED)  # Compuerta de aire exterior abierta y la de recirculación cerrada
 
@@ -1502,7 +1538,7 @@ class HeatRecoveryUnit(phi.MBDevice):
         Returns: resultado de la escritura modbus de los valores actualizados
         """
         if self.manual:
-            print(f"update {self.name} - Modo manual activado")
+            log.debug("update %s - Modo manual activado", self.name)
             if None not in (self.exhaust_flow_source, self.manual_airflow):
                 await self.set_airflow(self.manual_airflow)
             elif None not in (self.speed1_source, self.manual_speed):
@@ -1565,6 +1601,12 @@ class AirZoneManager(phi.MBDevice):
     Param: groups: grupos de habitaciones vinculados al dispositivo. Cada zonificador (fancoil) sólo puede estar
     asociado a un grupo de habitaciones. Si se introduce más de 1, sólo se utiliza el primero de ellos.
     """
+    __slots__ = ("bus_id", "device_id", "groups", "onoff_target", "onoff_st", "iv_source", "iv", "sp_source", "sp",
+                 "rt_source", "rt", "fan_manual_speed_mode", "fan_manual_speed", "fan_auto_cont_source",
+                 "fan_auto_cont", "fan_st_source", "fan_speed_target", "fan_speed", "sp1_source", "sp1", "rt1_source",
+                 "rt1", "sp2_source", "sp2", "rt2_source", "rt2", "demanda_st_source", "demand", "damper_st_source",
+                 "damper1_st", "damper2_st", "remote_onoff_st_source", "remote_onoff", "aux_eds_source", "ed1_aux",
+                 "ed2_aux", "ed3_aux")
 
     def __init__(self,
                  bus_id: str = "",
@@ -1644,12 +1686,11 @@ class AirZoneManager(phi.MBDevice):
         if new_status is None:
             self.onoff_st = 0 if current_st == 0 else 1
         elif new_status not in [0, 1]:
-            print(f"ERROR - El valor {new_status} no es válido para arrancar o parar el zonificador {self.name}.\n"
-                  f"Valores válidos son 1 para arrancar ó 0 para parar")
+            log.error("El valor %s no es válido para arrancar o parar el zonificador %s.\nValores válidos son 1 para "
+                      "arrancar ó 0 para parar", new_status, self.name)
             self.onoff_st = 0 if current_st == 0 else 1
         else:
             res = await set_value(target, new_status)
-            dbval = save_value(target, new_status)
             self.onoff_st = new_status
         return self.onoff_st
 
@@ -1706,11 +1747,10 @@ class AirZoneManager(phi.MBDevice):
             self.iv = current_iv_value
         # Se activa el modo indicado en iv_mode
         elif new_iv_mode in [0, 1, 2]:
-            res = await set_value(target, new_iv_mode)
-            dbval = save_value(target, new_iv_mode)
+            res = await set_value(target, new_iv_mode, group=True)
             self.iv = new_iv_mode
         else:
-            print(f"ERROR - Modo calefacción/refrigeración {new_iv_mode} no válido para el zonificador {self.name}")
+            log.error("Modo calefacción/refrigeración %s no válido para el zonificador %s", new_iv_mode, self.name)
             return
         return self.iv
 
@@ -1749,13 +1789,12 @@ class AirZoneManager(phi.MBDevice):
         if new_sp_value is None:
             self.__setattr__(sp_target, current_sp)
         elif new_sp_value > 35 or new_sp_value < 10:
-            print(f"{self.name}: ERROR estableciendo una consigna de {new_sp_value} en {target_name} "
-                  f"(rango 10-35)")
+            log.error("%s: ERROR estableciendo una consigna de %s en %s (rango 10-35)",
+                      self.name, new_sp_value, target_name)
             self.__setattr__(sp_target, current_sp)
         else:
-            print(f"airzonemanager.set_sp: Actualizando consigna con valor {new_sp_value} en {target_name}")
+            log.debug("airzonemanager.set_sp: Actualizando consigna con valor %s en %s", new_sp_value, target_name)
             res = await set_value(source, new_sp_value)
-            dbval = save_value(source, new_sp_value)
             # self.__setattr__(sp_target, new_sp_value)
             setattr(self, sp_target, new_sp_value)
         # return self.__getattribute__(sp_target)
@@ -1796,13 +1835,12 @@ class AirZoneManager(phi.MBDevice):
         if new_rt_value is None:
             self.__setattr__(rt_target, current_rt)
         elif new_rt_value > 50 or new_rt_value < 0:
-            print(f"{self.name}: ERROR estableciendo una temperatura de {new_rt_value} en {target_name} "
-                  f"(rango 0-50)")
+            log.error("%s: ERROR estableciendo una temperatura de %s en %s (rango 0-50)",
+                      self.name, new_rt_value, target_name)
             self.__setattr__(rt_target, current_rt)
         else:
-            print(f"airzonemanager.set_rt: Actualizando temperatura con valor {new_rt_value} en {target_name}")
+            log.debug("airzonemanager.set_rt: Actualizando temperatura con valor %s en %s", new_rt_value, target_name)
             res = await set_value(source, new_rt_value)
-            dbval = save_value(source, new_rt_value)
             setattr(self, rt_target, new_rt_value)
             # self.__setattr__(rt_target, new_rt_value)
         # return self.__getattribute__(rt_target)
@@ -1833,7 +1871,6 @@ class AirZoneManager(phi.MBDevice):
         current_auto_cont_mode = get_value(value_source=source)
         if new_fan_auto_cont_mode is not None:
             res = await set_value(source, new_fan_auto_cont_mode)  # Escritura en el dispositivo ModBus
-            dbval = save_value(source, new_fan_auto_cont_mode)
 
         self.fan_auto_cont = CONTINUO if new_fan_auto_cont_mode == CONTINUO else AUTO
         return self.fan_auto_cont
@@ -1874,17 +1911,15 @@ class AirZoneManager(phi.MBDevice):
             # Selecciono velocidad automática del ventilador
             auto_speed = 3  # 3 es velocidad automática del ventilador
             res = await set_value(manual_speed_target, auto_speed)
-            dbval = save_value(manual_speed_target, auto_speed)
             self.fan_speed = auto_speed
         elif man_speed is None:
             self.fan_speed = current_speed
         elif man_speed not in [0, 1, 2, 3]:
             self.fan_speed = current_speed
-            print(f"ERROR - No se puede fijar una velocidad de {man_speed} en el fancoil {self.name}.\n"
-                  f"Rango: (0, 1, 2, 3)")
+            log.error("No se puede fijar una velocidad de %s en el fancoil %s.\nRango: (0, 1, 2, 3)",
+                      man_speed, self.name)
         else:
             res = await set_value(manual_speed_target, man_speed)
-            dbval = save_value(manual_speed_target, man_speed)
             self.fan_speed = man_speed
         return self.fan_speed
 
@@ -1915,7 +1950,6 @@ class AirZoneManager(phi.MBDevice):
             self.remote_onoff = current_status
         else:
             res = await set_value(source, onoff_mode)
-            dbval = save_value(source, onoff_mode)
             self.remote_onoff = onoff_mode
         return self.remote_onoff
 
@@ -1938,7 +1972,7 @@ class AirZoneManager(phi.MBDevice):
         # Recojo el estado actual del registro que almacena la posición de las rejillas
         current_status = get_value(source)  # Tupla con los estados de las rejillas
         if current_status is None:
-            print(f"ERROR recuperando el estado de las rejillas del zonificador {self.name}")
+            log.error("Error recuperando el estado de las rejillas del zonificador %s", self.name)
             return
         self.damper1_st = current_status[0]
         self.damper2_st = current_status[1]
@@ -1964,7 +1998,7 @@ class AirZoneManager(phi.MBDevice):
         # Recojo el estado actual de las entradas digitales
         current_status = get_value(source)  # Tupla con los valores de los 16 bits del registro 22
         if current_status is None:
-            print(f"ERROR recuperando el estado de las entradas digitales auxiliares del zonificador {self.name}")
+            log.error("Error recuperando el estado de las entradas digitales auxiliares del zonificador %s", self.name)
             return
         self.ed1_aux = current_status[0]
         self.ed2_aux = current_status[1]
@@ -1999,12 +2033,11 @@ class AirZoneManager(phi.MBDevice):
         await self.set_sp(sp2, 2)  # Actualizo la consigna de la zona 2
         await self.set_rt(rt2, 2)  # Actualizo la temperatura ambiente  de la zona 2
 
-        with open(phi.ROOMGROUPS_VALUES_FILE, "r") as f:
-            roomgroups_values = json.load(f)
+        roomgroups_values = phi.roomgroups_values  # Resultados del ciclo (update_roomgroups_values)
 
         roomgroup_vals = roomgroups_values.get(self.groups[0])  # Datos del grupo de habitaciones asociado al fancoil
         if roomgroup_vals is None:
-            print(f"No se ha encontrado información del grupo de habitaciones {self.groups[0]}")
+            log.debug("No se ha encontrado información del grupo de habitaciones %s", self.groups[0])
 
         group_iv = await self.iv_mode(roomgroup_vals.get("iv"))  # 0:Calefaccion / 1:Refrigeracion en el grupo
         # de habitaciones; Calefacción es 2 en el zonificador
@@ -2070,6 +2103,12 @@ class TempFluidController(phi.MBDevice):
     groups: grupos de habitaciones vinculados al dispositivo. Puede haber hasta 3 grupos. El primer grupo
     se asocia al circuito 1, el segundo al circuito 2 y el tercero al circuito 3.
     """
+    __slots__ = ("bus_id", "device_id", "groups", "iv1_source", "iv1", "st1_target", "act_man_st1", "man_st1", "st1",
+                 "sp1_source", "act_man_sp1", "man_sp1", "sp1", "ti1_source", "ti1", "v1_source", "v1", "iv2_source",
+                 "iv2", "st2_target", "act_man_st2", "man_st2", "st2", "sp2_source", "act_man_sp2", "man_sp2", "sp2",
+                 "ti2_source", "ti2", "v2_source", "v2", "iv3_source", "iv3", "st3_target", "act_man_st3", "man_st3",
+                 "st3", "sp3_source", "act_man_sp3", "man_sp3", "sp3", "ti3_source", "ti3", "v3_source", "v3",
+                 "st4_source", "st4")
 
     def __init__(self,
                  bus_id: str = "",
@@ -2158,11 +2197,11 @@ class TempFluidController(phi.MBDevice):
         current_st = get_value(target)
         if new_st_value is not None:
             if new_st_value not in [phi.OFF, phi.ON]:
-                print(f"{self.name}: Error accionando la bomba del circuito {circuit} con el valor {new_st_value}")
+                log.error("%s: Error accionando la bomba del circuito %s con el valor %s",
+                          self.name, circuit, new_st_value)
                 self.__setattr__(states[idx], current_st)
             else:
                 res = await set_value(target, new_st_value)
-                dbval = save_value(target, new_st_value)
                 setattr(self, states[idx], new_st_value)
                 # self.__setattr__(states[idx], new_st_value)
         else:
@@ -2181,7 +2220,7 @@ class TempFluidController(phi.MBDevice):
         Returns: Tupla con el estado del modo manual y valor manual configurado para la bomba
         """
         if circuit not in (1, 2, 3):
-            print(f"ERROR intentando activar MANUALMENTE el circuito {circuit} de {self.name}")
+            log.error("Error intentando activar MANUALMENTE el circuito %s de %s", circuit, self.name)
             return
 
         manual_states_attributes = ("act_man_st1", "act_man_st2", "act_man_st3")
@@ -2192,7 +2231,7 @@ class TempFluidController(phi.MBDevice):
         circuit_manual_state = self.__getattribute__(circuit_manual_state_attr)
         circuit_manual_value = self.__getattribute__(circuit_manual_value_attr)
         if None not in (circuit_manual_state, circuit_manual_value):
-            print(f"Activando modo manual en circuito circuito {circuit} de {self.name}")
+            log.debug("Activando modo manual en circuito circuito %s de %s", circuit, self.name)
             await self.onoff(circuit, circuit_manual_value)  # El método onoff propaga el valor al dispositivo
 
         return circuit_manual_state, circuit_manual_value
@@ -2227,7 +2266,8 @@ class TempFluidController(phi.MBDevice):
             current_register_value = current_iv * 256 + current_sp
         if new_iv_mode is not None:
             if new_iv_mode not in [0, 1, 2]:
-                print(f"{self.name}: Error activando el modo del circuito {circuit} con el valor {new_iv_mode}")
+                log.error("%s: Error activando el modo del circuito %s con el valor %s",
+                          self.name, circuit, new_iv_mode)
                 # Se mantiene el modo actual
             else:
                 # Se propaga el nuevo modo de funcionamiento
@@ -2236,8 +2276,8 @@ class TempFluidController(phi.MBDevice):
                     msg = f"DEBUGGING {__file__}: Error propagando el modo de I/V a {self.name}"
                     return msg
                 new_val = set_hb(current_register_value, int(new_iv_mode))
+                # Sin agrupar: el registro también guarda la consigna (sp), que es distinta en cada controlador
                 res = await set_value(target, new_val)  # Escritura Modbus
-                dbval = save_value(target, new_val)
                 setattr(self, modes[idx], new_iv_mode)
                 # self.__setattr__(modes[idx], new_iv_mode)
         # mode = self.__getattribute__(modes[idx])
@@ -2274,18 +2314,16 @@ class TempFluidController(phi.MBDevice):
             self.__setattr__(setpoints[idx], current_sp)
             current_register_value = current_iv * 256 + current_sp
         else:
-            print(f"DEBUGGING {__file__}. El valor actual del registro {adr} del dispositivo {self.name} "
-                  f"es {current_iv_sp}")
+            log.debug("El valor actual del registro %s del dispositivo %s es %s", adr, self.name, current_iv_sp)
             return
         if new_sp is not None:
             if new_sp > 55 or new_sp < 5:
-                print(f"{self.name}: Error escribiendo la consigna {new_sp} para el circuito {circuit}")
+                log.error("%s: Error escribiendo la consigna %s para el circuito %s", self.name, new_sp, circuit)
                 # Se mantiene la consigna actual
             else:
                 # Se propaga la nueva consigna en el byte bajo
                 new_val = set_lb(current_register_value, int(new_sp))
                 res = await set_value(source, new_val)  # Escritura Modbus
-                dbval = save_value(source, new_val)
                 setattr(self, setpoints[idx], new_sp)
                 # self.__setattr__(setpoints[idx], new_sp)
         # setpoint = self.__getattribute__(setpoints[idx])
@@ -2317,7 +2355,8 @@ class TempFluidController(phi.MBDevice):
 
         if current_man_sp and current_man_val is not None:
             # Actualizando consigna manualmente
-            print(f"Actualizando MANUALMENTE la consigna del circuito {circuit} de {self.name} a {current_man_val}")
+            log.debug("Actualizando MANUALMENTE la consigna del circuito %s de %s a %s",
+                      circuit, self.name, current_man_val)
             await self.sp(circuit, current_man_val)
 
         return current_man_sp, current_man_val
@@ -2344,8 +2383,8 @@ class TempFluidController(phi.MBDevice):
                   "adr": adr}
         current_ti = get_value(source)
         if current_ti is None or current_ti < 0 or current_ti > 60:
-            print(f"{self.name}: Error leyendo la temperatura de impulsión del circuito {circuit}\n"
-                  f"Se para la bomba circuladora por seguridad")
+            log.error("%s: Error leyendo la temperatura de impulsión del circuito %s\nSe para la bomba circuladora "
+                      "por seguridad", self.name, circuit)
             await self.onoff(circuit, phi.OFF)
             return
         else:
@@ -2375,7 +2414,7 @@ class TempFluidController(phi.MBDevice):
                   "adr": adr}
         current_pos = get_value(source)
         if current_pos is None:
-            print(f"{self.name}: Error leyendo la posición de la válvula del circuito {circuit}")
+            log.error("%s: Error leyendo la posición de la válvula del circuito %s", self.name, circuit)
             return
         else:
             self.__setattr__(values[idx], current_pos)
@@ -2412,7 +2451,6 @@ class TempFluidController(phi.MBDevice):
                   "datatype": datatype,
                   "adr": adr}
         await set_value(source, new_st4_val)
-        dbval = save_value(source, new_st4_val)
         self.st4 = new_st4_val
         return self.st4
 
@@ -2450,8 +2488,7 @@ class TempFluidController(phi.MBDevice):
         valores_bomba_manual = {0: self.man_st1, 1: self.man_st2, 2: self.man_st3}
         consigna_manual = {0: self.act_man_sp1, 1: self.act_man_sp2, 2: self.act_man_sp3}
         valores_consigna_manual = {0: self.man_sp1, 1: self.man_sp2, 2: self.man_sp3}
-        with open(phi.ROOMGROUPS_VALUES_FILE, "r") as f:
-            roomgroups_values = json.load(f)
+        roomgroups_values = phi.roomgroups_values  # Resultados del ciclo (update_roomgroups_values)
 
         for idx, roomgroup_id in enumerate(self.groups):
             circuito = idx + 1
@@ -2469,7 +2506,7 @@ class TempFluidController(phi.MBDevice):
             roomgroup = roomgroups_values.get(roomgroup_id)  # Objeto del grupo RoomGroup
             if roomgroup is None:
                 continue
-            print(f"DEBUGGING {__file__}.\tCONTROL Tª IMPULSION.\n\tDatos del grupo de habitaciones\n{roomgroup}\n\n")
+            log.debug("CONTROL Tª IMPULSION.\n\tDatos del grupo de habitaciones\n%s", roomgroup)
             if roomgroup.get("demanda") != 0:
                 # Hay demanda de refrigeración (demanda = 1) o de calefacción (demanda = 2). Se propaga el modo iv
                 iv = 1 if roomgroup.get("iv") else 2  # roomgroup.iv es 1 en refrigeración
@@ -2543,6 +2580,13 @@ class Fancoil(phi.MBDevice):
     Param: groups: grupos de habitaciones vinculados al dispositivo. Cada fancoil sólo puede estar asociado a un grupo
     de habitaciones. Si se introduce más de 1, sólo se utiliza el primero de ellos.
     """
+    __slots__ = ("bus_id", "device_id", "groups", "onoff_target", "st_modo_demanda_source", "onoff_st", "demand",
+                 "iv_source", "iv", "sp_source", "sp", "rt_source", "rt", "fan_type_source", "fan_type",
+                 "fan_auto_cont_source", "fan_auto_cont", "fan_st_source", "fan_speed", "manual_fan_target",
+                 "manual_fan", "actmanual_fan", "manual_speed", "manual_speed_target", "ac_speed_limit_source",
+                 "ec_speed_limit_source", "speed_limit", "manual_valv_source", "manual_valv_position_source",
+                 "manual_valv_st", "manual_valv_pos", "valv_st_source", "valv_st", "remote_onoff_source",
+                 "remote_onoff", "sd_aux_source", "sd_aux", "floor_temp_source", "floor_temp")
 
     def __init__(self,
                  bus_id: str = "",
@@ -2630,12 +2674,11 @@ class Fancoil(phi.MBDevice):
             self.onoff_st = 0 if current_st_mode == 0 else 1  # Se devuelve 1 tanto en modo calefacción
             # como refrigeración
         elif new_status not in [0, 1]:
-            print(f"ERROR - El valor {new_status} no es válido para arrancar o parar el fancoil {self.name}.\n"
-                  f"Valores válidos son 1 para arrancar ó 0 para parar")
+            log.error("El valor %s no es válido para arrancar o parar el fancoil %s.\nValores válidos son 1 para "
+                      "arrancar ó 0 para parar", new_status, self.name)
             self.onoff_st = 0 if current_st_mode == 0 else 1
         else:
             res = await set_value(target, new_status)
-            dbval = save_value(target, new_status)
             self.onoff_st = new_status
         return self.onoff_st
 
@@ -2704,11 +2747,10 @@ class Fancoil(phi.MBDevice):
                 self.iv = current_iv_value
         # Se activa el modo indicado en iv_mode
         elif new_iv_mode in [phi.HEATING, phi.COOLING]:
-            res = await set_value(target, new_iv_mode)
-            dbval = save_value(target, new_iv_mode)
+            res = await set_value(target, new_iv_mode, group=True)
             self.iv = new_iv_mode
         else:
-            print(f"ERROR - Modo calefacción/refrigeración {new_iv_mode} no válido para el fancoil {self.name}")
+            log.error("Modo calefacción/refrigeración %s no válido para el fancoil %s", new_iv_mode, self.name)
             return
         return self.iv
 
@@ -2736,13 +2778,12 @@ class Fancoil(phi.MBDevice):
         if new_sp_value is None:
             self.sp = current_sp
         elif new_sp_value > 40 or new_sp_value < 10:
-            print(f"{self.name}: ERROR estableciendo una consigna de {new_sp_value} en el fancoil {self.name} "
-                  f"(rango 10-40)")
+            log.error("%s: ERROR estableciendo una consigna de %s en el fancoil %s (rango 10-40)",
+                      self.name, new_sp_value, self.name)
             self.sp = current_sp
         else:
-            print(f"fancoil.set_sp: Actualizando consigna con valor {new_sp_value} en fancoil {self.name}")
+            log.debug("fancoil.set_sp: Actualizando consigna con valor %s en fancoil %s", new_sp_value, self.name)
             res = await set_value(source, new_sp_value)
-            dbval = save_value(source, new_sp_value)
             self.sp = new_sp_value
         return self.sp
 
@@ -2775,14 +2816,14 @@ class Fancoil(phi.MBDevice):
             self.rt = current_rt
         elif new_rt_value > 50 or new_rt_value < 0:
             await self.manual_fan_speed(manual_mode=phi.OFF)  # Se activa la selección automática de velocidad
-            print(f"{self.name}: ERROR estableciendo una temperatura ambiente de {new_rt_value} en el "
-                  f"fancoil {self.name} (rango 0-50)")
+            log.error("%s: ERROR estableciendo una temperatura ambiente de %s en el fancoil %s (rango 0-50)",
+                      self.name, new_rt_value, self.name)
             self.rt = current_rt
         else:
             # await self.manual_fan_speed(manual_mode=phi.OFF)  # Se activa la selección automática de velocidad
-            print(f"fancoil.set_sp: Actualizando temperatura ambiente con valor {new_rt_value} en fancoil {self.name}")
+            log.debug("fancoil.set_sp: Actualizando temperatura ambiente con valor %s en fancoil %s",
+                      new_rt_value, self.name)
             res = await set_value(source, new_rt_value)
-            dbval = save_value(source, new_rt_value)
             self.rt = new_rt_value
         return self.rt
 
@@ -2836,13 +2877,11 @@ class Fancoil(phi.MBDevice):
             # Actualizo el modo del ventilador para refrigeración (byte alto)
             new_val_cooling = set_hb(current_value, int(fan_mode_cooling))
             res = await set_value(source, new_val_cooling)  # Escritura en el dispositivo ModBus
-            dbval = save_value(source, new_val_cooling)
             cont_cooling = new_val_cooling
         if fan_mode_heating is not None:
             # Actualizo el modo del ventilador para refrigeración (byte alto)
             new_val_heating = set_lb(current_value, int(fan_mode_heating))
             res = await set_value(source, new_val_heating)  # Escritura en el dispositivo ModBus
-            dbval = save_value(source, new_val_heating)
             cont_heating = new_val_heating
         if cooling:
             self.fan_auto_cont = CONTINUO if cont_cooling == CONTINUO else AUTO
@@ -2897,8 +2936,8 @@ class Fancoil(phi.MBDevice):
         if man_speed is not None:
             if (fan_type == "AC" and man_speed not in AC_FAN_SPEED) or \
                     (fan_type == "EC" and man_speed not in EC_FAN_SPEED):
-                print(f"La velocidad seleccionada, {man_speed}, para el fancoil {self.name} de tipo {fan_type} "
-                      f"no es válida. Se mantiene la configuración de velocidad manual actual.")
+                log.error("La velocidad seleccionada, %s, para el fancoil %s de tipo %s no es válida. Se mantiene la "
+                          "configuración de velocidad manual actual.", man_speed, self.name, fan_type)
                 man_speed = current_man_speed
             else:
                 # Se actualiza el valor de velocidad manual
@@ -2906,18 +2945,16 @@ class Fancoil(phi.MBDevice):
                 #       f"\n\tbyte bajo: {man_speed_ec}")
                 new_man_speed = set_hb(current_manual_speed_value, man_speed) if fan_type == "AC" \
                     else set_lb(current_manual_speed_value, man_speed)
-                print(f"{self.name} - Actualizando valor velocidad manual al valor {new_man_speed} en el esclavo "
-                      f"{self.slave}, dirección  {manual_speed_target}")
+                log.debug("%s - Actualizando valor velocidad manual al valor %s en el esclavo %s, dirección  %s",
+                          self.name, new_man_speed, self.slave, manual_speed_target)
                 res = await set_value(manual_speed_target, new_man_speed)  # Escritura en el dispositivo ModBus
-                dbval = save_value(manual_speed_target, new_man_speed)
         else:
             man_speed = current_man_speed
 
         if manual_mode is not None:
-            print(f"{self.name} - Estableciendo al valor {manual_mode} para el Ajuste Manual de Velocidad "
-                  f"en el esclavo {self.slave}, dirección  {manual_mode_target}")
+            log.debug("%s - Estableciendo al valor %s para el Ajuste Manual de Velocidad en el esclavo %s, dirección  "
+                      "%s", self.name, manual_mode, self.slave, manual_mode_target)
             res = await set_value(manual_mode_target, manual_mode)  # Se activa o desactiva el modo manual indicado
-            dbval = save_value(manual_mode_target, manual_mode)
             self.manual_fan = (manual_mode, man_speed)
             if manual_mode:
                 self.fan_speed = self.manual_fan[1]
@@ -2997,9 +3034,9 @@ class Fancoil(phi.MBDevice):
 
         if (max_speed is not None and max_speed not in SPEED_VALUES.get(fan_type)) or \
                 (min_speed is not None and min_speed not in SPEED_VALUES.get(fan_type)):
-            print(f"ERROR - Algún valor límite introducido no es válido para el fancoil {self.name}\n\t"
-                  f"Rango válido: {SPEED_VALUES.get(fan_type)[0]}-{SPEED_VALUES.get(fan_type)[-1]}")
-            print("\tSe mantienen los valores actuales")
+            log.error("Algún valor límite introducido no es válido para el fancoil %s\n\tRango válido: %s-%s",
+                      self.name, SPEED_VALUES.get(fan_type)[0], SPEED_VALUES.get(fan_type)[-1])
+            log.debug("Se mantienen los valores actuales")
             self.speed_limit = (current_max, current_min)
 
         if max_speed in [None, 0] and min_speed in [None, 0]:  # No se cambian los valores
@@ -3007,29 +3044,26 @@ class Fancoil(phi.MBDevice):
         elif max_speed in [None, 0]:
             # Sólo se modifica la velocidad mínima
             if min_speed > current_max:
-                print(f"ERROR - No se puede fijar una velocidad mínima, {min_speed}, mayor que la velocidad máxima "
-                      f"{current_max} actual en el fancoil {self.name}")
+                log.error("No se puede fijar una velocidad mínima, %s, mayor que la velocidad máxima %s actual en el "
+                          "fancoil %s", min_speed, current_max, self.name)
                 self.speed_limit = (current_max, current_min)
             else:  # Se modifica la velocidad mínima
                 new_limits = set_lb(current_limits, min_speed)
                 res = await set_value(source, new_limits)
-                dbval = save_value(source, new_limits)
                 self.speed_limit = (current_max, min_speed)
         elif min_speed in [None, 0]:
             # Sólo se modifica la velocidad máxima
             if max_speed < current_min:
-                print(f"ERROR - No se puede fijar una velocidad máxima, {max_speed}, menor que la velocidad mínima "
-                      f"{current_min} actual en el fancoil {self.name}")
+                log.error("No se puede fijar una velocidad máxima, %s, menor que la velocidad mínima %s actual en el "
+                          "fancoil %s", max_speed, current_min, self.name)
                 self.speed_limit = (current_max, current_min)
             else:  # Se modifica la velocidad máxima
                 new_limits = set_hb(current_limits, max_speed)
                 res = await set_value(source, new_limits)
-                dbval = save_value(source, new_limits)
                 self.speed_limit = (max_speed, current_min)
         else:  # Se modifican las velocidades máxima y mínima de funcionamiento del fancoil.
             new_limits = max_speed * 256 + min_speed
             res = await set_value(source, new_limits)
-            dbval = save_value(source, new_limits)
             self.speed_limit = (max_speed, min_speed)
         return self.speed_limit
 
@@ -3072,18 +3106,16 @@ class Fancoil(phi.MBDevice):
         current_manual_position = get_value(value_source=target)
         if new_position is not None:
             if new_position not in [phi.CLOSED, phi.OPEN]:
-                print(f"La posición seleccionada, {new_position}, para la válvula del fancoil {self.name} "
-                      f"no es válida. Debe ser 1 (abierta) o 0 (cerrada). \n"
-                      f"Se mantiene la configuración de manual actual.")
+                log.error("La posición seleccionada, %s, para la válvula del fancoil %s no es válida. Debe ser 1 "
+                          "(abierta) o 0 (cerrada). \nSe mantiene la configuración de manual actual.",
+                          new_position, self.name)
                 new_position = current_manual_position
             else:
                 # Se actualiza el valor de posición manual de la válvula
                 res = await set_value(target, new_position)  # Escritura en el dispositivo ModBus
-                dbval = save_value(target, new_position)
 
         if manual_mode is not None:
             res = await set_value(source, manual_mode)  # Se activa o desactiva el modo manual indicado
-            dbval = save_value(source, manual_mode)
             self.manual_valv_st = manual_mode
             self.manual_valv_pos = new_position
         else:
@@ -3117,7 +3149,6 @@ class Fancoil(phi.MBDevice):
             self.remote_onoff = current_status
         else:
             res = await set_value(source, onoff_mode)
-            dbval = save_value(source, onoff_mode)
             self.remote_onoff = onoff_mode
         return self.remote_onoff
 
@@ -3147,7 +3178,6 @@ class Fancoil(phi.MBDevice):
             self.sd_aux = current_status
         else:
             res = await set_value(source, onoff_mode)
-            dbval = save_value(source, onoff_mode)
             self.sd_aux = onoff_mode
         return self.sd_aux
 
@@ -3186,17 +3216,16 @@ class Fancoil(phi.MBDevice):
         de habitaciones asociado
         Returns: resultado de la escritura modbus de los valores actualizados
         """
-        with open(phi.ROOMGROUPS_VALUES_FILE, "r") as f:
-            roomgroups_values = json.load(f)
+        roomgroups_values = phi.roomgroups_values  # Resultados del ciclo (update_roomgroups_values)
 
         roomgroup = roomgroups_values.get(self.groups[0])  # Datos del grupo de habitaciones asociado al fancoil
         if roomgroup is None:
-            print(f"No se ha encontrado información del grupo de habitaciones {self.groups[0]}")
+            log.debug("No se ha encontrado información del grupo de habitaciones %s", self.groups[0])
             return
 
         self.iv = await self.iv_mode(roomgroup.get("iv"))  # 0:Calefaccion / 1:Refrigeracion
         if None in [self.iv, roomgroup.get("air_sp"), roomgroup.get("air_rt")]:
-            print(f"DEBUGGING método update {__file__}  iv, sp o rt del fancoil {self.name} es None")
+            log.debug("Debugging método update %s  iv, sp o rt del fancoil %s es None", __file__, self.name)
             return
         fancoil_sp = roomgroup.get("air_sp") + phi.OFFSET_COOLING if self.iv \
             else roomgroup.get("air_sp") + phi.OFFSET_HEATING  # Offset heating tiene un valor negativo
@@ -3252,6 +3281,9 @@ class DataSource(phi.MBDevice):
     CARPETA DE PROJECT_ELEMENTS.
     Param: device: dispositivo ModBus con el mapa de registros a mapear
     """
+    # Los atributos leídos y sus orígenes se crean a partir de datasources.json (_create_attrs) en el diccionario de la
+    # instancia
+    __slots__ = ("bus_id", "device_id", "groups", "attrs", "attr_sources", "__dict__")
 
     def __init__(self,
                  bus_id: str = "",
@@ -3283,22 +3315,22 @@ class DataSource(phi.MBDevice):
         datasources_file = f"{phi.PROJECT_ELEMENTS_FOLDER}datasources.json"
         ds_file_exists = phi.os.path.isfile(datasources_file)
         if not ds_file_exists:
-            print(f"(devices.py - DataSources) - No se encuentra el archivo {datasources_file}")
+            log.error("No se encuentra el archivo %s", datasources_file)
             return 0
 
-        print(f"Creando atributos de {self.__dict__}")
+        log.debug("Creando atributos de %s (%s_%s)", self.name, self.brand, self.model)
         ds_type = f"{self.brand}_{self.model}"
         with open(datasources_file, "r") as dsf:
             dss = json.load(dsf)
-        print(f"DataSources: {dss}")
+        log.debug("DataSources: %s", dss)
         ds_dict = dss.get("datasources")
         if not ds_dict:
-            print(f"(devices.py - DataSources) - Falta la clave 'datasources' en {datasources_file}")
+            log.error("Falta la clave 'datasources' en %s", datasources_file)
             return 0
 
         datasource = None if not ds_dict else ds_dict.get(ds_type)
         if not datasource:
-            print(f"(devices.py - DataSources) - No se ha definido el DataSource {ds_type} en {datasources_file}")
+            log.error("No se ha definido el DataSource %s en %s", ds_type, datasources_file)
             return 0
 
         for k, v in datasource.items():
@@ -3308,7 +3340,7 @@ class DataSource(phi.MBDevice):
                 setattr(self, k, v)  # Cargo el tipo de dato y el registro en el que se lee el atributo
                 self.attrs.append(attr)
                 self.attr_sources.append(k)
-        print(f"Creados los atributos {self.attrs} para {self.name}.\nSe leen desde {self.attr_sources}")
+        log.debug("Creados los atributos %s para %s.\nSe leen desde %s", self.attrs, self.name, self.attr_sources)
         return 1
 
     async def upload(self):
@@ -3323,12 +3355,12 @@ class DataSource(phi.MBDevice):
         """
         Se actualizan los valores leídos del DataSource
         """
-        print(f"Actualizando DataSource {self.name}")
+        log.debug("Actualizando DataSource %s", self.name)
         for idx, src in enumerate(self.attr_sources):
             # print(f"Procesando {src}")
             src_info = getattr(self, src)
             if src_info is None:
-                print(f"No se ha definido el origen de datos para {src} en DataSources.json")
+                log.debug("No se ha definido el origen de datos para %s en DataSources.json", src)
                 continue
             datatype = src_info[0]
             adr = src_info[1]
@@ -3340,20 +3372,20 @@ class DataSource(phi.MBDevice):
             setattr(self, self.attrs[idx], current_value)
             attr_file = f"{phi.EXCHANGE_FOLDER}/{self.bus_id}/{self.slave}/{self.attrs[idx]}"
             # print(f"Actualizando archivo {attr_file}")
-            print(f"\t\t\tProcesando archivo {attr_file}")
+            log.debug("Procesando archivo %s", attr_file)
             exc_file_exists = phi.os.path.isfile(attr_file)
             if not exc_file_exists:
                 try:
                     open(attr_file, 'w').close()
                 except OSError:
-                    print(f"\n\n\tERROR creando el fichero de intercambio {attr_file} para el esclavo {self.slave}")
+                    log.error("Error creando el fichero de intercambio %s para el esclavo %s", attr_file, self.slave)
                 else:
-                    print(f"\n\t...creado el archivo de intercambio {attr_file} "
-                          f"para el esclavo {self.slave}")
+                    log.debug("creado el archivo de intercambio %s para el esclavo %s", attr_file, self.slave)
             with open(attr_file, "w") as dsf:
                 dsf.write(str(current_value))
+            metrics.exchange_writes.inc(cls=self.__class__.__name__)
         else:
-            print(f"Actualización de Datasource {self.name} finalizada")
+            log.debug("Actualización de Datasource %s finalizada", self.name)
 
         # 08/07/23 En la clase DataSource se actualizan directamente los archivos desde el método update
         # await update_xch_files_from_devices(self)  # Guarda los valores del dispositivo en el archivo de intercambio
@@ -3373,7 +3405,7 @@ class DataSource(phi.MBDevice):
             adr = str(val_src[1])  # El número de registro en el json de datasourdes es integer
             regs = ds_regmap.get(datatype)
             if not regs:
-                print(f"El DataSource {self.name} no tiene definidos {datatype} en su mapa de registros")
+                log.debug("El DataSource %s no tiene definidos %s en su mapa de registros", self.name, datatype)
                 continue
             ds_description = regs.get(adr).get("descr").get(phi.LANGUAGE)
             ds_reg_value = getattr(self, self.attrs[idx])
@@ -3395,3 +3427,5 @@ SYSTEM_CLASSES = {
     "airzonemanager": AirZoneManager,
     "datasource": DataSource
 }
+# Registro de las clases de dispositivos con sus archivos de intercambio (mb_utils.exchange). Se construye una vez
+DEVICE_CLASSES = exchange.build_registry(SYSTEM_CLASSES)
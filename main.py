@@ -5,58 +5,96 @@ import sys
 import phoenix_init as phi
 
 from mb_utils.mb_utils import read_all_buses, update_roomgroups_values, update_all_buses, check_changes_from_web
+from publish import metrics
+from publish.api_server import start_api_server
+from phoenix_log import get_logger
 
+log = get_logger(__name__)
 
-# from publish.publish_results import publish_results
-
-async def main():
-    print(f"\n\t\tAccediendo al controlador {phi.boardsn}\n")
-
-    # changes = await check_changes_from_web()
-
-    id_lectura_actual = 0
-    historico_lecturas = {"lecturas": {}}
 
+async def ciclo(id_lectura_actual: int):
+    """
+    Ciclo completo de lectura de los buses, cálculo de los grupos de habitaciones y actualización de los dispositivos
+    Param:
+        id_lectura_actual: número de la lectura
+    """
     phi.collect()
+    inicio = metrics.start_cycle()
 
-    id_lectura_actual += 1
-    print(f"\n************\t INICIANDO LECTURA {id_lectura_actual}\t************\n")
+    log.info("************\t INICIANDO LECTURA %s\t************", id_lectura_actual)
     # Actualizo el diccionario con las lecturas modbus, para recalcular los grupos de habitaciones y otras variables
-    phi.datadb = await read_all_buses(id_lectura_actual)  # Diccionario READING_FILE con la última lectura de
-    # todos los registros
-    print(f"\n************\t LECTURA MODBUS FINALIZADA {id_lectura_actual}\t************\n")
+    with metrics.stage_timer("read_all_buses"):
+        phi.datadb = await read_all_buses(id_lectura_actual)  # Diccionario en memoria con la última lectura de
+        # todos los registros
+    log.info("************\t LECTURA MODBUS FINALIZADA %s\t************", id_lectura_actual)
 
-    phi.system_iv = await phi.get_modo_iv()  # Variable global con el modo de funcionamiento del sistema
-    print(f"\nMODO de funcionamiento del sistema: {phi.system_iv}")
+    with metrics.stage_timer("get_modo_iv"):
+        phi.cycle = await phi.get_cycle_context()  # Modo de funcionamiento y condiciones exteriores del ciclo
+        phi.system_iv = phi.cycle.system_iv  # Variable global con el modo de funcionamiento del sistema
+    log.debug("MODO de funcionamiento del sistema: %s", phi.system_iv)
 
-    print(f"\n************\t ACTUALIZANDO CENTRALITAS X148 {str(phi.datetime.now())}\t************\n")
+    log.info("************\t ACTUALIZANDO CENTRALITAS X148 %s\t************", phi.datetime.now())
     # Actualizo las instancias de los Controladores de suelo radiante con las últimas lecturas
-    bus_updating_results = await update_all_buses("UFHCController")
-    print(f"\n************\t FINALIZADA ACTUALIZACIÓN CENTRALITAS X148 {str(phi.datetime.now())}\t************\n")
+    with metrics.stage_timer("update_ufhc"):
+        bus_updating_results = await update_all_buses("UFHCController")
+    log.info("************\t FINALIZADA ACTUALIZACIÓN CENTRALITAS X148 %s\t************", phi.datetime.now())
 
-    print(f"\n************\t COMPROBANDO CAMBIOS EN LA WEB {str(phi.datetime.now())}\t************\n")
+    log.info("************\t COMPROBANDO CAMBIOS EN LA WEB %s\t************", phi.datetime.now())
 
     # Tras las lecturas de los buses, compruebo si el usuario ha cambiado la consigna en algún termostato
     # (revisando el fichero correspondiente) o si ha habido algún cambio desde la web: nueva consigna,
     # modos manuales, etc.
-    changes = await check_changes_from_web()
-    print(f"\n************\t FINALIZADA COMPROBACIÓN CAMBIOS EN LA WEB {str(phi.datetime.now())}\t************\n")
+    with metrics.stage_timer("check_changes_from_web"):
+        changes = await check_changes_from_web()
+    log.info("************\t FINALIZADA COMPROBACIÓN CAMBIOS EN LA WEB %s\t************", phi.datetime.now())
 
-    print(f"\n************\t ACTUALIZANDO GRUPOS DE HABITACIONES {str(phi.datetime.now())}\t************\n")
+    log.info("************\t ACTUALIZANDO GRUPOS DE HABITACIONES %s\t************", phi.datetime.now())
     # Actualizo las lecturas de todas las habitaciones y grupos de habitaciones del proyecto
-    roomgroup_updating_results = await update_roomgroups_values()
+    with metrics.stage_timer("update_roomgroups_values"):
+        roomgroup_updating_results = await update_roomgroups_values()
 
-    print(f"\n************\t FINALIZADA ACTUALIZACIÓN GRUPOS DE HABITACIONES {str(phi.datetime.now())}\t************\n")
+    log.info("************\t FINALIZADA ACTUALIZACIÓN GRUPOS DE HABITACIONES %s\t************", phi.datetime.now())
 
     # Propago los valores calculados a los dispositivos del proyecto
-    bus_updating_results = await update_all_buses()
+    with metrics.stage_timer("update_all_buses"):
+        bus_updating_results = await update_all_buses()
 
     # print(f"Free Memory: {micropython.mem_info(1)}")
     phi.collect()
+    metrics.end_cycle(inicio)
+
 
+async def main():
+    """
+    Sin argumentos se ejecuta un único ciclo.
+    Con --daemon se ejecuta un ciclo cada CYCLE_PERIOD segundos y se arranca el servidor HTTP de la API
+    (publish.api_server) en el mismo bucle de eventos.
+    """
+    log.info("Accediendo al controlador %s", phi.boardsn)
+    daemon = "--daemon" in sys.argv[1:]
+    api_server = await start_api_server() if daemon else None
+
+    id_lectura_actual = 0  # El histórico de lecturas se guarda en mb_utils.history desde read_all_buses
+    while True:
+        inicio_ciclo = asyncio.get_running_loop().time()
+        id_lectura_actual += 1
+        try:
+            await ciclo(id_lectura_actual)
+        except Exception:
+            if not daemon:
+                raise
+            # Un error en un ciclo (lectura, archivo de intercambio...) no detiene el controlador ni la API
+            log.exception("Error en el ciclo %s. Se continúa en el siguiente", id_lectura_actual)
+        if not daemon:
+            break
+        await asyncio.sleep(max(0, phi.CYCLE_PERIOD - (asyncio.get_running_loop().time() - inicio_ciclo)))
+
+    if api_server is not None:
+        api_server.close()
+        await api_server.wait_closed()
 
 
 if __name__ == "__main__":
     asyncio.run(main())
     end_time = phi.datetime.now()
-    print(f"Hora finalización: {str(end_time)}")
+    log.info("Hora finalización: %s", end_time)
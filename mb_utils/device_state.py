@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Estado de funcionamiento de los dispositivos que se conserva entre ciclos: modos y valores manuales fijados desde la
+web y últimos valores escritos en los dispositivos (DEVICE_STATE_ATTRS).
+La configuración estática de los dispositivos (sources, registros, parámetros de comunicación) no cambia entre
+ciclos, así que sólo se guarda este estado en DEVICES_STATE_FILE, y únicamente cuando cambia.
+"""
+import pickle
+from copy import deepcopy
+from os import path, replace
+from typing import Dict
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+_saved_state = None  # Último estado guardado en DEVICES_STATE_FILE
+
+
+def get_devices_state(buses: Dict) -> Dict:
+    """
+    Extrae el estado de funcionamiento de todos los dispositivos
+    Param:
+        buses: diccionario con las instancias de los dispositivos de cada bus
+    Returns: diccionario {bus: {dispositivo: {atributo: valor}}}
+    """
+    state = {}
+    for idbus, bus in buses.items():
+        state[idbus] = {}
+        for iddevice, device in bus.items():
+            attrs = DEVICE_STATE_ATTRS.get(device.__class__.__name__, ())
+            state[idbus][iddevice] = {attr: getattr(device, attr, None) for attr in attrs}
+    return state
+
+
+def restore_devices_state(buses: Dict) -> int:
+    """
+    Recupera el estado de funcionamiento guardado en DEVICES_STATE_FILE y lo aplica a los dispositivos.
+    Si el archivo no existe o es de otra versión, los dispositivos mantienen sus valores iniciales.
+    Param:
+        buses: diccionario con las instancias de los dispositivos de cada bus
+    Returns: nº de dispositivos actualizados
+    """
+    global _saved_state
+    if not path.isfile(DEVICES_STATE_FILE):
+        return 0
+    try:
+        with open(DEVICES_STATE_FILE, "rb") as f:
+            saved = pickle.load(f)
+    except (EOFError, pickle.UnpicklingError) as e:
+        log.error("No se puede leer el estado de los dispositivos %s\n%s", DEVICES_STATE_FILE, e)
+        return 0
+    if saved.get("version") != DEVICES_STATE_VERSION:
+        log.warning("Versión %s del archivo %s no válida. Se descarta el estado guardado",
+                    saved.get('version'), DEVICES_STATE_FILE)
+        return 0
+    updated = 0
+    for idbus, bus in saved.get("buses").items():
+        for iddevice, dev_state in bus.items():
+            device = buses.get(idbus, {}).get(iddevice)
+            if device is None:
+                continue
+            attrs = DEVICE_STATE_ATTRS.get(device.__class__.__name__, ())
+            for attr, value in dev_state.items():
+                if attr in attrs:
+                    setattr(device, attr, value)
+            updated += 1
+    _saved_state = deepcopy(get_devices_state(buses))
+    return updated
+
+
+def save_devices_state(buses: Dict) -> int:
+    """
+    Guarda en DEVICES_STATE_FILE el estado de funcionamiento de los dispositivos si ha cambiado desde la última
+    vez que se guardó.
+    Param:
+        buses: diccionario con las instancias de los dispositivos de cada bus
+    Returns: 1 si se ha escrito el archivo, 0 si el estado no había cambiado
+    """
+    global _saved_state
+    state = get_devices_state(buses)
+    if state == _saved_state:
+        return 0
+    tmp_file = DEVICES_STATE_FILE + ".tmp"
+    with open(tmp_file, "wb") as f:
+        pickle.dump({"version": DEVICES_STATE_VERSION, "buses": state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    replace(tmp_file, DEVICES_STATE_FILE)
+    _saved_state = deepcopy(state)
+    return 1
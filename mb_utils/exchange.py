@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Registro de las clases de dispositivos del sistema y de sus archivos de intercambio con la web.
+Se construye una sola vez al importar devices.devices, a partir de SYSTEM_CLASSES, EXCHANGE_R_FILES,
+EXCHANGE_RW_FILES y EXCHANGE_SCHEMAS, sin crear instancias de las clases. Cada clase tiene los atributos que se
+publican en los archivos de intercambio (R), los que se pueden modificar desde la web (RW) y el esquema de cada
+archivo: tipo, límites y unidades del valor.
+Los valores se guardan en los archivos como texto (encode). Al leerlos, DeviceClassInfo.decode los convierte al tipo
+del esquema y comprueba los límites en un solo paso: un valor que no cumple el esquema lanza ValueError y no llega a
+escribirse en el dispositivo.
+"""
+from dataclasses import dataclass, field
+from math import isfinite
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple, Union
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+NOT_EXCHANGED = ("ModbusRegisterMap",)  # Clases de SYSTEM_CLASSES que no son dispositivos
+
+
+@dataclass(frozen=True)
+class FileSchema:
+    """
+    Esquema del valor de un archivo de intercambio. En las tuplas, los límites se aplican a cada elemento
+    """
+    type: type  # int, float o tuple (de enteros)
+    min: Union[int, float, None] = None
+    max: Union[int, float, None] = None
+    unit: str = ""
+
+    def number(self, text: str):
+        if self.type is float:
+            value = float(text)
+            if not isfinite(value):
+                raise ValueError(f"{text} no es un número")
+        elif text in ("True", "False"):  # Estados guardados desde atributos booleanos
+            value = int(text == "True")
+        else:
+            value = float(text)
+            if not value.is_integer():
+                raise ValueError(f"{text} no es un número entero")
+            value = int(value)
+        if self.min is not None and value < self.min or self.max is not None and value > self.max:
+            raise ValueError(f"{text} fuera de los límites [{self.min}, {self.max}] {self.unit}".rstrip())
+        return value
+
+    def decode(self, text: str):
+        """
+        Convierte el texto de un archivo al tipo del esquema y comprueba sus límites
+        Raises: ValueError si el texto está vacío o no cumple el esquema
+        """
+        text = text.strip()
+        if not text:
+            raise ValueError("valor vacío")
+        if self.type is tuple:
+            return tuple(self.number(item) for item in text.strip("()").split(","))
+        return self.number(text)
+
+
+@dataclass(frozen=True)
+class DeviceClassInfo:
+    name: str  # Nombre de la clase: UFHCController, Generator, Fancoil...
+    cls: type
+    r_files: Tuple[str, ...]  # Atributos que se publican en los archivos de intercambio
+    rw_files: Tuple[str, ...]  # Atributos que se pueden modificar desde la web
+    schemas: Mapping[str, FileSchema] = field(default_factory=lambda: MappingProxyType({}))  # {atributo: esquema}
+
+    def decode(self, attr: str, text: str) -> Any:
+        """
+        Valor del archivo de intercambio 'attr' con el texto 'text'. Los archivos sin esquema se interpretan con
+        decode
+        Raises: ValueError si el texto no cumple el esquema del archivo
+        """
+        schema = self.schemas.get(attr)
+        if schema is None:
+            return decode(text)
+        return schema.decode(text)
+
+
+def get_schema(schemas: Dict[str, Tuple], attr: str) -> Union[FileSchema, None]:
+    """
+    Esquema del archivo 'attr' en 'schemas' (EXCHANGE_SCHEMAS de una clase). Los archivos numerados (sp1, iv2...)
+    usan el de su nombre sin número
+    """
+    schema = schemas.get(attr) or schemas.get(attr.rstrip("0123456789"))
+    return FileSchema(*schema) if schema is not None else None
+
+
+def build_registry(system_classes: Dict[str, type]) -> Mapping[str, DeviceClassInfo]:
+    """
+    Registro {nombre de la clase: DeviceClassInfo} de las clases de dispositivos de 'system_classes'
+    """
+    registry = {}
+    for cls in system_classes.values():
+        name = cls.__name__
+        if name in NOT_EXCHANGED:
+            continue
+        r_files = tuple(EXCHANGE_R_FILES.get(name, ()))
+        rw_files = tuple(EXCHANGE_RW_FILES.get(name, ()))
+        class_schemas = EXCHANGE_SCHEMAS.get(name, {})
+        schemas = {}
+        for attr in dict.fromkeys(r_files + rw_files):
+            schema = get_schema(class_schemas, attr)
+            if schema is None:
+                log.warning("El archivo de intercambio %s de la clase %s no tiene esquema en EXCHANGE_SCHEMAS",
+                            attr, name)
+                continue
+            schemas[attr] = schema
+        registry[name] = DeviceClassInfo(name, cls, r_files, rw_files, MappingProxyType(schemas))
+    log.debug("Clases de dispositivos del sistema: %s", tuple(registry))
+    return MappingProxyType(registry)
+
+
+def encode(value: Any) -> str:
+    """
+    Texto que se guarda en el archivo de intercambio. Los valores nulos devuelven ""
+    """
+    return "" if value in (None, "None") else f"{value}"
+
+
+def decode(text: str) -> Any:
+    """
+    Valor del texto de un archivo de intercambio sin esquema: tupla de enteros, float, int o str
+    """
+    if '(' in text:  # Is Tuple
+        return tuple(map(int, text.strip('()').split(', ')))
+    if '.' in text:  # Is float
+        return float(text)
+    if text.isdecimal():  # Is int
+        return int(text)
+    return str(text)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Escrituras agrupadas en los dispositivos de un mismo modelo: las escrituras idénticas apuntadas en un lote (batch)
+se envían juntas al cerrarlo, en una trama de difusión o en ráfaga.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Tuple, Union
+
+from mb_utils import port_arbiter
+from mb_utils.transport import is_tcp
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+GROUP_CLIENT = "grupo"  # Cliente de los turnos del puerto que ocupan las escrituras agrupadas
+
+# Escrituras pendientes del lote en curso: {(puerto, esclavo, operación, registro): (dispositivo, valor)}
+_pending: ContextVar[Union[Dict[Tuple, Tuple], None]] = ContextVar("group_writes", default=None)
+
+
+def defer(device, mbop: int, adr: int, value: int) -> bool:
+    """
+    Apunta la escritura de 'value' en el registro 'adr' de 'device' con la operación 'mbop' para enviarla al cerrar
+    el lote. Es lo que hace set_value(..., group=True) dentro de un lote. No se agrupan las escrituras en registros
+    que comparten byte alto y byte bajo con otros valores, porque supersede no las distingue
+    Returns: True si se ha apuntado y False si no hay un lote en curso o la operación no es válida en el dispositivo,
+    en cuyo caso hay que escribir directamente
+    """
+    pending = _pending.get()
+    if pending is None or mbop not in device.write_ops:
+        return False
+    key = (device.port, device.slave, mbop, adr)
+    pending.pop(key, None)  # La escritura repetida pasa al final
+    pending[key] = (device, value)
+    return True
+
+
+def supersede(device, mbop: int, adr: int) -> bool:
+    """
+    Descarta la escritura apuntada en el registro 'adr' de 'device' con la operación 'mbop' porque una escritura
+    directa posterior la sustituye y no debe sobrescribirla al cerrar el lote
+    Returns: True si había una escritura apuntada
+    """
+    pending = _pending.get()
+    if pending is None:
+        return False
+    return pending.pop((device.port, device.slave, mbop, adr), None) is not None
+
+
+@asynccontextmanager
+async def batch(devices: Iterable):
+    """
+    Lote de escrituras agrupadas, p. ej. al cambiar el modo calefacción/refrigeración del sistema. Se envían al salir
+    del bloque 'async with'
+        async with group_writes.batch(dispositivos):
+            ...
+    Params:
+        devices: dispositivos del proyecto, para saber qué esclavos reciben la difusión en cada puerto
+    """
+    pending = {}
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+        await flush(pending, devices)
+
+
+async def flush(pending: Dict[Tuple, Tuple], devices: Iterable):
+    """
+    Envía las escrituras apuntadas en 'pending' agrupando las idénticas (mismo puerto, modelo, operación, registro y
+    valor). Los puertos se atienden a la vez
+    """
+    if not pending:
+        return
+    port_slaves = {}  # {puerto: {esclavos}}
+    for device in devices:
+        port_slaves.setdefault(device.port, set()).add(device.slave)
+    groups = {}  # {puerto: {(marca, modelo, operación, registro, valor): [dispositivos]}}
+    for (port, _, mbop, adr), (device, value) in pending.items():
+        groups.setdefault(port, {}).setdefault((device.brand, device.model, mbop, adr, value), []).append(device)
+    await asyncio.gather(*[write_port_groups(port, port_groups, port_slaves.get(port, set()))
+                           for port, port_groups in groups.items()])
+
+
+async def write_port_groups(port: str, groups: Dict[Tuple, List], slaves: set):
+    for (brand, model, mbop, adr, value), group in groups.items():
+        if len(group) > 1 and f"{brand}_{model}" in MODBUS_BROADCAST_MODELS and not is_tcp(port) and \
+                {device.slave for device in group} == slaves:
+            # La difusión (esclavo 0) la reciben todos los esclavos del puerto sea cual sea su modelo, así que sólo se
+            # usa si el grupo los incluye a todos. Los esclavos no responden: se espera a que la procesen
+            log.info("Difusión en %s: valor %s en el registro %s de %s esclavos %s_%s",
+                     port, value, adr, len(group), brand, model)
+            async with port_arbiter.turn(port, GROUP_CLIENT, PORT_WRITE_MAX_WAIT):
+                await group[0].broadcast_in_turn(mbop, adr, value)
+                await asyncio.sleep(MODBUS_BROADCAST_DELAY)
+        elif is_tcp(port):  # Todas a la vez, aprovechando las peticiones simultáneas de la conexión con la pasarela
+            await asyncio.gather(*[device.do_write(device.slave, mbop, adr, value) for device in group])
+        else:  # Una escritura detrás de otra en un único turno del puerto
+            log.debug("Ráfaga en %s: valor %s en el registro %s de %s esclavos %s_%s",
+                      port, value, adr, len(group), brand, model)
+            async with port_arbiter.turn(port, GROUP_CLIENT, PORT_WRITE_MAX_WAIT):
+                for device in group:
+                    await device.write_in_turn(device.slave, mbop, adr, value)
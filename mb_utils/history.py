@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Histórico de lecturas ModBus y de los valores calculados para los grupos de habitaciones, en archivos anillo de
+registros de ancho fijo con un nivel por resolución de HISTORY_TIERS.
+"""
+import json
+import math
+import struct
+from datetime import datetime
+from os import makedirs, path, remove
+from typing import Any, Dict, List, Tuple
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+NUMERIC = "n"  # Valor numérico. Al reducir resolución se calcula la media
+HB_LB = "hl"  # Tupla con los bytes alto y bajo (regops.get_hb_lb). Se guarda el valor de 16 bits
+BITS = "bits"  # Tupla con los 16 bits del registro (regops.get_bits). Se guarda el valor de 16 bits
+NAN = float("nan")
+
+_index = None  # Columnas de cada entidad, cargadas desde HISTORY_INDEX_FILE
+
+
+def device_entity(bus_id: [int, str], device_id: [int, str]) -> str:
+    """
+    Nombre de la entidad del histórico para el dispositivo 'device_id' del bus 'bus_id'
+    """
+    return f"bus{bus_id}_dev{device_id}"
+
+
+def roomgroup_entity(roomgroup_id: str) -> str:
+    """
+    Nombre de la entidad del histórico para el grupo de habitaciones 'roomgroup_id'
+    """
+    return f"rg{roomgroup_id}"
+
+
+def device_columns(regmap: dict) -> List[Tuple[str, str]]:
+    """
+    Obtiene las columnas del histórico de un dispositivo a partir de su mapa de registros.
+    La columna de cada registro se llama <tipo de registro><dirección>, por ejemplo 'ir16'.
+    Param:
+        regmap: Mapa de registros del dispositivo
+    Returns: Lista de tuplas (columna, tipo de valor)
+    """
+    columns = []
+    for dtype in MODBUS_DATATYPES_KEYS.values():
+        regs = regmap.get(dtype)
+        if not regs:
+            continue
+        for adr in sorted(regs.keys(), key=int):
+            conv_f_read = regs[adr].get("conv_f_read")
+            last_op = conv_f_read[-1] if isinstance(conv_f_read, list) and conv_f_read else conv_f_read
+            kind = HB_LB if last_op == 6 else BITS if last_op == 9 else NUMERIC
+            columns.append((f"{dtype}{adr}", kind))
+    return columns
+
+
+def _encode(value, kind: str) -> float:
+    """
+    Convierte el valor leído en el float a almacenar. Los valores no numéricos se guardan como NaN
+    """
+    if value is None:
+        return NAN
+    if isinstance(value, (tuple, list)):
+        if kind == HB_LB and len(value) == 2:
+            return float(value[0] * 256 + value[1])
+        if kind == BITS:
+            return float(sum(int(bit) << idx for idx, bit in enumerate(value)))
+        return NAN
+    if isinstance(value, (bool, int, float)):
+        return float(value)
+    return NAN
+
+
+def _decode(value: float, kind: str):
+    """
+    Operación inversa a _encode. Devuelve None si no hay valor almacenado
+    """
+    if math.isnan(value):
+        return
+    if kind == HB_LB:
+        value = int(value)
+        return value // 256, value % 256
+    if kind == BITS:
+        value = int(value)
+        return tuple((value >> idx) & 1 for idx in range(16))
+    return round(value, 3)
+
+
+def _ring_file(entity: str, resolution: int) -> str:
+    # Un archivo anillo por entidad (dispositivo de un bus o grupo de habitaciones) y nivel de HISTORY_TIERS
+    return f"{HISTORY_FOLDER}{entity}_{resolution}.hist"
+
+
+def _record_struct(ncols: int) -> struct.Struct:
+    # Registro de ancho fijo: hora (uint32, segundos epoch) y un float32 por columna
+    return struct.Struct(f"<I{ncols}f")
+
+
+def _load_index() -> dict:
+    global _index
+    if _index is None:
+        _index = {}
+        if path.isfile(HISTORY_INDEX_FILE):
+            try:
+                with open(HISTORY_INDEX_FILE, "r") as f:
+                    _index = json.load(f)
+            except ValueError as e:
+                log.error("No se puede leer el índice del histórico %s\n%s", HISTORY_INDEX_FILE, e)
+    return _index
+
+
+def _check_layout(entity: str, columns: List[Tuple[str, str]]):
+    """
+    Comprueba que las columnas de la entidad coinciden con las guardadas en el índice.
+    Si han cambiado (nuevo mapa de registros), se eliminan los archivos anteriores de la entidad.
+    """
+    index = _load_index()
+    layout = [list(col) for col in columns]
+    if index.get(entity) == layout:
+        return
+    if entity in index:
+        log.debug("Histórico %s: han cambiado las columnas. Se reinicia el histórico de la entidad", entity)
+        for resolution, _ in HISTORY_TIERS:
+            ring_file = _ring_file(entity, resolution)
+            if path.isfile(ring_file):
+                remove(ring_file)
+    index[entity] = layout
+    if not path.isdir(HISTORY_FOLDER):
+        makedirs(HISTORY_FOLDER)
+    with open(HISTORY_INDEX_FILE, "w") as f:
+        json.dump(index, f)
+
+
+def _prepare_ring(ring_file: str, rec: struct.Struct, nslots: int):
+    """
+    Crea el archivo anillo con todos los registros vacíos (hora 0) si no existe o si su tamaño no corresponde con
+    el nº de registros configurado en HISTORY_TIERS
+    """
+    size = rec.size * nslots
+    if path.isfile(ring_file) and path.getsize(ring_file) == size:
+        return
+    with open(ring_file, "wb") as f:
+        f.truncate(size)
+
+
+def _read_rows(ring_file: str, rec: struct.Struct, nslots: int, resolution: int,
+               t_from: int, t_to: int) -> List[Tuple]:
+    """
+    Lee los registros del anillo entre las horas t_from y t_to (segundos epoch), ordenados por hora.
+    Se descartan los registros vacíos y los de vueltas anteriores del anillo.
+    """
+    if not path.isfile(ring_file):
+        return []
+    first = t_from // resolution
+    last = t_to // resolution
+    if last < first:
+        return []
+    count = min(last - first + 1, nslots)
+    first = last - count + 1
+    start = first % nslots
+    with open(ring_file, "rb") as f:
+        f.seek(start * rec.size)
+        n_first = min(count, nslots - start)
+        data = f.read(n_first * rec.size)
+        if n_first < count:
+            f.seek(0)
+            data += f.read((count - n_first) * rec.size)
+    data = data[:len(data) - len(data) % rec.size]
+    return [row for row in rec.iter_unpack(data) if row[0] and first <= row[0] // resolution <= last]
+
+
+def _aggregate(rows: List[Tuple], kinds: List[str]) -> List[float]:
+    """
+    Reduce varios registros a uno: media de los valores numéricos y último valor de los registros empaquetados
+    """
+    values = []
+    for idx, kind in enumerate(kinds, start=1):
+        col = [row[idx] for row in rows if not math.isnan(row[idx])]
+        if not col:
+            values.append(NAN)
+        elif kind == NUMERIC:
+            values.append(sum(col) / len(col))
+        else:
+            values.append(col[-1])
+    return values
+
+
+def record(entity: str, columns: List[Tuple[str, str]], values: dict, hora: [datetime, None] = None):
+    """
+    Añade una lectura al histórico de 'entity' y recalcula los niveles de menor resolución.
+    Params:
+        entity: nombre de la entidad (device_entity, roomgroup_entity)
+        columns: lista de tuplas (columna, tipo de valor)
+        values: diccionario columna: valor. Las columnas que falten se guardan vacías
+        hora: hora de la lectura. Por defecto la hora actual
+    """
+    hora = datetime.now() if hora is None else hora
+    ts = int(hora.timestamp())
+    _check_layout(entity, columns)
+    kinds = [kind for _, kind in columns]
+    rec = _record_struct(len(columns))
+    row = [_encode(values.get(col), kind) for col, kind in columns]
+    for tier, (resolution, nslots) in enumerate(HISTORY_TIERS):
+        slot_time = ts - ts % resolution
+        # Los niveles de menor resolución se recalculan a partir del anterior en cada lectura, de modo que el
+        # histórico no mantiene estado en memoria entre ejecuciones de main.py
+        if tier > 0:
+            prev_resolution, prev_nslots = HISTORY_TIERS[tier - 1]
+            rows = _read_rows(_ring_file(entity, prev_resolution), rec, prev_nslots, prev_resolution,
+                              slot_time, slot_time + resolution - 1)
+            if not rows:
+                break
+            row = _aggregate(rows, kinds)
+        ring_file = _ring_file(entity, resolution)
+        _prepare_ring(ring_file, rec, nslots)
+        with open(ring_file, "r+b") as f:
+            # La posición del registro se obtiene de la hora: no hace falta un índice y una consulta de tendencia se
+            # resuelve con una o dos lecturas contiguas del archivo
+            f.seek((slot_time // resolution) % nslots * rec.size)
+            f.write(rec.pack(slot_time, *row))
+
+
+def get_history(entity: str, t_from: datetime, t_to: [datetime, None] = None,
+                columns: [List[str], None] = None,
+                resolution: [int, None] = None) -> Dict[str, List[Tuple[datetime, Any]]]:
+    """
+    Devuelve la tendencia de las columnas de una entidad entre las horas t_from y t_to.
+    Si no se indica la resolución, se usa el nivel más fino de HISTORY_TIERS que cubre t_from.
+    Params:
+        entity: nombre de la entidad (device_entity, roomgroup_entity)
+        t_from, t_to: intervalo de la consulta. Por defecto t_to es la hora actual
+        columns: columnas a devolver. Por defecto todas
+        resolution: resolución en segundos de uno de los niveles de HISTORY_TIERS
+    Returns: diccionario columna: lista de tuplas (hora, valor). None si la entidad no tiene histórico
+    """
+    layout = _load_index().get(entity)
+    if layout is None:
+        log.error("No hay histórico de %s", entity)
+        return
+    t_to = datetime.now() if t_to is None else t_to
+    ts_from = int(t_from.timestamp())
+    ts_to = int(t_to.timestamp())
+    tiers = dict(HISTORY_TIERS)
+    if resolution not in tiers:
+        now = int(datetime.now().timestamp())
+        resolution = next((res for res, nslots in HISTORY_TIERS if now - ts_from <= res * nslots),
+                          HISTORY_TIERS[-1][0])
+    rows = _read_rows(_ring_file(entity, resolution), _record_struct(len(layout)), tiers[resolution], resolution,
+                      ts_from, ts_to)
+    trend = {}
+    for idx, (col, kind) in enumerate(layout, start=1):
+        if columns is not None and col not in columns:
+            continue
+        trend[col] = [(datetime.fromtimestamp(row[0]), _decode(row[idx], kind))
+                      for row in rows if not math.isnan(row[idx])]
+    return trend
+
+
+def get_source_history(source: [dict, None], t_from: datetime, t_to: [datetime, None] = None,
+                       resolution: [int, None] = None) -> [List[Tuple[datetime, Any]], None]:
+    """
+    Tendencia de un registro ModBus indicado como en get_value: diccionario con bus, device, datatype y adr
+    """
+    if not source:
+        return
+    col = f"{source.get('datatype')}{source.get('adr')}"
+    trend = get_history(device_entity(source.get("bus"), source.get("device")), t_from, t_to, [col], resolution)
+    return trend.get(col) if trend is not None else None
+
+
+def get_room_history(room, t_from: datetime, t_to: [datetime, None] = None,
+                     resolution: [int, None] = None) -> Dict[str, List[Tuple[datetime, Any]]]:
+    """
+    Tendencias de temperatura, consigna, humedad relativa y calidad de aire de una habitación (Room),
+    a partir de los registros de los que se obtienen sus valores
+    """
+    trends = {}
+    for attr in ("rt", "sp", "rh", "aq"):
+        trend = get_source_history(getattr(room, f"{attr}_source"), t_from, t_to, resolution)
+        if trend is None:
+            continue
+        if attr == "rh":  # La HR del X148 se obtiene como tupla HB y LB y la HR es el LB (Room.get_rh)
+            trend = [(hora, val[1] if isinstance(val, tuple) else val) for hora, val in trend]
+        trends[attr] = trend
+    return trends
+
+
+def get_roomgroup_history(roomgroup_id: str, t_from: datetime, t_to: [datetime, None] = None,
+                          columns: [List[str], None] = None,
+                          resolution: [int, None] = None) -> Dict[str, List[Tuple[datetime, Any]]]:
+    """
+    Tendencias de los valores calculados para un grupo de habitaciones (ROOMGROUP_HISTORY_FIELDS)
+    """
+    return get_history(roomgroup_entity(roomgroup_id), t_from, t_to, columns, resolution)
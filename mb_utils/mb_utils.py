@@ -2,8 +2,15 @@
 import sys
 from asyncio import create_task, gather
 from os import path
+from types import MappingProxyType
 import phoenix_init as phi
+from mb_utils import exchange, group_writes, history, read_size, snapshots, timing, write_check
+from mb_utils.device_state import save_devices_state
+from publish import events, metrics
 from regops.regops import group_adrs, recursive_conv_f
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
 
 
 def get_value(value_source: [dict, None]) -> [int, float, bool, phi.Tuple]:
@@ -17,13 +24,22 @@ def get_value(value_source: [dict, None]) -> [int, float, bool, phi.Tuple]:
     # print(f"get_value value_source: {value_source}")
     if value_source is None:
         return
+    # Las fuentes comprobadas al arrancar (mb_utils.project_check) dan directamente las claves de datadb
+    handle = phi.source_handles.get((value_source.get("bus"), value_source.get("device"),
+                                     value_source.get("datatype"), value_source.get("adr")))
+    if handle is not None:
+        bus_id, device_id, datatype, adr = handle
+        try:
+            return phi.datadb["buses"][bus_id][device_id]["data"][datatype].get(adr)
+        except (KeyError, TypeError):  # Dispositivo o tipo de registro sin lecturas
+            return
     bus_id = str(value_source.get("bus"))  # En el JSON, el bus_id que conecta la habitación con el dispositivo
     # se introduce como un entero, pero la clave del diccionario con los datos leídos son str
     device_id = str(value_source.get("device"))  # OJO, es el ID del Device en la base de datos, NO EL SLAVE
     datatype = value_source.get("datatype")
     adr = str(value_source.get("adr"))  # Sucede lo mismo que con el bus_id
     if any([bus_id is None, device_id is None, datatype is None, adr is None]):
-        print(f"ERROR - No se ha podido leer el valor del {datatype} {adr} en esclavo {device_id}/bus{bus_id}")
+        log.error("No se ha podido leer el valor del %s %s en esclavo %s/bus%s", datatype, adr, device_id, bus_id)
         return
     if phi.datadb is not None:
         buses_data = phi.datadb.get("buses")
@@ -42,8 +58,9 @@ def get_value(value_source: [dict, None]) -> [int, float, bool, phi.Tuple]:
                         value = regs.get(adr)
                         return value
                 else:
-                    print(f"get_value - No se han encontrado datos del dispositivo {device_id} en el bus {bus_id}")
-                    print(f"get_value\n{phi.datadb}")
+                    log.debug("get_value - No se han encontrado datos del dispositivo %s en el bus %s",
+                              device_id, bus_id)
+                    log.debug("get_value\n%s", phi.datadb)
 
 
 def save_value(value_target: [dict, None], new_value: [int, float, bool, phi.Tuple]) -> [int, float, bool, phi.Tuple]:
@@ -63,7 +80,7 @@ def save_value(value_target: [dict, None], new_value: [int, float, bool, phi.Tup
     datatype = value_target.get("datatype")
     adr = str(value_target.get("adr"))  # Sucede lo mismo que con el bus_id
     if any([bus_id is None, device_id is None, datatype is None, adr is None]):
-        print(f"ERROR - No se ha podido leer el valor del {datatype} {adr} en esclavo {device_id}/bus{bus_id}")
+        log.error("No se ha podido leer el valor del %s %s en esclavo %s/bus%s", datatype, adr, device_id, bus_id)
         return
     if phi.datadb is not None:
         buses_data = phi.datadb.get("buses")
@@ -86,23 +103,21 @@ def save_value(value_target: [dict, None], new_value: [int, float, bool, phi.Tup
                             #       phi.datadb["buses"][bus_id][device_id]["data"][datatype][adr] )
                             # sys.exit()
                             if isinstance(old_value, float):
-                                phi.datadb["buses"][bus_id][device_id]["data"][datatype][adr] = float(new_value)
-                        elif isinstance(old_value, int):
-                            phi.datadb["buses"][bus_id][device_id]["data"][datatype][adr] = int(new_value)
-                        else:
-                            phi.datadb["buses"][bus_id][device]["data"][datatype][adr] = new_value
-                        print(f"\nsave_value. Valor anterior {old_value}/{type(old_value)} "
-                              f"actualizado a {new_value}/{type(new_value)}")
-                        check_new_value = get_value(value_target)
-                        print(f"save_value. Comprobando actualización. "
-                              f"Nuevo valor leído en db: {check_new_value}\n")
-                        return check_new_value
+                                regs[adr] = float(new_value)
+                            elif isinstance(old_value, int):
+                                regs[adr] = int(new_value)
+                            else:  # Tuplas de byte alto y byte bajo
+                                regs[adr] = new_value
+                            log.debug("save_value. Valor anterior %s/%s actualizado a %s/%s",
+                                      old_value, type(old_value), new_value, type(new_value))
+                            return regs[adr]
                 else:
-                    print(f"save_value - No se han encontrado datos del dispositivo {device_id} en el bus {bus_id}")
-                    print(f"save_value\n{phi.datadb}")
+                    log.debug("save_value - No se han encontrado datos del dispositivo %s en el bus %s",
+                              device_id, bus_id)
+                    log.debug("save_value\n%s", phi.datadb)
 
 
-async def set_value(value_source: [dict, None], new_value: [int, float]) -> [int, None]:
+async def set_value(value_source: [dict, None], new_value: [int, float], group: bool = False) -> [int, None]:
     """
     Escribe el valor 'new_value' en el destino indicado en value_source.
     El valor new_value es un valor real de la magnitud que representa.
@@ -113,6 +128,8 @@ async def set_value(value_source: [dict, None], new_value: [int, float]) -> [int
     Params value_source: diccionario que indica el bus, el esclavo, el tipo de registro y el registro en el que se
     va a escribir
     new_value: valor a escribir
+    group: dentro de un lote de mb_utils.group_writes, la escritura se envía al cerrar el lote junto con las
+    idénticas de otros dispositivos del mismo modelo
     Returns: Resultado de la operación de escritura
     None si el valor que se quiere leer no existe en la base de datos
     """
@@ -126,8 +143,8 @@ async def set_value(value_source: [dict, None], new_value: [int, float]) -> [int
     # operaciones de conversión de 'new_value', el registro 'adr' se busca como clave str en la base de datos del
     # dispositivo
     if any([bus_id is None, device_id is None, datatype is None, adr is None]):
-        print(f"ERROR - No se puede escribir el valor {new_value} en el {datatype} {adr} del "
-              f"esclavo {device_id}/bus{bus_id}")
+        log.error("No se puede escribir el valor %s en el %s %s del esclavo %s/bus%s",
+                  new_value, datatype, adr, device_id, bus_id)
         return
     device = phi.buses.get(bus_id).get(device_id)  # Devuelve el dispositivo en el que se va a escribir
     device_register_map = get_regmap(device)
@@ -135,11 +152,11 @@ async def set_value(value_source: [dict, None], new_value: [int, float]) -> [int
     # del registro a escribir
     if conv_f_write is not None:
         modbus_value = recursive_conv_f(conv_f_write, new_value, dtype=phi.TYPE_INT, prec=1)
-        print(f"Escribiendo el valor real {new_value}, convertido para el dispositivo en {modbus_value}, "
-              f"en el dispositivo {device.name}")
+        log.debug("Escribiendo el valor real %s, convertido para el dispositivo en %s, en el dispositivo %s",
+                  new_value, modbus_value, device.name)
     else:
         modbus_value = new_value
-        print(f"Escribiendo el valor {new_value} en el dispositivo {device.name}")
+        log.debug("Escribiendo el valor %s en el dispositivo %s", new_value, device.name)
 
     # Compruebo las operaciones de escritura admitidas para el dispositivo
     modbus_operation = None
@@ -152,49 +169,48 @@ async def set_value(value_source: [dict, None], new_value: [int, float]) -> [int
             if phi.MODBUS_WRITE_OPERATIONS["SINGLE_REGISTER"] in device.write_ops \
             else phi.MODBUS_WRITE_OPERATIONS["MULTIPLE_REGISTERS"]
     else:
-        print(f"Operación de escritura no habilitada para el registro {adr} de tipo {datatype}")
+        log.debug("Operación de escritura no habilitada para el registro %s de tipo %s", adr, datatype)
+
+    # El almacén de lecturas se actualiza con el valor que devolverá la siguiente lectura. Si cambia, el dispositivo
+    # lo confirma al cerrar el lote de escrituras (mb_utils.write_check)
+    if modbus_operation is not None:
+        read_value = as_reading(device_register_map.get(datatype).get(adr), modbus_value)
+        if get_value(value_source) != read_value:
+            write_check.expect(device, value_source, device_register_map.get(datatype), modbus_value)
+        save_value(value_source, read_value)
+
+    if group and group_writes.defer(device, modbus_operation, int(adr), modbus_value):
+        log.debug("Escritura del valor %s en el registro %s de %s agrupada", modbus_value, adr, device.name)
+        return
+    if group_writes.supersede(device, modbus_operation, int(adr)):
+        log.debug("Se descarta la escritura agrupada pendiente en el registro %s de %s", adr, device.name)
 
     res = await device.write(modbus_operation, int(adr), modbus_value)
-    print(f"Operación Modbus, adr, valor a escribir, resultado {modbus_operation}, {int(adr)}, "
-          f"{modbus_value}/{type(modbus_value)}, {res}")
+    log.debug("Operación Modbus, adr, valor a escribir, resultado %s, %s, %s/%s, %s",
+              modbus_operation, int(adr), modbus_value, type(modbus_value), res)
 
     return res
 
 
-async def get_h(temp: [int, float], rel_hum: [int, float], altitud=phi.ALTITUD) -> [float, None]:
+def as_reading(register: dict, modbus_value):
     """
-    Calcula la entalpia a partir de un valor de temp en celsius y hr en %. Por defecto se toma la altitud de Madrid
-    Si no se lee la humedad relativa, se devuelve 0
+    Valor que se obtiene al leer 'modbus_value' del registro 'register' del mapa de registros, tras aplicar sus
+    funciones de conversión de lectura
     """
-    # print(f"Calculando entalpía de {self.name}")
-    if rel_hum is None or rel_hum == 0:
-        return 0
-    pres_total = 101325 if altitud is None else 101325 * (1 - 2.25577 * 0.00001 * altitud) ** 5.2559
-    nullvalues = ("", None, "false")
-    if any((temp in nullvalues, rel_hum in nullvalues)):
-        return
-    pres_vap_sat = 10 ** (7.5 * temp / (273.159 + temp - 35.85) + 2.7858)  # Pa
-    # print(f"presion vapor saturado: {pres_vap_sat}")
-    pres_vap = pres_vap_sat * rel_hum / 100  # Pa
-    # print(f"presion total: {pres_total}")
-    # print(f"presion vapor: {pres_vap}")
-    pres_aire_seco = pres_total - pres_vap  # Pa
-    # print(f"presion aire seco: {pres_aire_seco}")
-    hum_especifica = 0.621954 * (pres_vap / pres_aire_seco)  # kg agua / hg aire seco
-    entalpia = (1.006 + 1.86 * hum_especifica) * temp + 2501 * hum_especifica
-    return round(entalpia, 1)
-
-
-async def get_dp(temp: [int, float], rel_hum: [int, float]) -> [float, None]:
-    """
-        Calcula el punto de rocío a partir de una temp en celsius y hr en %.
-        Si la temperatura o la humedad no tienen valores válidos, se devuelve None
-        """
-    nullvalues = ("", None, "false", 0)
-    if any((temp in nullvalues, rel_hum in nullvalues)):
-        return
-    t_rocio = (rel_hum / 100) ** (1 / 8) * (112 + 0.9 * temp) + 0.1 * temp - 112
-    return round(t_rocio, 1)
+    conv_f_read = register.get("conv_f_read")
+    if conv_f_read is None:
+        return modbus_value
+    return recursive_conv_f(conv_f_read, modbus_value, phi.TYPE_FLOAT, 1)
+
+
+def save_read_back(value_target: dict, modbus_value: int):
+    """
+    Corrige el almacén de lecturas con el valor leído del dispositivo cuando no coincide con el escrito
+    (mb_utils.write_check)
+    """
+    device = phi.buses.get(str(value_target.get("bus"))).get(str(value_target.get("device")))
+    register = get_regmap(device).get(value_target.get("datatype")).get(str(value_target.get("adr")))
+    save_value(value_target, as_reading(register, modbus_value))
 
 
 def get_regmap(device: phi.MBDevice) -> [dict, None]:
@@ -225,22 +241,29 @@ async def read_device_datatype(device: phi.MBDevice, regmap: dict, dtype: int) -
         phi.MODBUS_DATATYPES_KEYS.get(dtype))  # Diccionario con todos los datos de tipo "dtype" del dispositivo
     # modbus_operation = MODBUS_DATATYPES_KEYS.get(dtype)
     if regs is not None:  # El dispositivo tiene registros del tipo "dtype"
-        addresses = sorted([int(adr) for adr in regs.keys()])  # Lista ordenada de registros a leer
-        # print(f"Registros del JSON: {addresses}")
-        grouped_addresses = group_adrs(addresses)  # Agrupo las direcciones de registros que van consecutivas
+        plan = phi.read_blocks.get((str(device.bus_id), str(device.device_id)))
+        if plan is not None:
+            # Plan de lectura (mb_utils.read_plan): sólo los bloques con registros que utiliza el proyecto
+            grouped_addresses = plan.get(phi.MODBUS_DATATYPES_KEYS.get(dtype))
+            if not grouped_addresses:
+                return {phi.MODBUS_DATATYPES_KEYS.get(dtype): None}
+        else:
+            addresses = sorted([int(adr) for adr in regs.keys()])  # Lista ordenada de registros a leer
+            grouped_addresses = group_adrs(addresses)  # Agrupo las direcciones de registros que van consecutivas
         # print(f"\nRegistros tipo {MODBUS_DATATYPES[dtype]}: {grouped_addresses}")
-        read_data = []
+        read_data = {}
         # print(f"read_device_datatype - Grupos de registros: \n{grouped_addresses}")
         for reggr in grouped_addresses:
             reading = await device.read(modbus_operation, reggr[0], reggr[1])
             if reading is not None:
-                read_data += reading[:reggr[1]]  # Ajusto la cantidad de valores devueltos porque con COILS y
-                # DISCRETE INPUTS la librería devuelve múltiplos de 8 valores y necesito que la respuesta coincida
-                # con el número de registros solicitados
+                # Ajusto la cantidad de valores devueltos porque con COILS y DISCRETE INPUTS la librería devuelve
+                # múltiplos de 8 valores. Cada valor se asocia a su dirección aunque falle la lectura de otro bloque
+                read_data.update(zip(range(reggr[0], reggr[0] + reggr[1]), reading[:reggr[1]]))
                 # print(f"Lectura {phi.MODBUS_DATATYPES[dtype]}: {reading}")
         # print(f"Lectura completa: {read_data}")
         if read_data:
-            adr_value_tuples = list(zip(addresses, read_data))
+            # Los bloques del plan de lectura pueden incluir registros que no están en el mapa
+            adr_value_tuples = [(adr, valor) for adr, valor in read_data.items() if str(adr) in regs]
             # print(f"read_device_datatype:\n{adr_value_tuples}")
             for idx, result in enumerate(adr_value_tuples):
                 regadr = str(result[0])  # En el JSON, los registros son keys y, por tanto, strings
@@ -283,7 +306,7 @@ async def read_project_device(device: phi.MBDevice) -> [str, None]:
     """
     rmap = get_regmap(device)
     name = rmap.get("name")
-    print(f"\nNombre del dispositivo: {name}")
+    log.debug("Nombre del dispositivo: %s", name)
     reading_tasks = [create_task(read_device_datatype(device, rmap, datatype))
                      for datatype in tuple(phi.MODBUS_DATATYPES.keys())]
 
@@ -292,10 +315,48 @@ async def read_project_device(device: phi.MBDevice) -> [str, None]:
     return readings
 
 
+async def read_port_devices(lectura_actual: dict, port_devices: list):
+    """
+    Lee los dispositivos conectados a un mismo puerto y guarda los valores leídos en 'lectura_actual'.
+    Los dispositivos se leen a la vez. En un puerto serie, mb_utils.port_arbiter reparte por rotación los turnos del
+    puerto entre los dispositivos de todos los buses que lo comparten. Tras una pasarela TCP es la conexión con la
+    pasarela (mb_utils.transport) la que limita las peticiones simultáneas.
+    Params:
+        lectura_actual: diccionario con la lectura de todos los buses que está componiendo read_all_buses
+        port_devices: lista de tuplas (id del bus, id del dispositivo, dispositivo)
+    """
+
+    async def read_device(idbus, iddevice, device):
+        # Lee el dispositivo completo y almacena la información en un fichero en memoria StringIO?
+        device_readings = await read_project_device(device)  # Lectura ModBus
+        # print(f"\n\tLECTURA DISPOSITIVO\t{device.name}\n\t\t{device_readings}")
+        log.debug("%s - Finalizada la lectura del dispositivo %s", phi.datetime.now(), device.name)
+        log.debug("device_readings: %s", device_readings)
+        if all([x is None for x in device_readings]):
+            log.warning("No hay lecturas del dispositivo %s", device.name)
+            return
+        # lectura_actual["buses"][idbus][iddevice]["data"] = {}
+        for idx, regtype_readings in enumerate(device_readings):
+            regtypename = phi.MODBUS_DATATYPES.get(idx + 1)
+            if regtype_readings is None:
+                log.debug("El dispositivo no ha devuelto lecturas de registros del tipo: %s", regtypename)
+                continue  # JSC Modification on SETUP
+            if isinstance(regtype_readings, dict) and \
+                    len(regtype_readings.values()) == 1 and \
+                    list(regtype_readings.values())[0] is None:
+                log.debug("El dispositivo no tiene registros del tipo %s", regtypename)
+                continue  # JSC Modification on SETUP
+            for regtype, dev_response in regtype_readings.items():
+                lectura_actual["buses"][idbus][iddevice]["data"][regtype] = dev_response
+
+    await gather(*[read_device(*port_device) for port_device in port_devices])
+
+
 async def read_all_buses(id_lectura: int = 0):
     """
-    Recorre todos los buses y guarda en READINGS_FILE el diccionario con los valores leídos en los registros
+    Recorre todos los buses y guarda (mb_utils.snapshots) el diccionario con los valores leídos en los registros
     ModBus de todos los dispositivos.
+    Los dispositivos de distintos puertos (pasarelas TCP) se leen a la vez.
     Returns: diccionario con la última lectura: hora y buses con los valores de cada tipo de registro leído en cada
     dispositivo de cada bus.
     """
@@ -303,47 +364,56 @@ async def read_all_buses(id_lectura: int = 0):
 
     hora_lectura = phi.datetime.now()  # Hora actual en formato datetime
 
-    # historico_lecturas["lecturas"][id_lectura_actual] = {}
     lectura_actual = {
         "id": id_lectura,
         "hora": str(hora_lectura),
         "buses": {}
     }
-    print(f"(read_all_buses) {hora_lectura}: LEYENDO TODOS LOS BUSES\n")
+    log.debug("(read_all_buses) %s: LEYENDO TODOS LOS BUSES", hora_lectura)
+    ports = {}  # Dispositivos de cada puerto: {puerto: [(id del bus, id del dispositivo, dispositivo)]}
     for idbus, bus in phi.buses.items():
         lectura_actual["buses"][idbus] = {}
         for iddevice, device in bus.items():
             lectura_actual["buses"][idbus][iddevice] = {"slave": device.slave, "data": {}}
-            # lectura_actual["buses"][idbus][iddevice]["slave"] = device.slave
-            # Lee el dispositivo completo y almacena la información en un fichero en memoria StringIO?
-            device_readings = await read_project_device(device)  # Lectura ModBus
-            # print(f"\n\tLECTURA DISPOSITIVO\t{device.name}\n\t\t{device_readings}")
-            print(f"\n{str(phi.datetime.now())}\nDuración:\t{str(phi.datetime.now() - hora_lectura)}")
-            print(f"\ndevice_readings: {device_readings}")
-            if all([x is None for x in device_readings]):
-                print(f"No hay lecturas del dispositivo {device.name}")
-                continue
-            # lectura_actual["buses"][idbus][iddevice]["data"] = {}
-            for idx, regtype_readings in enumerate(device_readings):
-                regtypename = phi.MODBUS_DATATYPES.get(idx + 1)
-                if regtype_readings is None:
-                    print(f"DEBBUGGING {__file__}: El dispositivo no ha devuelto lecturas de "
-                          f"registros del tipo: {regtypename}")
-                    continue  # JSC Modification on SETUP
-                if isinstance(regtype_readings, dict) and \
-                        len(regtype_readings.values()) == 1 and \
-                        list(regtype_readings.values())[0] is None:
-                    print(f"El dispositivo no tiene registros del tipo {regtypename}")
-                    continue  # JSC Modification on SETUP
-                for regtype, dev_response in regtype_readings.items():
-                    lectura_actual["buses"][idbus][iddevice]["data"][regtype] = dev_response
-
-    # Guardo en el disco la última lectura
-    with open(phi.READINGS_FILE, "w") as f:  # El fichero se reescribe en cada bucle. No acumula históricos
-        phi.json.dump(lectura_actual, f)
+            ports.setdefault(device.port, []).append((idbus, iddevice, device))
+    await gather(*[read_port_devices(lectura_actual, port_devices) for port_devices in ports.values()])
+    # Los tiempos de respuesta y tamaños de lectura de los esclavos se guardan periódicamente para recuperarlos al
+    # arrancar
+    timing.save_timing()
+    read_size.save_read_sizes()
+
+    # Guardo en el disco la última lectura. Sólo se escriben los registros que han cambiado (mb_utils.snapshots)
+    changes = snapshots.save_readings(lectura_actual)
+    # Y envío esos cambios a los clientes suscritos a los eventos
+    events.publish_changes("readings", {"/".join(key): value for key, value in changes.items()})
+    # Y la añado al histórico de lecturas
+    save_readings_history(lectura_actual, hora_lectura)
     return lectura_actual
 
 
+def save_readings_history(lectura: dict, hora_lectura: phi.datetime):
+    """
+    Añade al histórico (mb_utils.history) los valores leídos en todos los dispositivos.
+    Un error al escribir el histórico no debe detener el control, por lo que sólo se informa del mismo.
+    Params:
+        lectura: diccionario con la lectura de todos los buses devuelto por read_all_buses
+        hora_lectura: hora de la lectura
+    """
+    for idbus, bus in lectura.get("buses").items():
+        for iddevice, device_reading in bus.items():
+            if not device_reading.get("data"):
+                continue
+            device = phi.buses.get(idbus).get(iddevice)
+            columns = history.device_columns(get_regmap(device))
+            values = {f"{regtype}{adr}": value
+                      for regtype, regs in device_reading["data"].items() if regs
+                      for adr, value in regs.items()}
+            try:
+                history.record(history.device_entity(idbus, iddevice), columns, values, hora_lectura)
+            except OSError as e:
+                log.error("No se ha podido guardar el histórico del dispositivo %s\n%s", device.name, e)
+
+
 def get_f_modif_timestamp(path_to_file: str) -> [str, None]:
     """
     Devuelve la fecha de la última modificación del archivo o None si el archivo no existe.
@@ -357,7 +427,7 @@ def get_f_modif_timestamp(path_to_file: str) -> [str, None]:
     file_exists = phi.os.path.isfile(path_to_file)
     if file_exists:
         last_mod_date = str(phi.datetime.fromtimestamp(phi.os.stat(path_to_file).st_mtime))
-        print(f"DEBUGGING {__file__}: Obteniendo fecha ultima modificacion {path_to_file}: {last_mod_date}")
+        log.debug("Obteniendo fecha ultima modificacion %s: %s", path_to_file, last_mod_date)
         return last_mod_date
     else:
         return None
@@ -379,20 +449,15 @@ async def check_changes_from_web() -> int:
          0 si no hay que modificar nada desde la web
     """
     # first_time = False
-    # Obtengo la fecha de la última lectura guardada:
-    if not path.isfile(phi.READINGS_FILE):
-        # No se ha generado el archivo con las últimas lecturas ModBus.
-        # Se recogen los valores almacenados en los ficheros de intercambio.
-        # first_time = True
-        # last_reading_time = None
+    # Obtengo la fecha de la última lectura. Se mantiene en memoria en phi.datadb y sólo si todavía no se ha leído
+    # en esta ejecución se recupera de la última lectura guardada
+    last_reading = phi.datadb if phi.datadb else snapshots.load_readings()
+    if not last_reading:
+        # No se ha guardado ninguna lectura ModBus.
         emsg = f"{phi.datetime.now}/ {__file__} (check_changes_from_web) ERROR - No se ha generado fichero de lecturas"
         raise FileNotFoundError(emsg)
-        # return
-    else:
-        with open(phi.READINGS_FILE, "r") as rf:
-            last_reading = phi.json.load(rf)
-            last_reading_time = last_reading.get("hora")
-            print(f"\nComprobando cambios desde la WEB:\n\tHora de la última lectura: {last_reading_time}")
+    last_reading_time = last_reading.get("hora")
+    log.debug("Comprobando cambios desde la WEB:\n\tHora de la última lectura: %s", last_reading_time)
 
     # Recorro todos los esclavos para ver si hay que actualizar algún valor
     attr_mod = {}
@@ -406,7 +471,7 @@ async def check_changes_from_web() -> int:
             checked_device = (bus_id, dev_sl)
             if checked_device in checked:  # Si ya he comprobado el dispositivo, no vuelvo a hacerlo (normalmente
                 # no va a haber dispositivos repetidos, pero por si acaso...
-                print(f"Ya se han comprobado los cambios del esclavo {dev_sl}: {dev.name} del bus {bus_id}")
+                log.debug("Ya se han comprobado los cambios del esclavo %s: %s del bus %s", dev_sl, dev.name, bus_id)
                 continue
             else:
                 checked.append(checked_device)
@@ -414,109 +479,149 @@ async def check_changes_from_web() -> int:
             if dev_class == "UFHCController":  # Los cambios en la centralita X148 ya se han comprobado
                 continue
 
-            xch_rw_files = phi.EXCHANGE_RW_FILES.get(dev_class)
+            class_info = phi.DEVICE_CLASSES.get(dev_class)
+            xch_rw_files = class_info.rw_files if class_info is not None else ()
             ex_folder_name = phi.EXCHANGE_FOLDER + r"/" + bus_id + r"/" + dev_sl
-            print(f"Comprobando esclavo {dev_sl}: {dev.name} (clase {dev_class})) del bus {bus_id}")
+            log.debug("Comprobando esclavo %s: %s (clase %s)) del bus %s", dev_sl, dev.name, dev_class, bus_id)
             # print(f"\tArchivos\n{xch_rw_files}")
             for xf in xch_rw_files:
                 xch_file_to_check = ex_folder_name + r"/" + xf
                 # file_from_dev_to_check = ex_folder_name + r"/" + xf
                 last_mod_time = get_f_modif_timestamp(xch_file_to_check)
-                print(f"check_changes_from_web - Comprobando valores actuales del dispositivo {dev.name}, "
-                      f"atributo {xf}")
+                log.debug("check_changes_from_web - Comprobando valores actuales del dispositivo %s, atributo %s",
+                          dev.name, xf)
                 # Cambio la siguiente línea porque por algún motivo el atributo no está actualizado NO APLICA
                 current_value = getattr(dev, xf)  # el nombre del fichero xf coincide con el atributo a comprobar
 
                 if None in (last_mod_time, last_reading_time):
-                    print(f"ERROR al recuperar las fechas de última modificación y última lectura:\n\t"
-                          f"Última modificación {xch_file_to_check}: {last_mod_time}\n\t"
-                          f"Última lectura: {last_reading_time}")
+                    log.error("Error al recuperar las fechas de última modificación y última lectura:\n\tÚltima "
+                              "modificación %s: %s\n\tÚltima lectura: %s",
+                              xch_file_to_check, last_mod_time, last_reading_time)
                     continue
-                print(f"Fechas de última modificación y última lectura:\n\t"
-                      f"Última modificación {xch_file_to_check}: {last_mod_time}\n\t"
-                      f"Última lectura: {last_reading_time}")
+                log.debug("Fechas de última modificación y última lectura:\n\tÚltima modificación %s: %s\n\tÚltima "
+                          "lectura: %s", xch_file_to_check, last_mod_time, last_reading_time)
                 with open(xch_file_to_check, "r") as modf:
-                    print(f"Examinando file_from_web_to_check: {xch_file_to_check}")
+                    log.debug("Examinando file_from_web_to_check: %s", xch_file_to_check)
                     web_value = modf.read().strip()
-                print(f"\nDEBUGGING {__file__}:"
-                      f"\n\tValor leído en la web: {web_value}"
-                      f"\n\tValor actual: {current_value} {type(current_value)}")
+                log.debug("Valor leído en la web: %s\n\tValor actual: %s %s",
+                          web_value, current_value, type(current_value))
 
                 if last_mod_time > last_reading_time:  # Ha habido modificaciones desde la Web
+                    try:
+                        val_to_write = class_info.decode(xf, web_value)
+                    except ValueError as e:
+                        # El valor no llega al dispositivo y el archivo vuelve a mostrar el valor actual
+                        log.warning("Valor %s no válido en %s: %s. Se mantiene el valor actual %s",
+                                    web_value, xch_file_to_check, e, current_value)
+                        metrics.exchange_rejects.inc(cls=dev_class)
+                        with open(xch_file_to_check, "w") as xchf:
+                            xchf.write(exchange.encode(current_value))
+                        continue
                     changes = True
-                    print(f"\nSe ha modificado desde la Web el fichero:\n\t{xch_file_to_check}\n"
-                          f"\tValor anterior:\t{current_value} (tipo {type(getattr(dev, xf))})\n"
-                          f"\tValor desde web:\t{web_value} (tipo {type(web_value)})\n")
+                    log.debug("Se ha modificado desde la Web el fichero:\n\t%s\n\tValor anterior:\t%s (tipo "
+                              "%s)\n\tValor desde web:\t%s (tipo %s)",
+                              xch_file_to_check, current_value, type(getattr(dev, xf)), web_value, type(web_value))
                     attr_mod[xch_file_to_check] = web_value
-                    if web_value is not None:
-                        if '(' in web_value:  # Is Tuple
-                            val_to_write = tuple(map(int, web_value.strip('()').split(', ')))
-                        elif '.' in web_value:  # Is float
-                            val_to_write = float(web_value)
-                        elif web_value.isdecimal():  # Is int
-                            val_to_write = int(web_value)
-                        else:
-                            val_to_write = str(web_value)
-                        setattr(dev, xf, val_to_write)
-                        with open(xch_file_to_check, "w") as xchf:
-                            xchf.write(str(web_value))
+                    setattr(dev, xf, val_to_write)
+                    with open(xch_file_to_check, "w") as xchf:
+                        xchf.write(str(web_value))
+                    metrics.exchange_writes.inc(cls=dev.__class__.__name__)
                 else:
                     attr_not_mod[xch_file_to_check] = current_value
             if changes:
                 changes = False
-                print(f"{__file__} Subiendo actualización a dispositivo ModBus")
+                log.debug("Subiendo actualización a dispositivo ModBus")
                 await dev.upload()
-        print(f"Archivos modificados: {attr_mod}")
-        print(f"Archivos NO modificados: {attr_not_mod}")
+        log.debug("Archivos modificados: %s", attr_mod)
+        log.debug("Archivos NO modificados: %s", attr_not_mod)
 
     return 1
 
 
+def get_room_key(room) -> str:
+    """
+    Identificador único de una habitación en el proyecto: <edificio>_<vivienda>_<habitación>
+    """
+    return f"{room.building_id}_{room.dwelling_id}_{room.room_id}"
+
+
+def get_roomgroup_dict(roomgroup) -> phi.Dict:
+    """
+    Devuelve los valores calculados de un grupo de habitaciones con las claves de phi.roomgroups_values
+    Param:
+        roomgroup: grupo de habitaciones (RoomGroup)
+    Returns: diccionario con los valores del grupo
+    """
+    return {"iv": roomgroup.iv,
+            "demanda": roomgroup.demand,
+            "water_sp": roomgroup.water_sp,
+            "air_sp": roomgroup.air_sp,
+            "air_rt": roomgroup.air_rt,
+            "air_dp": roomgroup.air_dp,
+            "air_h": roomgroup.air_h,
+            "aq": roomgroup.aq,
+            "aq_sp": roomgroup.aq_sp}
+
+
 async def update_roomgroups_values():
     """
-    Actualiza los cálculos para todos los grupos de habitaciones y los guarda en ROOMGROUPS_VALUES_FILE
-    Returns: si la actualización de grupos de habitaciones y la escritura de ROOMGROUPS_VALUES_FILE ha sido un éxito
+    Actualiza los cálculos para todos los grupos de habitaciones y los publica en phi.roomgroups_values, de donde
+    los toman los dispositivos del proyecto vinculados a los grupos. Si ROOMGROUPS_VALUES_EXPORT es True, también
+    se guardan en ROOMGROUPS_VALUES_FILE para la web
+    Returns: resultados de la actualización de cada grupo de habitaciones
     """
     roomgroup_updating_tasks = [create_task(r.get_consignas())
                                 for r in tuple(phi.all_room_groups.values())]
     roomgroup_updating_results = await gather(*roomgroup_updating_tasks)
     roomgroups_values = {}
     for roomgroup_id, roomgroup in phi.all_room_groups.items():
-        roomgroups_values[roomgroup_id] = {}
-        roomgroups_values[roomgroup_id]["iv"] = roomgroup.iv
-        roomgroups_values[roomgroup_id]["demanda"] = roomgroup.demand
-        roomgroups_values[roomgroup_id]["water_sp"] = roomgroup.water_sp
-        roomgroups_values[roomgroup_id]["air_sp"] = roomgroup.air_sp
-        roomgroups_values[roomgroup_id]["air_rt"] = roomgroup.air_rt
-        roomgroups_values[roomgroup_id]["air_dp"] = roomgroup.air_dp
-        roomgroups_values[roomgroup_id]["air_h"] = roomgroup.air_h
-        roomgroups_values[roomgroup_id]["aq"] = roomgroup.aq
-        roomgroups_values[roomgroup_id]["aq_sp"] = roomgroup.aq_sp
-    # Actualizo el fichero con la información de los grupos de habitaciones para actualizar los dispositivos del
-    # proyecto vinculados a los mismos
-    with open(phi.ROOMGROUPS_VALUES_FILE, "w") as f:
-        phi.json.dump(roomgroups_values, f)
+        roomgroups_values[roomgroup_id] = MappingProxyType(get_roomgroup_dict(roomgroup))
+    # Instantánea de sólo lectura con los resultados del ciclo para los dispositivos
+    phi.roomgroups_values = MappingProxyType(roomgroups_values)
+    if phi.ROOMGROUPS_VALUES_EXPORT:
+        export_roomgroups_values(roomgroups_values)
+    # Envío a los clientes suscritos los valores de habitaciones y grupos que han cambiado
+    if events.has_subscribers():
+        events.publish_diff("roomgroups", {f"{roomgroup_id}/{field}": value
+                                           for roomgroup_id, values in roomgroups_values.items()
+                                           for field, value in values.items()})
+        events.publish_diff("rooms", {f"{get_room_key(room)}/{attr}": getattr(room, attr)
+                                      for roomgroup in phi.all_room_groups.values()
+                                      for room in roomgroup.roomgroup
+                                      for attr in ("sp", "rt", "rh", "st", "aq", "aqsp")})
+    # Añado los valores calculados al histórico de los grupos de habitaciones
+    hora = phi.datetime.now()
+    rg_columns = [(field, history.NUMERIC) for field in phi.ROOMGROUP_HISTORY_FIELDS]
+    for roomgroup_id, values in roomgroups_values.items():
+        try:
+            history.record(history.roomgroup_entity(roomgroup_id), rg_columns, values, hora)
+        except OSError as e:
+            log.error("No se ha podido guardar el histórico del grupo %s\n%s", roomgroup_id, e)
 
     return roomgroup_updating_results
 
 
-async def get_roomgroup_values(roomgroup_id: str) -> [phi.Dict, None]:
+def export_roomgroups_values(roomgroups_values: phi.Dict):
     """
-    Recoge el valor de 'attribute' de un determinado roomgroup almacenado en ROOMGROUPS_VALUES_FILE
-    Returns: diccionario con los valores del roomgroup
+    Guarda en ROOMGROUPS_VALUES_FILE los resultados de los grupos de habitaciones para la web
     """
-    if not path.isfile(phi.ROOMGROUPS_VALUES_FILE):
-        return
+    tmp_file = phi.ROOMGROUPS_VALUES_FILE + ".tmp"
     try:
-        with open(phi.ROOMGROUPS_VALUES_FILE, "r") as f:
-            roomgroups_values = phi.json.load(f)
-    except FileNotFoundError as e:
-        print(f"ERROR {__file__}. No se puede abrir el archivo {phi.ROOMGROUPS_VALUES_FILE}\n{e}")
-        return
+        with open(tmp_file, "w") as f:
+            phi.json.dump({roomgroup_id: dict(values) for roomgroup_id, values in roomgroups_values.items()}, f)
+        phi.os.replace(tmp_file, phi.ROOMGROUPS_VALUES_FILE)
+    except OSError as e:
+        log.error("No se ha podido guardar el archivo %s\n%s", phi.ROOMGROUPS_VALUES_FILE, e)
+
 
-    roomgroup_info = roomgroups_values.get(roomgroup_id)
+async def get_roomgroup_values(roomgroup_id: str) -> [phi.Mapping, None]:
+    """
+    Recoge los valores calculados en el ciclo de un determinado roomgroup (phi.roomgroups_values)
+    Returns: diccionario de sólo lectura con los valores del roomgroup
+    """
+    roomgroup_info = phi.roomgroups_values.get(roomgroup_id)
     if roomgroup_info is None:
-        print(f"ERROR {__file__}. No se encuentra el grupo de habitaciones {roomgroup_id:}")
+        log.error("No se encuentra el grupo de habitaciones %s", roomgroup_id)
         return
 
     return roomgroup_info
@@ -534,21 +639,29 @@ async def update_all_buses(device_type=None):
         sólo se actualiza ese tipo de dispositivo
     """
     # webcheck = await check_changes_from_web()
-    for idbus, bus in phi.buses.items():
-        for iddevice, device in bus.items():
-            dev_class = device.__class__.__name__
-            if device_type and device_type != dev_class or device_type is None and dev_class == "UFHCController":
-                continue
+    # Las escrituras idénticas en los dispositivos de un mismo modelo, como el modo calefacción/refrigeración, se
+    # envían juntas al terminar (mb_utils.group_writes)
+    # Al terminar se comprueban con una lectura por dispositivo las escrituras que han cambiado algún valor
+    # (mb_utils.write_check)
+    async with write_check.batch(save_read_back), \
+            group_writes.batch(device for bus in phi.buses.values() for device in bus.values()):
+        for idbus, bus in phi.buses.items():
+            for iddevice, device in bus.items():
+                dev_class = device.__class__.__name__
+                if device_type and device_type != dev_class or device_type is None and dev_class == "UFHCController":
+                    continue
 
-            print(f"\nActualizando valores del dispositivo {device.name}")
-            update = await device.update()  # El método update toma los valores de las últimas lecturas
-            if repr(device) is not None:
-                print(repr(device))
-            print(f"Finalizada actualización de {device.name} / {device.brand}_{device.model}")
-    with open(phi.BUSES_INSTANCES_FILE, "wb") as bf:
-        print(
-            f"{__file__} (mbutils) \n\tACTUALIZANDO ARCHIVO buses CON INSTANCIAS DE LOS DISPOSITIVOS")
-        phi.pickle.dump(phi.buses, bf)
+                log.debug("Actualizando valores del dispositivo %s", device.name)
+                update = await device.update()  # El método update toma los valores de las últimas lecturas
+                if repr(device) is not None:
+                    log.debug("%r", device)
+                log.debug("Finalizada actualización de %s / %s_%s", device.name, device.brand, device.model)
+                if events.has_subscribers():
+                    events.publish_diff("devices", {f"{idbus}/{iddevice}/{attr}": getattr(device, attr, None)
+                                                    for attr in phi.EXCHANGE_R_FILES.get(dev_class, ())})
+    # Sólo se guarda el estado de funcionamiento de los dispositivos, y únicamente si ha cambiado
+    if save_devices_state(phi.buses):
+        log.debug("(mbutils) \n\tACTUALIZADO EL ESTADO DE FUNCIONAMIENTO DE LOS DISPOSITIVOS")
     return 1
 
 
@@ -563,12 +676,12 @@ async def update_xch_files_from_devices(device):
     if not device:
         return
 
-    device_class_names = [c().__class__.__name__ for c in phi.SYSTEM_CLASSES.values() if c != phi.ModbusRegisterMap]
     dev_class = device.__class__.__name__  # Tipo de dispositivo UFHCController, Generator, Fancoil, Split,
-    print(f"\n\n\nDEBUGGING - {device_class_names}\nActualizando ficheros de la clase {dev_class}\n\n")
-    if dev_class not in device_class_names:
-        print(f"ERROR {__file__} - La clase {dev_class} no corresponde a ninguna de las clases del "
-              f"proyecto:\n{device_class_names}")
+    class_info = phi.DEVICE_CLASSES.get(dev_class)
+    log.debug("Actualizando ficheros de la clase %s", dev_class)
+    if class_info is None:
+        log.error("La clase %s no corresponde a ninguna de las clases del proyecto:\n%s",
+                  dev_class, tuple(phi.DEVICE_CLASSES))
         return
     bus_id = device.bus_id  # el atributo bus_id pertenece en realidad a los dispositivos creados con herencias de
     # MBDevice, pero no pertenece a MBDevice
@@ -576,21 +689,21 @@ async def update_xch_files_from_devices(device):
     # no al device_id definido en la base de datos del proyecto
 
     # HeatRecoveryUnit, AirZoneManager, TempFluidController
-    attrs_to_update = phi.EXCHANGE_R_FILES.get(dev_class)  # Tupla con los archivos a actualizar (son los nombres
-    # de los atributos)
-    for attr in attrs_to_update:
+    for attr in class_info.r_files:  # Los nombres de los archivos a actualizar son los de los atributos
         # attr_file = phi.EXCHANGE_FOLDER + r"/" + bus_id + r"/" + slave + r"/" + attr
         attr_file = f"{phi.EXCHANGE_FOLDER}/{bus_id}/{slave}/{attr}"
         if not path.isfile(attr_file):
-            print(f"ERROR {__file__}\nNo se encuentra el archivo {attr_file}")
+            log.error("No se encuentra el archivo %s", attr_file)
             continue
-        attr_value = f"{getattr(device, attr)}"
-        if attr_value not in (None, "None", ""):
+        attr_value = exchange.encode(getattr(device, attr))
+        if attr_value:
             with open(attr_file, "w") as f:
                 f.write(attr_value)
+            metrics.exchange_writes.inc(cls=device.__class__.__name__)
             with open(attr_file, "r") as f:
                 read_value = f.read().strip()
-            print(f"{device.name} - Intentando escribir {attr_value} en {attr_file}.\nValor guardado: {read_value}")
+            log.debug("%s - Intentando escribir %s en %s.\nValor guardado: %s",
+                      device.name, attr_value, attr_file, read_value)
 
 
 async def update_devices_from_xch_files(device):
@@ -603,13 +716,13 @@ async def update_devices_from_xch_files(device):
     if not device:
         return
 
-    device_class_names = [c().__class__.__name__ for c in phi.SYSTEM_CLASSES.values() if c != phi.ModbusRegisterMap]
     cls = device.__class__.__name__  # Tipo de dispositivo UFHCController, Generator, Fancoil, Split,
-    print(f"\n\n\nDEBUGGING - {device_class_names}\nActualizando el dispositivo {device.name}, de la clase {cls} "
-          f"con la configuración de sus ficheros de intercambio.\n\n\n")
-    if cls not in device_class_names:
-        print(f"ERROR {__file__} - La clase {cls} no corresponde a ninguna de las clases del "
-              f"proyecto:\n{device_class_names}")
+    class_info = phi.DEVICE_CLASSES.get(cls)
+    log.debug("Actualizando el dispositivo %s, de la clase %s con la configuración de sus ficheros de intercambio.",
+              device.name, cls)
+    if class_info is None:
+        log.error("La clase %s no corresponde a ninguna de las clases del proyecto:\n%s",
+                  cls, tuple(phi.DEVICE_CLASSES))
         return
     bus_id = device.bus_id  # el atributo bus_id pertenece en realidad a los dispositivos creados con herencias de
     # MBDevice, pero no pertenece a MBDevice
@@ -617,27 +730,21 @@ async def update_devices_from_xch_files(device):
     # no al device_id definido en la base de datos del proyecto
 
     # HeatRecoveryUnit, AirZoneManager, TempFluidController
-    attrs_to_update = phi.EXCHANGE_R_FILES.get(cls)  # Tupla con los archivos a actualizar (son los nombres
-    # de los atributos)
-    for attr in attrs_to_update:
+    for attr in class_info.r_files:  # Los nombres de los archivos son los de los atributos
         # attr_file = phi.EXCHANGE_FOLDER + r"/" + bus_id + r"/" + slave + attr + r"/RW"
         attr_file = phi.EXCHANGE_FOLDER + r"/" + bus_id + r"/" + slave + r"/" + attr
         if not path.isfile(attr_file):
-            print(f"ERROR {__file__}\nNo se encuentra el archivo {attr_file}")
+            log.error("No se encuentra el archivo %s", attr_file)
             continue
         with open(attr_file, "r") as f:
-            attr_value_in_file = f.read()
-            attr_value_in_device = getattr(device, attr)
-            print(f"DEBUGGING {__file__}: \n\tfichero intercambio: {attr_file}\n\tAtributo: {attr_value_in_file}")
-            if isinstance(attr_value_in_device, int):  # Atributo tipo integer
-                if attr_value_in_file:
-                    attr_value_in_file = int(attr_value_in_file)
-                else:
-                    attr_value_in_file = attr_value_in_device
-            elif isinstance(attr_value_in_device, float):  # Atributo tipo float
-                if attr_value_in_file:
-                    attr_value_in_file = float(attr_value_in_file)
-                else:
-                    attr_value_in_file = attr_value_in_device
-            if attr_value_in_file is not None:
-                setattr(device, attr, attr_value_in_file)
+            attr_value_in_file = f.read().strip()
+        log.debug("fichero intercambio: %s\n\tAtributo: %s", attr_file, attr_value_in_file)
+        if not attr_value_in_file:  # Se mantiene el valor actual
+            continue
+        try:
+            attr_value = class_info.decode(attr, attr_value_in_file)
+        except ValueError as e:
+            log.error("Valor %s no válido en %s: %s", attr_value_in_file, attr_file, e)
+            metrics.exchange_rejects.inc(cls=cls)
+            continue
+        setattr(device, attr, attr_value)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Arbitraje de los puertos serie compartidos por varios buses o dispositivos: cada operación de un dispositivo se hace
+en su turno del puerto (turn).
+"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from time import monotonic
+from typing import Deque, Dict, Hashable, Tuple
+
+from mb_utils.transport import is_tcp
+from phoenix_constants import *
+from phoenix_log import get_logger
+from publish import metrics
+
+log = get_logger(__name__)
+
+
+class PortArbiter:
+    """
+    Turnos de un puerto serie. Cada cliente (dispositivo) tiene su cola de peticiones y los clientes con peticiones
+    pendientes se atienden por rotación, sea cual sea su bus, de modo que un dispositivo con muchos registros no
+    retrasa a los demás. La cola y la espera de cada puerto se publican en publish.metrics
+    """
+
+    def __init__(self, port: str):
+        self.port = port
+        self.busy = False
+        self.queues: Dict[Hashable, Deque[Tuple[float, asyncio.Future]]] = {}  # {cliente: [(plazo, futuro)]}
+        self.rotation: Deque[Hashable] = deque()  # Clientes con peticiones pendientes en orden de turno
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def acquire(self, client: Hashable, max_wait: float):
+        if not self.busy and not self.rotation:
+            self.busy = True
+            metrics.port_wait.observe(0, port=self.port)
+            return
+        start = monotonic()
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues.setdefault(client, deque())
+        if not queue:
+            self.rotation.append(client)
+        queue.append((start + max_wait, future))
+        metrics.port_queue_depth.set(self.depth, port=self.port)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Se había concedido el turno
+            else:
+                self.discard(client, future)
+            raise
+        metrics.port_wait.observe(monotonic() - start, port=self.port)
+
+    def discard(self, client: Hashable, future: asyncio.Future):
+        queue = self.queues.get(client, ())
+        for request in queue:
+            if request[1] is future:
+                queue.remove(request)
+                break
+        if client in self.queues and not queue:
+            del self.queues[client]
+            self.rotation.remove(client)
+        metrics.port_queue_depth.set(self.depth, port=self.port)
+
+    def next_client(self) -> Hashable:
+        """
+        Cliente al que le toca el turno: el de la petición de plazo más antiguo si está vencido o el siguiente de la
+        rotación
+        """
+        overdue = min(self.rotation, key=lambda client: self.queues[client][0][0])
+        if self.queues[overdue][0][0] <= monotonic():
+            self.rotation.remove(overdue)
+            return overdue
+        return self.rotation.popleft()
+
+    def release(self):
+        while self.rotation:
+            client = self.next_client()
+            queue = self.queues[client]
+            _, future = queue.popleft()
+            if queue:
+                self.rotation.append(client)  # Vuelve al final de la rotación
+            else:
+                del self.queues[client]
+            if not future.done():  # Las peticiones canceladas se descartan
+                metrics.port_queue_depth.set(self.depth, port=self.port)
+                future.set_result(None)  # El puerto sigue ocupado, ahora por 'client'
+                return
+        self.busy = False
+        metrics.port_queue_depth.set(0, port=self.port)
+
+
+_arbiters: Dict[str, PortArbiter] = {}
+
+
+@asynccontextmanager
+async def turn(port: str, client: Hashable, max_wait: float = PORT_MAX_WAIT):
+    """
+    Espera el turno del puerto 'port' para el cliente 'client' (normalmente el esclavo) y lo libera al terminar. En un
+    puerto serie sólo puede haber una transacción en curso, así que el turno cubre la operación completa: abrir el
+    puerto, leer o escribir un bloque con sus reintentos y cerrarlo
+        async with port_arbiter.turn(puerto, esclavo):
+            ...
+    Params:
+        max_wait: segundos de espera a partir de los que la petición pasa delante de la rotación (PORT_MAX_WAIT para
+        las lecturas y PORT_WRITE_MAX_WAIT para las escrituras)
+    """
+    if is_tcp(port):  # La conexión con la pasarela (mb_utils.transport) ya limita las peticiones simultáneas
+        yield
+        return
+    arbiter = _arbiters.get(port)
+    if arbiter is None:
+        arbiter = _arbiters[port] = PortArbiter(port)
+    await arbiter.acquire(client, max_wait)
+    try:
+        yield
+    finally:
+        arbiter.release()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Comprobación de la configuración del proyecto antes de arrancar.
+Se cruzan project.json, los JSON de los objetos del proyecto (project_elements/*.json) y los mapas de registros de
+los dispositivos (devices/*.json):
+- Buses y dispositivos: clase, marca y modelo conocidos, mapa de registros y configuración del modelo existentes y
+  esclavos no repetidos en el mismo puerto (los buses que comparten puerto serie cuentan como uno solo) y la misma
+  configuración de la línea serie en todos los dispositivos del puerto
+- Fuentes de datos de las habitaciones y de los edificios (*_source): bus, dispositivo, tipo de registro y dirección
+  existentes en el mapa de registros del dispositivo
+- Fuentes y destinos (*_source, *_target) de la configuración de cada modelo: tipo de registro y dirección existentes
+  en el mapa de registros
+- Grupos: los grupos de los dispositivos deben tener habitaciones y el grupo de una centralita de suelo radiante sólo
+  puede tener habitaciones conectadas a esa centralita
+Mientras se comprueba, se construyen los índices que se utilizan después sin más comprobaciones:
+- handles: {(bus, dispositivo, tipo de registro, dirección) tal como aparecen en las fuentes:
+           (bus, dispositivo, tipo de registro, dirección) como claves str de datadb}
+- read_plan: {(bus, dispositivo): {tipo de registro: direcciones que se leen}}. En las centralitas de suelo radiante
+  sólo entran los canales de las habitaciones de su grupo. Se añaden los registros de supervisión ("monitor" de cada
+  dispositivo en project.json y READ_PLAN_MONITOR de cada modelo)
+Uso desde la línea de comandos:
+    python -m mb_utils.project_check [project.json]
+"""
+import json
+import re
+import sys
+from dataclasses import dataclass, field
+from os import path
+from typing import Dict, List, Set, Tuple, Union
+
+from mb_utils.transport import bus_port, is_tcp
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+ROOM_SOURCES = ("iv_source", "sp_source", "rt_source", "rh_source", "st_source", "aq_source", "aqsp_source")
+O_DATA_SOURCES = ("te_source", "rh_source", "aq_source")
+ELEMENT_DBS = {cls.lower(): db for cls, db in PRJ_DEVICES_DB.items()}  # Clases en minúsculas, como en project.json
+CHANNEL_SOURCE = re.compile(r"ch\d+_source\.")  # Fuentes de los canales de las centralitas de suelo radiante
+
+
+@dataclass
+class ProjectIndex:
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    handles: Dict[Tuple, Tuple[str, str, str, str]] = field(default_factory=dict)
+    read_plan: Dict[Tuple[str, str], Dict[str, Set[int]]] = field(default_factory=dict)
+
+    def log(self):
+        for warning in self.warnings:
+            log.warning("Configuración del proyecto: %s", warning)
+        for error in self.errors:
+            log.error("Configuración del proyecto: %s", error)
+
+
+def load_json(json_file: str, index: ProjectIndex) -> Union[Dict, None]:
+    try:
+        with open(json_file, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        index.errors.append(f"No existe el archivo {json_file}")
+    except ValueError as e:
+        index.errors.append(f"JSON no válido en {json_file}: {e}")
+
+
+def element_sources(config: Dict, prefix: str = "") -> List[Tuple[str, str, int]]:
+    """
+    Fuentes y destinos (*_source, *_target) de la configuración de un modelo
+    Returns: lista de (nombre, tipo de registro, dirección). Las fuentes anidadas (canales de las centralitas) se
+    nombran 'fuente.magnitud'
+    """
+    sources = []
+    for name, value in config.items():
+        if not (prefix or name.endswith("_source") or name.endswith("_target")):
+            continue
+        if isinstance(value, dict):
+            sources += element_sources(value, f"{prefix}{name}.")
+        elif isinstance(value, (list, tuple)) and len(value) > 1:
+            sources.append((f"{prefix}{name}", value[0], value[1]))
+    return sources
+
+
+def check_register(index: ProjectIndex, regmaps: Dict, devices: Dict, where: str, bus_id, device_id, datatype,
+                   adr, plan: bool = True) -> bool:
+    """
+    Comprueba que el registro existe y, si es así, lo añade a los índices
+    Params:
+        plan: añadir el registro al plan de lectura
+    """
+    device = devices.get(str(bus_id), {}).get(str(device_id))
+    if device is None:
+        index.errors.append(f"{where}: no existe el dispositivo {device_id} del bus {bus_id}")
+        return False
+    if datatype not in MODBUS_DATATYPES_KEYS.values():
+        index.errors.append(f"{where}: tipo de registro '{datatype}' no válido")
+        return False
+    regmap = regmaps.get(f"{device.get('brand')}_{device.get('model')}")
+    if regmap is None:
+        return False  # Ya se ha informado al comprobar el dispositivo
+    if str(adr) not in (regmap.get(datatype) or {}):
+        index.errors.append(f"{where}: el registro {datatype} {adr} no está en el mapa de registros de "
+                            f"{device.get('brand')}_{device.get('model')} (dispositivo {device_id} del bus {bus_id})")
+        return False
+    handle = (str(bus_id), str(device_id), datatype, str(adr))
+    index.handles[(bus_id, device_id, datatype, adr)] = handle
+    if str(bus_id).isdigit() and str(device_id).isdigit() and str(adr).isdigit():
+        index.handles[(int(bus_id), int(device_id), datatype, int(adr))] = handle
+    if plan:
+        index.read_plan.setdefault(handle[:2], {}).setdefault(datatype, set()).add(int(adr))
+    return True
+
+
+def check_source(index: ProjectIndex, regmaps: Dict, devices: Dict, where: str, source: Union[Dict, None]) -> bool:
+    """
+    Comprueba una fuente de datos de project.json: {"bus", "device", "datatype", "adr"}. Las fuentes vacías no se
+    utilizan
+    """
+    if not source:
+        return True
+    missing = [key for key in ("bus", "device", "datatype", "adr") if source.get(key) is None]
+    if missing:
+        index.errors.append(f"{where}: faltan las claves {missing}")
+        return False
+    return check_register(index, regmaps, devices, where, source["bus"], source["device"], source["datatype"],
+                          source["adr"])
+
+
+def check_monitor(index: ProjectIndex, regmaps: Dict, devices: Dict, where: str, bus_id: str, device_id: str,
+                  monitor: Union[Dict, bool, None]):
+    """
+    Añade al plan de lectura los registros de supervisión 'monitor' del dispositivo: {tipo de registro: [direcciones]}
+    o True para todo su mapa de registros
+    """
+    if not monitor:
+        return
+    device = devices[bus_id][device_id]
+    if monitor is True:
+        regmap = regmaps[f"{device.get('brand')}_{device.get('model')}"]
+        monitor = {datatype: list(regmap.get(datatype) or ()) for datatype in MODBUS_DATATYPES_KEYS.values()}
+    if not isinstance(monitor, dict):
+        index.errors.append(f"{where} monitor: debe ser true o {{tipo de registro: [direcciones]}}")
+        return
+    for datatype, adrs in monitor.items():
+        if not isinstance(adrs, (list, tuple)):
+            index.errors.append(f"{where} monitor.{datatype}: debe ser una lista de direcciones")
+            continue
+        for adr in adrs:
+            check_register(index, regmaps, devices, f"{where} monitor", bus_id, device_id, datatype, adr)
+
+
+def check_buses(prj: Dict, index: ProjectIndex) -> Tuple[Dict, Dict, Dict]:
+    """
+    Comprueba los buses y dispositivos y carga sus mapas de registros y la configuración de sus modelos
+    Returns: (dispositivos {bus: {dispositivo: diccionario del dispositivo}}, mapas de registros {marca_modelo: mapa},
+    configuraciones {clase_marca_modelo: configuración del modelo})
+    """
+    devices = {}
+    regmaps = {}
+    configs = {}
+    element_dbs = {}
+    slaves = {}  # {puerto: {esclavo: dispositivo}}
+    line_settings = {}  # {puerto serie: {(velocidad, bits de datos, paridad, bits de parada)}}
+    for bus_id, bus in (prj.get("buses") or {}).items():
+        devices[str(bus_id)] = bus.get("devices") or {}
+        port = bus_port(bus)
+        for device_id, device in devices[str(bus_id)].items():
+            where = f"Dispositivo {device_id} ({device.get('name')}) del bus {bus_id}"
+            slave = device.get("slave")
+            if not isinstance(slave, int) or not 1 <= slave <= 247:
+                index.errors.append(f"{where}: dirección de esclavo {slave} no válida")
+            elif slave in slaves.setdefault(port, {}):
+                index.errors.append(f"{where}: el esclavo {slave} ya es el dispositivo {slaves[port][slave]} en el "
+                                    f"puerto {port}")
+            else:
+                slaves[port][slave] = f"{device_id} del bus {bus_id}"
+            if not is_tcp(port):
+                line_settings.setdefault(port, set()).add(
+                    tuple(device.get(key) for key in ("baudrate", "databits", "parity", "stopbits")))
+            cls, model_id = device.get("class"), f"{device.get('brand')}_{device.get('model')}"
+            if cls not in ELEMENT_DBS:
+                index.errors.append(f"{where}: clase '{cls}' desconocida")
+                continue
+            if model_id not in regmaps:
+                rmap = load_json(MODULE_PATH + f"/devices/{model_id}.json", index)
+                regmaps[model_id] = (rmap or {}).get(model_id)
+                if rmap is not None and regmaps[model_id] is None:
+                    index.errors.append(f"El archivo devices/{model_id}.json no contiene la clave {model_id}")
+            if regmaps[model_id] is None:
+                continue
+            if cls not in element_dbs:
+                element_db = load_json(ELEMENT_DBS[cls], index) or {}
+                element_dbs[cls] = tuple(element_db.values())[0] if element_db else {}
+            config = element_dbs[cls].get(model_id)
+            if config is None:
+                index.errors.append(f"{where}: el modelo {model_id} no está en {path.basename(ELEMENT_DBS[cls])}")
+                continue
+            configs[f"{cls}_{model_id}"] = config
+    for port, settings in line_settings.items():
+        if len(settings) > 1:  # Los dispositivos del puerto se leen por turnos (mb_utils.port_arbiter)
+            index.warnings.append(f"Los dispositivos del puerto {port} tienen distinta configuración de la línea "
+                                  f"serie (velocidad, bits de datos, paridad, bits de parada): "
+                                  f"{sorted(settings, key=str)}")
+    # Se quitan de los mapas que faltan para no repetir el error en cada fuente
+    return devices, {model_id: rmap for model_id, rmap in regmaps.items() if rmap is not None}, configs
+
+
+def check_project(prj: Dict) -> ProjectIndex:
+    """
+    Comprueba la configuración del proyecto 'prj' (clave "project" de project.json) y construye sus índices
+    Returns: ProjectIndex con los errores, avisos e índices
+    """
+    index = ProjectIndex()
+    devices, regmaps, configs = check_buses(prj, index)
+
+    # Fuentes de las habitaciones y grupos
+    group_rooms = {}  # {grupo: [(nombre de la habitación, rt_source)]}
+    for bld_id, bld in (prj.get("buildings") or {}).items():
+        bld_where = f"Edificio {bld_id} ({bld.get('name')})"
+        onoff = bld.get("onoff_source") or {}
+        if onoff and str(onoff.get("device")) not in devices.get(str(onoff.get("bus")), {}):
+            index.errors.append(f"{bld_where} onoff_source: no existe el dispositivo {onoff.get('device')} del bus "
+                                f"{onoff.get('bus')}")
+        check_source(index, regmaps, devices, f"{bld_where} iv_source", (bld.get("iv_source") or {}).get("mbdev"))
+        for name in O_DATA_SOURCES:
+            source = (bld.get("o_data") or {}).get(name) or {}
+            check_source(index, regmaps, devices, f"{bld_where} o_data.{name}", source.get("mbdev"))
+        for dwell_id, dwell in (bld.get("dwellings") or {}).items():
+            for room_id, room in (dwell.get("rooms") or {}).items():
+                where = f"Habitación {room.get('name')} ({bld_id}/{dwell_id}/{room_id})"
+                for name in ROOM_SOURCES:
+                    check_source(index, regmaps, devices, f"{where} {name}", room.get(name))
+                if not room.get("groups"):
+                    index.warnings.append(f"{where}: no pertenece a ningún grupo")
+                for group in room.get("groups") or ():
+                    group_rooms.setdefault(str(group), []).append((room.get("name"), room.get("rt_source") or {}))
+
+    # Fuentes de la configuración de cada modelo y grupos de los dispositivos
+    for bus_id, bus_devices in devices.items():
+        for device_id, device in bus_devices.items():
+            where = f"Dispositivo {device_id} ({device.get('name')}) del bus {bus_id}"
+            cls = device.get("class")
+            model_id = f"{device.get('brand')}_{device.get('model')}"
+            config = configs.get(f"{cls}_{model_id}")
+            groups = [str(group) for group in device.get("groups") or ()]
+            if config is not None:
+                # Las centralitas de suelo radiante sólo leen los canales de las habitaciones de su grupo
+                channels = {f"ch{rt_source.get('adr')}_source" for _, rt_source in group_rooms.get(
+                    groups[0] if groups else None, ())} if cls == "ufhccontroller" else None
+                for name, datatype, adr in element_sources(config):
+                    plan = channels is None or not CHANNEL_SOURCE.match(name) or name.split(".")[0] in channels
+                    check_register(index, regmaps, devices, f"{where} {name}", bus_id, device_id, datatype, adr,
+                                   plan)
+            if model_id in regmaps:
+                check_monitor(index, regmaps, devices, where, bus_id, device_id, READ_PLAN_MONITOR.get(model_id))
+                check_monitor(index, regmaps, devices, where, bus_id, device_id, device.get("monitor"))
+            for group in groups:
+                if group not in group_rooms:
+                    index.warnings.append(f"{where}: el grupo {group} no tiene habitaciones")
+            if cls == "ufhccontroller" and groups:
+                if len(groups) > 1:
+                    index.warnings.append(f"{where}: sólo se utiliza el primero de los grupos {groups}")
+                others = [room for room, rt_source in group_rooms.get(groups[0], ())
+                          if (str(rt_source.get("bus")), str(rt_source.get("device"))) != (bus_id, str(device_id))]
+                if others:
+                    index.errors.append(f"{where}: el grupo {groups[0]} de la centralita incluye habitaciones "
+                                        f"conectadas a otros dispositivos: {others}")
+
+    lowered = {}
+    for group in group_rooms:
+        lowered.setdefault(group.lower(), []).append(group)
+    for groups in lowered.values():
+        if len(groups) > 1:
+            index.warnings.append(f"Grupos que sólo se diferencian en mayúsculas y minúsculas: {groups}")
+    return index
+
+
+def main(argv: List[str]) -> int:
+    config_file = argv[0] if argv else CONFIG_FILE
+    with open(config_file, "r") as f:
+        prj = json.load(f).get("project")
+    index = check_project(prj)
+    for warning in index.warnings:
+        print(f"AVISO: {warning}")
+    for error in index.errors:
+        print(f"ERROR: {error}")
+    registers = sum(len(adrs) for plan in index.read_plan.values() for adrs in plan.values())
+    print(f"{len(index.errors)} errores, {len(index.warnings)} avisos. {registers} registros referenciados en "
+          f"{len(index.read_plan)} dispositivos")
+    return 1 if index.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
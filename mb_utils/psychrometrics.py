@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Cálculos psicrométricos del aire húmedo: entalpía y punto de rocío a partir de la temperatura en °C y la humedad
+relativa en %.
+La presión atmosférica a la altitud del proyecto (ALTITUD) se calcula una sola vez. Los resultados se memorizan para
+cada par (temperatura, humedad) redondeado a PSYCHRO_T_DECIMALS y PSYCHRO_RH_DECIMALS decimales: los sensores dan
+0.1 °C y 1 %, así que las habitaciones, los canales de las centralitas y el exterior repiten los mismos pares de un
+ciclo a otro.
+Para varios pares a la vez, batch devuelve la entalpía y el punto de rocío de cada uno.
+"""
+from functools import lru_cache
+from typing import Iterable, List, Tuple, Union
+
+from phoenix_constants import *
+
+NULL_VALUES = ("", None, "false")  # Lecturas no válidas de temperatura o humedad
+SEA_LEVEL_PRESSURE = 101325  # Pa
+
+
+def total_pressure(altitud: Union[int, float, None]) -> float:
+    """
+    Presión atmosférica en Pa a la altitud 'altitud' en m. Si es None, se toma la del nivel del mar
+    """
+    if altitud is None:
+        return SEA_LEVEL_PRESSURE
+    return SEA_LEVEL_PRESSURE * (1 - 2.25577 * 0.00001 * altitud) ** 5.2559
+
+
+PRES_TOTAL = total_pressure(ALTITUD)  # Presión atmosférica del proyecto
+
+
+@lru_cache(maxsize=PSYCHRO_CACHE_SIZE)
+def _enthalpy(temp: float, rel_hum: float, pres_total: float) -> float:
+    pres_vap_sat = 10 ** (7.5 * temp / (273.159 + temp - 35.85) + 2.7858)  # Pa
+    pres_vap = pres_vap_sat * rel_hum / 100  # Pa
+    pres_aire_seco = pres_total - pres_vap  # Pa
+    hum_especifica = 0.621954 * (pres_vap / pres_aire_seco)  # kg agua / kg aire seco
+    return round((1.006 + 1.86 * hum_especifica) * temp + 2501 * hum_especifica, 1)
+
+
+@lru_cache(maxsize=PSYCHRO_CACHE_SIZE)
+def _dew_point(temp: float, rel_hum: float) -> float:
+    return round((rel_hum / 100) ** (1 / 8) * (112 + 0.9 * temp) + 0.1 * temp - 112, 1)
+
+
+def enthalpy(temp, rel_hum, altitud=ALTITUD) -> [float, None]:
+    """
+    Entalpía en kJ/kg de aire seco. Por defecto se toma la altitud del proyecto
+    Returns: None si la temperatura o la humedad no tienen valores válidos
+    """
+    if temp in NULL_VALUES or rel_hum in NULL_VALUES:
+        return
+    pres_total = PRES_TOTAL if altitud == ALTITUD else total_pressure(altitud)
+    return _enthalpy(round(float(temp), PSYCHRO_T_DECIMALS), round(float(rel_hum), PSYCHRO_RH_DECIMALS), pres_total)
+
+
+def dew_point(temp, rel_hum) -> [float, None]:
+    """
+    Punto de rocío en °C
+    Returns: None si la temperatura o la humedad no tienen valores válidos (también si valen 0)
+    """
+    if temp in NULL_VALUES + (0,) or rel_hum in NULL_VALUES + (0,):
+        return
+    return _dew_point(round(float(temp), PSYCHRO_T_DECIMALS), round(float(rel_hum), PSYCHRO_RH_DECIMALS))
+
+
+def batch(pairs: Iterable[Tuple], altitud=ALTITUD) -> List[Tuple[Union[float, None], Union[float, None]]]:
+    """
+    Entalpía y punto de rocío de cada par (temperatura, humedad relativa) de 'pairs'
+    Returns: lista [(entalpía, punto de rocío)] en el orden de 'pairs'
+    """
+    return [(enthalpy(temp, rel_hum, altitud), dew_point(temp, rel_hum)) for temp, rel_hum in pairs]
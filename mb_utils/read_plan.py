@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Plan de lectura de los dispositivos: bloques de registros que se leen en cada ciclo.
+Sólo se leen los registros que utiliza el proyecto (read_plan de mb_utils.project_check): las fuentes de las
+habitaciones y edificios, las fuentes y destinos de la configuración de cada modelo (en las centralitas de suelo
+radiante, sólo los de los canales con habitaciones) y los registros de supervisión ("monitor" de cada dispositivo en
+project.json y READ_PLAN_MONITOR de cada modelo).
+Los registros utilizados se agrupan en bloques dentro de cada tramo de direcciones consecutivas del mapa de registros,
+porque los esclavos pueden rechazar las lecturas de direcciones que no tienen. Dos registros utilizados del mismo tramo
+van en el mismo bloque si los separan como mucho READ_PLAN_MAX_GAP registros sin utilizar: se leen unos pocos
+registros de más a cambio de ahorrar una transacción.
+Los dispositivos sin registros utilizados conocidos se leen completos, como sin plan de lectura.
+"""
+from typing import Dict, Iterable, Set, Tuple
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+from regops.regops import group_adrs
+
+log = get_logger(__name__)
+
+
+def datatype_blocks(mapped: Iterable[int], used: Set[int], max_gap: int = READ_PLAN_MAX_GAP) -> Tuple[Tuple[int, int]]:
+    """
+    Bloques de lectura de los registros 'used' de un tipo de registro
+    Params:
+        mapped: direcciones del tipo de registro en el mapa de registros
+        used: direcciones utilizadas
+        max_gap: máximo nº de registros sin utilizar entre dos utilizados del mismo bloque
+    Returns: tupla de (primera dirección, nº de registros)
+    """
+    blocks = []
+    for start, count in group_adrs(sorted(mapped)):
+        needed = sorted(adr for adr in used if start <= adr < start + count)
+        if not needed:
+            continue
+        first = last = needed[0]
+        for adr in needed[1:]:
+            if adr - last - 1 > max_gap:
+                blocks.append((first, last - first + 1))
+                first = adr
+            last = adr
+        blocks.append((first, last - first + 1))
+    return tuple(blocks)
+
+
+def compile_read_plan(read_plan: Dict[Tuple[str, str], Dict[str, Set[int]]], buses: Dict,
+                      regmaps: Iterable) -> Dict[Tuple[str, str], Dict[str, Tuple[Tuple[int, int]]]]:
+    """
+    Compila los registros utilizados por cada dispositivo en sus bloques de lectura
+    Params:
+        read_plan: {(bus, dispositivo): {tipo de registro: direcciones utilizadas}}
+        buses: diccionario con las instancias de los dispositivos de cada bus
+        regmaps: objetos ModbusRegisterMap de los dispositivos del proyecto
+    Returns: {(bus, dispositivo): {tipo de registro: ((primera dirección, nº de registros), ...)}}. Los dispositivos
+    sin registros utilizados no aparecen
+    """
+    rmaps = {regmap.map_id: regmap.rmap for regmap in regmaps}
+    blocks = {}
+    planned = total = 0
+    for idbus, bus in buses.items():
+        for iddevice, device in bus.items():
+            rmap = rmaps.get(f"{device.brand}_{device.model}") or {}
+            for datatype in MODBUS_DATATYPES_KEYS.values():
+                total += len(rmap.get(datatype) or ())
+            used = read_plan.get((str(idbus), str(iddevice)))
+            if not used:
+                log.debug("Sin registros utilizados en el dispositivo %s. Se lee completo", device.name)
+                continue
+            blocks[(str(idbus), str(iddevice))] = {
+                datatype: datatype_blocks((int(adr) for adr in rmap.get(datatype) or ()), adrs)
+                for datatype, adrs in used.items()}
+            planned += sum(quan for dev_blocks in blocks[(str(idbus), str(iddevice))].values()
+                           for _, quan in dev_blocks)
+    log.info("Plan de lectura: %s de %s registros de los mapas de %s dispositivos", planned, total,
+             sum(len(bus) for bus in buses.values()))
+    return blocks
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Tamaño de las lecturas ModBus de cada esclavo.
+- Tamaño máximo: nº de registros que el esclavo admite en una lectura. Por defecto es 'qregsmax' del JSON del modelo
+  (devices/marca_modelo.json). La herramienta de sondeo lo averigua leyendo bloques cada vez más grandes:
+      python -m mb_utils.read_size [--bus B] [--device D] [--save]
+  Para cada tipo de registro del mapa se lee el mayor bloque de direcciones consecutivas del mapa y se busca el mayor
+  tamaño que responde bien MODBUS_READSIZE_PROBE_TRIES veces seguidas. El máximo del esclavo es el menor de los
+  límites encontrados. Si todas las lecturas responden bien, el límite no se ha alcanzado y se mantiene 'qregsmax'.
+  Con --save el máximo se guarda en MODBUS_READSIZE_FILE.
+- Tamaño de trabajo: el que utiliza MBDevice.read para dividir las lecturas largas. Lo ajusta ReadSizeTuner durante
+  el funcionamiento: cada MODBUS_READSIZE_WINDOW lecturas del tamaño actual calcula los registros leídos por segundo,
+  contando el tiempo perdido en las lecturas fallidas (timeouts y tramas con CRC incorrecto). Si la tasa de fallos
+  supera MODBUS_READSIZE_MAX_ERROR_RATE pasa al tamaño inferior de la escala; si no, prueba el superior mientras no se
+  haya medido y después se queda con el de mayor rendimiento. Cada MODBUS_READSIZE_RETRY_WINDOWS ventanas se olvidan
+  las medidas de los tamaños superiores para volver a probarlos.
+Los tamaños máximo y de trabajo de cada esclavo (puerto, esclavo) se guardan en MODBUS_READSIZE_FILE cada
+MODBUS_READSIZE_SAVE_PERIOD segundos y se recuperan al arrancar. Con el simulador o la reproducción de transacciones
+grabadas no se lee ni se guarda el archivo.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from os import path, replace
+from time import monotonic, perf_counter
+from typing import Dict, List, Tuple, Union
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+ILLEGAL_DATA_ADDRESS = 2  # Código de excepción ModBus de dirección no válida
+
+
+def size_ladder(limit: int) -> Tuple[int, ...]:
+    """
+    Tamaños de lectura que prueba ReadSizeTuner: el máximo y sus fracciones 3/4, 1/2 y 1/4
+    """
+    return tuple(sorted({max(1, limit * num // 4) for num in (1, 2, 3, 4)}))
+
+
+class ReadSizeTuner:
+    """
+    Ajuste del tamaño de las lecturas de un esclavo según su rendimiento y su tasa de fallos
+    """
+
+    def __init__(self, limit: int, size: Union[int, None] = None):
+        self.limit = limit  # Tamaño máximo
+        self.ladder = size_ladder(limit)
+        self.size = max(s for s in self.ladder if s <= (size or limit))  # Tamaño de trabajo
+        self.throughput: Dict[int, float] = {}  # Registros por segundo medidos con cada tamaño
+        self.windows = 0  # Ventanas de medida completadas
+        self.attempts = self.failures = 0
+        self.busy = 0.0
+
+    def observe(self, quan: int, elapsed: float, ok: bool) -> bool:
+        """
+        Registra un intento de lectura de 'quan' registros. Sólo cuentan las lecturas del tamaño de trabajo
+        Returns: True si ha cambiado el tamaño de trabajo
+        """
+        if quan != self.size:
+            return False
+        self.attempts += 1
+        self.failures += not ok
+        self.busy += elapsed
+        if self.attempts < MODBUS_READSIZE_WINDOW:
+            return False
+        error_rate = self.failures / self.attempts
+        if error_rate > MODBUS_READSIZE_MAX_ERROR_RATE:
+            self.throughput[self.size] = 0
+        else:
+            self.throughput[self.size] = (self.attempts - self.failures) * self.size / max(self.busy, 1e-6)
+        self.windows += 1
+        self.attempts = self.failures = 0
+        self.busy = 0.0
+        if self.windows % MODBUS_READSIZE_RETRY_WINDOWS == 0:
+            self.throughput = {s: t for s, t in self.throughput.items() if s <= self.size}
+        idx = self.ladder.index(self.size)
+        if error_rate > MODBUS_READSIZE_MAX_ERROR_RATE:
+            new_size = self.ladder[max(0, idx - 1)]
+        elif idx + 1 < len(self.ladder) and self.ladder[idx + 1] not in self.throughput:
+            new_size = self.ladder[idx + 1]
+        else:
+            new_size = max(self.throughput, key=self.throughput.get)
+        changed = new_size != self.size
+        if changed:
+            log.info("Tamaño de lectura %s -> %s (fallos %.0f%%, %s)", self.size, new_size, error_rate * 100,
+                     {s: round(t, 1) for s, t in sorted(self.throughput.items())})
+        self.size = new_size
+        return changed
+
+
+_tuners: Dict[Tuple[str, int], ReadSizeTuner] = {}
+_saved: Dict[Tuple[str, int], Dict] = {}  # {(puerto, esclavo): {"max": tamaño máximo, "size": tamaño de trabajo}}
+_persist = not (MODBUS_SIMULATOR or MODBUS_REPLAY_FILE)
+_last_save = monotonic()
+
+
+def _tuner(port: str, slave: int, qregsmax: int) -> ReadSizeTuner:
+    tuner = _tuners.get((port, slave))
+    if tuner is None:
+        saved = _saved.get((port, slave), {})
+        tuner = _tuners[(port, slave)] = ReadSizeTuner(saved.get("max") or qregsmax, saved.get("size"))
+    return tuner
+
+
+def read_size(port: str, slave: int, qregsmax: int) -> int:
+    """
+    Nº de registros a leer en cada transacción con el esclavo 'slave' del puerto 'port'
+    Params:
+        qregsmax: máximo del JSON del modelo, si no se ha sondeado el esclavo
+    """
+    return _tuner(port, slave, qregsmax).size
+
+
+def observe(port: str, slave: int, quan: int, elapsed: float, ok: bool):
+    """
+    Registra un intento de lectura de 'quan' registros del esclavo 'slave' del puerto 'port'
+    """
+    tuner = _tuners.get((port, slave))
+    if tuner is not None:
+        tuner.observe(quan, elapsed, ok)
+
+
+def load_read_sizes(sizes_file: str = MODBUS_READSIZE_FILE) -> int:
+    """
+    Recupera los tamaños de lectura guardados en 'sizes_file'
+    Returns: nº de esclavos recuperados
+    """
+    if not _persist or not path.isfile(sizes_file):
+        return 0
+    try:
+        with open(sizes_file, "r") as f:
+            saved = json.load(f)
+    except (OSError, ValueError) as e:
+        log.error("No se pueden leer los tamaños de lectura de los esclavos %s\n%s", sizes_file, e)
+        return 0
+    for key, sizes in saved.get("slaves", {}).items():
+        port, _, slave = key.rpartition("|")
+        _saved[(port, int(slave))] = sizes
+    return len(_saved)
+
+
+def save_read_sizes(sizes_file: str = MODBUS_READSIZE_FILE, force: bool = False) -> int:
+    """
+    Guarda en 'sizes_file' los tamaños de lectura de los esclavos si han pasado MODBUS_READSIZE_SAVE_PERIOD segundos
+    desde la última vez, o siempre con 'force'
+    Returns: 1 si se ha escrito el archivo, 0 si no
+    """
+    global _last_save
+    if not _persist or not force and monotonic() - _last_save < MODBUS_READSIZE_SAVE_PERIOD:
+        return 0
+    _last_save = monotonic()
+    for key, tuner in _tuners.items():
+        _saved.setdefault(key, {})["size"] = tuner.size
+    if not _saved:
+        return 0
+    tmp_file = sizes_file + ".tmp"
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump({"slaves": {f"{port}|{slave}": sizes for (port, slave), sizes in _saved.items()}}, f, indent=1)
+        replace(tmp_file, sizes_file)
+    except OSError as e:
+        log.error("No se han podido guardar los tamaños de lectura de los esclavos %s\n%s", sizes_file, e)
+        return 0
+    return 1
+
+
+def set_max_size(port: str, slave: int, max_size: int):
+    """
+    Fija el tamaño máximo de lectura del esclavo 'slave' del puerto 'port', averiguado con probe_device
+    """
+    _saved[(port, slave)] = {"max": max_size, "size": max_size}
+    _tuners.pop((port, slave), None)
+
+
+async def probe_block(device, mbop: int, adr: int, quan: int) -> Union[bool, None]:
+    """
+    Lee MODBUS_READSIZE_PROBE_TRIES veces 'quan' registros desde 'adr' sin reintentos
+    Returns: True si todas las lecturas son correctas, False si alguna falla y None si el esclavo responde que el
+    bloque incluye direcciones no válidas
+    """
+    from modbus_tk.exceptions import ModbusError
+    for _ in range(MODBUS_READSIZE_PROBE_TRIES):
+        start = perf_counter()
+        try:
+            reading = await device.execute(device.slave, mbop, adr, quan)
+        except ModbusError as e:
+            if e.get_exception_code() == ILLEGAL_DATA_ADDRESS:
+                return None
+            return False
+        except Exception as e:
+            log.debug("Sondeo de %s registros desde %s del esclavo %s: %s", quan, adr, device.slave, e)
+            return False
+        finally:
+            log.debug("Sondeo de %s registros: %.1f ms", quan, (perf_counter() - start) * 1000)
+        if not reading or len(reading) < quan:
+            return False
+    return True
+
+
+async def probe_device(device, regmap: Dict) -> Tuple[Union[int, None], Dict]:
+    """
+    Busca el mayor nº de registros que admite 'device' en una lectura
+    Params:
+        regmap: mapa de registros del modelo del dispositivo
+    Returns: (tamaño máximo o None si no se ha alcanzado el límite,
+              {tipo de registro: (dirección, tamaño del bloque consecutivo, mayor tamaño leído, límite alcanzado)})
+    """
+    from mb_utils import port_arbiter
+    async with port_arbiter.turn(device.port, device.slave):  # El sondeo ocupa el puerto serie
+        return await probe_in_turn(device, regmap)
+
+
+async def probe_in_turn(device, regmap: Dict) -> Tuple[Union[int, None], Dict]:
+    from regops.regops import group_adrs
+    limits = []
+    detail = {}
+    device.conn = await device.connect()
+    try:
+        for mbop, dtype in MODBUS_DATATYPES_KEYS.items():
+            regs = regmap.get(dtype)
+            if not regs:
+                continue
+            adr, span = max(group_adrs(sorted(int(adr) for adr in regs)), key=lambda group: group[1])
+            span = min(span, MODBUS_READSIZE_PROBE_MAX)
+            lo, hi = 0, span  # Mayor tamaño correcto y tamaño a partir del que se desconoce
+            limited = False
+            while lo < hi:
+                quan = (lo + hi + 1) // 2
+                result = await probe_block(device, mbop, adr, quan)
+                if result:
+                    lo = quan
+                else:
+                    hi = quan - 1
+                    limited = limited or result is False
+            if lo < span:
+                limited = True
+            detail[dtype] = (adr, span, lo, limited)
+            if limited and lo:
+                limits.append(lo)
+    finally:
+        device.conn.close()
+    return (min(limits) if limits else None), detail
+
+
+async def probe(bus_id: Union[str, None] = None, device_id: Union[str, None] = None, save: bool = False) -> Dict:
+    """
+    Sondea los dispositivos del proyecto, o sólo los del bus 'bus_id' o el dispositivo 'device_id'
+    Returns: {(bus, dispositivo): tamaño máximo o None}
+    """
+    import phoenix_init as phi
+    results = {}
+    for idbus, bus in phi.buses.items():
+        if bus_id is not None and str(idbus) != str(bus_id):
+            continue
+        for iddevice, device in bus.items():
+            if device_id is not None and str(iddevice) != str(device_id):
+                continue
+            regmap = next((m.rmap for m in phi.mbregmaps if m.map_id == f"{device.brand}_{device.model}"), None)
+            if regmap is None:
+                continue
+            max_size, detail = await probe_device(device, regmap)
+            results[(idbus, iddevice)] = max_size
+            print(f"Bus {idbus} dispositivo {iddevice} ({device.name}, esclavo {device.slave}): "
+                  f"qregsmax {device.qregsmax}, máximo sondeado {max_size if max_size else 'no alcanzado'}")
+            for dtype, (adr, span, size, limited) in detail.items():
+                print(f"  {dtype}: bloque de {span} desde {adr}, lectura máxima {size}"
+                      f"{'' if limited else ' (sin límite)'}")
+            if save and max_size:
+                set_max_size(device.port, device.slave, max_size)
+    if save:
+        save_read_sizes(force=True)
+    return results
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m mb_utils.read_size",
+                                     description="Sondeo del nº máximo de registros por lectura de los esclavos")
+    parser.add_argument("--bus")
+    parser.add_argument("--device")
+    parser.add_argument("--save", action="store_true", help=f"Guardar los máximos en {MODBUS_READSIZE_FILE}")
+    args = parser.parse_args(argv)
+    asyncio.run(probe(args.bus, args.device, args.save))
+    return 0
+
+
+load_read_sizes()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""
+Simulador de esclavos ModBus RTU construido a partir de los mapas de registros de devices/*.json y de los buses
+definidos en project.json, para ejecutar main.py y las herramientas de lectura/escritura sin hardware.
+
+Cada esclavo virtual (VirtualSlave) tiene los registros co, di, hr e ir de su mapa. Los valores iniciales y su
+evolución se deducen de la descripción en inglés de cada registro y se codifican con la inversa de conv_f_read:
+    - Consignas ("setpoint"): constantes hasta que el maestro las escribe.
+    - Temperaturas ambiente, de agua y exterior, humedades y CO2: evolucionan como un proceso de Ornstein-Uhlenbeck
+      alrededor de su valor de referencia. La temperatura de cada canal tiende a la consigna del mismo canal.
+    - Estado de actuadores ("actuator status"): abierto mientras la temperatura del canal está por debajo de su
+      consigna (calefacción).
+    - Dirección ModBus: la del esclavo. Resto de registros: 0.
+
+Cada puerto serie de SERIAL_PORTS es un SimulatedBus con los esclavos de todos los buses que lo usan. El bus
+simula la latencia de respuesta (SIMULATOR_LATENCY), el tiempo de transmisión de las tramas según la velocidad del
+esclavo y las tramas perdidas (SIMULATOR_DROP_RATE), que el maestro ve como un timeout de SIMULATOR_TIMEOUT.
+SIMULATOR_TIME_SCALE multiplica todas las esperas: con 0 no se espera nada (pruebas de rendimiento).
+
+Transportes:
+    - En el propio proceso (MODBUS_SIMULATOR = True): MBDevice.connect devuelve un SimulatedMaster, con la misma
+      interfaz que modbus_tk.modbus_rtu.RtuMaster.
+    - Pseudoterminal: python -m mb_utils.simulator [enlace] atiende las tramas RTU en un pty enlazado desde
+      'enlace' (SIMULATOR_PTY_LINK por defecto, con el índice del puerto si hay varios). Basta con que SERIAL_PORTS
+      apunte al enlace para que el sistema use pyserial y modbus_tk normalmente.
+    - Pasarela TCP: los buses con transporte "tcp" o "rtutcp" (mb_utils.transport) se atienden en la dirección
+      "ip" y el puerto "tcp_port" del bus, con tramas Modbus TCP o RTU sobre TCP respectivamente.
+"""
+import json
+import os
+import random
+import re
+import select
+import socket
+import struct
+import sys
+import threading
+import tty
+from math import ceil, exp, sqrt
+from time import monotonic, sleep
+from typing import Dict, List, Tuple, Union
+
+from phoenix_constants import *
+from mb_utils.transport import MBAP_HEADER, bus_port, crc16
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+READ_FCODES = {1: COIL_ID, 2: DISCRETE_INPUT_ID, 3: HOLDING_REGISTER_ID, 4: INPUT_REGISTER_ID}
+WRITE_FCODES = {5: COIL_ID, 6: HOLDING_REGISTER_ID, 15: COIL_ID, 16: HOLDING_REGISTER_ID}
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+CHAR_BITS = 11  # Bit de inicio, 8 de datos, paridad y bit de parada
+GAP_CHARS = 3.5  # Silencio entre tramas RTU en caracteres
+
+# Conversión del valor del registro al valor real (conv_f_read) y su inversa
+DECODE = {0: lambda v: v * 10, 1: lambda v: v / 10, 2: lambda v: v * 100, 3: lambda v: v / 100,
+          4: lambda v: v * 9 / 5 + 32, 5: lambda v: (v - 32) * 5 / 9, 10: lambda v: v - 65536 if v > 32767 else v}
+ENCODE = {0: DECODE[1], 1: DECODE[0], 2: DECODE[3], 3: DECODE[2], 4: DECODE[5], 5: DECODE[4], 10: lambda v: v}
+
+CHANNEL = re.compile(r"(?:channel|circuit|zone)\s*(\d+)")
+# (patrón de la descripción, valor de referencia, desviación por √s, constante de tiempo en s, mínimo, máximo)
+SIGNALS = ((re.compile(r"outdoor|outside|exterior"), 12, 0.05, 1800, -10, 45),
+           (re.compile(r"water|supply|return|flow|impuls"), 35, 0.05, 300, 5, 65),
+           (re.compile(r"humidity"), 50, 0.1, 900, 20, 95),
+           (re.compile(r"co2|air quality"), 700, 2, 600, 400, 2000),
+           (re.compile(r"temperature"), 21.5, 0.01, 900, 5, 40))
+
+
+class SlaveException(Exception):
+    """
+    Respuesta de excepción ModBus del esclavo
+    """
+
+    def __init__(self, code: int):
+        super().__init__(f"Excepción ModBus {code}")
+        self.code = code
+
+
+def decode(ops: Union[List, int, None], raw: int) -> float:
+    for op in ([ops] if isinstance(ops, int) else ops or ()):
+        raw = DECODE[op](raw) if op in DECODE else raw
+    return raw
+
+
+def encode(ops: Union[List, int, None], value: float) -> int:
+    for op in reversed([ops] if isinstance(ops, int) else ops or ()):
+        value = ENCODE[op](value) if op in ENCODE else value
+    return int(round(value)) & 0xFFFF
+
+
+class Signal:
+    """
+    Valor real de un registro que evoluciona con el tiempo hacia 'target'
+    """
+
+    def __init__(self, value: float, noise: float = 0, tau: float = 0, lo: float = None, hi: float = None):
+        self.value = self.target = value
+        self.noise = noise
+        self.tau = tau
+        self.lo = lo
+        self.hi = hi
+        self.setpoint: Union[Tuple, None] = None  # (tipo, dirección) de la consigna a la que tiende
+
+    def step(self, dt: float, rng: random.Random):
+        if not self.tau:
+            return
+        value = self.target + (self.value - self.target) * exp(-dt / self.tau) + rng.gauss(0, self.noise * sqrt(dt))
+        self.value = min(max(value, self.lo), self.hi)
+
+
+class VirtualSlave:
+    """
+    Esclavo ModBus virtual con los registros del mapa 'map_id' (devices/<map_id>.json)
+    """
+
+    def __init__(self, slave: int, map_id: str, baudrate: int = 9600, seed: Union[int, None] = None):
+        self.slave = slave
+        self.map_id = map_id
+        self.baudrate = baudrate
+        self.rng = random.Random(slave if seed is None else seed)
+        self.regs: Dict[int, Dict[int, int]] = {COIL_ID: {}, DISCRETE_INPUT_ID: {}, HOLDING_REGISTER_ID: {},
+                                                INPUT_REGISTER_ID: {}}
+        self.signals: Dict[Tuple[int, int], Signal] = {}  # Registros con valor real: {(tipo, dirección): señal}
+        self.ops: Dict[Tuple[int, int], List] = {}  # conv_f_read de cada registro con valor real
+        self.actuators: Dict[Tuple[int, int], Tuple] = {}  # {actuador: ((tipo, dir) temperatura, (tipo, dir) consigna)}
+        self.last_tick = monotonic()
+        with open(f"{DEVICES_FOLDER}{map_id}.json", "r") as f:
+            regmap = json.load(f).get(map_id)
+        self.write_ops = tuple(regmap.get("write_ops", ()))
+        self._build(regmap)
+
+    def _build(self, regmap: Dict):
+        setpoints, temperatures, actuators = {}, {}, {}
+        for dtype, dkey in MODBUS_DATATYPES_KEYS.items():
+            for adr, reg in (regmap.get(dkey) or {}).items():
+                adr = int(adr)
+                descr = reg.get("descr", {})
+                text = (descr.get("en", "") if isinstance(descr, dict) else str(descr)).lower()
+                channel = CHANNEL.search(text)
+                key = (dtype, adr)
+                self.regs[dtype][adr] = 0
+                if dtype in (COIL_ID, DISCRETE_INPUT_ID):
+                    if "actuator" in text and channel:
+                        actuators[channel.group(1)] = key
+                    continue
+                ops = reg.get("conv_f_read")
+                if "modbus address" in text:
+                    self.regs[dtype][adr] = self.slave
+                elif "setpoint" in text:
+                    ref = 35 if "water" in text or "supply" in text else 50 if "dhw" in text else 21
+                    self.signals[key] = Signal(ref)
+                    if channel:
+                        setpoints.setdefault(channel.group(1), key)
+                else:
+                    for pattern, ref, noise, tau, lo, hi in SIGNALS:
+                        if pattern.search(text):
+                            self.signals[key] = Signal(ref + self.rng.uniform(-1, 1), noise, tau, lo, hi)
+                            if channel and pattern is SIGNALS[-1][0]:
+                                temperatures.setdefault(channel.group(1), key)
+                            break
+                if key in self.signals:
+                    self.ops[key] = ops
+                    self.regs[dtype][adr] = encode(ops, self.signals[key].value)
+        for channel, key in temperatures.items():
+            if channel in setpoints:
+                self.signals[key].setpoint = setpoints[channel]
+        for channel, key in actuators.items():
+            if channel in temperatures and channel in setpoints:
+                self.actuators[key] = (temperatures[channel], setpoints[channel])
+
+    def tick(self, now: Union[float, None] = None):
+        """
+        Hace evolucionar los valores reales desde la última llamada
+        """
+        now = monotonic() if now is None else now
+        dt, self.last_tick = now - self.last_tick, now
+        if dt <= 0:
+            return
+        for key, signal in self.signals.items():
+            if signal.setpoint is not None:
+                signal.target = self.signals[signal.setpoint].value
+            signal.step(dt, self.rng)
+            if signal.tau:
+                self.regs[key[0]][key[1]] = encode(self.ops[key], signal.value)
+        for (dtype, adr), (t_key, sp_key) in self.actuators.items():
+            rt, sp = self.signals[t_key].value, self.signals[sp_key].value
+            if rt < sp - 0.2:
+                self.regs[dtype][adr] = 1
+            elif rt > sp + 0.2:
+                self.regs[dtype][adr] = 0
+
+    def read(self, fcode: int, adr: int, quan: int) -> Tuple[int, ...]:
+        table = self.regs[READ_FCODES[fcode]]
+        if not 1 <= quan <= 125 or any(a not in table for a in range(adr, adr + quan)):
+            raise SlaveException(ILLEGAL_DATA_ADDRESS)
+        return tuple(table[a] for a in range(adr, adr + quan))
+
+    def write(self, fcode: int, adr: int, values: Tuple[int, ...]):
+        if fcode not in self.write_ops:
+            raise SlaveException(ILLEGAL_FUNCTION)
+        dtype = WRITE_FCODES[fcode]
+        table = self.regs[dtype]
+        if any(a not in table for a in range(adr, adr + len(values))):
+            raise SlaveException(ILLEGAL_DATA_ADDRESS)
+        for a, value in enumerate(values, adr):
+            table[a] = (1 if value else 0) if dtype == COIL_ID else int(value) & 0xFFFF
+            signal = self.signals.get((dtype, a))
+            if signal is not None:
+                signal.value = signal.target = decode(self.ops[(dtype, a)], table[a])
+
+
+class SimulatedBus:
+    """
+    Puerto serie simulado con los esclavos virtuales conectados a él
+    """
+
+    def __init__(self, port: str, latency: float = SIMULATOR_LATENCY, drop_rate: float = SIMULATOR_DROP_RATE,
+                 timeout: float = SIMULATOR_TIMEOUT, time_scale: float = SIMULATOR_TIME_SCALE):
+        self.port = port
+        self.slaves: Dict[int, VirtualSlave] = {}
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.timeout = timeout
+        self.time_scale = time_scale
+        self.rng = random.Random(port)
+        self.lock = threading.Lock()
+
+    def add_slave(self, slave: VirtualSlave):
+        if slave.slave in self.slaves:
+            log.warning("El esclavo %s está repetido en %s. Se sustituye", slave.slave, self.port)
+        self.slaves[slave.slave] = slave
+
+    def frame_time(self, slave: VirtualSlave, fcode: int, quan: int) -> float:
+        """
+        Tiempo de transmisión de la petición y la respuesta, incluidos los silencios entre tramas
+        """
+        if fcode in (1, 2):
+            nbytes = 8 + 5 + ceil(quan / 8)
+        elif fcode in (3, 4):
+            nbytes = 8 + 5 + 2 * quan
+        elif fcode == 15:
+            nbytes = 9 + ceil(quan / 8) + 8
+        elif fcode == 16:
+            nbytes = 9 + 2 * quan + 8
+        else:
+            nbytes = 8 + 8
+        return (nbytes + 2 * GAP_CHARS) * CHAR_BITS / slave.baudrate
+
+    def transact(self, slave_id: int, fcode: int, adr: int, quan: int = 0,
+                 values: Tuple[int, ...] = ()) -> Tuple[Union[Tuple, None], float]:
+        """
+        Atiende una petición
+        Returns: (respuesta, segundos que tarda). La respuesta es None si la trama se pierde o el esclavo no existe
+        Raises: SlaveException si el esclavo responde con una excepción ModBus
+        """
+        with self.lock:
+            slave = self.slaves.get(slave_id)
+            if slave is None or self.rng.random() < self.drop_rate:
+                return None, self.timeout * self.time_scale
+            quan = len(values) if fcode in WRITE_FCODES else quan
+            delay = (self.latency + self.frame_time(slave, fcode, quan)) * self.time_scale
+            slave.tick()
+            if fcode in READ_FCODES:
+                return slave.read(fcode, adr, quan), delay
+            if fcode in WRITE_FCODES:
+                slave.write(fcode, adr, values)
+                return values, delay
+            raise SlaveException(ILLEGAL_FUNCTION)
+
+    def broadcast(self, fcode: int, adr: int, values: Tuple[int, ...]) -> float:
+        """
+        Atiende una escritura por difusión (esclavo 0): escriben todos los esclavos que tienen el registro y ninguno
+        responde
+        Returns: segundos que tarda la petición
+        """
+        with self.lock:
+            delay = 0
+            for slave in self.slaves.values():
+                delay = max(delay, self.frame_time(slave, fcode, len(values)))
+                slave.tick()
+                try:
+                    slave.write(fcode, adr, values)
+                except SlaveException:
+                    pass
+            return (self.latency + delay) * self.time_scale
+
+
+class SimulatedMaster:
+    """
+    Maestro ModBus con la interfaz de modbus_tk.modbus_rtu.RtuMaster que se comunica con un SimulatedBus
+    """
+
+    def __init__(self, bus: SimulatedBus):
+        self.bus = bus
+
+    def execute(self, slave: int, function_code: int, starting_address: int, quantity_of_x: int = 0,
+                output_value: Union[int, Tuple, List] = 0, **kwargs) -> Tuple:
+        from modbus_tk.exceptions import ModbusError, ModbusInvalidResponseError
+        values = tuple(output_value) if function_code in (15, 16) else (output_value,)
+        if slave == 0 and function_code in WRITE_FCODES:
+            # Como modbus_tk, se espera una respuesta a la difusión que los esclavos no envían
+            sleep(self.bus.broadcast(function_code, starting_address, values))
+            sleep(self.bus.timeout * self.bus.time_scale)
+            raise ModbusInvalidResponseError("Response length is invalid 0")
+        try:
+            response, delay = self.bus.transact(slave, function_code, starting_address, quantity_of_x, values)
+        except SlaveException as e:
+            sleep(self.bus.latency * self.bus.time_scale)
+            raise ModbusError(e.code)
+        sleep(delay)
+        if response is None:
+            raise ModbusInvalidResponseError("Response length is invalid 0")
+        if function_code in READ_FCODES:
+            return response
+        return starting_address, output_value if function_code in (5, 6) else len(values)
+
+    def broadcast(self, function_code: int, starting_address: int, output_value: Union[int, Tuple, List] = 0):
+        """
+        Envía una escritura por difusión (esclavo 0) sin esperar respuesta
+        """
+        values = tuple(output_value) if function_code in (15, 16) else (output_value,)
+        sleep(self.bus.broadcast(function_code, starting_address, values))
+
+    def set_timeout(self, timeout: float):
+        self.bus.timeout = timeout
+
+    def set_verbose(self, verbose: bool):
+        pass
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+
+_buses: Dict[str, SimulatedBus] = {}
+
+
+def load_buses(config_file: str = CONFIG_FILE) -> Dict[str, SimulatedBus]:
+    """
+    Crea los buses simulados con los esclavos de los buses definidos en el proyecto
+    Returns: diccionario {puerto: bus simulado}
+    """
+    with open(config_file, "r") as f:
+        prj_buses = json.load(f).get("project", {}).get("buses", {})
+    buses = {}
+    for bus_id, bus in prj_buses.items():
+        port = bus_port(bus)
+        sim_bus = buses.setdefault(port, SimulatedBus(port))
+        for dev_info in (bus.get("devices") or {}).values():
+            map_id = f"{dev_info.get('brand')}_{dev_info.get('model')}"
+            try:
+                sim_bus.add_slave(VirtualSlave(int(dev_info.get("slave")), map_id, dev_info.get("baudrate", 9600)))
+            except (OSError, AttributeError, TypeError, ValueError) as e:
+                log.error("No se puede simular el esclavo %s del bus %s (%s)\n%s",
+                          dev_info.get("slave"), bus_id, map_id, e)
+    return buses
+
+
+def simulated_master(port: str) -> SimulatedMaster:
+    """
+    Maestro conectado al bus simulado del puerto 'port'. Los buses se crean la primera vez y se mantienen para que
+    los valores de los esclavos evolucionen de un ciclo al siguiente
+    """
+    if not _buses:
+        _buses.update(load_buses())
+    bus = _buses.get(port)
+    if bus is None:
+        bus = _buses[port] = SimulatedBus(port)
+    return SimulatedMaster(bus)
+
+
+def rtu_response(bus: SimulatedBus, request: bytes) -> Tuple[Union[bytes, None], float]:
+    """
+    Procesa una trama RTU de petición
+    Returns: (trama de respuesta o None si no se responde, segundos de espera antes de responder)
+    """
+    if len(request) < 8 or crc16(request[:-2]) != request[-2:]:
+        return None, 0
+    slave, fcode = request[0], request[1]
+    adr, quan = struct.unpack(">HH", request[2:6])
+    values = ()
+    if fcode == 5:
+        values, quan = (1 if quan == 0xFF00 else 0,), 1
+    elif fcode == 6:
+        values, quan = (quan,), 1
+    elif fcode == 15:
+        bits = request[7:7 + request[6]]
+        values = tuple((bits[i // 8] >> (i % 8)) & 1 for i in range(quan))
+    elif fcode == 16:
+        values = struct.unpack(f">{quan}H", request[7:7 + 2 * quan])
+    if slave == 0:  # Difusión: escriben todos los esclavos y ninguno responde
+        if fcode in WRITE_FCODES:
+            bus.broadcast(fcode, adr, values)
+        return None, 0
+    try:
+        response, delay = bus.transact(slave, fcode, adr, quan, values)
+    except SlaveException as e:
+        pdu = bytes((slave, fcode | 0x80, e.code))
+        return pdu + crc16(pdu), bus.latency * bus.time_scale
+    if response is None:
+        return None, 0
+    if fcode in (1, 2):
+        packed = bytearray(ceil(len(response) / 8))
+        for i, bit in enumerate(response):
+            packed[i // 8] |= (1 if bit else 0) << (i % 8)
+        pdu = bytes((slave, fcode, len(packed))) + bytes(packed)
+    elif fcode in (3, 4):
+        pdu = bytes((slave, fcode, 2 * len(response))) + struct.pack(f">{len(response)}H", *response)
+    else:
+        pdu = request[:6]  # Eco de la dirección y del valor escrito o de la cantidad de registros escritos
+    return pdu + crc16(pdu), delay
+
+
+def serve_pty(bus: SimulatedBus, link: str):
+    """
+    Atiende las peticiones RTU que llegan al pseudoterminal enlazado desde 'link'. No termina nunca
+    """
+    master_fd, slave_fd = os.openpty()
+    tty.setraw(slave_fd)
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.ttyname(slave_fd), link)
+    log.info("Simulando %s esclavos de %s en %s -> %s", len(bus.slaves), bus.port, link, os.ttyname(slave_fd))
+    baudrate = min((s.baudrate for s in bus.slaves.values()), default=9600)
+    gap = GAP_CHARS * CHAR_BITS / baudrate
+    frame = b""
+    while True:
+        ready, _, _ = select.select([master_fd], [], [], gap if frame else None)
+        if ready:
+            frame += os.read(master_fd, 512)
+            continue
+        response, delay = rtu_response(bus, frame)
+        frame = b""
+        sleep(delay)
+        if response is not None:
+            os.write(master_fd, response)
+
+
+def recv_exact(conn: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Conexión cerrada por el maestro")
+        data += chunk
+    return data
+
+
+def serve_tcp_connection(bus: SimulatedBus, conn: socket.socket, transport: str):
+    """
+    Atiende las peticiones de un maestro conectado a la pasarela simulada hasta que cierra la conexión.
+    Las peticiones Modbus TCP se convierten en tramas RTU para responderlas con rtu_response
+    """
+    with conn:
+        try:
+            while True:
+                if transport == MODBUS_TRANSPORT_TCP:
+                    tid, _, length, unit = MBAP_HEADER.unpack(recv_exact(conn, MBAP_HEADER.size))
+                    request = bytes((unit,)) + recv_exact(conn, length - 1)
+                    request += crc16(request)
+                else:
+                    request = recv_exact(conn, 7)
+                    request += recv_exact(conn, 2 + request[6] if request[1] in (15, 16) else 1)
+                response, delay = rtu_response(bus, request)
+                sleep(delay)
+                if response is None:
+                    continue
+                if transport == MODBUS_TRANSPORT_TCP:
+                    response = MBAP_HEADER.pack(tid, 0, len(response) - 2, unit) + response[1:-2]
+                conn.sendall(response)
+        except (ConnectionError, OSError):
+            pass
+
+
+def serve_tcp(bus: SimulatedBus, port: str):
+    """
+    Pasarela simulada en la dirección del puerto 'port' ('transporte://ip:puerto'). No termina nunca
+    """
+    transport, address = port.split("://")
+    host, tcp_port = address.rsplit(":", 1)
+    server = socket.create_server((host, int(tcp_port)))
+    log.info("Simulando %s esclavos de la pasarela %s", len(bus.slaves), port)
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=serve_tcp_connection, args=(bus, conn, transport), daemon=True).start()
+
+
+def main(args: List[str]):
+    link = args[0] if args else SIMULATOR_PTY_LINK
+    buses = load_buses()
+    serial_buses = [bus for port, bus in buses.items() if "://" not in port]
+    threads = []
+    for port, bus in buses.items():
+        if "://" in port:
+            thread = threading.Thread(target=serve_tcp, args=(bus, port), daemon=True)
+        else:
+            bus_link = link if len(serial_buses) == 1 else f"{link}{serial_buses.index(bus)}"
+            thread = threading.Thread(target=serve_pty, args=(bus, bus_link), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Objetos de estado con __slots__.
+Las habitaciones, los grupos de habitaciones y los dispositivos ModBus guardan sus atributos en __slots__ en lugar de
+en un diccionario por instancia: ocupan menos memoria, el acceso a los atributos es más rápido y las copias guardadas
+con pickle en TEMP_FOLDER son más pequeñas. Cada clase declara en __slots__ sólo los atributos que añade a los de sus
+clases base; las clases con atributos que se crean a partir de un JSON (DataSource) añaden "__dict__" para ellos.
+SlotState permite cargar también las instancias guardadas antes de usar __slots__, cuyo estado es el diccionario de
+la instancia.
+"""
+from dataclasses import fields
+from typing import Dict, Tuple
+
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+NOT_STATE = ("__dict__", "__weakref__")  # Entradas de __slots__ que no son atributos de estado
+
+
+def slot_names(cls: type) -> Tuple[str, ...]:
+    """
+    Atributos en __slots__ de las instancias de 'cls', de la clase base a la derivada
+    """
+    names = {}
+    for klass in reversed(cls.__mro__):
+        klass_slots = klass.__dict__.get("__slots__", ())
+        for name in (klass_slots,) if isinstance(klass_slots, str) else klass_slots:
+            if name not in NOT_STATE:
+                names[name] = None
+    return tuple(names)
+
+
+def state_attrs(obj) -> Tuple[str, ...]:
+    """
+    Atributos de estado de 'obj': los de __slots__ que tienen valor y los del diccionario de la instancia, si lo tiene
+    """
+    attrs = tuple(name for name in slot_names(type(obj)) if hasattr(obj, name))
+    return attrs + tuple(getattr(obj, "__dict__", ()))
+
+
+def dataclass_slots(cls: type) -> type:
+    """
+    Decorador que pasa a __slots__ los campos de la dataclass 'cls', como dataclass(slots=True) a partir de Python
+    3.10. Se aplica encima de @dataclass. Los valores por defecto de los campos los asigna __init__
+    """
+    field_names = tuple(f.name for f in fields(cls))
+    cls_dict = dict(cls.__dict__)
+    for name in field_names + NOT_STATE:
+        cls_dict.pop(name, None)
+    cls_dict["__slots__"] = field_names
+    cls_dict["__qualname__"] = cls.__qualname__
+    return type(cls)(cls.__name__, cls.__bases__, cls_dict)
+
+
+class SlotState:
+    """
+    Base de las clases con __slots__ cuyas instancias se guardan con pickle
+    """
+    __slots__ = ()
+
+    def __setstate__(self, state: [Dict, Tuple[Dict, Dict]]):
+        """
+        Recupera el estado de una instancia guardada con pickle: la tupla (diccionario de la instancia,
+        {atributo en __slots__: valor}) o, en las instancias guardadas antes de usar __slots__, el diccionario de la
+        instancia. Los atributos que ya no tiene la clase se descartan
+        """
+        if isinstance(state, tuple):
+            inst_dict, slots_state = state
+            state = {**(inst_dict or {}), **(slots_state or {})}
+        for name, value in state.items():
+            try:
+                setattr(self, name, value)
+            except AttributeError:
+                log.warning("Se descarta el atributo %s guardado en una instancia de %s", name, type(self).__name__)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Almacenamiento en disco de las lecturas ModBus (datadb) como una instantánea binaria base más un archivo con los
+registros que cambian en cada lectura (deltas).
+"""
+import json
+import pickle
+from os import path, replace
+from typing import Dict, Tuple
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+_state = None  # Última lectura guardada: {"gen", "id", "hora", "slaves", "regs", "deltas"}
+
+
+def _flatten(lectura: dict) -> Tuple[Dict, Dict]:
+    """
+    Convierte el diccionario de lecturas en dos diccionarios planos:
+    - esclavos: (bus, dispositivo): slave
+    - registros: (bus, dispositivo, tipo de registro, dirección): valor
+    """
+    slaves = {}
+    regs = {}
+    for idbus, bus in lectura.get("buses").items():
+        for iddevice, device_reading in bus.items():
+            slaves[(idbus, iddevice)] = device_reading.get("slave")
+            for regtype, values in device_reading.get("data").items():
+                if not values:
+                    continue
+                for adr, value in values.items():
+                    regs[(idbus, iddevice, regtype, adr)] = value
+    return slaves, regs
+
+
+def _unflatten(state: dict) -> dict:
+    """
+    Operación inversa a _flatten. Devuelve el diccionario de lecturas con el formato de read_all_buses
+    """
+    lectura = {"id": state.get("id"), "hora": state.get("hora"), "buses": {}}
+    for (idbus, iddevice), slave in state.get("slaves").items():
+        lectura["buses"].setdefault(idbus, {})[iddevice] = {"slave": slave, "data": {}}
+    for (idbus, iddevice, regtype, adr), value in state.get("regs").items():
+        lectura["buses"][idbus][iddevice]["data"].setdefault(regtype, {})[adr] = value
+    return lectura
+
+
+def _write_base(state: dict):
+    """
+    Reescribe la instantánea base y vacía el archivo de deltas
+    """
+    tmp_file = READINGS_BASE_FILE + ".tmp"
+    with open(tmp_file, "wb") as f:
+        pickle.dump({k: state[k] for k in ("gen", "id", "hora", "slaves", "regs")}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    replace(tmp_file, READINGS_BASE_FILE)
+    with open(READINGS_DELTA_FILE, "wb"):
+        pass
+    state["deltas"] = 0
+
+
+def _load_state() -> [dict, None]:
+    """
+    Reconstruye la última lectura guardada a partir de la instantánea base y los deltas.
+    Un delta incompleto al final del archivo (corte de alimentación) se descarta.
+    """
+    if not path.isfile(READINGS_BASE_FILE):
+        return
+    try:
+        with open(READINGS_BASE_FILE, "rb") as f:
+            state = pickle.load(f)
+    except (EOFError, pickle.UnpicklingError) as e:
+        log.error("No se puede leer la instantánea de lecturas %s\n%s", READINGS_BASE_FILE, e)
+        return
+    state["deltas"] = 0
+    if path.isfile(READINGS_DELTA_FILE):
+        with open(READINGS_DELTA_FILE, "rb") as f:
+            while True:
+                try:
+                    delta = pickle.load(f)
+                except EOFError:
+                    break
+                except pickle.UnpicklingError:
+                    log.error("Delta incompleto en %s. Se descarta", READINGS_DELTA_FILE)
+                    break
+                if delta.get("gen") != state["gen"]:
+                    continue
+                state["id"] = delta.get("id")
+                state["hora"] = delta.get("hora")
+                state["regs"].update(delta.get("changes"))
+                for key in delta.get("removed"):
+                    state["regs"].pop(key, None)
+                state["deltas"] += 1
+    return state
+
+
+def save_readings(lectura: dict) -> Dict:
+    """
+    Guarda en disco la lectura 'lectura' (diccionario devuelto por read_all_buses).
+    Si existe una lectura anterior con los mismos dispositivos, sólo se añade al archivo de deltas lo que ha cambiado.
+    Param:
+        lectura: diccionario con la hora, el id de la lectura y los valores leídos en cada bus y dispositivo
+    Returns: registros que han cambiado respecto a la lectura anterior (diario de cambios):
+        {(bus, dispositivo, tipo de registro, dirección): valor}
+    """
+    global _state
+    if _state is None:
+        _state = _load_state()
+    slaves, regs = _flatten(lectura)
+    prev = _state
+    missing = object()
+    changes = regs if prev is None else {k: v for k, v in regs.items() if prev["regs"].get(k, missing) != v}
+    _state = {"gen": 0 if prev is None else prev["gen"], "id": lectura.get("id"), "hora": lectura.get("hora"),
+              "slaves": slaves, "regs": regs, "deltas": 0 if prev is None else prev["deltas"]}
+    # Compactación: cada READINGS_COMPACTION_DELTAS deltas, o si cambian los dispositivos leídos, se reescribe la base
+    # con un nuevo nº de generación, que permite descartar los deltas de una base anterior si se interrumpe
+    if prev is None or prev["slaves"] != slaves or prev["deltas"] >= READINGS_COMPACTION_DELTAS:
+        _state["gen"] += 1
+        _write_base(_state)
+    else:
+        delta = {"gen": _state["gen"], "id": _state["id"], "hora": _state["hora"],
+                 "changes": changes,
+                 "removed": [k for k in prev["regs"] if k not in regs]}
+        with open(READINGS_DELTA_FILE, "ab") as f:
+            pickle.dump(delta, f, protocol=pickle.HIGHEST_PROTOCOL)
+        _state["deltas"] += 1
+
+    if READINGS_JSON_EXPORT:
+        with open(READINGS_FILE, "w") as f:
+            json.dump(lectura, f)
+    return changes
+
+
+def load_readings() -> [dict, None]:
+    """
+    Devuelve la última lectura guardada con el mismo formato que read_all_buses, o None si no hay lecturas
+    """
+    global _state
+    if _state is None:
+        _state = _load_state()
+    if _state is None:
+        return
+    return _unflatten(_state)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Tiempos de espera adaptativos de cada esclavo ModBus.
+El tiempo de espera de la respuesta de cada esclavo (puerto, esclavo) se calcula a partir de la distribución de sus
+tiempos de respuesta observados: percentil MODBUS_TIMEOUT_PERCENTILE por MODBUS_TIMEOUT_MARGIN, limitado entre
+MODBUS_TIMEOUT_MIN y MODBUS_TIMEOUT_MAX. Mientras no hay MODBUS_TIMING_MIN_SAMPLES respuestas se utiliza
+MODBUS_TIMEOUT_DEFAULT. Cada timeout seguido duplica el tiempo de espera del esclavo hasta la siguiente respuesta, para
+que un esclavo que se ha vuelto más lento no quede fuera por un tiempo calculado con respuestas antiguas.
+La pausa antes de repetir una petición fallida es la mediana del tiempo de respuesta por MODBUS_RETRY_DELAY_MARGIN,
+limitada entre MODBUS_RETRY_DELAY_MIN y MODBUS_RETRY_DELAY_MAX, de modo que una respuesta tardía no se confunda con la
+del reintento.
+Las últimas MODBUS_TIMING_SAMPLES respuestas de cada esclavo se guardan en MODBUS_TIMING_FILE cada
+MODBUS_TIMING_SAVE_PERIOD segundos y se recuperan al arrancar. Con el simulador o la reproducción de transacciones
+grabadas no se lee ni se guarda el archivo.
+"""
+import json
+from collections import deque
+from os import path, replace
+from time import monotonic
+from typing import Deque, Dict, Tuple, Union
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+
+class SlaveTiming:
+    """
+    Tiempos de respuesta observados de un esclavo y tiempos de espera calculados a partir de ellos
+    """
+
+    def __init__(self, samples: Union[list, None] = None):
+        self.samples: Deque[float] = deque(samples or (), maxlen=MODBUS_TIMING_SAMPLES)
+        self.timeouts = 0  # Timeouts seguidos desde la última respuesta
+        self._timeout = None  # Tiempo de espera calculado. None si hay que recalcularlo
+        self._delay = None
+
+    def observe(self, elapsed: float):
+        self.samples.append(elapsed)
+        self.timeouts = 0
+        self._timeout = self._delay = None
+
+    def timed_out(self):
+        self.timeouts += 1
+
+    def percentile(self, pct: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    @property
+    def timeout(self) -> float:
+        if self._timeout is None:
+            if len(self.samples) < MODBUS_TIMING_MIN_SAMPLES:
+                self._timeout = MODBUS_TIMEOUT_DEFAULT
+            else:
+                self._timeout = min(MODBUS_TIMEOUT_MAX, max(MODBUS_TIMEOUT_MIN, self.percentile(
+                    MODBUS_TIMEOUT_PERCENTILE) * MODBUS_TIMEOUT_MARGIN))
+        return min(MODBUS_TIMEOUT_MAX, self._timeout * 2 ** self.timeouts)
+
+    @property
+    def delay(self) -> float:
+        if self._delay is None:
+            if len(self.samples) < MODBUS_TIMING_MIN_SAMPLES:
+                self._delay = MODBUS_RETRY_DELAY_MAX
+            else:
+                self._delay = min(MODBUS_RETRY_DELAY_MAX, max(MODBUS_RETRY_DELAY_MIN, self.percentile(
+                    0.5) * MODBUS_RETRY_DELAY_MARGIN))
+        return self._delay
+
+
+_slaves: Dict[Tuple[str, int], SlaveTiming] = {}
+_persist = not (MODBUS_SIMULATOR or MODBUS_REPLAY_FILE)
+_last_save = monotonic()
+
+
+def _slave(port: str, slave: int) -> SlaveTiming:
+    timing = _slaves.get((port, slave))
+    if timing is None:
+        timing = _slaves[(port, slave)] = SlaveTiming()
+    return timing
+
+
+def observe(port: str, slave: int, elapsed: float):
+    """
+    Registra el tiempo de respuesta válida del esclavo 'slave' del puerto 'port'
+    """
+    _slave(port, slave).observe(elapsed)
+
+
+def timed_out(port: str, slave: int):
+    """
+    Registra que el esclavo 'slave' del puerto 'port' no ha respondido a tiempo
+    """
+    _slave(port, slave).timed_out()
+
+
+def timeout(port: str, slave: int) -> float:
+    """
+    Segundos de espera de la respuesta del esclavo 'slave' del puerto 'port'
+    """
+    return _slave(port, slave).timeout
+
+
+def retry_delay(port: str, slave: int) -> float:
+    """
+    Segundos de pausa antes de repetir una petición fallida al esclavo 'slave' del puerto 'port'
+    """
+    return _slave(port, slave).delay
+
+
+def load_timing(timing_file: str = MODBUS_TIMING_FILE) -> int:
+    """
+    Recupera los tiempos de respuesta guardados en 'timing_file'
+    Returns: nº de esclavos recuperados
+    """
+    if not _persist or not path.isfile(timing_file):
+        return 0
+    try:
+        with open(timing_file, "r") as f:
+            saved = json.load(f)
+    except (OSError, ValueError) as e:
+        log.error("No se pueden leer los tiempos de respuesta de los esclavos %s\n%s", timing_file, e)
+        return 0
+    for key, samples in saved.get("slaves", {}).items():
+        port, _, slave = key.rpartition("|")
+        _slaves[(port, int(slave))] = SlaveTiming(samples)
+    return len(saved.get("slaves", {}))
+
+
+def save_timing(timing_file: str = MODBUS_TIMING_FILE, force: bool = False) -> int:
+    """
+    Guarda en 'timing_file' los tiempos de respuesta de los esclavos si han pasado MODBUS_TIMING_SAVE_PERIOD
+    segundos desde la última vez, o siempre con 'force'
+    Returns: 1 si se ha escrito el archivo, 0 si no
+    """
+    global _last_save
+    if not _persist or not _slaves or not force and monotonic() - _last_save < MODBUS_TIMING_SAVE_PERIOD:
+        return 0
+    _last_save = monotonic()
+    slaves = {f"{port}|{slave}": [round(sample, 4) for sample in timing.samples]
+              for (port, slave), timing in _slaves.items() if timing.samples}
+    tmp_file = timing_file + ".tmp"
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump({"slaves": slaves}, f)
+        replace(tmp_file, timing_file)
+    except OSError as e:
+        log.error("No se han podido guardar los tiempos de respuesta de los esclavos %s\n%s", timing_file, e)
+        return 0
+    return 1
+
+
+load_timing()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Registro de las transacciones ModBus y reproducción posterior sin hardware.
+
+Grabación (MODBUS_TRACE = True): MBDevice.read y MBDevice.do_write guardan cada transacción en el archivo
+binario circular MODBUS_TRACE_FILE, de tamaño fijo con MODBUS_TRACE_SLOTS registros de MODBUS_TRACE_SLOT_SIZE bytes:
+    cabecera: TRACE_HEADER (firma, versión, tamaño de registro, nº de registros, siguiente posición, total grabados)
+    registro: TRACE_RECORD (instante de inicio, duración, puerto, esclavo, función, dirección, cantidad, estado,
+              nº de valores) seguido de los valores de 16 bits leídos o escritos o, si ha habido una excepción,
+              del texto 'Clase: mensaje' de la excepción.
+Al llenarse el archivo se sobrescriben las transacciones más antiguas.
+
+Reproducción (MODBUS_REPLAY_FILE != None): MBDevice.connect devuelve un ReplayMaster en lugar del maestro RTU.
+ReplayMaster atiende execute() con las respuestas grabadas para el mismo puerto, esclavo, función, dirección y
+cantidad, en el mismo orden en que se grabaron y sin esperas, de modo que se pueden medir la decodificación, los
+cálculos de los grupos de habitaciones y la actualización de los dispositivos a máxima velocidad.
+
+python -m mb_utils.trace [archivo] muestra las transacciones grabadas.
+"""
+import struct
+import sys
+from collections import deque
+from datetime import datetime
+from os import makedirs, path
+from typing import Dict, List, Tuple, Union
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+TRACE_MAGIC = b"PHXT"
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct("<4sHHIIQ")  # Firma, versión, tamaño registro, nº registros, siguiente, total
+TRACE_RECORD = struct.Struct("<df16sBBHHBH")  # Inicio, duración, puerto, esclavo, función, dir, cantidad, estado, nº
+STATUS_OK = 0
+STATUS_EMPTY = 1  # Transacción sin respuesta ni excepción
+STATUS_EXCEPTION = 2
+MAX_VALUES = (MODBUS_TRACE_SLOT_SIZE - TRACE_RECORD.size) // 2
+
+_trace_file = None  # Archivo de grabación abierto
+_next_slot = 0
+_total = 0
+_replay_masters: Dict[str, "ReplayMaster"] = {}
+
+
+def _open_trace():
+    """
+    Abre el archivo de grabación. Si no existe o su formato no coincide con el configurado, se crea de nuevo
+    """
+    global _trace_file, _next_slot, _total
+    makedirs(path.dirname(MODBUS_TRACE_FILE), exist_ok=True)
+    if path.isfile(MODBUS_TRACE_FILE):
+        f = open(MODBUS_TRACE_FILE, "r+b")
+        magic, version, slot_size, slots, next_slot, total = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+        if (magic, version, slot_size, slots) == (TRACE_MAGIC, TRACE_VERSION, MODBUS_TRACE_SLOT_SIZE,
+                                                  MODBUS_TRACE_SLOTS):
+            _trace_file, _next_slot, _total = f, next_slot, total
+            return _trace_file
+        log.warning("El formato de %s no coincide con el configurado. Se crea de nuevo", MODBUS_TRACE_FILE)
+        f.close()
+    f = open(MODBUS_TRACE_FILE, "w+b")
+    f.truncate(TRACE_HEADER.size + MODBUS_TRACE_SLOTS * MODBUS_TRACE_SLOT_SIZE)
+    _trace_file, _next_slot, _total = f, 0, 0
+    _write_header()
+    return _trace_file
+
+
+def _write_header():
+    _trace_file.seek(0)
+    _trace_file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, MODBUS_TRACE_SLOT_SIZE, MODBUS_TRACE_SLOTS,
+                                        _next_slot, _total))
+
+
+def record(port: str, slave: int, fcode: int, adr: int, quan: int, t_start: float, elapsed: float,
+           values: Union[Tuple, List, None] = None, error: Union[Exception, None] = None):
+    """
+    Graba una transacción ModBus en MODBUS_TRACE_FILE. No hace nada si MODBUS_TRACE es False.
+    Params:
+        port: puerto serie
+        slave: esclavo
+        fcode: código de función ModBus
+        adr: dirección del primer registro
+        quan: cantidad de registros leídos o escritos
+        t_start: instante de inicio de la transacción (timestamp)
+        elapsed: duración de la transacción en segundos
+        values: respuesta de la lectura o valores escritos
+        error: excepción producida en la transacción
+    """
+    global _next_slot, _total
+    if not MODBUS_TRACE:
+        return
+    try:
+        f = _trace_file or _open_trace()
+        if error is not None:
+            status, payload = STATUS_EXCEPTION, f"{error.__class__.__name__}: {error}".encode()[:MAX_VALUES * 2]
+            nvalues = len(payload)
+        elif values:
+            values = tuple(values)[:MAX_VALUES]
+            status, nvalues = STATUS_OK, len(values)
+            payload = struct.pack(f"<{nvalues}H", *(int(v) & 0xFFFF for v in values))
+        else:
+            status, payload, nvalues = STATUS_EMPTY, b"", 0
+        f.seek(TRACE_HEADER.size + _next_slot * MODBUS_TRACE_SLOT_SIZE)
+        f.write(TRACE_RECORD.pack(t_start, elapsed, str(port).encode()[:16], slave & 0xFF, fcode, adr & 0xFFFF,
+                                  quan & 0xFFFF, status, nvalues) + payload)
+        _next_slot = (_next_slot + 1) % MODBUS_TRACE_SLOTS
+        _total += 1
+        _write_header()
+        f.flush()
+    except OSError as e:
+        log.error("No se puede grabar la transacción en %s\n%s", MODBUS_TRACE_FILE, e)
+
+
+def read_trace(trace_file: str = MODBUS_TRACE_FILE) -> List[Dict]:
+    """
+    Lee las transacciones grabadas en 'trace_file'
+    Returns: lista de diccionarios ordenada de la transacción más antigua a la más reciente con las claves
+    t, elapsed, port, slave, fcode, adr, quan, values (tupla o None) y error (texto o None)
+    """
+    if _trace_file is not None:
+        _trace_file.flush()
+    with open(trace_file, "rb") as f:
+        magic, version, slot_size, slots, next_slot, total = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            log.error("%s no es un archivo de transacciones ModBus válido", trace_file)
+            return []
+        data = f.read(slots * slot_size)
+    first = next_slot if total > slots else 0
+    transactions = []
+    for i in range(min(total, slots)):
+        offset = ((first + i) % slots) * slot_size
+        t, elapsed, port, slave, fcode, adr, quan, status, nvalues = TRACE_RECORD.unpack_from(data, offset)
+        payload_offset = offset + TRACE_RECORD.size
+        values = error = None
+        if status == STATUS_OK:
+            values = struct.unpack_from(f"<{nvalues}H", data, payload_offset)
+        elif status == STATUS_EXCEPTION:
+            error = data[payload_offset:payload_offset + nvalues].decode(errors="replace")
+        transactions.append({"t": t, "elapsed": elapsed, "port": port.rstrip(b"\x00").decode(), "slave": slave,
+                             "fcode": fcode, "adr": adr, "quan": quan, "values": values, "error": error})
+    return transactions
+
+
+class ReplayError(Exception):
+    """
+    Excepción grabada en la transacción que se reproduce
+    """
+
+
+class ReplayMaster:
+    """
+    Sustituto del maestro ModBus RTU que responde con las transacciones grabadas en un puerto.
+    Las respuestas de cada (esclavo, función, dirección, cantidad) se devuelven en el orden en que se grabaron.
+    Agotadas las respuestas, se repite la última. Sin respuesta grabada, se comporta como un esclavo que no responde.
+    """
+
+    def __init__(self, port: str, transactions: List[Dict]):
+        self.port = port
+        self.responses: Dict[Tuple, deque] = {}
+        for tr in transactions:
+            if tr["port"] == port[:16]:
+                key = (tr["slave"], tr["fcode"], tr["adr"], tr["quan"])
+                self.responses.setdefault(key, deque()).append(tr)
+
+    def execute(self, slave: int, fcode: int, adr: int, quan: int = 0, output_value: Union[int, Tuple, List] = 0,
+                **kwargs) -> Tuple:
+        if fcode in (5, 6):
+            quan = 1
+        elif fcode in (15, 16):
+            quan = len(output_value)
+        pending = self.responses.get((slave, fcode, adr, quan))
+        if not pending:
+            raise ReplayError(f"Sin respuesta grabada del esclavo {slave} (función {fcode}, dirección {adr}, "
+                              f"cantidad {quan}) en {self.port}")
+        tr = pending.popleft() if len(pending) > 1 else pending[0]
+        if tr["error"] is not None:
+            raise ReplayError(tr["error"])
+        if tr["values"] is None:
+            return ()
+        return tr["values"] if fcode in (1, 2, 3, 4) else (adr, tr["values"][0] if quan == 1 else quan)
+
+    def broadcast(self, fcode: int, adr: int, output_value: Union[int, Tuple, List] = 0):
+        """
+        Las difusiones no tienen respuesta que reproducir
+        """
+
+    def set_timeout(self, timeout: float):
+        pass
+
+    def set_verbose(self, verbose: bool):
+        pass
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def replay_master(port: str) -> ReplayMaster:
+    """
+    Devuelve el maestro que reproduce las transacciones de MODBUS_REPLAY_FILE en el puerto 'port'.
+    Se mantiene una instancia por puerto para que las respuestas avancen de un ciclo al siguiente
+    """
+    master = _replay_masters.get(port)
+    if master is None:
+        master = _replay_masters[port] = ReplayMaster(port, read_trace(MODBUS_REPLAY_FILE))
+    return master
+
+
+if __name__ == "__main__":
+    for tr in read_trace(sys.argv[1] if len(sys.argv) > 1 else MODBUS_TRACE_FILE):
+        result = tr["error"] if tr["error"] is not None else tr["values"]
+        print(f"{datetime.fromtimestamp(tr['t'])}\t{tr['elapsed'] * 1000:7.1f} ms\t{tr['port']}\tesclavo {tr['slave']}"
+              f"\tfunción {tr['fcode']}\tdir {tr['adr']}\tcant {tr['quan']}\t{result}")
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Transportes ModBus sobre TCP ("tcp": Modbus TCP y "rtutcp": tramas RTU encapsuladas en TCP) para los buses
+conectados a través de una pasarela Ethernet, con una conexión persistente por pasarela.
+"""
+import socket
+import struct
+import threading
+from itertools import count
+from math import ceil
+from time import monotonic
+from typing import Dict, List, Tuple, Union
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+# Cabecera de Modbus TCP. Con el identificador de transacción se pueden enviar hasta 'pipeline' peticiones antes de
+# recibir las respuestas. En RTU sobre TCP no lo hay y la pasarela atiende una sola petición cada vez
+MBAP_HEADER = struct.Struct(">HHHB")  # Identificador de transacción, protocolo (0), longitud, unidad
+READ_FCODES = (1, 2, 3, 4)
+
+_masters: Dict[str, "TcpMaster"] = {}
+_masters_lock = threading.Lock()
+
+
+def bus_port(bus: Dict) -> str:
+    """
+    Puerto de los dispositivos del bus 'bus' (diccionario del bus en project.json): el puerto serie de SERIAL_PORTS o,
+    si el bus usa una pasarela TCP (claves "transport", "ip", "tcp_port" y "pipeline"), 'transporte://ip:puerto', que
+    identifica la pasarela en las métricas, en la grabación de transacciones y en el simulador
+    """
+    transport = bus.get("transport", MODBUS_TRANSPORT_RTU)
+    if transport not in MODBUS_TCP_TRANSPORTS:
+        return SERIAL_PORTS.get(bus.get("port"), str(bus.get("port")))
+    ip = bus.get("ip")
+    host = ".".join(str(octet) for octet in ip) if isinstance(ip, (list, tuple)) else str(ip)
+    return f"{transport}://{host}:{bus.get('tcp_port', MODBUS_TCP_PORT)}"
+
+
+def is_tcp(port: Union[str, None]) -> bool:
+    return bool(port) and port.split("://")[0] in MODBUS_TCP_TRANSPORTS and "://" in port
+
+
+def get_master(port: str, pipeline: int = MODBUS_TCP_PIPELINE) -> "TcpMaster":
+    """
+    Devuelve la conexión compartida con la pasarela del puerto 'port' ('transporte://ip:puerto'). Se crea la primera
+    vez
+    """
+    with _masters_lock:
+        master = _masters.get(port)
+        if master is None:
+            transport, address = port.split("://")
+            host, tcp_port = address.rsplit(":", 1)
+            master = _masters[port] = TcpMaster(host, int(tcp_port), transport, pipeline)
+        return master
+
+
+def close_all():
+    """
+    Cierra las conexiones con todas las pasarelas
+    """
+    with _masters_lock:
+        for master in _masters.values():
+            master.disconnect()
+
+
+def crc16(frame: bytes) -> bytes:
+    crc = 0xFFFF
+    for byte in frame:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return struct.pack("<H", crc)
+
+
+def request_pdu(fcode: int, adr: int, quan: int = 0, output_value: Union[int, Tuple, List] = 0) -> bytes:
+    """
+    PDU (código de función y datos) de una petición de lectura o escritura
+    """
+    if fcode in READ_FCODES:
+        return struct.pack(">BHH", fcode, adr, quan)
+    if fcode == 5:
+        return struct.pack(">BHH", fcode, adr, 0xFF00 if output_value else 0)
+    if fcode == 6:
+        return struct.pack(">BHH", fcode, adr, int(output_value) & 0xFFFF)
+    values = tuple(output_value)
+    if fcode == 15:
+        packed = bytearray(ceil(len(values) / 8))
+        for i, bit in enumerate(values):
+            packed[i // 8] |= (1 if bit else 0) << (i % 8)
+        return struct.pack(">BHHB", fcode, adr, len(values), len(packed)) + bytes(packed)
+    if fcode == 16:
+        return struct.pack(f">BHHB{len(values)}H", fcode, adr, len(values), 2 * len(values),
+                           *(int(v) & 0xFFFF for v in values))
+    raise ValueError(f"Función ModBus {fcode} no soportada")
+
+
+def parse_pdu(fcode: int, quan: int, pdu: bytes) -> Tuple:
+    """
+    Interpreta la PDU de la respuesta con el mismo formato que devuelve modbus_tk
+    Raises: ModbusError si el esclavo responde con una excepción y ModbusInvalidResponseError si la respuesta no
+    corresponde a la petición
+    """
+    from modbus_tk.exceptions import ModbusError, ModbusInvalidResponseError
+    if not pdu:
+        raise ModbusInvalidResponseError("Response length is invalid 0")
+    if pdu[0] == fcode | 0x80:
+        raise ModbusError(pdu[1] if len(pdu) > 1 else 0)
+    if pdu[0] != fcode:
+        raise ModbusInvalidResponseError(f"Función {pdu[0]} en la respuesta a la función {fcode}")
+    if fcode in (1, 2):
+        bits = pdu[2:2 + pdu[1]]
+        return tuple((bits[i // 8] >> (i % 8)) & 1 for i in range(min(quan, 8 * len(bits))))
+    if fcode in (3, 4):
+        return struct.unpack(f">{pdu[1] // 2}H", pdu[2:2 + pdu[1]])
+    return struct.unpack(">HH", pdu[1:5])
+
+
+def rtu_response_size(header: bytes) -> int:
+    """
+    Longitud total de la trama RTU de respuesta a partir de sus 3 primeros bytes (esclavo, función y byte de datos)
+    """
+    fcode = header[1]
+    if fcode & 0x80:
+        return 5
+    if fcode in READ_FCODES:
+        return 5 + header[2]
+    return 8
+
+
+class TcpMaster:
+    """
+    Conexión persistente con una pasarela ModBus TCP o RTU sobre TCP, con la interfaz de modbus_tk.modbus_rtu.RtuMaster.
+    Se abre la primera vez y se vuelve a abrir tras un error de comunicación
+    """
+    # Admite transacciones simultáneas desde varios hilos: MBDevice las ejecuta en un hilo aparte y se leen a la vez
+    # los dispositivos de distintas pasarelas y varios de la misma si admite 'pipeline'
+    concurrent = True
+
+    def __init__(self, host: str, port: int = MODBUS_TCP_PORT, transport: str = MODBUS_TRANSPORT_TCP,
+                 pipeline: int = MODBUS_TCP_PIPELINE, timeout: float = MODBUS_TCP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.transport = transport
+        self.pipeline = max(1, pipeline) if transport == MODBUS_TRANSPORT_TCP else 1
+        self.timeout = timeout
+        self.sock: Union[socket.socket, None] = None
+        self.slots = threading.BoundedSemaphore(self.pipeline)  # Peticiones pendientes de respuesta
+        self.cond = threading.Condition()  # Protege sock, responses y receiving
+        self.responses: Dict[int, Union[bytes, Exception, None]] = {}  # {transacción: PDU, excepción o None}
+        self.receiving = False  # Un hilo está leyendo del socket
+        self.tids = count(1)
+
+    def __repr__(self):
+        return f"{self.transport}://{self.host}:{self.port}"
+
+    def set_timeout(self, timeout: float):
+        self.timeout = timeout
+
+    def set_verbose(self, verbose: bool):
+        pass
+
+    def open(self):
+        with self.cond:
+            self._connect()
+
+    def close(self):
+        """
+        La conexión, compartida por los dispositivos de la pasarela, se mantiene abierta para las siguientes
+        transacciones. Se cierra con disconnect()
+        """
+
+    def disconnect(self):
+        with self.cond:
+            self._drop(None)
+
+    def _connect(self) -> socket.socket:
+        if self.sock is None:
+            sock = socket.create_connection((self.host, self.port), timeout=MODBUS_TCP_CONNECT_TIMEOUT)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sock = sock
+            log.info("Conectado con la pasarela %r", self)
+        return self.sock
+
+    def _drop(self, error: Union[Exception, None]):
+        """
+        Cierra el socket y da por fallidas las peticiones pendientes. Hay que llamarlo con self.cond adquirido
+        """
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+            if error is not None:
+                log.warning("Conexión con la pasarela %r cerrada\n%s", self, error)
+        for tid, response in self.responses.items():
+            if response is None:
+                self.responses[tid] = error or ConnectionError("Conexión cerrada")
+        self.cond.notify_all()
+
+    def _recv_exact(self, sock: socket.socket, size: int, deadline: float) -> bytes:
+        data = b""
+        while len(data) < size:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise socket.timeout("timed out")
+            sock.settimeout(remaining)
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("La pasarela ha cerrado la conexión")
+            data += chunk
+        return data
+
+    def _receive(self, sock: socket.socket, deadline: float) -> Tuple[int, bytes]:
+        """
+        Lee una respuesta completa del socket
+        Returns: (identificador de transacción, PDU). En RTU sobre TCP el identificador es siempre 0
+        Raises: socket.timeout si no llega nada antes de 'deadline' y ConnectionError si la respuesta queda a medias,
+        porque entonces no se puede saber dónde empieza la siguiente
+        """
+        first = self._recv_exact(sock, 1, deadline)
+        deadline = max(deadline, monotonic() + self.timeout)
+        try:
+            if self.transport == MODBUS_TRANSPORT_TCP:
+                tid, _, length, _ = MBAP_HEADER.unpack(first + self._recv_exact(sock, MBAP_HEADER.size - 1, deadline))
+                return tid, self._recv_exact(sock, length - 1, deadline)
+            header = first + self._recv_exact(sock, 2, deadline)
+            frame = header + self._recv_exact(sock, rtu_response_size(header) - 3, deadline)
+        except socket.timeout:
+            raise ConnectionError("Respuesta incompleta de la pasarela")
+        if crc16(frame[:-2]) != frame[-2:]:
+            raise ValueError("CRC incorrecto en la respuesta RTU")
+        return 0, frame[1:-2]
+
+    def transact(self, slave: int, pdu: bytes, timeout: Union[float, None] = None) -> bytes:
+        """
+        Envía la petición 'pdu' al esclavo 'slave' y espera su respuesta
+        Params:
+            timeout: segundos de espera de la respuesta. Por defecto, self.timeout
+        Returns: PDU de la respuesta
+        Raises: ModbusInvalidResponseError si no hay respuesta a tiempo o se pierde la conexión
+        """
+        from modbus_tk.exceptions import ModbusInvalidResponseError
+        with self.slots:
+            with self.cond:
+                tid = next(self.tids) & 0xFFFF if self.transport == MODBUS_TRANSPORT_TCP else 0
+                try:
+                    sock = self._connect()
+                    if self.transport == MODBUS_TRANSPORT_TCP:
+                        adu = MBAP_HEADER.pack(tid, 0, len(pdu) + 1, slave) + pdu
+                    else:
+                        adu = bytes((slave,)) + pdu
+                        adu += crc16(adu)
+                    self.responses[tid] = None
+                    sock.sendall(adu)
+                except OSError as e:
+                    self.responses.pop(tid, None)
+                    self._drop(e)
+                    raise ModbusInvalidResponseError(f"Sin conexión con la pasarela {self!r}: {e}")
+                deadline = monotonic() + (timeout or self.timeout)
+                while self.responses.get(tid) is None and self.sock is not None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    if self.receiving:
+                        self.cond.wait(remaining)
+                        continue
+                    # Este hilo lee la siguiente respuesta y la entrega a la petición que corresponda
+                    self.receiving = True
+                    self.cond.release()
+                    rx_tid = rx_pdu = error = None
+                    try:
+                        rx_tid, rx_pdu = self._receive(sock, deadline)
+                    except socket.timeout:
+                        pass
+                    except (OSError, ValueError, struct.error) as e:
+                        error = e
+                    finally:
+                        self.cond.acquire()
+                        self.receiving = False
+                    if error is not None:
+                        self._drop(error)
+                    elif rx_tid in self.responses:
+                        self.responses[rx_tid] = rx_pdu
+                    self.cond.notify_all()
+                response = self.responses.pop(tid, None)
+                if not isinstance(response, bytes):
+                    if self.transport == MODBUS_TRANSPORT_RTU_TCP and self.sock is not None:
+                        # Sin identificador de transacción, la respuesta tardía se tomaría por la de la siguiente
+                        # petición
+                        self._drop(None)
+                    raise ModbusInvalidResponseError(f"Sin respuesta del esclavo {slave} en {self!r}: "
+                                                     f"{response or 'timed out'}")
+                return response
+
+    def execute(self, slave: int, function_code: int, starting_address: int, quantity_of_x: int = 0,
+                output_value: Union[int, Tuple, List] = 0, timeout: Union[float, None] = None, **kwargs) -> Tuple:
+        pdu = request_pdu(function_code, starting_address, quantity_of_x, output_value)
+        return parse_pdu(function_code, quantity_of_x, self.transact(slave, pdu, timeout))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Comprobación de las escrituras en los dispositivos.
+set_value actualiza el almacén de lecturas (datadb) con el valor escrito, tal como lo devolvería la siguiente lectura,
+sin volver a buscarlo para comprobarlo. La confirmación del dispositivo se hace por lotes:
+    async with write_check.batch(on_mismatch):
+        ...
+Dentro del lote se apuntan las escrituras que cambian el valor almacenado y, al cerrarlo, se leen de una vez los
+registros escritos de cada dispositivo, en los bloques del plan de lectura (mb_utils.read_plan). Las escrituras que
+repiten el valor almacenado no se comprueban: ese valor es el que ha devuelto el dispositivo en la última lectura.
+Cada discrepancia entre el valor escrito y el leído se registra, se publica en el tema "writes" de publish.events y
+se pasa a on_mismatch(destino, valor leído) para corregir el almacén.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Tuple, Union
+
+from mb_utils.read_plan import datatype_blocks
+from phoenix_constants import *
+from phoenix_log import get_logger
+from publish import events, metrics
+
+log = get_logger(__name__)
+
+READ_OPERATIONS = {datatype: mbop for mbop, datatype in MODBUS_DATATYPES_KEYS.items()}  # {"hr": 3, ...}
+
+# Escrituras del lote en curso: {(bus, dispositivo): (dispositivo, {tipo de registro: (mapa del tipo de registro,
+# {dirección: (destino, valor escrito)})})}
+_expected: ContextVar[Union[Dict[Tuple[str, str], Tuple], None]] = ContextVar("write_check", default=None)
+
+
+def expect(device, target: Dict, regs: Dict, value: int) -> bool:
+    """
+    Apunta la escritura de 'value' (valor ModBus, antes de la conversión de lectura) en el destino 'target' de
+    'device' para comprobarla al cerrar el lote
+    Params:
+        regs: registros del tipo de registro de 'target' en el mapa de registros del dispositivo
+    Returns: False si no hay un lote en curso
+    """
+    expected = _expected.get()
+    if expected is None:
+        return False
+    _, writes = expected.setdefault((str(target.get("bus")), str(target.get("device"))), (device, {}))
+    datatype = target.get("datatype")
+    writes.setdefault(datatype, (regs, {}))[1][int(target.get("adr"))] = (target, value)
+    return True
+
+
+@asynccontextmanager
+async def batch(on_mismatch: Callable[[Dict, int], None]):
+    """
+    Lote de escrituras que se comprueban al salir del bloque 'async with'
+    """
+    expected = {}
+    token = _expected.set(expected)
+    try:
+        yield
+    finally:
+        _expected.reset(token)
+        mismatches = {}
+        await asyncio.gather(*[verify_device(device, writes, on_mismatch, mismatches)
+                               for device, writes in expected.values()])
+        events.publish_changes("writes", mismatches)
+
+
+def as_read(datatype: str, value) -> int:
+    """
+    Valor que devuelve la lectura del registro tras escribir 'value'
+    """
+    if datatype == MODBUS_DATATYPES_KEYS[COIL_ID]:
+        return 1 if value else 0
+    return int(value) & 0xFFFF
+
+
+async def verify_device(device, writes: Dict[str, Tuple], on_mismatch: Callable[[Dict, int], None],
+                        mismatches: Dict):
+    for datatype, (regs, adrs) in writes.items():
+        for start, quan in datatype_blocks((int(adr) for adr in regs), set(adrs)):
+            reading = await device.read(READ_OPERATIONS[datatype], start, quan)
+            if reading is None:
+                log.warning("No se han podido comprobar las escrituras en %s %s-%s del dispositivo %s",
+                            datatype, start, start + quan - 1, device.name)
+                continue
+            for adr in range(start, start + quan):
+                if adr not in adrs:
+                    continue
+                target, written = adrs[adr]
+                read_value = reading[adr - start]
+                if as_read(datatype, written) == read_value:
+                    continue
+                log.warning("El dispositivo %s no ha aceptado el valor %s en el registro %s %s. Valor leído: %s",
+                            device.name, written, datatype, adr, read_value)
+                metrics.write_mismatches.inc(port=device.port, slave=device.slave)
+                mismatches[f"{target.get('bus')}/{target.get('device')}/{datatype}{adr}"] = \
+                    {"written": written, "read": read_value}
+                on_mismatch(target, read_value)
@@ -1,22 +1,33 @@
 #!/usr/bin/env python3
-from typing import Union, List, Tuple, Dict
+from typing import Union, List, Tuple, Dict, Mapping
+import asyncio
 import serial
 from dataclasses import dataclass
 from datetime import datetime
 from math import ceil
-from time import sleep
+from types import MappingProxyType
+from time import perf_counter, time
 import modbus_tk
 import modbus_tk.defines as cst
 from modbus_tk import modbus_rtu
 from modbus_tk.modbus import ModbusError
 
 from phoenix_constants import *
+from mb_utils import port_arbiter, read_size, simulator, timing, trace, transport
+from mb_utils.slots import SlotState, dataclass_slots
+from publish import metrics
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
 
 # VARIABLES DEL SISTEMA PHOENIX
 boardsn: str = ""  # Número de serie de la placa
 prj: Dict = {}  # Diccionario generado a partir del JSON con la configuración del proyecto
 datadb: Dict = {}  # Variable para almacenar las lecturas de registros ModBus y asociarlas con las Rooms
 all_room_groups: Dict = {}  # Diccionario con todos los grupos de habitaciones. Clave principal es id del grupo
+# Resultados de los grupos de habitaciones del último ciclo (mb_utils.update_roomgroups_values). Es una instantánea de
+# sólo lectura: cada ciclo publica una nueva
+roomgroups_values: Mapping[str, Mapping] = MappingProxyType({})
 buses: Dict = {}  # Diccionario con las instancias de los dispositivos ModBus asociados a cada bus
 mbregmaps: Tuple = ()  # Tupla de objetos tipo mapa de registros modbus ModbusRegisterMap.
 
@@ -24,8 +35,9 @@ mbregmaps: Tuple = ()  # Tupla de objetos tipo mapa de registros modbus ModbusRe
 # El mapa de registros es un diccionario cuya clave principal de cada diccionario permite identificar
 # cada dispositivo por marca y modelo
 
+@dataclass_slots
 @dataclass
-class MBDevice:
+class MBDevice(SlotState):
     port: Union[None, str] = None  # Puerto de comunicaciones
     name: Union[None, str] = ""  # Descripción del dispositivo en el proyecto
     slave: Union[None, int] = None  # Dirección en el ModBus
@@ -36,14 +48,26 @@ class MBDevice:
     brand: str = ""
     model: str = ""
     qregsmax: int = 25
+    pipeline: int = MODBUS_TCP_PIPELINE  # Peticiones simultáneas admitidas por la pasarela TCP del bus
     conn: modbus_tk.modbus_rtu.RtuMaster = None
     serialport: serial.Serial = None
     write_ops: Tuple = (cst.WRITE_SINGLE_COIL,
                         cst.WRITE_MULTIPLE_COILS,
                         cst.WRITE_SINGLE_REGISTER,
                         cst.WRITE_MULTIPLE_REGISTERS)
+    dev_stopbits: Union[None, int] = None  # Bits de parada definidos en el JSON del proyecto
 
-    async def connect(self) -> Union[modbus_tk.modbus_rtu.RtuMaster, None]:
+    async def connect(self) -> Union[modbus_tk.modbus_rtu.RtuMaster, trace.ReplayMaster, simulator.SimulatedMaster,
+                                     transport.TcpMaster, None]:
+        if MODBUS_REPLAY_FILE:  # Se reproducen las transacciones grabadas en lugar de acceder al bus
+            self.conn = trace.replay_master(self.port)
+            return self.conn
+        if MODBUS_SIMULATOR:  # Esclavos simulados a partir de los mapas de registros
+            self.conn = simulator.simulated_master(self.port)
+            return self.conn
+        if transport.is_tcp(self.port):  # Pasarela Modbus TCP o RTU sobre TCP con conexión persistente
+            self.conn = transport.get_master(self.port, self.pipeline)
+            return self.conn
         try:
             # Connect to the slave
             serport = serial.Serial(port=self.port,
@@ -56,16 +80,38 @@ class MBDevice:
             # print(f'{datetime.now()} - Estado puerto serie {self.port}: {["cerrado", "abierto"][serport.is_open]}')
             # serport.flush()
             self.conn = modbus_rtu.RtuMaster(serport)
-            self.conn.set_timeout(1)
             self.conn.set_verbose(True)
 
             # print(f'{str(datetime.now())} - Conexión realizada con el puerto {self.port}')
             return self.conn
 
         except modbus_tk.modbus.ModbusError as exc:
-            print(exc)
+            log.error("%s", exc)
             return
 
+    async def execute(self, slave: int, *args, **kwargs) -> Tuple:
+        """
+        Ejecuta una transacción con el esclavo 'slave' en la conexión del dispositivo. La transacción se hace en un
+        hilo aparte para que el bucle de eventos siga atendiendo otros dispositivos. Las conexiones que admiten
+        transacciones simultáneas (pasarelas TCP) reciben el tiempo de espera en cada transacción; en el resto, el
+        turno del puerto (mb_utils.port_arbiter) garantiza que no hay otra transacción en curso.
+        El tiempo de espera de la respuesta se adapta a los tiempos de respuesta del esclavo (mb_utils.timing)
+        """
+        timeout = timing.timeout(self.port, slave)
+        start = perf_counter()
+        try:
+            if getattr(self.conn, "concurrent", False):
+                result = await asyncio.to_thread(self.conn.execute, slave, *args, timeout=timeout, **kwargs)
+            else:
+                self.conn.set_timeout(timeout)
+                result = await asyncio.to_thread(self.conn.execute, slave, *args, **kwargs)
+        except modbus_tk.exceptions.ModbusInvalidResponseError:
+            timing.timed_out(self.port, slave)
+            raise
+        if result:
+            timing.observe(self.port, slave, perf_counter() - start)
+        return result
+
     async def read(self, mbop: int, adr: int, quan: int) -> Union[Tuple[int, ...], None]:
         """
         Método para leer el dispositivo ModBus
@@ -74,28 +120,40 @@ class MBDevice:
         quan: cantidad de registros a leer
         Returns: resultado de la lectura modbus.
         """
-        # Si quan es mayor que el máximo número de registros a leer de una vez, qregsmax, el proceso de lectura
-        # se hace por partes de manera que en cada proceso de lectura no se supere el máximo número de registros
-        self.qregsmax = self.qregsmax if self.qregsmax else 25
-        if quan > self.qregsmax:
+        # Si quan es mayor que el número de registros a leer de una vez, el proceso de lectura se hace por partes de
+        # manera que en cada proceso de lectura no se supere ese número. Es el tamaño de trabajo del esclavo, que se
+        # ajusta según su rendimiento sin superar el máximo sondeado o qregsmax (mb_utils.read_size)
+        self.qregsmax = self.qregsmax if self.qregsmax else MODBUS_READSIZE_DEFAULT
+        qregs = read_size.read_size(self.port, self.slave, self.qregsmax)
+        if quan > qregs:
             readings = []
-            qreadings = ceil(quan / self.qregsmax)  # Calculo el número de lecturas que es necesario hacer
+            qreadings = ceil(quan / qregs)  # Calculo el número de lecturas que es necesario hacer
             for i in range(qreadings):
-                init_adr = adr + i * self.qregsmax
-                partial_quan = self.qregsmax if (i + 1) * self.qregsmax < quan else quan - i * self.qregsmax
+                init_adr = adr + i * qregs
+                partial_quan = qregs if (i + 1) * qregs < quan else quan - i * qregs
                 readings.append((init_adr, partial_quan))
         else:
             readings = [(adr, quan)]
+        # El puerto se abre, se lee y se cierra en el turno del dispositivo (mb_utils.port_arbiter)
+        async with port_arbiter.turn(self.port, self.slave):
+            return await self.read_in_turn(mbop, adr, quan, readings)
+
+    async def read_in_turn(self, mbop: int, adr: int, quan: int,
+                           readings: List[Tuple[int, int]]) -> Union[Tuple[int, ...], None]:
+        """
+        Lee los bloques 'readings' (dirección, cantidad) en que se divide la lectura de 'quan' registros desde 'adr'
+        """
         total_readings = []
         # try:
         self.conn = await self.connect()
-        print("\n... abriendo conexión con el dispositivo Modbus")
+        log.debug("abriendo conexión con el dispositivo Modbus")
         for reading in readings:
+            radr, rquan = reading
             if mbop not in [cst.READ_COILS,
                             cst.READ_DISCRETE_INPUTS,
                             cst.READ_HOLDING_REGISTERS,
                             cst.READ_INPUT_REGISTERS]:
-                print(f'Operación de lectura, {mbop}, no válida')
+                log.error("Operación de lectura, %s, no válida", mbop)
                 return
             # print(f"lectura Modbus\n\t{self.__dict__}")
             tries = 0
@@ -103,26 +161,43 @@ class MBDevice:
             while tries < READING_TRIES:
                 try:
                     tries += 1
-                    print(f'{datetime.now()} -\tIntentando leer {reading[1]} registros desde el registro {reading[0]} '
-                          f'del esclavo {self.slave} con la operación {mbop} en el '
-                          f'puerto {self.port} ==> Intento {tries}')
-                    reading = self.conn.execute(self.slave, mbop, reading[0], reading[1])
+                    log.debug("Intentando leer %s registros desde el registro %s del esclavo %s con la operación %s "
+                              "en el puerto %s ==> Intento %s",
+                              rquan, radr, self.slave, mbop, self.port, tries)
+                    t_start, start = time(), perf_counter()
+                    reading = await self.execute(self.slave, mbop, radr, rquan)
+                    elapsed = perf_counter() - start
+                    metrics.observe_modbus(self.port, self.slave, elapsed, ok=bool(reading))
+                    read_size.observe(self.port, self.slave, rquan, elapsed, ok=bool(reading))
+                    trace.record(self.port, self.slave, mbop, radr, rquan, t_start, elapsed, values=reading)
                     if reading:
                         break
-                    sleep(0.5)
                 except Exception as e:
-                    print(f"Error lectura intento {tries}\n{e}")
+                    elapsed = perf_counter() - start
+                    metrics.observe_modbus(self.port, self.slave, elapsed, ok=False,
+                                           timeout=isinstance(e, modbus_tk.exceptions.ModbusInvalidResponseError))
+                    if not isinstance(e, ModbusError):  # Las excepciones del esclavo no dependen del tamaño de trama
+                        read_size.observe(self.port, self.slave, rquan, elapsed, ok=False)
+                    trace.record(self.port, self.slave, mbop, radr, rquan, t_start, elapsed, error=e)
+                    log.warning("Error lectura intento %s\n%s", tries, e)
+                if tries < READING_TRIES:
+                    # Pausa para que una respuesta tardía no se tome por la del reintento
+                    await asyncio.sleep(timing.retry_delay(self.port, self.slave))
 
             else:
-                print(f'{str(datetime.now())} -\tNo se ha podido realizar la lectura de {quan} registros desde la '
-                      f'dirección {adr} del esclavo {self.slave}/{self.name} con la operación {mbop} en el '
-                      f'puerto {self.port}\n')
-                print("... cerrando conexión con el dispositivo Modbus\n")
+                metrics.modbus_retries.inc(READING_TRIES - 1, port=self.port, slave=self.slave)
+                metrics.modbus_errors.inc(port=self.port, slave=self.slave)
+                log.error("No se ha podido realizar la lectura de %s registros desde la dirección %s del esclavo "
+                          "%s/%s con la operación %s en el puerto %s",
+                          quan, adr, self.slave, self.name, mbop, self.port)
+                log.debug("cerrando conexión con el dispositivo Modbus")
                 self.conn.close()
                 return
 
+            if tries > 1:
+                metrics.modbus_retries.inc(tries - 1, port=self.port, slave=self.slave)
             total_readings += reading
-        print("... cerrando conexión con el dispositivo Modbus\n")
+        log.debug("cerrando conexión con el dispositivo Modbus")
         self.conn.close()
         return tuple(total_readings)
 
@@ -130,12 +205,12 @@ class MBDevice:
 
         # Compruebo operaciones de escritura válidas definidas para el dispositivo
         if mbop not in self.write_ops:
-            print(f'Operación de escritura, {mbop}, no válida. Dispositivo {self.name}')
+            log.error("Operación de escritura, %s, no válida. Dispositivo %s", mbop, self.name)
             return
 
         # Compruebo si se han introducido valores a escribir:
         if not output_value:
-            print(f'Escritura ModBus: No se han introducido valores a escribir en el dispositivo {self.name}')
+            log.debug("Escritura ModBus: No se han introducido valores a escribir en el dispositivo %s", self.name)
             return
 
         # Si se quieren escribir varios valores, pero no está habilitada la escritura múltiple en el dispositivo,
@@ -149,28 +224,65 @@ class MBDevice:
         for wlist in writinglist:
             await self.do_write(self.slave, mbop, wlist[0], *wlist[1])
 
-        print(
-            f'{str(datetime.now())} -\tIntentando escribir {len(output_value)} valores a partir del registro {adr} del '
-            f'esclavo {self.slave} con la operación {mbop} en el puerto {self.port}')
+        log.debug("Intentando escribir %s valores a partir del registro %s del esclavo %s con la operación %s en el "
+                  "puerto %s", len(output_value), adr, self.slave, mbop, self.port)
 
     async def do_write(self, slv: int, mbop: int, adr: int, *output_value: Union[int, Tuple[int], List[int]]):
+        # Las escrituras pasan delante de las lecturas que esperan el turno del puerto
+        async with port_arbiter.turn(self.port, slv, PORT_WRITE_MAX_WAIT):
+            return await self.write_in_turn(slv, mbop, adr, *output_value)
+
+    async def write_in_turn(self, slv: int, mbop: int, adr: int, *output_value: Union[int, Tuple[int], List[int]]):
+        t_start, start = time(), perf_counter()  # La duración incluye la apertura del puerto, que también puede fallar
         try:
             self.conn = await self.connect()
             value2write = output_value[0] if len(output_value) == 1 and mbop in [5, 6] else output_value
-            ret = self.conn.execute(slv, mbop, adr, output_value=value2write)
+            ret = await self.execute(slv, mbop, adr, output_value=value2write)
+            elapsed = perf_counter() - start
+            metrics.observe_modbus(self.port, slv, elapsed)
+            trace.record(self.port, slv, mbop, adr, len(output_value), t_start, elapsed, values=output_value)
             return ret
         except Exception as e:
-            if isinstance(output_value, int):
-                msg = f'{datetime.now()} -\tNo se ha podido escribir el valor {output_value} en el registro {adr}' \
-                      f' del esclavo {self.slave} con la operación {mbop} en el puerto {self.port}\n{e}'
-            else:
-                msg = f'{datetime.now()} -\tNo se han podido escribir {len(output_value)} registros del ' \
-                      f'esclavo {self.slave} con la operación {mbop} en el puerto {self.port}\n{e}'
-            print(msg)
+            elapsed = perf_counter() - start
+            metrics.observe_modbus(self.port, slv, elapsed, ok=False,
+                                   timeout=isinstance(e, modbus_tk.exceptions.ModbusInvalidResponseError))
+            trace.record(self.port, slv, mbop, adr, len(output_value), t_start, elapsed, error=e)
+            metrics.modbus_errors.inc(port=self.port, slave=slv)
+            log.error("No se han podido escribir %s registros a partir del registro %s del esclavo %s con la "
+                      "operación %s en el puerto %s\n%s", len(output_value), adr, slv, mbop, self.port, e)
             return
         finally:
             self.conn.close()
 
+    async def broadcast_in_turn(self, mbop: int, adr: int, *output_value: Union[int, Tuple[int], List[int]]) -> bool:
+        """
+        Escribe 'output_value' en el registro 'adr' de todos los esclavos del puerto con una trama de difusión
+        (esclavo 0). Los esclavos no responden, así que la trama se envía sin esperar respuesta y no cuenta en los
+        tiempos de respuesta (mb_utils.timing) ni en los errores del esclavo 0
+        Returns: True si se ha enviado la trama
+        """
+        value2write = output_value[0] if len(output_value) == 1 and mbop in [5, 6] else output_value
+        t_start, start = time(), perf_counter()
+        try:
+            self.conn = await self.connect()
+            if isinstance(self.conn, modbus_rtu.RtuMaster):
+                # RtuMaster.execute espera la respuesta incluso del esclavo 0: se envía la trama RTU directamente
+                frame = bytes((0,)) + transport.request_pdu(mbop, adr, output_value=value2write)
+                self.conn.open()
+                await asyncio.to_thread(self.conn._send, frame + transport.crc16(frame))
+            else:
+                await asyncio.to_thread(self.conn.broadcast, mbop, adr, value2write)
+            trace.record(self.port, 0, mbop, adr, len(output_value), t_start, perf_counter() - start,
+                         values=output_value)
+            return True
+        except Exception as e:
+            log.error("No se ha podido enviar la difusión de %s registros a partir del registro %s con la operación %s "
+                      "en el puerto %s\n%s", len(output_value), adr, mbop, self.port, e)
+            return False
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+
     def __repr__(self):
         dev_info = f"Dispositivo {self.name}: {self.brand} / {self.model}. Esclavo {self.slave}"
         return dev_info
@@ -184,7 +296,7 @@ class ModbusRegisterMap:
     def __init__(self, map_id: str):
         self.map_id = map_id
         # Se carga el diccionario con el mapa de registros del dispositivo
-        print(f"(devices.ModbusRegisterMap) - Cargando mapa de registros {self.map_id}")
+        log.debug("(devices.ModbusRegisterMap) - Cargando mapa de registros %s", self.map_id)
         self.rmap: [dict, None] = None  # Diccionario con el Mapa de registros
 
     def co(self):
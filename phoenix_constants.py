@@ -51,15 +51,124 @@ IV = "iv"  # Archivo para almacenar el modo de funcionamiento calefacción/refri
 
 # JSON DE CONFIGURACIÓN DEL PROYECTO
 MODULE_PATH = os.path.realpath(os.path.dirname(__file__))
-CONFIG_FILE = MODULE_PATH + r"/project.json"
+CONFIG_FILE = os.environ.get("PHOENIX_CONFIG_FILE", MODULE_PATH + r"/project.json")
 DEVICES_FOLDER = MODULE_PATH + r"/devices/"
 PROJECT_ELEMENTS_FOLDER = MODULE_PATH + r"/project_elements/"
-TEMP_FOLDER = "/home/pi/var/tmp/phoenix/"
-READINGS_FILE = TEMP_FOLDER + "modbus_readings.json"
-ROOMGROUPS_VALUES_FILE = TEMP_FOLDER + "roomgroups_values.json"
+TEMP_FOLDER = os.environ.get("PHOENIX_TEMP_FOLDER", "/home/pi/var/tmp/phoenix/")
+READINGS_FILE = TEMP_FOLDER + "modbus_readings.json"  # Sólo se escribe si READINGS_JSON_EXPORT es True
+READINGS_JSON_EXPORT = False  # Exportar también la última lectura completa en JSON (compatibilidad)
+READINGS_BASE_FILE = TEMP_FOLDER + "modbus_readings.base"  # Instantánea binaria completa de las lecturas
+READINGS_DELTA_FILE = TEMP_FOLDER + "modbus_readings.delta"  # Registros modificados en cada lectura
+READINGS_COMPACTION_DELTAS = 60  # Nº de deltas tras los que se reescribe la instantánea base
+ROOMGROUPS_VALUES_FILE = TEMP_FOLDER + "roomgroups_values.json"  # Sólo se escribe si ROOMGROUPS_VALUES_EXPORT es True
+ROOMGROUPS_VALUES_EXPORT = True  # Exportar los resultados de los grupos de habitaciones de cada ciclo para la web
 ROOMGROUPS_INSTANCES_FILE = TEMP_FOLDER + "roomgroups.pickle"
-BUSES_INSTANCES_FILE = TEMP_FOLDER + "buses.pickle"
+BUSES_INSTANCES_FILE = TEMP_FOLDER + "buses.pickle"  # Configuración estática de los dispositivos (1ª ejecución)
+DEVICES_STATE_FILE = TEMP_FOLDER + "devices_state.pickle"  # Estado de funcionamiento de los dispositivos
+DEVICES_STATE_VERSION = 1  # Versión del formato de DEVICES_STATE_FILE. Si no coincide, se descarta el archivo
 REGMAP_INSTANCES_FILE = TEMP_FOLDER + "regmaps.pickle"
+PROJECT_CHECK_STRICT = os.environ.get("PHOENIX_STRICT_CONFIG") == "1"  # No arrancar si hay errores en la configuración
+
+# HISTÓRICO DE LECTURAS
+HISTORY_FOLDER = TEMP_FOLDER + "historico/"
+HISTORY_INDEX_FILE = HISTORY_FOLDER + "index.json"  # Columnas almacenadas en los archivos de cada entidad
+# Niveles del histórico: (resolución en segundos, nº de registros del anillo). Cada resolución debe ser múltiplo de
+# la anterior. Por defecto: 2 días con 1 minuto, 30 días con 15 minutos y 1 año con 1 hora
+HISTORY_TIERS = ((60, 2 * 24 * 60),
+                 (15 * 60, 30 * 24 * 4),
+                 (60 * 60, 365 * 24))
+ROOMGROUP_HISTORY_FIELDS = ("iv", "demanda", "water_sp", "air_sp", "air_rt", "air_dp", "air_h", "aq", "aq_sp")
+
+# SERVIDOR HTTP CON LA API JSON (publish.api_server). Sólo se arranca cuando main.py se ejecuta con --daemon
+API_SERVER_HOST = "0.0.0.0"
+API_SERVER_PORT = 8080
+API_REQUEST_TIMEOUT = 10  # Segundos de espera máxima a la petición de un cliente
+API_GZIP_MIN_SIZE = 1024  # Tamaño mínimo en bytes de la respuesta para comprimirla con gzip
+CYCLE_PERIOD = 60  # Segundos entre el inicio de dos ciclos de lectura en modo --daemon
+EVENTS_QUEUE_SIZE = 100  # Nº máximo de eventos pendientes de enviar a cada cliente de /api/events
+EVENTS_KEEPALIVE = 15  # Segundos sin eventos tras los que se envía un comentario a los clientes de /api/events
+METRICS_FILE = TEMP_FOLDER + "phoenix.prom"  # Métricas para el recolector textfile de node_exporter
+
+# REGISTRO DE MENSAJES (phoenix_log)
+LOG_LEVEL = os.environ.get("PHOENIX_LOG_LEVEL", "WARNING")  # Nivel general: DEBUG, INFO, WARNING, ERROR
+LOG_LEVELS = {}  # Nivel de módulos concretos. Ej: {"mb_utils.mb_utils": "DEBUG", "devices": "INFO"}
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+LOG_RATE_LIMIT = 300  # Segundos durante los que se descarta un mismo aviso o error repetido
+
+# GRABACIÓN Y REPRODUCCIÓN DE TRANSACCIONES MODBUS (mb_utils.trace)
+MODBUS_TRACE = os.environ.get("PHOENIX_MODBUS_TRACE") == "1"  # Grabar todas las transacciones ModBus
+MODBUS_TRACE_FILE = TEMP_FOLDER + "modbus_trace.ring"
+MODBUS_TRACE_SLOTS = 20000  # Nº de transacciones que caben en el archivo circular
+MODBUS_TRACE_SLOT_SIZE = 288  # Bytes por transacción: cabecera de 37 bytes y hasta 125 valores de 16 bits
+MODBUS_REPLAY_FILE = os.environ.get("PHOENIX_MODBUS_REPLAY")  # Archivo grabado a reproducir en lugar de los buses
+
+# SIMULADOR DE ESCLAVOS MODBUS (mb_utils.simulator)
+MODBUS_SIMULATOR = os.environ.get("PHOENIX_MODBUS_SIMULATOR") == "1"  # Usar esclavos simulados en lugar de los buses
+SIMULATOR_LATENCY = 0.01  # Segundos que tarda el esclavo simulado en empezar a responder
+SIMULATOR_DROP_RATE = 0.0  # Fracción de peticiones que el esclavo simulado no responde
+SIMULATOR_TIMEOUT = 1  # Segundos que espera el maestro la respuesta de una petición perdida
+SIMULATOR_TIME_SCALE = float(os.environ.get("PHOENIX_SIMULATOR_TIME_SCALE", 1.0))  # Factor de las esperas (0: ninguna)
+SIMULATOR_PTY_LINK = "/tmp/ttySIM"  # Enlace al pseudoterminal del simulador
+BOARD_SN = os.environ.get("PHOENIX_BOARD_SN")  # Nº de serie a utilizar fuera de la centralita (simulador, benchmarks)
+
+# TRANSPORTES MODBUS TCP (mb_utils.transport). Se eligen con la clave "transport" de cada bus del proyecto
+MODBUS_TRANSPORT_RTU = "rtu"  # Puerto serie local (SERIAL_PORTS), por defecto
+MODBUS_TRANSPORT_TCP = "tcp"  # Modbus TCP con cabecera MBAP en la dirección "ip" del bus
+MODBUS_TRANSPORT_RTU_TCP = "rtutcp"  # Tramas RTU sobre TCP (pasarela Ethernet - RS485 transparente)
+MODBUS_TCP_TRANSPORTS = (MODBUS_TRANSPORT_TCP, MODBUS_TRANSPORT_RTU_TCP)
+MODBUS_TCP_PORT = 502  # Puerto TCP de la pasarela si el bus no define "tcp_port"
+MODBUS_TCP_TIMEOUT = 1  # Segundos de espera de la respuesta a una petición
+MODBUS_TCP_CONNECT_TIMEOUT = 3  # Segundos de espera al abrir la conexión con la pasarela
+MODBUS_TCP_PIPELINE = 4  # Peticiones Modbus TCP pendientes de respuesta por conexión si el bus no define "pipeline"
+
+# TIEMPOS DE ESPERA ADAPTATIVOS DE CADA ESCLAVO MODBUS (mb_utils.timing)
+MODBUS_TIMING_FILE = TEMP_FOLDER + "slave_timing.json"  # Últimos tiempos de respuesta de cada esclavo
+MODBUS_TIMING_SAMPLES = 200  # Nº de tiempos de respuesta que se conservan de cada esclavo
+MODBUS_TIMING_MIN_SAMPLES = 20  # Nº de respuestas a partir del que se calculan los tiempos de espera del esclavo
+MODBUS_TIMING_SAVE_PERIOD = 300  # Segundos entre escrituras de MODBUS_TIMING_FILE
+MODBUS_TIMEOUT_DEFAULT = 1  # Segundos de espera de la respuesta de un esclavo sin suficientes respuestas observadas
+MODBUS_TIMEOUT_PERCENTILE = 0.99  # Percentil del tiempo de respuesta en el que se basa el tiempo de espera
+MODBUS_TIMEOUT_MARGIN = 2.0  # Factor sobre el percentil del tiempo de respuesta
+MODBUS_TIMEOUT_MIN = 0.1  # Límites en segundos del tiempo de espera de la respuesta
+MODBUS_TIMEOUT_MAX = 3
+MODBUS_RETRY_DELAY_MARGIN = 1.0  # Factor sobre la mediana del tiempo de respuesta para la pausa antes de reintentar
+MODBUS_RETRY_DELAY_MIN = 0.02  # Límites en segundos de la pausa antes de repetir una petición fallida
+MODBUS_RETRY_DELAY_MAX = 0.5
+
+# TURNOS DE LOS PUERTOS SERIE COMPARTIDOS (mb_utils.port_arbiter)
+PORT_MAX_WAIT = 2.0  # Segundos de espera a partir de los que una lectura pasa delante de la rotación de dispositivos
+PORT_WRITE_MAX_WAIT = 0  # Las escrituras pasan delante de las lecturas pendientes
+
+# ESCRITURAS AGRUPADAS (mb_utils.group_writes)
+# Modelos "marca_modelo" que aceptan escrituras por difusión (esclavo 0). Ej: ("uponor_x148",)
+MODBUS_BROADCAST_MODELS = ()
+MODBUS_BROADCAST_DELAY = 0.1  # Segundos de pausa tras una difusión para que los esclavos la procesen
+
+# PLAN DE LECTURA DE LOS DISPOSITIVOS (mb_utils.read_plan). Sólo se leen los registros que utiliza el proyecto
+READ_PLAN = os.environ.get("PHOENIX_READ_PLAN", "1") == "1"  # Con "0" se leen todos los registros de los mapas
+READ_PLAN_MAX_GAP = 3  # Registros sin utilizar que se leen para unir dos bloques del mismo tramo del mapa
+# Registros de supervisión que se leen siempre en cada modelo aunque no los utilice el proyecto.
+# Ej: {"me_ecodan": {"hr": [299, 300]}}. En project.json, la clave "monitor" de cada dispositivo admite el mismo
+# formato, {tipo de registro: [direcciones]}, o true para leer todo su mapa de registros
+READ_PLAN_MONITOR = {}
+
+# TAMAÑO DE LAS LECTURAS MODBUS DE CADA ESCLAVO (mb_utils.read_size)
+MODBUS_READSIZE_FILE = TEMP_FOLDER + "read_sizes.json"  # Tamaños máximo y de trabajo de cada esclavo
+MODBUS_READSIZE_SAVE_PERIOD = 300  # Segundos entre escrituras de MODBUS_READSIZE_FILE
+MODBUS_READSIZE_DEFAULT = 25  # Registros por lectura si el JSON del modelo no define "qregsmax"
+MODBUS_READSIZE_WINDOW = 50  # Nº de lecturas del tamaño de trabajo con las que se mide su rendimiento
+MODBUS_READSIZE_MAX_ERROR_RATE = 0.02  # Tasa de lecturas fallidas a partir de la que se reduce el tamaño
+MODBUS_READSIZE_RETRY_WINDOWS = 20  # Ventanas de medida tras las que se vuelven a probar los tamaños superiores
+MODBUS_READSIZE_PROBE_TRIES = 3  # Lecturas correctas seguidas para dar por bueno un tamaño en el sondeo
+MODBUS_READSIZE_PROBE_MAX = 125  # Máximo nº de registros de una lectura según el protocolo ModBus
+
+# BANCO DE PRUEBAS DE RENDIMIENTO (benchmarks)
+BENCHMARK_FOLDER = MODULE_PATH + r"/benchmarks/"
+BENCHMARK_BASELINE_FILE = BENCHMARK_FOLDER + "baseline.json"  # Resultados de referencia de cada escenario
+BENCHMARK_CYCLES = 5  # Nº de ciclos completos medidos en cada escenario (más uno previo de calentamiento)
+BENCHMARK_MICRO_TIME = 0.5  # Segundos mínimos de medida de cada micro-benchmark
+BENCHMARK_TOLERANCE = 0.25  # Incremento relativo sobre la referencia a partir del cual se considera una regresión
+BENCHMARK_MAX_SLAVE = 247  # Dirección ModBus más alta utilizable por los dispositivos del proyecto sintético
 
 # CONFIG_FILE = "./project.json"
 
@@ -101,6 +210,12 @@ TMIN_IMPUL_REFR = 11  # Temperatura mínima de impulsión en refrigeración
 RT_LIM_CALEF = 26
 RT_LIM_REFR = 20
 ALTITUD = 696
+# PSICROMETRÍA (mb_utils.psychrometrics)
+# La entalpía y el punto de rocío se calculan y memorizan con la temperatura y la humedad relativa redondeadas a
+# estos decimales. Los sensores dan 0.1 °C y 1 %
+PSYCHRO_T_DECIMALS = 1
+PSYCHRO_RH_DECIMALS = 1
+PSYCHRO_CACHE_SIZE = 4096  # Nº de pares (temperatura, humedad) memorizados
 
 DEFAULT_TEMP_EXTERIOR_VERANO = 35  # Valor entre junio y septiembre
 DEFAULT_TEMP_EXTERIOR_INVIERNO = 3  # Valor resto del año
@@ -127,7 +242,7 @@ FC_FREEC = 6  # Fancoil más freecooling
 VENTILACION = 8
 
 # DIRECTORIO PARA ALMACENAR LOS ARCHIVOS DE INTERCAMBIO CON LA WEB DE SIGEEN:
-EXCHANGE_FOLDER = r"/home/pi/var/tmp/reg"
+EXCHANGE_FOLDER = os.environ.get("PHOENIX_EXCHANGE_FOLDER", r"/home/pi/var/tmp/reg")
 TEMP_EXT_FILE = EXCHANGE_FOLDER + "/1/1000/temp"
 HR_EXT_FILE = EXCHANGE_FOLDER + "/1/2000/humd"
 AQ_EXT_FILE = EXCHANGE_FOLDER + "/1/3000/aq"
@@ -203,3 +318,61 @@ EXCHANGE_RW_FILES = {
     "TempFluidController": TEMPFLUIDCONTROLLER_RW_FILES,
     "DataSource": DATASOURCE_RW_FILES
 }
+# ESQUEMA DE LOS ARCHIVOS DE INTERCAMBIO CON LA WEB (mb_utils.exchange)
+# Tipo, valores mínimo y máximo (None: sin límite) y unidades del valor de cada archivo. Los archivos de los canales y
+# circuitos numerados (sp1, sp2...) usan el esquema de su nombre sin número. Los valores de la web que no cumplen el
+# esquema se rechazan antes de escribir en los dispositivos
+XCH_SWITCH = (int, 0, 1, "")  # Estados y modos 0/1: on/off, manual/automático, calefacción/refrigeración...
+XCH_INT = (int, None, None, "")  # Valores enteros propios de cada dispositivo (valores on/off, alarmas...)
+XCH_TEMP = (float, None, None, "°C")  # Temperaturas leídas
+XCH_ROOM_SP = (float, 5, 40, "°C")  # Consignas de temperatura ambiente
+XCH_WATER_SP = (float, 5, 65, "°C")  # Consignas de temperatura de impulsión de agua
+XCH_RH = (float, 0, 100, "%")
+XCH_ENERGY = (float, 0, None, "kWh")
+XCH_RATIO = (float, 0, None, "")  # COP, EER
+XCH_AIRFLOW = (float, 0, None, "m³/h")
+XCH_HRU_MODE = (int, 0, VENTILACION, "")  # Modos de funcionamiento del recuperador: PARADO...VENTILACION
+EXCHANGE_SCHEMAS = {
+    "UFHCController": {"iv": XCH_SWITCH, "pump": XCH_SWITCH, "sp": XCH_ROOM_SP, "rt": XCH_TEMP, "rh": XCH_RH,
+                       "ft": XCH_TEMP, "st": XCH_SWITCH, "coff": XCH_SWITCH, "dp": XCH_TEMP,
+                       "h": (float, None, None, "kJ/kg")},
+    "Generator": {"onoff_st": XCH_SWITCH, "manual_onoff_mode": XCH_SWITCH, "manual_onoff": XCH_INT, "sp": XCH_TEMP,
+                  "manual_sp_mode": XCH_SWITCH, "manual_sp": XCH_WATER_SP, "dhw_sp": (float, 5, TMAX_ACS, "°C"),
+                  "dhw_t": XCH_TEMP, "iv": XCH_SWITCH, "manual_iv_mode": XCH_SWITCH, "manual_iv": XCH_INT,
+                  "alarm": XCH_INT, "t_ext": XCH_TEMP, "supply_water_temp": XCH_TEMP, "return_water_temp": XCH_TEMP,
+                  "t_inercia": XCH_TEMP, "water_flow": (float, 0, None, ""), "eelectrica_consumida": XCH_ENERGY,
+                  "ecooling_consumida": XCH_ENERGY, "eheating_consumida": XCH_ENERGY, "edhw_consumida": XCH_ENERGY,
+                  "cop": XCH_RATIO, "eer": XCH_RATIO},
+    "Fancoil": {"onoff_st": XCH_SWITCH, "demand": (int, 0, 2, ""), "iv": XCH_SWITCH, "sp": XCH_TEMP, "rt": XCH_TEMP,
+                "fan_auto_cont": XCH_SWITCH, "fan_speed": (int, 0, 100, ""), "actmanual_fan": XCH_SWITCH,
+                "manual_speed": (int, 0, 100, ""), "speed_limit": (tuple, 0, 100, ""), "valv_st": XCH_SWITCH,
+                "manual_valv_st": XCH_SWITCH, "manual_valv_pos": XCH_SWITCH, "remote_onoff": XCH_SWITCH,
+                "sd_aux": XCH_SWITCH, "floor_temp": XCH_TEMP},
+    "Split": {},
+    "HeatRecoveryUnit": {"onoff": XCH_SWITCH, "manual": XCH_SWITCH, "manual_speed": (int, 0, 3, ""),
+                         "hru_mode": XCH_HRU_MODE, "man_hru_mode_st": XCH_SWITCH, "man_hru_mode": XCH_HRU_MODE,
+                         "speed": (int, 0, 3, ""), "manual_airflow": XCH_AIRFLOW, "supply_flow": XCH_AIRFLOW,
+                         "exhaust_flow": XCH_AIRFLOW, "valv_st": XCH_INT, "man_valv_pos": XCH_SWITCH,
+                         "man_dampers_pos": XCH_SWITCH, "bypass_st": XCH_INT, "dampers_st": XCH_INT,
+                         "remote_onoff": XCH_SWITCH, "aux_ed2_st": XCH_INT, "aux_ed3_st": XCH_INT},
+    "AirZoneManager": {"iv": XCH_SWITCH, "sp": XCH_ROOM_SP, "rt": XCH_TEMP, "fan_auto_cont": XCH_SWITCH,
+                       "fan_speed": (int, 0, 2, ""), "damper1_st": XCH_INT, "damper2_st": XCH_INT,
+                       "demand": XCH_INT, "remote_onoff": XCH_SWITCH, "ed1_aux": XCH_INT, "ed2_aux": XCH_INT,
+                       "ed3_aux": XCH_INT},
+    "TempFluidController": {"iv": (int, 0, 2, ""), "st": XCH_SWITCH, "act_man_st": XCH_SWITCH, "man_st": XCH_SWITCH,
+                            "sp": (int, 5, 55, "°C"), "act_man_sp": XCH_SWITCH, "man_sp": (int, 5, 55, "°C"),
+                            "ti": XCH_TEMP, "v": (float, 0, 100, "%")},
+    "DataSource": {}
+}
+# ATRIBUTOS CON EL ESTADO DE FUNCIONAMIENTO DE LOS DISPOSITIVOS QUE SE CONSERVA ENTRE CICLOS:
+# MODOS Y VALORES MANUALES FIJADOS DESDE LA WEB Y ÚLTIMOS VALORES ESCRITOS EN LOS DISPOSITIVOS
+DEVICE_STATE_ATTRS = {
+    "UFHCController": (),
+    "Generator": GENERATOR_RW_FILES + ("onoff_st", "sp", "iv"),
+    "Fancoil": FANCOIL_RW_FILES,
+    "Split": SPLIT_RW_FILES,
+    "HeatRecoveryUnit": HEATRECOVERYUNIT_RW_FILES + ("hru_mode", "speed", "valv_st", "bypass_st", "dampers_st"),
+    "AirZoneManager": AIRZONEMANAGER_RW_FILES + ("fan_manual_speed_mode", "fan_manual_speed"),
+    "TempFluidController": TEMPFLUIDCONTROLLER_RW_FILES,
+    "DataSource": DATASOURCE_RW_FILES
+}
@@ -7,14 +7,23 @@ from gc import \
     collect
 from phoenix_config import *
 from phoenix_constants import *
-from project_elements.building import Room, RoomGroup, init_modo_iv, get_modo_iv
-from devices.devices import SYSTEM_CLASSES
+from project_elements.building import Room, RoomGroup, CycleContext, init_modo_iv, get_modo_iv, get_cycle_context
+from devices.devices import SYSTEM_CLASSES, DEVICE_CLASSES
+from mb_utils import slots
+from mb_utils.device_state import restore_devices_state
+from mb_utils.transport import bus_port
+from mb_utils.project_check import check_project
+from mb_utils.read_plan import compile_read_plan
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
 
 
 init_time = datetime.now()
-print(f"Hora inicio: {str(init_time)}")
+log.info("Hora inicio: %s", init_time)
 
 system_iv = init_modo_iv()  # Inicializamos el modo de funcionamiento frío_calor
+cycle = CycleContext(init_time, system_iv)  # Datos comunes del ciclo en curso (main.ciclo)
 
 
 # system_classes = list(SYSTEM_CLASSES.values())  # Clases de dispositivos del sistema
@@ -42,37 +51,37 @@ def create_device_files(device) -> int:
         try:
             os.mkdir(EXCHANGE_FOLDER)
         except OSError:
-            print(f"ERROR Creando el directorio de intercambio con la web: {EXCHANGE_FOLDER}")
+            log.error("Error Creando el directorio de intercambio con la web: %s", EXCHANGE_FOLDER)
         else:
-            print(f"\n\n\tDirectorio de intercambio con la web {EXCHANGE_R_FILES}  -  CREADO\n")
+            log.debug("Directorio de intercambio con la web %s  -  CREADO", EXCHANGE_R_FILES)
     else:
-        print(f"\n\tEl fichero de intercambio, {EXCHANGE_FOLDER}, ya existe.")
+        log.debug("El fichero de intercambio, %s, ya existe.", EXCHANGE_FOLDER)
     bus_folder_name = EXCHANGE_FOLDER + r"/" + bus_id
     bus_folder_exists = os.path.isdir(bus_folder_name)
     if not bus_folder_exists:
         try:
             os.mkdir(bus_folder_name)
         except OSError:
-            print(f"\n\tERROR Creando el directorio de intercambio con la web: {bus_folder_name} para el "
-                  f"bus {bus_id}\n")
+            log.error("Error Creando el directorio de intercambio con la web: %s para el bus %s",
+                      bus_folder_name, bus_id)
             return 0
         else:
-            print(f"\n\t\t...directorio para bus {bus_id} en {bus_folder_name}  -  CREADO")
+            log.debug("directorio para bus %s en %s  -  CREADO", bus_id, bus_folder_name)
     sl_folder_name = bus_folder_name + r"/" + slave
-    print(f"\t\tProcesando carpeta {sl_folder_name}")
+    log.debug("Procesando carpeta %s", sl_folder_name)
     sl_folder_exists = os.path.isdir(sl_folder_name)
     if not sl_folder_exists:
         try:
             os.mkdir(sl_folder_name)
         except OSError:
-            print(f"\n\tERROR Creando el directorio de intercambio con la web: {sl_folder_name} para el "
-                  f"esclavo {slave}\n")
+            log.error("Error Creando el directorio de intercambio con la web: %s para el esclavo %s",
+                      sl_folder_name, slave)
         else:
-            print(f"\n\t\t...directorio para esclavo {slave} en {sl_folder_name}  -  CREADO")
+            log.debug("directorio para esclavo %s en %s  -  CREADO", slave, sl_folder_name)
     contador_archivos_creados = 0
     for exc_filename in file_names:
         exc_file_path = sl_folder_name + r"/" + exc_filename
-        print(f"\t\t\tProcesando archivo {exc_file_path}")
+        log.debug("Procesando archivo %s", exc_file_path)
         exc_file_exists = os.path.isfile(exc_file_path)
         if not exc_file_exists:
             try:
@@ -81,11 +90,11 @@ def create_device_files(device) -> int:
                     sp_bus_filename = exc_file_path + "_bus"
                     open(sp_bus_filename, 'w').close()  # Archivo para almacenar cada X148/canal/consigna
             except OSError:
-                print(f"\n\n\tERROR creando el fichero de intercambio {exc_file_path} para el esclavo {slave}")
+                log.error("Error creando el fichero de intercambio %s para el esclavo %s", exc_file_path, slave)
             else:
                 contador_archivos_creados += 1
-                print(f"\n\t...creado el archivo de intercambio nº {contador_archivos_creados}: {exc_file_path} "
-                      f"para el esclavo {slave}")
+                log.debug("creado el archivo de intercambio nº %s: %s para el esclavo %s",
+                          contador_archivos_creados, exc_file_path, slave)
     return 1
 
 
@@ -94,12 +103,14 @@ def get_boardsn() -> str:
     Obtiene el número de serie de la centralita
     :return: Cadena con el número de serie de la ESP32
     """
+    if BOARD_SN:  # Ejecución fuera de la centralita (simulador, benchmarks)
+        return BOARD_SN
     command = "cat /proc/cpuinfo | grep Serial"
     rpi3sn = os.popen(command).read()
     if rpi3sn:
         return rpi3sn.split(':')[1].strip()
     else:
-        print("PHOENIX_INIT: No hay ninguna centralita conectada.\n\t... Abandonando el programa.")
+        log.error("PHOENIX_INIT: No hay ninguna centralita conectada.\n\t... Abandonando el programa.")
         sys.exit()
 
 
@@ -118,22 +129,33 @@ def load_project() -> [dict, None]:
             prj_cfg = project.get("project")
             return prj_cfg
     except FileNotFoundError:
-        print(f"\nERROR - No se ha encontrado el fichero de configuración del proyecto {CONFIG_FILE}")
+        log.error("No se ha encontrado el fichero de configuración del proyecto %s", CONFIG_FILE)
         return
 
 
 # Cargo el proyecto y compruebo si existe el JSON de configuración y si el proyecto tiene definidos edificios
 prj = load_project()
 if prj is None:
-    print("\nERROR cargando la configuración del proyecto.\n...Abandonando el programa")
+    log.error("Error cargando la configuración del proyecto.\n...Abandonando el programa")
     sys.exit()
 # print(prj)
 
 buildings = prj.get("buildings")
 if buildings is None:
-    print("ERROR (phoenix-config: load_buildings) - No se ha definido ningún edificio en el fichero de "
-          "configuración del proyecto,\n\n\t...Abandonando el programa.")
+    log.error("Error (phoenix-config: load_buildings) - No se ha definido ningún edificio en el fichero de "
+              "configuración del proyecto,\n\n\t...Abandonando el programa.")
+    sys.exit()
+
+# Compruebo las referencias entre project.json, project_elements y los mapas de registros (mb_utils.project_check) y
+# construyo los índices de las fuentes de datos y de los registros utilizados por el proyecto
+project_index = check_project(prj)
+project_index.log()
+if project_index.errors and PROJECT_CHECK_STRICT:
+    log.error("Hay %s errores en la configuración del proyecto.\n...Abandonando el programa",
+              len(project_index.errors))
     sys.exit()
+source_handles = project_index.handles  # {fuente tal como aparece en la configuración: claves de datadb}
+read_plan = project_index.read_plan  # {(bus, dispositivo): {tipo de registro: direcciones utilizadas}}
 
 def create_o_data_files():
     """
@@ -143,7 +165,7 @@ def create_o_data_files():
     Returns: 1 si se crea, 0 si no se crea
 
     """
-    print("\nCREANDO ARCHIVOS DE INTERCAMBIO DE T, HR Y AQ EXTERIORES Y DE MODO IV DEL SISTEMA")
+    log.debug("CREANDO ARCHIVOS DE INTERCAMBIO DE T, HR Y AQ EXTERIORES Y DE MODO IV DEL SISTEMA")
     bus_id = "1"  # Los archivos exteriores siempre irán en el bus 1
     # Compruebo si existe el directorio de intercambio de registros:
     reg_folder_exists = os.path.isdir(EXCHANGE_FOLDER)
@@ -151,22 +173,22 @@ def create_o_data_files():
         try:
             os.mkdir(EXCHANGE_FOLDER)
         except OSError:
-            print(f"ERROR Creando el directorio de intercambio con la web: {EXCHANGE_FOLDER}")
+            log.error("Error Creando el directorio de intercambio con la web: %s", EXCHANGE_FOLDER)
         else:
-            print(f"\n\n\tDirectorio de intercambio con la web {EXCHANGE_FOLDER}  -  CREADO\n")
+            log.debug("Directorio de intercambio con la web %s  -  CREADO", EXCHANGE_FOLDER)
     else:
-        print(f"\n\tEl fichero de intercambio, {EXCHANGE_FOLDER}, ya existe.")
+        log.debug("El fichero de intercambio, %s, ya existe.", EXCHANGE_FOLDER)
     bus_folder_name = EXCHANGE_FOLDER + r"/" + bus_id
     bus_folder_exists = os.path.isdir(bus_folder_name)
     if not bus_folder_exists:
         try:
             os.mkdir(bus_folder_name)
         except OSError:
-            print(f"\n\tERROR Creando el directorio de intercambio con la web: {bus_folder_name} para el "
-                  f"bus {bus_id}\n")
+            log.error("Error Creando el directorio de intercambio con la web: %s para el bus %s",
+                      bus_folder_name, bus_id)
             return 0
         else:
-            print(f"\n\t\t...directorio para bus {bus_id} en {bus_folder_name}  -  CREADO")
+            log.debug("directorio para bus %s en %s  -  CREADO", bus_id, bus_folder_name)
 
     o_files = {"1000": TEMP_EXT_FILE, "2000": HR_EXT_FILE, "3000": AQ_EXT_FILE, "5000": MODO_IV_FILE}
     for d, f in o_files.items():
@@ -176,23 +198,23 @@ def create_o_data_files():
             try:
                 os.mkdir(full_d_name)
             except OSError:
-                print(f"ERROR Creando el directorio de intercambio con la web: {full_d_name}")
+                log.error("Error Creando el directorio de intercambio con la web: %s", full_d_name)
             else:
-                print(f"\n\n\tDirectorio de intercambio con la web {full_d_name}  -  CREADO\n")
+                log.debug("Directorio de intercambio con la web %s  -  CREADO", full_d_name)
         else:
-            print(f"\n\tEl fichero de intercambio, {full_d_name}, ya existe.")
+            log.debug("El fichero de intercambio, %s, ya existe.", full_d_name)
 
         f_exists = os.path.isfile(f)
         if not f_exists:
-            print(f"Intentando crear {f}")
+            log.debug("Intentando crear %s", f)
             try:
                 open(f, 'w').close()
             except OSError:
-                print(f"\n\n\tERROR creando el fichero de valores exteriores o modo IV: {f}")
+                log.error("Error creando el fichero de valores exteriores o modo IV: %s", f)
                 return 0
             else:
-                print(f"\n\t...creado el fichero{f}")
-    print("Ficheros de valores exteriores y modo IV creados\n")
+                log.debug("creado el fichero%s", f)
+    log.debug("Ficheros de valores exteriores y modo IV creados")
     return 1
 create_o_data_files()
 
@@ -206,7 +228,7 @@ def load_roomgroups():
     el valor los objetos RoomGroup del edificio, siendo uno de los atributos de dichos objetos
     una lista de los objetos Room que componen el grupo.
     """
-    print(f"\n(load_roomgroups)\tPROCESANDO GRUPOS DE HABITACIONES\n")
+    log.debug("(load_roomgroups)\tPROCESANDO GRUPOS DE HABITACIONES")
     roomgroups = {}
 
     hay_habitaciones = False  # Si no hay ninguna habitación definida en el proyecto se genera un aviso y se
@@ -215,19 +237,19 @@ def load_roomgroups():
     for bldid, bld in buildings.items():
         dwellings = bld.get("dwellings")
         if dwellings is None:
-            print(f"WARNING (phoenix-config: load_buildings) - El edificio {bld.get('name')} no tiene "
-                  "definidas viviendas.")
+            log.warning("Warning (phoenix-config: load_buildings) - El edificio %s no tiene definidas viviendas.",
+                        bld.get('name'))
             continue
         for dwellid, dwell in dwellings.items():
-            print(f"Procesando vivienda {dwell.get('name')}")
+            log.debug("Procesando vivienda %s", dwell.get('name'))
             rooms = dwell.get("rooms")
             if rooms is None:
-                print(f"WARNING (phoenix-config: load_buildings) - La vivienda {dwell.get('name')} del edificio "
-                      f"{bld.get('name')} no tiene definidas habitaciones")
+                log.warning("Warning (phoenix-config: load_buildings) - La vivienda %s del edificio %s no tiene "
+                            "definidas habitaciones", dwell.get('name'), bld.get('name'))
                 continue
             hay_habitaciones = True
             for roomid, room in rooms.items():
-                print(f"\n\tProcesando habitación {room.get('name')}")
+                log.debug("Procesando habitación %s", room.get('name'))
                 # Se instancia cada habitación.
                 groups = room.get("groups")
                 new_room = Room(
@@ -249,22 +271,22 @@ def load_roomgroups():
                 )
                 # print(f"DEBUGGING {__file__} - Atributos Room\n{new_room.__dict__}")
                 for idx, group in enumerate(groups):
-                    print(f"\t\t(load_roomgroups) Procesando grupo {idx} con 'id': {group}")
+                    log.debug("(load_roomgroups) Procesando grupo %s con 'id': %s", idx, group)
                     # Compruebo si existe el grupo de habitaciones
                     grp = roomgroups.get(str(group))
                     if grp is None:
-                        print(f"\t\t\tNo existia el grupo {group}. Lo creo")
+                        log.debug("No existia el grupo %s. Lo creo", group)
                         # No existía el grupo, creo la clave en el diccionario all_rooms y el
                         # objeto RoomGroup
                         roomgroups[str(group)] = RoomGroup(id_rg=str(group))
-                        print(f"\t\t\t... creado grupo de habitaciones\nGrupo: {str(group)}")
+                        log.debug("creado grupo de habitaciones\nGrupo: %s", group)
                     # Se añade la habitación a la lista de habitaciones del RoomGroup.
                     roomgroups[str(group)].roomgroup.append(new_room)
-                    print(f"\t\t\t... añadiendo habitación {new_room.name} al grupo {str(group)}")
+                    log.debug("añadiendo habitación %s al grupo %s", new_room.name, group)
 
     if not hay_habitaciones:
-        print("ERROR (phoenix-config: load_buildings) - No se ha definido ninguna habitación en todo el "
-              "edificio en el fichero de configuración")
+        log.error("Error (phoenix-config: load_buildings) - No se ha definido ninguna habitación en todo el edificio "
+                  "en el fichero de configuración")
         sys.exit()
     # for k, v in roomgroups.items():
     #     print(f"Grupo {k}: {[x.name for x in v.roomgroup]}")
@@ -303,26 +325,25 @@ def load_buses():
     Returns: diccionario con el "id" de los buses como clave y como valor otro diccionario con el "id"
     del dispositivo como clave y el objeto del dispositivo físico como valor.
     """
-    print(f"\n(load_buses)\tPROCESANDO BUSES DEL PROYECTO\n")
+    log.debug("(load_buses)\tPROCESANDO BUSES DEL PROYECTO")
     prj_buses = prj.get("buses")
     if prj_buses is None:
-        print("ERROR (load_devices) - No se han definido los buses de comunicaciones del proyecto")
-        print("ERROR (load_devices) - ... Saliendo del programa")
+        log.error("No se han definido los buses de comunicaciones del proyecto")
+        log.error("Saliendo del programa")
         sys.exit()
     devices = {}
     for bus in prj_buses:
         # Extraigo los dispositivos del bus
         bus_devices = prj_buses[bus].get("devices")
-        bus_key = prj_buses[bus].get("port")
-        bus_port = SERIAL_PORTS.get(bus_key)
+        port = bus_port(prj_buses[bus])  # Puerto serie o pasarela TCP (mb_utils.transport)
+        pipeline = prj_buses[bus].get("pipeline", MODBUS_TCP_PIPELINE)
         # bus_id = prj_buses[bus].get('id')
         bus_id = bus
         bus_name = prj_buses[bus].get('name')
         if bus_devices is None:
-            msg = f"WARNING (load_devices) - No hay dispositivos asociados al bus {bus}"
-            print(msg)
+            log.warning("No hay dispositivos asociados al bus %s", bus)
             continue
-        print(f"\tProcesando bus {bus_id} - {bus_name}")
+        log.debug("Procesando bus %s - %s", bus_id, bus_name)
         devices[bus] = {}
         for device in bus_devices:
             # Datos del dispositivo específicos para el proyecto (extraídos del JSON con los datos del proyecto)
@@ -334,13 +355,11 @@ def load_buses():
             brand = dev_info.get("brand")
             model = dev_info.get("model")
             groups = dev_info.get("groups")
-            print(f"\n\t\t... procesando el dispositivo {dev_id} - {name}: clase {cls} (esclavo {slave})")
+            log.debug("procesando el dispositivo %s - %s: clase %s (esclavo %s)", dev_id, name, cls, slave)
             dev_parity = PARITY.get(dev_info.get("parity"))
             # print(f"(phoenix-config) - Paridad del dispositivo: {dev_parity}")
             if cls is None:
-                msg = f"""WARNING (load_devices) - El dispositivo {name} no tiene definida su Clase Python  
-                en el fichero de configuración"""
-                print(msg)
+                log.warning("El dispositivo %s no tiene definida su Clase Python en el fichero de configuración", name)
                 continue
 
             # Se instancia el dispositivo
@@ -353,7 +372,8 @@ def load_buses():
                 model=model
             )
             # Cargando parámetros de comunicación del dispositivo
-            mbdevice.port = bus_port
+            mbdevice.port = port
+            mbdevice.pipeline = pipeline
             mbdevice.slave = dev_info.get("slave")
             mbdevice.baudrate = dev_info.get("baudrate")
             mbdevice.databits = dev_info.get("databits")
@@ -361,21 +381,19 @@ def load_buses():
             mbdevice.dev_stopbits = dev_info.get("stopbits")
 
             devices[bus][device] = mbdevice
-            print(f"\t\t\t... dispositivo {dev_id} - {name}: clase {cls} (esclavo {slave}) CREADO")
-            print(f"\t... creando los archivos de intercambio del dispositivo {mbdevice.slave} - {cls}")
+            log.debug("dispositivo %s - %s: clase %s (esclavo %s) CREADO", dev_id, name, cls, slave)
+            log.debug("creando los archivos de intercambio del dispositivo %s - %s", mbdevice.slave, cls)
             ex_file_creation = create_device_files(mbdevice)
             if not ex_file_creation:
-                print(f"ERROR - No se han podido crear los archivos de intercambio del esclavo "
-                      f"{mbdevice.slave}, de la clase {cls}")
+                log.error("No se han podido crear los archivos de intercambio del esclavo %s, de la clase %s",
+                          mbdevice.slave, cls)
             collect()
 
     if not devices:
-        msg = """WARNING (load_devices) - No se ha definido ningún dispositivo en ningún bus del proyecto.
-        ... Abandonando el programa"""
-        print(msg)
+        log.error("No se ha definido ningún dispositivo en ningún bus del proyecto.\n... Abandonando el programa")
         sys.exit()
 
-    print(f"\n(load_buses)\tFINALIZADO EL PROCESAMIENTO DE LOS BUSES DEL PROYECTO\n\n")
+    log.debug("(load_buses)\tFINALIZADO EL PROCESAMIENTO DE LOS BUSES DEL PROYECTO")
 
     return devices
 
@@ -385,13 +403,12 @@ if not os.path.isfile(BUSES_INSTANCES_FILE):
     buses = load_buses()  # Diccionario con todos los buses.
     # Clave principal es id del grupo
     with open(BUSES_INSTANCES_FILE, "wb") as bf:
-        print(
-            f"{__file__}\n\tPRIMERA EJECUCIÓN\nCREANDO ARCHIVO DE BUSES CON LAS INSTANCIAS DE LOS DISPOSITIVOS MODBUS")
+        log.debug("PRIMERA EJECUCIÓN\nCREANDO ARCHIVO DE BUSES CON LAS INSTANCIAS DE LOS DISPOSITIVOS MODBUS")
         pickle.dump(buses, bf)
 else:
-    # Ya se habían creado los grupos de habitaciones
+    # Ya se habían creado los dispositivos. Su estado de funcionamiento se recupera de DEVICES_STATE_FILE al final
     with open(BUSES_INSTANCES_FILE, "rb") as bf:
-        print(f"{__file__}\n\t...CARGANDO ARCHIVO DE BUSES CON LAS INSTANCIAS DE LOS DISPOSITIVOS MODBUS")
+        log.debug("CARGANDO ARCHIVO DE BUSES CON LAS INSTANCIAS DE LOS DISPOSITIVOS MODBUS")
         buses = pickle.load(bf)
 
 
@@ -429,7 +446,8 @@ def load_regmapfiles() -> Tuple:
                         new_map.rmap = rmap.get(f"{brand}_{model}")
                         regmaps.append(new_map)
                 except Exception as e:
-                    print(f"\n{e}\nERROR (load_regmapfiles) - Mapa de registros {devregmapfilename} no encontrado.")
+                    log.error("%s\nERROR (load_regmapfiles) - Mapa de registros %s no encontrado.",
+                              e, devregmapfilename)
             # Actualizo los valores de los atributos 'qregsmax' y 'write_operations' del dispositivo
             dev_regmap_key = f"{brand}_{model}"
             mapa_registros = [x.rmap for x in regmaps if x.map_id == dev_regmap_key][0]  # Diccionario con el mapa
@@ -451,7 +469,7 @@ def config_devices():
     # Buscamos todos los tipos de dispositivo existentes bajo la clave 'class' en cada 'devices' de cada 'bus'
     # device_dbs = set()  # SET con los Nombres de los ficheros JSON que contienen las bases de datos de cada tipo
     # de dispositivo
-    print(f"\n(load_buses)\tCONFIGURANDO DISPOSITIVOS MODBUS DEL PROYECTO")
+    log.debug("(load_buses)\tCONFIGURANDO DISPOSITIVOS MODBUS DEL PROYECTO")
     devtypes = {}  # Lista de diccionarios con los objetos del proyecto según su tipo, generator, fancoil, etc. y
     # su brand_model (marca_modelo), me_ecodan, uponor_x148...
     for bus in buses:
@@ -465,8 +483,8 @@ def config_devices():
             bus_devices[device].brand is not None and bus_devices[device].model is not None and bus_devices[
                 device].__class__.__name__ is not None]
         device_dbs = set(device_dbs)
-        print(f"\t... (config_devices) Bases de datos de configuración de dispositivos encontrados "
-              f"en el bus {bus}: \n\t\t{device_dbs}")
+        log.debug("(config_devices) Bases de datos de configuración de dispositivos encontrados en el bus %s: \n\t\t%s",
+                  bus, device_dbs)
         # Se carga el diccionario con la información POR TIPO de los dispositivos del proyecto
         collect()
         for typedb in device_dbs:
@@ -483,20 +501,20 @@ def config_devices():
                     # esa clave principal
                     devtypes[typedb] = obj_info.get(dev_id)  # Diccionario para, por ejemplo, un generador tipo
                     # ecodan: Generator_me_ecodan
-                    print(f"\t\t... cargada base de datos {dev_id}")
+                    log.debug("cargada base de datos %s", dev_id)
         # Ahora se completa la definición de los objetos del proyecto: Generadores, Fancoils, etc.
         null_values = (None, "")
         for device in bus_devices:
             dev_to_config = bus_devices[device]
-            print(f"\t\t... finalizando configuración del dispositivo {dev_to_config.name}")
+            log.debug("finalizando configuración del dispositivo %s", dev_to_config.name)
             dev_data_key = f"{dev_to_config.__class__.__name__}_{dev_to_config.brand}_{dev_to_config.model}"
             # print(f"Base datos dispositivo:\n{devtypes[dev_data_key]}\n")
-            # Obtengo los atributos de la clase de objeto
-            attrs = tuple(dev_to_config.__dict__.keys())
+            # Obtengo los atributos del objeto: los de __slots__ de su clase y los creados a partir de un JSON
+            attrs = slots.state_attrs(dev_to_config)
             # print(f"Atributos del Dispositivo:{attrs}")
             # Actualizo todos los atributos con valor None o ''
             for attr in attrs:
-                attr_val = dev_to_config.__dict__.__getitem__(attr)
+                attr_val = getattr(dev_to_config, attr)
                 # print(f"Valor actual de {attr}: {attr_val}")
                 if attr_val in null_values:
                     # Hay que actualizar el atributo porque está vacío
@@ -505,11 +523,10 @@ def config_devices():
                     if new_val is not None:  # Se evalúa esta condición por si el MBDevice tuviera atributos no
                         # definidos en el fichero de configuración
                         setattr(dev_to_config, attr, new_val)
-            print(f"\t\t... configuración del dispositivo {dev_to_config.name} FINALIZADA\n")
+            log.debug("configuración del dispositivo %s FINALIZADA", dev_to_config.name)
             collect()
-            # print(f"Configurando dispositivo:\n{dev_to_config.__dict__}")
 
-    print(f"\n(load_buses)\nCONFIGURACIÓN DE LOS DISPOSITIVOS MODBUS DEL PROYECTO FINALIZADA\n\n")
+    log.debug("(load_buses)\nCONFIGURACIÓN DE LOS DISPOSITIVOS MODBUS DEL PROYECTO FINALIZADA")
 
     return 1
 
@@ -525,4 +542,9 @@ else:
     with open(REGMAP_INSTANCES_FILE, "rb") as rmf:
         mbregmaps = pickle.load(rmf)
 
+# Bloques de registros que se leen de cada dispositivo. Sin plan de lectura, se leen todos los registros del mapa
+read_blocks = compile_read_plan(read_plan, buses, mbregmaps) if READ_PLAN else {}
+
 dev_config = config_devices()
+# Recupero el estado de funcionamiento de los dispositivos (modos y valores manuales) guardado en el ciclo anterior
+restore_devices_state(buses)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Registro de mensajes del sistema Phoenix sobre el módulo logging de la librería estándar.
+- Cada módulo obtiene su logger con get_logger(__name__) y pasa los valores como argumentos del mensaje, que sólo se
+  formatea si el nivel del logger lo permite:
+      log.debug("Leyendo el esclavo %s del bus %s", slave, bus_id)
+- El nivel general es LOG_LEVEL (variable de entorno PHOENIX_LOG_LEVEL) y LOG_LEVELS permite fijar el de módulos
+  o paquetes concretos, de modo que en producción se trabaja en WARNING y se puede depurar un único módulo.
+- Los avisos y errores repetidos (mismo logger y mismo mensaje con los mismos valores) se muestran como mucho una
+  vez cada LOG_RATE_LIMIT segundos. La siguiente vez que se muestran se indica cuántos se han descartado.
+Los mensajes se envían a stderr, que en el servicio se recoge en journald.
+El módulo sólo depende de phoenix_constants para poder usarse desde cualquier otro módulo.
+"""
+import logging
+import sys
+from time import monotonic
+from typing import Dict, Tuple
+
+from phoenix_constants import *
+
+ROOT_LOGGER = "phoenix"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Descarta los avisos y errores que se repiten antes de LOG_RATE_LIMIT segundos
+    """
+
+    def __init__(self, period: float = LOG_RATE_LIMIT):
+        super().__init__()
+        self.period = period
+        # {(logger, mensaje formateado): [instante último mensaje mostrado, descartados]}
+        self.last_seen: Dict[Tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        try:
+            # Los mensajes con la misma plantilla y distintos valores (esclavos, puertos...) son errores distintos
+            key = (record.name, record.getMessage())
+        except (TypeError, ValueError):  # Argumentos que no encajan con la plantilla; se informa al formatear
+            key = (record.name, record.msg)
+        now = monotonic()
+        seen = self.last_seen.get(key)
+        if seen is not None and now - seen[0] < self.period:
+            seen[1] += 1
+            return False
+        if seen is not None and seen[1]:
+            record.msg = f"{record.msg} (repetido {seen[1]} veces más en los últimos {self.period} s)"
+        self.last_seen[key] = [now, 0]
+        return True
+
+
+def set_levels(level: str = LOG_LEVEL, levels: [Dict, None] = None):
+    """
+    Fija el nivel general y el de los módulos indicados en 'levels' ({módulo: nivel})
+    """
+    logging.getLogger(ROOT_LOGGER).setLevel(level.upper())
+    for module, module_level in (LOG_LEVELS if levels is None else levels).items():
+        logging.getLogger(f"{ROOT_LOGGER}.{module}").setLevel(module_level.upper())
+
+
+def setup():
+    """
+    Configura el logger raíz del sistema. Sólo actúa la primera vez que se llama
+    """
+    root = logging.getLogger(ROOT_LOGGER)
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RateLimitFilter())
+    root.addHandler(handler)
+    root.propagate = False
+    set_levels()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Devuelve el logger del módulo 'name' (normalmente __name__) dentro de la jerarquía del sistema
+    """
+    setup()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
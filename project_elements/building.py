@@ -6,9 +6,19 @@ Viviendas, Habitaciones, Grupos de habitaciones...
 import sys
 from os import path
 from gc import collect
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Mapping
 import phoenix_init as phi
 from asyncio import create_task, gather
+from mb_utils import psychrometrics
+from mb_utils.slots import SlotState
 from mb_utils.mb_utils import get_value
+from publish import metrics
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
 
 
 def init_modo_iv() -> int:
@@ -39,13 +49,12 @@ async def get_modo_iv(bld: str = "1") -> [int, None]:
     modo_iv = init_modo_iv()
     bld_data = phi.prj.get("buildings")[bld]
     if bld_data is None:
-        print(f"ERROR (get_modo_iv) - No se ha definido edificio {bld}")
+        log.error("No se ha definido edificio %s", bld)
         sys.exit()
     iv_source = bld_data.get("iv_source")
     if iv_source is None:
-        msg = f"WARNING (get_modo_iv) - No se indicado origen de lectura del modo Frío/Calor en el " \
-              f"edificio {bld}. Se toman valores por defecto"
-        print(msg)
+        log.warning("No se indicado origen de lectura del modo Frío/Calor en el edificio %s. Se toman valores por "
+                    "defecto", bld)
         return modo_iv
     modo_iv_from_mbdev_source = iv_source.get("mbdev")
     modo_iv_from_file_source = iv_source.get("file")  # El modo_iv siempre se va a guardar en este archivo
@@ -60,23 +69,24 @@ async def get_modo_iv(bld: str = "1") -> [int, None]:
         device = phi.buses.get(bus_id).get(device_id)  # Devuelve el dispositivo en el que se va a escribir
         # modo_iv = await device.iv_mode()
         modo_iv = await device.iv_mode()
-        print(f"El modo Frío/Calor se lee del dispositivo ModBus {device.name}.\n\tValor leido: {modo_iv}")
+        log.debug("El modo Frío/Calor se lee del dispositivo ModBus %s.\n\tValor leido: %s", device.name, modo_iv)
         modo_iv_file = phi.EXCHANGE_FOLDER + modo_iv_from_file_source
         modo_iv_file_exists = path.isfile(modo_iv_file)
         if not modo_iv_file_exists:
             try:
                 open(modo_iv_file, 'w').close()
             except OSError:
-                print(f"\n\n\tERROR creando el fichero para el modo IV {modo_iv_file}")
+                log.error("Error creando el fichero para el modo IV %s", modo_iv_file)
             else:
-                print(f"\n\t...creado el fichero para el modo IV {modo_iv_file}")
+                log.debug("creado el fichero para el modo IV %s", modo_iv_file)
         with open(modo_iv_file, "w") as ivf:
-            print(f"Guardando el modo Frío/Calor en {modo_iv_file}")
+            log.debug("Guardando el modo Frío/Calor en %s", modo_iv_file)
             ivf.write(str(modo_iv))
+        metrics.exchange_writes.inc(cls="Building")
     elif modo_iv_from_file_source:
         modo_iv_file = phi.EXCHANGE_FOLDER + modo_iv_from_file_source
         if path.isfile(modo_iv_file):
-            print("El modo Frío/Calor se lee de un archivo")
+            log.debug("El modo Frío/Calor se lee de un archivo")
             with open(modo_iv_file, "r") as ivf:
                 modo_iv = int(ivf.read())
     return modo_iv
@@ -94,33 +104,32 @@ def get_temp_exterior(bld: str = "1") -> [float, None]:
         """
     bld_data = phi.prj.get("buildings")[bld]
     if bld_data is None:
-        print(f"ERROR (get_temp_exterior) - No se ha definido edificio {bld}")
+        log.error("No se ha definido edificio %s", bld)
         sys.exit()
     o_data = bld_data.get("o_data")
     if o_data is None:
-        msg = f"WARNING (get_temp_exterior) - No se indicado origen de lectura de valores exteriores en el " \
-              f"edificio {bld}. Se toman valores por defecto"
-        print(msg)
+        log.warning("No se indicado origen de lectura de valores exteriores en el edificio %s. Se toman valores por "
+                    "defecto", bld)
         return get_default_t_exterior()
     te_source = o_data.get("te_source")
     if te_source is None:
-        msg = f"WARNING (get_temp_exterior) - No se indicado origen de lectura de temperatura exterior en el " \
-              f"edificio {bld}. Se toman valores por defecto"
-        print(msg)
+        log.warning("No se indicado origen de lectura de temperatura exterior en el edificio %s. Se toman valores "
+                    "por defecto", bld)
         return get_default_t_exterior()
     t_ext_from_mbdev_source = te_source.get("mbdev")
     t_ext_from_file_source = te_source.get("file")
     if t_ext_from_mbdev_source not in [None, {}]:
         t_ext = get_value(t_ext_from_mbdev_source)
-        print("La temperatura exterior se lee de un dispositivo ModBus")
-        print(f"Valor de temperatura exterior leido: {t_ext}\n")
+        log.debug("La temperatura exterior se lee de un dispositivo ModBus")
+        log.debug("Valor de temperatura exterior leido: %s", t_ext)
         t_ext_file = phi.EXCHANGE_FOLDER + t_ext_from_file_source
         with open(t_ext_file, "w") as ivf:
-            print(f"Guardando temperatura exterior en {t_ext_file}")
+            log.debug("Guardando temperatura exterior en %s", t_ext_file)
             ivf.write(str(t_ext))
+        metrics.exchange_writes.inc(cls="Building")
         return t_ext
     elif t_ext_from_file_source:
-        print("La temperatura exterior se lee de un archivo")
+        log.debug("La temperatura exterior se lee de un archivo")
         t_ext_file = phi.EXCHANGE_FOLDER + t_ext_from_file_source
         if path.isfile(t_ext_file):
             with open(t_ext_file, "r") as txf:
@@ -142,28 +151,26 @@ def get_hrel_exterior(bld: str = "1") -> [float, None]:
         """
     bld_data = phi.prj.get("buildings")[bld]
     if bld_data is None:
-        print(f"ERROR {__file__} - No se ha definido edificio {bld}")
+        log.error("No se ha definido edificio %s", bld)
         sys.exit()
     o_data = bld_data.get("o_data")
     if o_data is None:
-        msg = f"WARNING {__file__} - No se indicado origen de lectura de valores exteriores en el " \
-              f"edificio {bld}. Se fija la humedad a 0"
-        print(msg)
+        log.warning("No se indicado origen de lectura de valores exteriores en el edificio %s. Se fija la humedad "
+                    "a 0", bld)
         return 0
     rh_source = o_data.get("rh_source")
     if rh_source is None:
-        msg = f"WARNING {__file__} - No se indicado origen de lectura de la humedad relativa exterior en el " \
-              f"edificio {bld}. Se fija la humedad a 0"
-        print(msg)
+        log.warning("No se indicado origen de lectura de la humedad relativa exterior en el edificio %s. Se fija la "
+                    "humedad a 0", bld)
         return 0
     rh_ext_from_mbdev_source = rh_source.get("mbdev")
     rh_ext_from_file_source = rh_source.get("file")
     if rh_ext_from_mbdev_source not in [None, {}]:
-        print("La humedad relativa exterior se lee de un dispositivo ModBus")
+        log.debug("La humedad relativa exterior se lee de un dispositivo ModBus")
         hr_ext = get_value(rh_ext_from_mbdev_source)
         return hr_ext
     elif rh_ext_from_file_source:
-        print("La humedad relativa exterior se lee de un archivo")
+        log.debug("La humedad relativa exterior se lee de un archivo")
         hr_ext_file = phi.EXCHANGE_FOLDER + rh_ext_from_file_source
         if path.isfile(hr_ext_file):
             with open(hr_ext_file, "r") as hrxf:
@@ -173,33 +180,63 @@ def get_hrel_exterior(bld: str = "1") -> [float, None]:
         return 0
 
 
-def get_h_exterior(bld: str = "1", altitud=phi.ALTITUD) -> [float, None]:
+def get_h_exterior(bld: str = "1", altitud=phi.ALTITUD, te=None, rh=None) -> [float, None]:
     """
     Calcula la entalpia exterior con temp en celsius y hr en %. Por defecto se toma la altitud de Madrid
     Si no se lee la humedad relativa exterior, se devuelve 0
+    Si no se pasan te y rh, se obtienen del edificio 'bld'
     """
-    te = get_temp_exterior(bld)
-    rh = get_hrel_exterior(bld)
-    print(f"Calculando entalpía exterior con temperatura:{te} y humedad relativa {rh}")
+    te = get_temp_exterior(bld) if te is None else te
+    rh = get_hrel_exterior(bld) if rh is None else rh
+    log.debug("Calculando entalpía exterior con temperatura:%s y humedad relativa %s", te, rh)
     if rh is None or rh == 0:
         return 0
-    pres_total = 101325 if altitud is None else 101325 * (1 - 2.25577 * 0.00001 * altitud) ** 5.2559
-    nullvalues = ("", None, "false")
-    if any((te in nullvalues, rh in nullvalues)):
-        return
-    pres_vap_sat = 10 ** (7.5 * te / (273.159 + te - 35.85) + 2.7858)  # Pa
-    # print(f"presion vapor saturado: {pres_vap_sat}")
-    pres_vap = pres_vap_sat * rh / 100  # Pa
-    # print(f"presion total: {pres_total}")
-    # print(f"presion vapor: {pres_vap}")
-    pres_aire_seco = pres_total - pres_vap  # Pa
-    # print(f"presion aire seco: {pres_aire_seco}")
-    hum_especifica = 0.621954 * (pres_vap / pres_aire_seco)  # kg agua / hg aire seco
-    entalpia = (1.006 + 1.86 * hum_especifica) * te + 2501 * hum_especifica
-    return round(entalpia, 1)
-
-
-class Room:
+    return psychrometrics.enthalpy(te, rh, altitud)
+
+
+@dataclass(frozen=True)
+class CycleContext:
+    """
+    Datos comunes a todo el ciclo: hora, modo Frío/Calor del sistema y condiciones exteriores de cada edificio.
+    Se obtienen una sola vez al empezar el ciclo (get_cycle_context) y las habitaciones, grupos y dispositivos los
+    toman de phi.cycle en lugar de volver a leer la configuración del edificio y los archivos de intercambio.
+    Si un edificio no está en el contexto, sus valores se obtienen en el momento
+    """
+    hora: datetime
+    system_iv: int
+    t_ext: Mapping[str, float] = field(default_factory=lambda: MappingProxyType({}))  # {edificio: temperatura}
+    rh_ext: Mapping[str, float] = field(default_factory=lambda: MappingProxyType({}))  # {edificio: humedad}
+    h_ext: Mapping[str, float] = field(default_factory=lambda: MappingProxyType({}))  # {edificio: entalpía}
+
+    def temp_exterior(self, bld: str = "1") -> [float, None]:
+        bld = str(bld)
+        return self.t_ext[bld] if bld in self.t_ext else get_temp_exterior(bld)
+
+    def hrel_exterior(self, bld: str = "1") -> [float, None]:
+        bld = str(bld)
+        return self.rh_ext[bld] if bld in self.rh_ext else get_hrel_exterior(bld)
+
+    def h_exterior(self, bld: str = "1") -> [float, None]:
+        bld = str(bld)
+        return self.h_ext[bld] if bld in self.h_ext else get_h_exterior(bld)
+
+
+async def get_cycle_context() -> CycleContext:
+    """
+    Obtiene los datos comunes del ciclo. Se llama una vez por ciclo, tras la lectura de los buses
+    """
+    system_iv = await get_modo_iv()
+    t_ext, rh_ext, h_ext = {}, {}, {}
+    for bld in phi.prj.get("buildings", {}):
+        bld = str(bld)
+        t_ext[bld] = get_temp_exterior(bld)
+        rh_ext[bld] = get_hrel_exterior(bld)
+        h_ext[bld] = get_h_exterior(bld, te=t_ext[bld], rh=rh_ext[bld])
+    return CycleContext(phi.datetime.now(), system_iv, MappingProxyType(t_ext), MappingProxyType(rh_ext),
+                        MappingProxyType(h_ext))
+
+
+class Room(SlotState):
     """
     Objeto de clase Room, con información sobre el edificio y la vivienda a la que pertenece,
     el nombre de la habitación, el grupo o grupos de habitaciones a los que pertenece, el origen de
@@ -207,6 +244,9 @@ class Room:
     A partir del origen de esos datos, se rellenan los atributos de la habitación del tipo consigna, temperatura,
     estado actuador, punto de rocío, entalpía, etc.
     """
+    __slots__ = ("building_id", "dwelling_id", "room_id", "name", "groups", "iv_source", "iv", "sp_source", "sp",
+                 "rt_source", "rt", "rh_source", "rh", "dp", "h", "st_source", "st", "af", "aq_source", "aq",
+                 "aqsp_source", "aqsp", "offsetairref", "offsetaircal")
 
     def __init__(self,
                  building_id: str = "",
@@ -286,35 +326,17 @@ class Room:
         # print(f"Calculando temperatura de rocío de {self.name}")
         # rt = self.get_rt()
         # rh = self.get_rh()
-        nullvalues = ("", None, "false", 0)
-        if any((self.rt in nullvalues, self.rh in nullvalues)):
-            return
-        t_rocio = (self.rh / 100) ** (1 / 8) * (112 + 0.9 * self.rt) + 0.1 * self.rt - 112
-        return round(t_rocio, 1)
+        return psychrometrics.dew_point(self.rt, self.rh)
 
     def calc_h(self, altitud=phi.ALTITUD):
         """
         Calcula la entalpia con temp en celsius y hr en %. Por defecto se toma la altitud de Madrid
         """
-        # print(f"Calculando entalpía de {self.name}")
-        entalpia = None
-        # rt = self.get_rt()
-        # rh = self.get_rh()
-        pres_total = 101325 if altitud is None else 101325 * (1 - 2.25577 * 0.00001 * altitud) ** 5.2559
-        print(f"DEBUGGING {__file__} Calculando entalpia: {self.rt} / {self.rh}")
+        log.debug("Calculando entalpia: %s / %s", self.rt, self.rh)
         if None in (self.rt, self.rh) or self.rh == 0.0:
-            return entalpia
-        pres_vap_sat = 10 ** (7.5 * self.rt / (273.159 + self.rt - 35.85) + 2.7858)  # Pa
-        # print(f"presion vapor saturado: {pres_vap_sat}")
-        pres_vap = pres_vap_sat * self.rh / 100  # Pa
-        # print(f"presion total: {pres_total}")
-        # print(f"presion vapor: {pres_vap}")
-        pres_aire_seco = pres_total - pres_vap  # Pa
-        # print(f"presion aire seco: {pres_aire_seco}")
-        hum_especifica = 0.621954 * (pres_vap / pres_aire_seco)  # kg agua / hg aire seco
-        entalpia = (1.006 + 1.86 * hum_especifica) * self.rt + 2501 * hum_especifica
-        self.h = round(entalpia, 1)
-        return round(entalpia, 1)
+            return
+        self.h = psychrometrics.enthalpy(self.rt, self.rh, altitud)
+        return self.h
 
     def get_iv_mode(self):
         """
@@ -326,9 +348,8 @@ class Room:
         """
         modo = ("Calefacción", "Refrigeración")
         # iv_mode = get_modo_iv(self.building_id)
-        iv_mode = phi.system_iv
-        print(f"Modo funcionamiento habitación {self.name} del edificio {self.building_id}:")
-        print(f"\t\t{modo[iv_mode]}\n")
+        iv_mode = phi.cycle.system_iv
+        log.debug("Modo funcionamiento habitación %s del edificio %s: %s", self.name, self.building_id, modo[iv_mode])
         self.iv = iv_mode
         return self.iv
 
@@ -355,8 +376,8 @@ class Room:
 
         if dev_model == "x147" and self.iv:
             setpoint += 2
-            print(f"Corrigiendo consigna de {self.name} en X-147 refrigeración (se suman 2 gradC).\n"
-                  f"Valor corregido {setpoint}\n")
+            log.debug("Corrigiendo consigna de %s en X-147 refrigeración (se suman 2 gradC).\nValor corregido %s",
+                      self.name, setpoint)
         self.sp = setpoint
         return setpoint
 
@@ -423,7 +444,7 @@ class Room:
         Actualiza las lecturas de la habitación
         Returns 1 cuando termina la actualización:
         """
-        print(f"Iniciando actualización de la habitación {self.name}")
+        log.debug("Iniciando actualización de la habitación %s", self.name)
         self.iv = self.get_iv_mode()
         self.rt = self.get_rt()
         self.rh = self.get_rh()
@@ -433,25 +454,22 @@ class Room:
         self.st = self.get_st()
         self.aq = self.get_aq()
         self.aqsp = self.get_aqsp()
-        print(f"\nCalefacción/Refrigeración (1=Refrigeración): {self.iv}"
-              f"\nTemperatura habitación: {self.rt}"
-              f"\nHumedad relativa: {self.rh}"
-              f"\nConsigna: {self.sp}"
-              f"\nTemperatura de rocío: {self.dp}"
-              f"\nEntalpía: {self.h}"
-              f"\nEstado actuador: {self.st}"
-              f"\nCalidad de aire: {self.aq}"
-              f"\nConsigna de calidad de aire: {self.aqsp}\n")
+        log.debug("Calefacción/Refrigeración (1=Refrigeración): %s\nTemperatura habitación: %s\nHumedad relativa: "
+                  "%s\nConsigna: %s\nTemperatura de rocío: %s\nEntalpía: %s\nEstado actuador: %s\nCalidad de aire: "
+                  "%s\nConsigna de calidad de aire: %s",
+                  self.iv, self.rt, self.rh, self.sp, self.dp, self.h, self.st, self.aq, self.aqsp)
         return 1
 
 
-class RoomGroup:
+class RoomGroup(SlotState):
     """
     Clase formada por un grupo de habitaciones
     TODO Definir en la base de datos cómo se le pasa el modo de funcionamiento Calefacción/Refrigeración
     TODO al grupo de habitaciones. Normalmente debe proceder de una modbus_source. Debe actualizarse en cada
     TODO lectura. De momento, se toma el modo IV inicial definido en init_modo_iv()
     """
+    __slots__ = ("id_rg", "roomgroup", "iv", "demand", "water_sp", "air_sp", "air_rt", "air_dp", "air_h", "aq", "aq_sp",
+                 "offsetref", "offsetcal", "habbombaref", "habbombacal", "offsetwspref", "offsetwspcal", "offsettrocio")
 
     def __init__(self, id_rg: [str, None] = None, roomgroup=None):
         if roomgroup is None:
@@ -502,7 +520,7 @@ class RoomGroup:
         if len(self.roomgroup) == 0:
             raise ValueError(f"No se han añadido habitaciones al grupo {self.id_rg}")
         bld = self.roomgroup[0].building_id
-        t_exterior = get_temp_exterior(bld)
+        t_exterior = phi.cycle.temp_exterior(bld)
         # Inicializo los valores de calidad de aire del grupo
         group_aq = 0
         group_aq_sp = phi.AIR_QUALITY_DEFAULT_SETPOINT
@@ -522,9 +540,9 @@ class RoomGroup:
                                for r in tuple(self.roomgroup)]
 
         updating_results = await gather(*room_updating_tasks)
-        print(f"Resultado actualización habitaciones {updating_results}.\nDebe ser una tupla de 1's")
+        log.debug("Resultado actualización habitaciones %s.\nDebe ser una tupla de 1's", updating_results)
         for room in self.roomgroup:
-            print(f"Calculando consignas del grupo {self.id_rg}. Datos habitación {room.name}")
+            log.debug("Calculando consignas del grupo %s. Datos habitación %s", self.id_rg, room.name)
             null_values = ["", None, 0, 0.0, "0", "0.0", "true", "false"]
             # Calidad de aire
             room_aq = room.aq if room.aq is not None else 0
@@ -538,8 +556,7 @@ class RoomGroup:
             rt = room.rt  # Temperatura ambiente del objeto Room
             sp = room.sp  # Consigna del objeto Room
             if None in [sp, rt]:
-                print(f"DEBUGGING {__file__}. La consigna {sp} o la temperatura {rt} del grupo {self.roomgroup} "
-                      f"son nulos")
+                log.debug("La consigna %s o la temperatura %s del grupo %s son nulos", sp, rt, self.roomgroup)
                 continue
             group_air_temperature = rt if group_air_temperature is None else group_air_temperature
             air_sp = sp + room.offsetairref if cooling else sp + room.offsetaircal
@@ -558,8 +575,8 @@ class RoomGroup:
                 continue  # Ignoramos las habitaciones de las que no dispongamos lecturas de temperatura o consigna
 
             if cooling:  # Modo refrigeracion
-                print(f"DEBUGGING {__file__}: sp: {sp} / offsetwspref {self.offsetwspref} / "
-                      f"t_exterior {t_exterior} / RT_LIM_REFR {phi.RT_LIM_REFR}")
+                log.debug("sp: %s / offsetwspref %s / t_exterior %s / RT_LIM_REFR %s",
+                          sp, self.offsetwspref, t_exterior, phi.RT_LIM_REFR)
                 if rt - sp > self.offsetref:  # Se necesita la temperatura de impulsion más baja
                     demanda = 1
                     t_impulsion_temp = sp - self.offsetwspref - (t_exterior - max(phi.RT_LIM_REFR, sp)) / 2
@@ -612,7 +629,7 @@ class RoomGroup:
         self.aq = group_aq
         self.aq_sp = group_aq_sp
         collect()
-        print(repr(self))
+        log.debug("%r", self)
         return 1
 
     def iv_mode(self, new_iv_mode: [int, None] = None):
@@ -651,7 +668,7 @@ class RoomGroup:
             self.iv = new_iv_mode
         elif q_hab_cooling + q_hab_heating == 0:  # No se ha leído el modo IV de ninguna habitación
             # self.iv = get_modo_iv()
-            self.iv = phi.system_iv
+            self.iv = phi.cycle.system_iv
         else:
             self.iv = modo_iv
 
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP asíncrono con una API JSON de sólo lectura sobre los datos en memoria del sistema: buses, dispositivos,
+habitaciones, grupos de habitaciones y última lectura ModBus.
+Se ejecuta en el mismo bucle de eventos que main.py, de modo que las respuestas salen directamente de phi.buses,
+phi.all_room_groups y phi.datadb sin tocar los archivos de intercambio.
+Las respuestas llevan ETag (se responde 304 si coincide con If-None-Match) y se comprimen con gzip si el cliente lo
+admite.
+Rutas:
+    /api
+    /api/buses
+    /api/devices                    /api/devices/<bus>/<dispositivo>
+    /api/rooms                      /api/rooms/<edificio>_<vivienda>_<habitación>
+    /api/roomgroups                 /api/roomgroups/<grupo>
+    /api/readings                   /api/readings/<bus>/<dispositivo>
+    /api/events?topics=<temas>      Server-Sent Events con los cambios (publish.events). Temas: readings, devices,
+                                    rooms, roomgroups, writes. Por defecto, todos
+    /metrics                        Métricas en formato de texto de Prometheus (publish.metrics)
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+
+import phoenix_init as phi
+from mb_utils.mb_utils import get_room_key, get_roomgroup_dict
+from publish import events, metrics
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+HTTP_STATUS = {200: "OK", 304: "Not Modified", 404: "Not Found", 405: "Method Not Allowed", 400: "Bad Request",
+               500: "Internal Server Error"}
+API_ROUTES = ("/api/buses", "/api/devices", "/api/rooms", "/api/roomgroups", "/api/readings", "/api/events")
+EVENT_TOPICS = ("readings", "devices", "rooms", "roomgroups", "writes")
+
+_gzip_cache = {}  # Última respuesta comprimida de cada ruta: {ruta: (etag, cuerpo comprimido)}
+
+
+def get_device_dict(device) -> dict:
+    """
+    Información de un dispositivo: identificación y valores actuales de los atributos que se comparten con la web
+    """
+    dev_class = device.__class__.__name__
+    attrs = phi.EXCHANGE_R_FILES.get(dev_class) or getattr(device, "attrs", ())
+    return {"bus": device.bus_id,
+            "id": device.device_id,
+            "name": device.name,
+            "class": dev_class,
+            "brand": device.brand,
+            "model": device.model,
+            "slave": device.slave,
+            "values": {attr: getattr(device, attr, None) for attr in attrs}}
+
+
+def get_room_dict(room) -> dict:
+    """
+    Valores actuales de una habitación
+    """
+    return {"building": room.building_id,
+            "dwelling": room.dwelling_id,
+            "room": room.room_id,
+            "name": room.name,
+            "groups": room.groups,
+            "iv": room.iv,
+            "sp": room.sp,
+            "rt": room.rt,
+            "rh": room.rh,
+            "dp": room.dp,
+            "h": room.h,
+            "st": room.st,
+            "aq": room.aq,
+            "aqsp": room.aqsp}
+
+
+def get_rooms() -> dict:
+    """
+    Habitaciones del proyecto. Una habitación puede pertenecer a varios grupos, pero sólo se incluye una vez.
+    Returns: diccionario {edificio_vivienda_habitación: habitación}
+    """
+    rooms = {}
+    for roomgroup in phi.all_room_groups.values():
+        for room in roomgroup.roomgroup:
+            rooms.setdefault(get_room_key(room), room)
+    return rooms
+
+
+def get_payload(route: str):
+    """
+    Obtiene los datos a devolver para la ruta 'route'
+    Returns: objeto serializable en JSON o None si la ruta no existe
+    """
+    parts = [p for p in route.split("/") if p]
+    if parts[:1] != ["api"]:
+        return
+    resource, args = (parts[1], parts[2:]) if len(parts) > 1 else (None, [])
+    if resource is None:
+        return {"routes": API_ROUTES}
+    if resource == "buses" and not args:
+        return {idbus: {iddev: {"name": dev.name, "class": dev.__class__.__name__, "slave": dev.slave}
+                        for iddev, dev in bus.items()}
+                for idbus, bus in phi.buses.items()}
+    if resource == "devices":
+        if not args:
+            return {idbus: {iddev: get_device_dict(dev) for iddev, dev in bus.items()}
+                    for idbus, bus in phi.buses.items()}
+        if len(args) == 2:
+            device = phi.buses.get(args[0], {}).get(args[1])
+            return get_device_dict(device) if device is not None else None
+    if resource == "rooms":
+        rooms = get_rooms()
+        if not args:
+            return {key: get_room_dict(room) for key, room in rooms.items()}
+        if len(args) == 1:
+            room = rooms.get(args[0])
+            return get_room_dict(room) if room is not None else None
+    if resource == "roomgroups":
+        if not args:
+            return {idrg: get_roomgroup_dict(rg) for idrg, rg in phi.all_room_groups.items()}
+        if len(args) == 1:
+            roomgroup = phi.all_room_groups.get(args[0])
+            return get_roomgroup_dict(roomgroup) if roomgroup is not None else None
+    if resource == "readings" and phi.datadb:
+        if not args:
+            return phi.datadb
+        if len(args) == 2:
+            return phi.datadb.get("buses", {}).get(args[0], {}).get(args[1])
+
+
+def build_response(status: int, body: bytes = b"", headers: [dict, None] = None) -> bytes:
+    """
+    Compone la respuesta HTTP/1.1 con el código 'status', las cabeceras 'headers' y el cuerpo 'body'
+    """
+    lines = [f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}"]
+    headers = {} if headers is None else headers
+    headers["Content-Length"] = str(len(body))
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def etag_matches(etag: str, if_none_match: [str, None]) -> bool:
+    """
+    Comprueba si el ETag de la respuesta coincide con alguno de los de la cabecera If-None-Match del cliente
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def handle_get(route: str, headers: dict) -> bytes:
+    """
+    Responde a una petición GET de la API
+    """
+    payload = get_payload(route)
+    if payload is None:
+        return build_response(404, b'{"error": "not found"}', {"Content-Type": "application/json"})
+    body = json.dumps(payload, default=str, separators=(",", ":")).encode()
+    etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    resp_headers = {"Content-Type": "application/json", "ETag": etag, "Cache-Control": "no-cache",
+                    "Vary": "Accept-Encoding"}
+    if etag_matches(etag, headers.get("if-none-match")):
+        del resp_headers["Content-Type"]
+        return build_response(304, b"", resp_headers)
+    if "gzip" in headers.get("accept-encoding", "") and len(body) >= phi.API_GZIP_MIN_SIZE:
+        cached = _gzip_cache.get(route)
+        if cached is None or cached[0] != etag:
+            cached = (etag, gzip.compress(body, compresslevel=6))
+            _gzip_cache[route] = cached
+        body = cached[1]
+        resp_headers["Content-Encoding"] = "gzip"
+    return build_response(200, body, resp_headers)
+
+
+async def stream_events(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, query: str):
+    """
+    Envía al cliente los cambios publicados en publish.events como Server-Sent Events hasta que se desconecta.
+    Cada evento lleva como nombre el tema y como datos un JSON con las claves que han cambiado.
+    Param:
+        query: parámetros de la petición. topics=<tema1>,<tema2> limita los temas a recibir
+    """
+    params = dict(p.partition("=")[::2] for p in query.split("&") if p)
+    topics = set(params.get("topics").split(",")) if params.get("topics") else set(EVENT_TOPICS)
+    writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                  "Connection: keep-alive\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+    queue = events.subscribe()
+    disconnected = asyncio.ensure_future(reader.read())  # El cliente no envía nada más: termina al desconectarse
+    try:
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(queue.get())
+            await asyncio.wait((next_event, disconnected), timeout=phi.EVENTS_KEEPALIVE,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                if not disconnected.done():
+                    writer.write(b": keepalive\n\n")
+                    await writer.drain()
+                continue
+            event_id, topic, changes = next_event.result()
+            if topic in topics:
+                data = json.dumps(changes, default=str, separators=(",", ":"))
+                writer.write(f"id: {event_id}\nevent: {topic}\ndata: {data}\n\n".encode())
+                await writer.drain()
+    finally:
+        disconnected.cancel()
+        events.unsubscribe(queue)
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Atiende las peticiones de un cliente. La conexión se mantiene abierta (keep-alive) mientras el cliente no
+    indique lo contrario o no supere API_REQUEST_TIMEOUT sin enviar una petición.
+    """
+    try:
+        while True:
+            request_line = await asyncio.wait_for(reader.readline(), phi.API_REQUEST_TIMEOUT)
+            if not request_line:
+                break
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                writer.write(build_response(400))
+                break
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), phi.API_REQUEST_TIMEOUT)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            route, _, query = target.partition("?")
+            if method == "GET" and route.rstrip("/") == "/api/events":
+                await stream_events(reader, writer, query)
+                break
+            try:
+                if method != "GET":
+                    response = build_response(405, b"", {"Allow": "GET"})
+                elif route.rstrip("/") == "/metrics":
+                    response = build_response(200, metrics.render().encode(),
+                                              {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+                else:
+                    response = handle_get(route, headers)
+            except Exception:
+                log.exception("Error respondiendo a %s %s", method, target)
+                response = build_response(500, b'{"error": "internal server error"}',
+                                          {"Content-Type": "application/json"})
+            writer.write(response)
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close" or version == "HTTP/1.0":
+                break
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_api_server(host: str = phi.API_SERVER_HOST, port: int = phi.API_SERVER_PORT) -> asyncio.AbstractServer:
+    """
+    Arranca el servidor HTTP en el bucle de eventos actual
+    Returns: objeto servidor de asyncio. Se detiene con server.close()
+    """
+    server = await asyncio.start_server(handle_client, host, port)
+    log.info("Servidor API escuchando en %s:%s", host, port)
+    return server
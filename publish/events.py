@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Canal de eventos con los cambios de los registros ModBus, dispositivos, habitaciones y grupos de habitaciones.
+Los productores (read_all_buses, update_roomgroups_values, update_all_buses) publican sólo las claves que cambian y
+cada cliente suscrito (publish.api_server, ruta /api/events con Server-Sent Events) recibe los cambios en su cola.
+Mientras no hay clientes suscritos no se guarda ni se compara nada, así que el coste en el ciclo es nulo. Al
+suscribirse el primer cliente, la siguiente publicación de los temas devices, rooms y roomgroups (publish_diff)
+incluye todos los valores; el tema readings sólo envía los registros que cambian en cada lectura
+(mb_utils.snapshots). Los clientes que se suscriben después reciben sólo los cambios, así que el estado completo se
+obtiene de las rutas /api/readings, /api/devices, /api/rooms y /api/roomgroups.
+El tema "writes" recoge las escrituras que los dispositivos no han aceptado (mb_utils.write_check).
+"""
+import asyncio
+from typing import Dict, Set
+
+from phoenix_constants import *
+
+_subscribers: Set[asyncio.Queue] = set()  # Colas de los clientes suscritos
+_last_values: Dict[str, Dict] = {}  # Últimos valores publicados de cada tema
+_event_id = 0  # Número del último evento publicado
+
+
+def subscribe() -> asyncio.Queue:
+    """
+    Suscribe un nuevo cliente
+    Returns: cola en la que se reciben las tuplas (id evento, tema, cambios)
+    """
+    queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+    _subscribers.add(queue)
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue):
+    """
+    Elimina la suscripción de un cliente. Si no quedan clientes, se olvidan los últimos valores publicados
+    """
+    _subscribers.discard(queue)
+    if not _subscribers:
+        _last_values.clear()
+
+
+def has_subscribers() -> bool:
+    return bool(_subscribers)
+
+
+def publish_changes(topic: str, changes: Dict):
+    """
+    Envía a todos los clientes los cambios 'changes' del tema 'topic'.
+    Si la cola de un cliente está llena (cliente lento), se descarta su evento más antiguo.
+    Params:
+        topic: tema del evento: readings, devices, rooms, roomgroups, writes
+        changes: diccionario clave: nuevo valor con las claves que han cambiado
+    """
+    global _event_id
+    if not changes or not _subscribers:
+        return
+    _event_id += 1
+    event = (_event_id, topic, changes)
+    for queue in tuple(_subscribers):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+def publish_diff(topic: str, values: Dict):
+    """
+    Compara 'values' con los últimos valores publicados del tema y envía sólo las claves que han cambiado.
+    Las claves que no aparecen en 'values' se mantienen, de modo que se pueden publicar actualizaciones parciales.
+    Params:
+        topic: tema del evento
+        values: diccionario clave: valor actual
+    """
+    if not _subscribers:
+        return
+    last = _last_values.setdefault(topic, {})
+    missing = object()
+    changes = {k: v for k, v in values.items() if last.get(k, missing) != v}
+    last.update(changes)
+    publish_changes(topic, changes)
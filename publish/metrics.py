@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Métricas del sistema en formato de texto de Prometheus:
+- Duración de cada ciclo y de cada etapa del ciclo (main.ciclo)
+- Latencia, reintentos, timeouts y errores de las transacciones ModBus de cada esclavo (MBDevice.read / do_write)
+- Escrituras que el dispositivo no ha aceptado (mb_utils.write_check)
+- Tiempo de ocupación y utilización de cada puerto serie
+- Peticiones en cola y tiempo de espera del turno de cada puerto serie (mb_utils.port_arbiter)
+- Nº de escrituras en los archivos de intercambio con la web
+Se publican en la ruta /metrics del servidor HTTP (publish.api_server) y, al final de cada ciclo, en METRICS_FILE
+para el recolector 'textfile' de node_exporter cuando main.py se ejecuta ciclo a ciclo.
+"""
+from contextlib import contextmanager
+from os import replace
+from time import perf_counter
+from typing import Dict, Tuple
+
+from phoenix_constants import *
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
+
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)  # Segundos
+MODBUS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)  # Segundos
+
+
+class Metric:
+    """
+    Métrica con valores independientes para cada combinación de etiquetas
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, descr: str):
+        self.name = name
+        self.descr = descr
+        self.values: Dict[Tuple, float] = {}
+
+    @staticmethod
+    def labels_key(labels: dict) -> Tuple:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def format_labels(key: Tuple, extra: Tuple = ()) -> str:
+        pairs = key + extra
+        if not pairs:
+            return ""
+        escaped = ((k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.descr}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{self.format_labels(key)} {value}" for key, value in self.values.items()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        key = self.labels_key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.labels_key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self.labels_key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, descr: str, buckets: Tuple):
+        super().__init__(name, descr)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self.labels_key(labels)
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [0] * (len(self.buckets) + 2)  # Cubetas, suma y nº de observaciones
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[idx] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.descr}", f"# TYPE {self.name} {self.kind}"]
+        for key, counts in self.values.items():
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{self.format_labels(key, (('le', str(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{self.format_labels(key, (('le', '+Inf'),))} {counts[-1]}")
+            lines.append(f"{self.name}_sum{self.format_labels(key)} {counts[-2]}")
+            lines.append(f"{self.name}_count{self.format_labels(key)} {counts[-1]}")
+        return "\n".join(lines)
+
+
+cycle_duration = Histogram("phoenix_cycle_duration_seconds", "Duración del ciclo completo", STAGE_BUCKETS)
+stage_duration = Histogram("phoenix_stage_duration_seconds", "Duración de cada etapa del ciclo", STAGE_BUCKETS)
+modbus_latency = Histogram("phoenix_modbus_transaction_seconds", "Latencia de las transacciones ModBus correctas",
+                           MODBUS_BUCKETS)
+modbus_retries = Counter("phoenix_modbus_retries_total", "Reintentos de lectura ModBus")
+modbus_timeouts = Counter("phoenix_modbus_timeouts_total", "Transacciones ModBus sin respuesta del esclavo")
+modbus_errors = Counter("phoenix_modbus_errors_total", "Transacciones ModBus fallidas tras todos los intentos")
+write_mismatches = Counter("phoenix_modbus_write_mismatches_total", "Escrituras que el dispositivo no ha aceptado")
+bus_busy = Counter("phoenix_bus_busy_seconds_total", "Tiempo de ocupación de cada puerto serie")
+bus_utilisation = Gauge("phoenix_bus_utilisation_ratio", "Fracción del último ciclo con el puerto serie ocupado")
+port_queue_depth = Gauge("phoenix_port_queue_depth", "Peticiones esperando el turno de cada puerto serie")
+port_wait = Histogram("phoenix_port_wait_seconds", "Espera hasta obtener el turno de cada puerto serie", MODBUS_BUCKETS)
+exchange_writes = Counter("phoenix_exchange_file_writes_total", "Escrituras en los archivos de intercambio con la web")
+exchange_rejects = Counter("phoenix_exchange_rejects_total", "Valores de la web fuera del esquema de su archivo")
+
+ALL_METRICS = (cycle_duration, stage_duration, modbus_latency, modbus_retries, modbus_timeouts, modbus_errors,
+               write_mismatches, bus_busy, bus_utilisation, port_queue_depth, port_wait, exchange_writes,
+               exchange_rejects)
+
+_busy_at_cycle_start: Dict[Tuple, float] = {}
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Mide la duración de una etapa del ciclo:
+        with stage_timer("read_all_buses"):
+            ...
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.observe(perf_counter() - start, stage=stage)
+
+
+def start_cycle() -> float:
+    """
+    Marca el inicio de un ciclo
+    Returns: instante de inicio, a pasar a end_cycle
+    """
+    _busy_at_cycle_start.clear()
+    _busy_at_cycle_start.update(bus_busy.values)
+    return perf_counter()
+
+
+def end_cycle(start: float):
+    """
+    Registra la duración del ciclo, calcula la utilización de cada puerto durante el mismo y actualiza METRICS_FILE
+    """
+    duration = perf_counter() - start
+    cycle_duration.observe(duration)
+    for key, busy in bus_busy.values.items():
+        bus_utilisation.set(round((busy - _busy_at_cycle_start.get(key, 0)) / duration, 4) if duration else 0,
+                            **dict(key))
+    try:
+        write_metrics_file()
+    except OSError as e:
+        log.error("No se ha podido guardar el archivo de métricas %s\n%s", METRICS_FILE, e)
+
+
+def observe_modbus(port: str, slave: int, elapsed: float, ok: bool = True, timeout: bool = False):
+    """
+    Registra una transacción ModBus (un intento) con el esclavo 'slave' del puerto 'port'
+    Params:
+        elapsed: segundos que ha estado ocupado el puerto
+        ok: la transacción ha tenido respuesta válida
+        timeout: el esclavo no ha respondido
+    """
+    bus_busy.inc(elapsed, port=port)
+    if ok:
+        modbus_latency.observe(elapsed, port=port, slave=slave)
+    elif timeout:
+        modbus_timeouts.inc(port=port, slave=slave)
+
+
+def render() -> str:
+    """
+    Texto con todas las métricas en formato de exposición de Prometheus
+    """
+    return "\n".join(m.render() for m in ALL_METRICS) + "\n"
+
+
+def write_metrics_file():
+    tmp_file = METRICS_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
+        f.write(render())
+    replace(tmp_file, METRICS_FILE)
@@ -1,34 +0,0 @@
-#!/usr/bin/env python3
-from gc import collect
-import socket
-
-collect()
-
-
-def publish_results(html: str):
-    """
-    Publica los resultados de las lecturas ModBus
-    Params: html: Datos a publicar
-    Returns:
-    """
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind(('', 80))
-    s.listen(5)
-
-    while True:
-        conn, addr = s.accept()
-        print('Got a connection from %s' % str(addr))
-        request = conn.recv(1024)
-        request = str(request)
-        print('Content = %s' % request)
-        response = """<html><head> <title>Resultados Lectura ModBus</title><meta name="viewport" content="width=device-width, initial-scale=1">
-        <link rel="icon" href="data:,"> <style>html{font-family: Helvetica; display:inline-block; margin: 0px auto; text-align: center;}
-        h1{color: #0F3376; padding: 2vh;}p{font-size: 1.5rem;}.button{display: inline-block; background-color: #e7bd3b; border: none; 
-        border-radius: 4px; color: white; padding: 16px 40px; text-decoration: none; font-size: 30px; margin: 2px; cursor: pointer;}
-        .button2{background-color: #4286f4;}</style></head><body> """ + html + """</body></html>"""
-        # response = web_page()
-        conn.send('HTTP/1.1 200 OK\n')
-        conn.send('Content-Type: text/html\n')
-        conn.send('Connection: close\n\n')
-        conn.sendall(response)
-        conn.close()
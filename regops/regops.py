@@ -6,6 +6,9 @@ en sus valores reales
 """
 from phoenix_constants import *
 from typing import List, Tuple
+from phoenix_log import get_logger
+
+log = get_logger(__name__)
 
 # Diccionario con built-in functions para convertir los valores convertidos
 # al formato deseado
@@ -29,10 +32,10 @@ def x10(val: [int, float, str], dtype=TYPE_INT, prec=1) -> [int, float, str]:
         try:
             val_to_ret = round(float(val) * 10, prec)
         except ValueError:
-            print(f"regops(función x10):{val} no es una cadena válida")
+            log.warning("regops(función x10):%s no es una cadena válida", val)
             return  # devuelve None
     else:
-        print(f"regops(función x10):{val} no es un valor válido")
+        log.warning("regops(función x10):%s no es un valor válido", val)
         return  # devuelve None
 
     return ret_val[dtype](val_to_ret)
@@ -54,10 +57,10 @@ def x10_1(val: [int, float, str], dtype=TYPE_INT, prec=1) -> [int, float, str]:
         try:
             val_to_ret = round(float(val) / 10, prec)
         except ValueError:
-            print(f"regops(función x10_1):{val} no es una cadena válida")
+            log.warning("regops(función x10_1):%s no es una cadena válida", val)
             return  # devuelve None
     else:
-        print(f"regops(función x10_1):{val} no es un valor válido")
+        log.warning("regops(función x10_1):%s no es un valor válido", val)
         return  # devuelve None
 
     # print("x10_1", ret_val[dtype](val_to_ret))
@@ -80,10 +83,10 @@ def x100(val: [int, float, str], dtype=TYPE_INT, prec=1) -> [int, float, str]:
         try:
             val_to_ret = round(float(val) * 100, prec)
         except ValueError:
-            print(f"regops(función x100):{val} no es una cadena válida")
+            log.warning("regops(función x100):%s no es una cadena válida", val)
             return  # devuelve None
     else:
-        print(f"regops(función x100):{val} no es un valor válido")
+        log.warning("regops(función x100):%s no es un valor válido", val)
         return  # devuelve None
 
     # print("x100", ret_val[dtype](val_to_ret))
@@ -106,10 +109,10 @@ def x10_2(val: [int, float, str], dtype=TYPE_INT, prec=1) -> [int, float, str]:
         try:
             val_to_ret = round(float(val) / 100, prec)
         except ValueError:
-            print(f"regops(función x10_2):{val} no es una cadena válida")
+            log.warning("regops(función x10_2):%s no es una cadena válida", val)
             return  # devuelve None
     else:
-        print(f"regops(función x10_2):{val} no es un valor válido")
+        log.warning("regops(función x10_2):%s no es un valor válido", val)
         return  # devuelve None
 
     # print("x10_2", ret_val[dtype](val_to_ret))
@@ -131,10 +134,10 @@ def c_to_f(val: [int, float, str], dtype=TYPE_INT, prec=1) -> [int, float, str]:
         try:
             val_to_ret = round(float(val) * 9 / 5, prec) + 32
         except ValueError:
-            print(f"regops(función c_to_f):{val} no es una cadena válida")
+            log.warning("regops(función c_to_f):%s no es una cadena válida", val)
             return  # devuelve None
     else:
-        print(f"regops(función c_to_f):{val} no es un valor válido")
+        log.warning("regops(función c_to_f):%s no es un valor válido", val)
         return  # devuelve None
 
     # print("c_to_f", ret_val[dtype](val_to_ret))
@@ -156,10 +159,10 @@ def f_to_c(val: [int, float, str], dtype=TYPE_INT, prec=1) -> [int, float, str]:
         try:
             val_to_ret = round((float(val) - 32) * 5 / 9, prec)
         except ValueError:
-            print(f"regops(función f_to_c):{val} no es una cadena válida")
+            log.warning("regops(función f_to_c):%s no es una cadena válida", val)
             return  # devuelve None
     else:
-        print(f"regops(función f_to_c):{val} no es un valor válido")
+        log.warning("regops(función f_to_c):%s no es un valor válido", val)
         return  # devuelve None
 
     # print("f_to_c", ret_val[dtype](val_to_ret), "precision", prec)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Pruebas de Phoenix contra un proyecto sintético (benchmarks.synthetic) y el bus simulado sin esperas.
+phoenix_init carga el proyecto al importarse, así que las variables de entorno PHOENIX_* se fijan aquí, antes de
+importar ningún módulo de Phoenix.
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORK_FOLDER = tempfile.mkdtemp(prefix="phoenix_tests_")
+os.environ.update({"PHOENIX_CONFIG_FILE": os.path.join(WORK_FOLDER, "project.json"),
+                   "PHOENIX_TEMP_FOLDER": os.path.join(WORK_FOLDER, "phoenix") + "/",
+                   "PHOENIX_EXCHANGE_FOLDER": os.path.join(WORK_FOLDER, "reg"),
+                   "PHOENIX_MODBUS_SIMULATOR": "1",
+                   "PHOENIX_SIMULATOR_TIME_SCALE": "0",
+                   "PHOENIX_BOARD_SN": "TESTS",
+                   "PHOENIX_LOG_LEVEL": "ERROR"})
+
+from benchmarks import synthetic  # noqa: E402
+
+synthetic.write_project(os.environ["PHOENIX_CONFIG_FILE"], buildings=1, dwellings=2, rooms=2)
+synthetic.write_exchange_files(os.environ["PHOENIX_EXCHANGE_FOLDER"])
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK_FOLDER, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def phi():
+    """
+    phoenix_init con el almacén de lecturas cargado por un ciclo completo de main.ciclo
+    """
+    import phoenix_init
+    import main
+    asyncio.run(main.ciclo(0))
+    return phoenix_init
+
+
+@pytest.fixture(scope="session")
+def find_device(phi):
+    """
+    Función que devuelve el primer dispositivo del proyecto de la marca y el modelo indicados
+    """
+    def find(brand: str, model: str):
+        return next(device for bus in phi.buses.values() for device in bus.values()
+                    if (device.brand, device.model) == (brand, model))
+    return find
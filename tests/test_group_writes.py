@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Escrituras agrupadas (mb_utils.group_writes) en el bus simulado
+"""
+import asyncio
+
+import pytest
+from modbus_tk.exceptions import ModbusInvalidResponseError
+
+import phoenix_init  # noqa: F401 El proyecto se carga antes que mb_utils.mb_utils, como en main
+from mb_utils import group_writes, simulator, timing
+from publish import metrics
+
+
+def test_broadcast_does_not_wait_for_a_reply(phi, find_device, monkeypatch):
+    hru = find_device("sistena", "sig310")
+    group = [device for bus in phi.buses.values() for device in bus.values()
+             if (device.port, device.brand, device.model) == (hru.port, hru.brand, hru.model)]
+    assert len(group) > 1
+    monkeypatch.setattr(group_writes, "MODBUS_BROADCAST_MODELS", (f"{hru.brand}_{hru.model}",))
+    monkeypatch.setattr(group_writes, "MODBUS_BROADCAST_DELAY", 0)
+    bus = simulator.simulated_master(hru.port).bus
+    broadcast_timeout = timing.timeout(hru.port, 0)
+    adr, value = 7, 1 - bus.slaves[hru.slave].regs[phi.HOLDING_REGISTER_ID][7]
+
+    asyncio.run(group_writes.write_port_groups(hru.port, {(hru.brand, hru.model, 6, adr, value): group},
+                                               {device.slave for device in group}))
+    assert all(bus.slaves[device.slave].regs[phi.HOLDING_REGISTER_ID][adr] == value for device in group)
+    assert timing.timeout(hru.port, 0) == broadcast_timeout
+    assert metrics.modbus_errors.get(port=hru.port, slave=0) == 0
+
+
+def test_simulated_master_waits_for_broadcast_reply_like_modbus_tk(phi, find_device):
+    # RtuMaster.execute espera la respuesta también del esclavo 0: el maestro simulado se comporta igual
+    hru = find_device("sistena", "sig310")
+    with pytest.raises(ModbusInvalidResponseError):
+        simulator.simulated_master(hru.port).execute(0, 6, 7, output_value=0)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Transportes ModBus sobre TCP (mb_utils.transport) contra una pasarela local que responde a las peticiones según el
+guion de cada prueba
+"""
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+import pytest
+from modbus_tk.exceptions import ModbusInvalidResponseError
+
+from mb_utils import transport
+from phoenix_constants import MODBUS_TRANSPORT_RTU_TCP, MODBUS_TRANSPORT_TCP
+
+
+class Gateway:
+    """
+    Pasarela en 127.0.0.1 que atiende cada conexión con handler(conexión, nº de conexión) en un hilo propio
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.connections = 0
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.handle, args=(conn, self.connections), daemon=True).start()
+
+    def handle(self, conn: socket.socket, number: int):
+        with conn:
+            try:
+                self.handler(conn, number)
+            except OSError:
+                pass
+
+    def close(self):
+        self.server.close()
+
+
+def recv_exact(conn: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Conexión cerrada")
+        data += chunk
+    return data
+
+
+def recv_mbap(conn: socket.socket):
+    """
+    Returns: (transacción, unidad, PDU) de la siguiente petición Modbus TCP
+    """
+    tid, _, length, unit = transport.MBAP_HEADER.unpack(recv_exact(conn, transport.MBAP_HEADER.size))
+    return tid, unit, recv_exact(conn, length - 1)
+
+
+def mbap(tid: int, unit: int, pdu: bytes) -> bytes:
+    return transport.MBAP_HEADER.pack(tid, 0, len(pdu) + 1, unit) + pdu
+
+
+def registers_pdu(fcode: int, values) -> bytes:
+    return struct.pack(f">BB{len(values)}H", fcode, 2 * len(values), *values)
+
+
+def respond(pdu: bytes) -> bytes:
+    """
+    Respuesta a la PDU de una petición: en las lecturas, cada registro vale su dirección; las escrituras se repiten
+    """
+    fcode, adr, quan = struct.unpack(">BHH", pdu[:5])
+    if fcode in (3, 4):
+        return registers_pdu(fcode, range(adr, adr + quan))
+    return pdu[:5]
+
+
+def rtu_frame(slave: int, pdu: bytes) -> bytes:
+    frame = bytes((slave,)) + pdu
+    return frame + transport.crc16(frame)
+
+
+@pytest.fixture
+def gateway():
+    gateways = []
+
+    def start(handler) -> Gateway:
+        gateways.append(Gateway(handler))
+        return gateways[-1]
+
+    yield start
+    for gw in gateways:
+        gw.close()
+
+
+def master(gw: Gateway, transport_name: str, pipeline: int = 1, timeout: float = 1) -> transport.TcpMaster:
+    return transport.TcpMaster("127.0.0.1", gw.port, transport_name, pipeline, timeout)
+
+
+def test_mbap_round_trip(gateway):
+    requests = []
+
+    def handler(conn, _):
+        while True:
+            tid, unit, pdu = recv_mbap(conn)
+            requests.append((tid, unit, pdu[0]))
+            conn.sendall(mbap(tid, unit, respond(pdu)))
+
+    gw = gateway(handler)
+    tcp = master(gw, MODBUS_TRANSPORT_TCP)
+    try:
+        assert tcp.execute(7, 3, 10, 3) == (10, 11, 12)
+        assert tcp.execute(7, 4, 100, 1) == (100,)
+        assert tcp.execute(7, 6, 20, output_value=215) == (20, 215)
+    finally:
+        tcp.disconnect()
+    assert [unit for _, unit, _ in requests] == [7, 7, 7]
+    assert len({tid for tid, _, _ in requests}) == 3
+    assert gw.connections == 1
+
+
+def test_pipelined_responses_out_of_order(gateway):
+    def handler(conn, _):
+        while True:
+            first, second = recv_mbap(conn), recv_mbap(conn)
+            for tid, unit, pdu in (second, first):  # La pasarela responde en orden inverso
+                conn.sendall(mbap(tid, unit, respond(pdu)))
+
+    gw = gateway(handler)
+    tcp = master(gw, MODBUS_TRANSPORT_TCP, pipeline=2)
+    try:
+        with ThreadPoolExecutor(2) as pool:
+            for _ in range(3):
+                first = pool.submit(tcp.execute, 1, 3, 0, 2)
+                second = pool.submit(tcp.execute, 2, 3, 50, 2)
+                assert (first.result(), second.result()) == ((0, 1), (50, 51))
+    finally:
+        tcp.disconnect()
+    assert gw.connections == 1
+
+
+def test_rtutcp_bad_crc(gateway):
+    def handler(conn, number):
+        while True:
+            request = recv_exact(conn, 8)
+            response = rtu_frame(request[0], respond(request[1:6]))
+            if number == 1:  # La primera conexión responde con el CRC alterado
+                response = response[:-1] + bytes((response[-1] ^ 0xFF,))
+            conn.sendall(response)
+
+    gw = gateway(handler)
+    rtu = master(gw, MODBUS_TRANSPORT_RTU_TCP)
+    try:
+        with pytest.raises(ModbusInvalidResponseError):
+            rtu.execute(3, 3, 5, 2)
+        assert rtu.sock is None  # Se descarta la conexión
+        assert rtu.execute(3, 3, 5, 2) == (5, 6)
+    finally:
+        rtu.disconnect()
+    assert gw.connections == 2
+
+
+def test_rtutcp_late_response_drops_connection(gateway):
+    def handler(conn, number):
+        while True:
+            request = recv_exact(conn, 8)
+            if number == 1:  # La primera respuesta llega después del tiempo de espera del maestro
+                sleep(0.3)
+                conn.sendall(rtu_frame(request[0], registers_pdu(3, (999, 999))))
+                continue
+            conn.sendall(rtu_frame(request[0], respond(request[1:6])))
+
+    gw = gateway(handler)
+    rtu = master(gw, MODBUS_TRANSPORT_RTU_TCP)
+    try:
+        with pytest.raises(ModbusInvalidResponseError):
+            rtu.execute(3, 3, 5, 2, timeout=0.1)
+        assert rtu.sock is None
+        sleep(0.3)
+        # La respuesta tardía llega a la conexión descartada y no se toma por la de la siguiente petición
+        assert rtu.execute(3, 3, 5, 2) == (5, 6)
+    finally:
+        rtu.disconnect()
+    assert gw.connections == 2
+
+
+def test_tcp_late_response_is_ignored(gateway):
+    def handler(conn, _):
+        tid, unit, pdu = recv_mbap(conn)
+        sleep(0.3)
+        conn.sendall(mbap(tid, unit, registers_pdu(3, (999, 999))))  # Respuesta tardía a la primera petición
+        while True:
+            tid, unit, pdu = recv_mbap(conn)
+            conn.sendall(mbap(tid, unit, respond(pdu)))
+
+    gw = gateway(handler)
+    tcp = master(gw, MODBUS_TRANSPORT_TCP)
+    try:
+        with pytest.raises(ModbusInvalidResponseError):
+            tcp.execute(1, 3, 5, 2, timeout=0.1)
+        # La respuesta tardía lleva el identificador de la transacción vencida y se descarta
+        assert tcp.execute(1, 3, 5, 2) == (5, 6)
+    finally:
+        tcp.disconnect()
+    assert gw.connections == 1
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Centralitas de suelo radiante (devices.devices.UFHCController)
+"""
+import asyncio
+
+import phoenix_init  # noqa: F401 El proyecto se carga antes que mb_utils.mb_utils, como en main
+from mb_utils.mb_utils import get_value
+
+
+def test_x147_upload_in_cooling(phi, find_device):
+    device = find_device("uponor", "x147")
+    assert device.active_channels
+    channel = device.active_channels[0]
+    sp_target = {"bus": device.bus_id, "device": device.device_id, "datatype": "hr", "adr": channel - 1}
+    sp_value = device.channel_values[device.SP][channel - 1]
+    device.iv = phi.COOLING
+    try:
+        assert asyncio.run(device.upload()) == 1
+        # En refrigeración, la X147 recibe la consigna 2 gradC por debajo de la de los termostatos
+        assert get_value(sp_target) == float(sp_value) - 2.0
+    finally:
+        asyncio.run(device.iv_mode(phi.HEATING))
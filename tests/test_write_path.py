@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Escritura de valores: set_value actualiza el almacén de lecturas (save_value) con el valor que devolverá la siguiente
+lectura y write_check.batch corrige con save_read_back los registros que el dispositivo no ha aceptado.
+"""
+import asyncio
+
+import pytest
+
+import phoenix_init  # noqa: F401 El proyecto se carga antes que mb_utils.mb_utils, como en main
+from mb_utils import simulator, write_check
+from mb_utils.mb_utils import as_reading, get_regmap, get_value, save_read_back, save_value, set_value
+
+
+def target(device, datatype: str, adr: int) -> dict:
+    return {"bus": device.bus_id, "device": device.device_id, "datatype": datatype, "adr": adr}
+
+
+def simulated_slave(device) -> simulator.VirtualSlave:
+    return simulator.simulated_master(device.port).bus.slaves[device.slave]
+
+
+async def written(value_target: dict, value, on_mismatch=save_read_back):
+    async with write_check.batch(on_mismatch):
+        await set_value(value_target, value)
+
+
+@pytest.mark.parametrize("brand, model, datatype, adr, value, stored", [
+    ("uponor", "x148", "hr", 0, 23.5, 23.5),  # Consigna con conversión de escritura y de lectura
+    ("sistena", "sig610", "hr", 2, 1, 1),  # Registro entero
+    ("uponor", "x148", "co", 0, 1, 1),  # Bobina
+    ("sistena", "sig610", "hr", 6, (1 << 8) + 25, (1, 25)),  # Byte alto y byte bajo
+])
+def test_set_value_updates_store(phi, find_device, brand, model, datatype, adr, value, stored):
+    device = find_device(brand, model)
+    value_target = target(device, datatype, adr)
+    old_value = get_value(value_target)
+    assert old_value is not None and old_value != stored
+    mismatches = []
+    asyncio.run(written(value_target, value, lambda tgt, read_value: mismatches.append((tgt, read_value))))
+    assert get_value(value_target) == stored
+    assert type(get_value(value_target)) is type(old_value)
+    assert not mismatches
+
+
+def test_save_value_keeps_register_type(phi, find_device):
+    device = find_device("sistena", "sig610")
+    int_target, tuple_target = target(device, "hr", 3), target(device, "hr", 8)
+    assert save_value(int_target, 7.0) == 7 and type(get_value(int_target)) is int
+    assert save_value(tuple_target, (2, 30)) == (2, 30)
+    assert get_value(tuple_target) == (2, 30)
+    assert save_value(target(device, "hr", 9999), 1) is None  # Registro sin lecturas
+
+
+def test_write_check_corrects_rejected_write(phi, find_device, monkeypatch):
+    device = find_device("uponor", "x148")
+    value_target = target(device, "hr", 1)
+    slave = simulated_slave(device)
+    regs = slave.regs[phi.HOLDING_REGISTER_ID]
+    device_value = regs[1]
+    # El esclavo responde a la escritura pero no cambia el registro, como un dispositivo que rechaza el valor
+    monkeypatch.setattr(slave, "write", lambda fcode, adr, values: None)
+    mismatches = []
+
+    def on_mismatch(tgt, read_value):
+        mismatches.append((tgt, read_value))
+        save_read_back(tgt, read_value)
+
+    asyncio.run(written(value_target, 26.0, on_mismatch))
+    assert mismatches == [(value_target, device_value)]
+    assert regs[1] == device_value
+    assert get_value(value_target) == as_reading(get_regmap(device)["hr"]["1"], device_value) != 26.0
+
+
+def test_unchanged_value_is_not_checked(phi, find_device):
+    device = find_device("sistena", "sig610")
+    value_target = target(device, "hr", 4)
+
+    async def write_same():
+        async with write_check.batch(save_read_back):
+            await set_value(value_target, get_value(value_target))
+            return write_check._expected.get()
+
+    assert asyncio.run(write_same()) == {}